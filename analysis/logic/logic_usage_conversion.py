@@ -4,19 +4,51 @@
 """
 from __future__ import annotations
 
+import hashlib
+import io
+import os
+import pickle
 import re
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
 from pathlib import Path
 from typing import Any
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from shared.services.view_model_cache import vm_cache_get, vm_cache_set
+
 _DATA_DIR = Path(__file__).resolve().parents[2] / "data"
 _RECIPE_FILE = _DATA_DIR / "recipe_table.xlsx"
 
 _SKIP_KEYWORDS = ["環保袋", "特色描述", "歡迎評價", "折價券", "官方會員", "註冊禮", "總計"]
 _FILENAME_RE = re.compile(r"^report_(UberEats|foodpanda)_(\d{8})_(\d{8})\.xlsx$")
 
+# 配方表解析結果的二進位快取（以檔案內容 hash 命名），新行程啟動時不必重新解析 Excel；
+# pickle 內是 DataFrame，檔名帶 pandas 版本，升級後不會讀到舊版格式
+_RECIPE_CACHE_DIR = Path(tempfile.gettempdir()) / f"oms_recipe_cache_{os.getuid() if hasattr(os, 'getuid') else 'user'}"
+_RECIPE_CACHE_VERSION = 1
+
+
+def _read_report_sheet(file_bytes: bytes) -> pd.DataFrame:
+    """只讀第一個工作表的前兩欄（品名、數量），以 openpyxl read-only 逐列串流，尾端空白列不計。"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        rows = [tuple(row) + (None,) * (2 - len(row)) for row in worksheet.iter_rows(max_col=2, values_only=True)]
+    finally:
+        workbook.close()
+    while rows and rows[-1] == (None, None):
+        rows.pop()
+    return pd.DataFrame(rows, columns=[0, 1])
+
 
 # ---------------------------------------------------------------------------
 # 1. 報表解析
@@ -33,9 +65,8 @@ def parse_report_file(file_bytes: bytes, filename: str) -> dict[str, Any]:
     date_end = f"{m.group(3)[:4]}/{m.group(3)[4:6]}/{m.group(3)[6:]}"
     date_range = f"{date_start} ~ {date_end}"
 
-    import io
     try:
-        df = pd.read_excel(io.BytesIO(file_bytes), sheet_name=0, header=None)
+        df = _read_report_sheet(file_bytes)
     except Exception as e:
         return {"error": f"無法讀取 Excel 檔案：{e}"}
 
@@ -52,24 +83,97 @@ def parse_report_file(file_bytes: bytes, filename: str) -> dict[str, Any]:
     mask = items["item_name"].apply(lambda x: not any(kw in str(x) for kw in _SKIP_KEYWORDS))
     items = items[mask].reset_index(drop=True)
 
-    return {"platform": platform, "date_range": date_range, "items_df": items, "error": None}
+    return {
+        "platform": platform,
+        "date_range": date_range,
+        "date_start": date_start,
+        "date_end": date_end,
+        "items_df": items,
+        "error": None,
+    }
 
 
 # ---------------------------------------------------------------------------
 # 2. 配方表讀取
 # ---------------------------------------------------------------------------
 
-@st.cache_data(show_spinner=False)
+def _recipe_file_mtime() -> int | None:
+    try:
+        return _RECIPE_FILE.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
 def load_recipe_data() -> dict[str, pd.DataFrame] | None:
-    """讀取配方表 Excel 的 4 個 sheet。找不到檔案或讀取失敗回傳 None。結果會被 cache。"""
-    if not _RECIPE_FILE.exists():
+    """讀取配方表 Excel 的 4 個 sheet。找不到檔案或讀取失敗回傳 None。結果依檔案 mtime cache。"""
+    mtime = _recipe_file_mtime()
+    if mtime is None:
         return None
+    return _load_recipe_data(mtime)
 
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def _load_recipe_data(mtime: int) -> dict[str, pd.DataFrame] | None:
+    # mtime 只作為 cache key：配方表更新後自動重讀
+    try:
+        file_bytes = _RECIPE_FILE.read_bytes()
+    except OSError:
+        return None
+    cache_path = _RECIPE_CACHE_DIR / f"{hashlib.sha256(file_bytes).hexdigest()}.v{_RECIPE_CACHE_VERSION}.pd{pd.__version__}.pkl"
+    cached = _read_recipe_cache(cache_path)
+    if cached is not None:
+        return cached
+    data = _parse_recipe_workbook(file_bytes)
+    if data is not None:
+        _write_recipe_cache(cache_path, data)
+    return data
+
+
+def _recipe_cache_dir_trusted() -> bool:
+    """快取目錄必須是自己建立且他人不可寫，才讀取其中的 pickle。"""
+    try:
+        stat = _RECIPE_CACHE_DIR.stat()
+    except OSError:
+        return False
+    if hasattr(os, "getuid") and stat.st_uid != os.getuid():
+        return False
+    return not stat.st_mode & 0o022
+
+
+def _read_recipe_cache(cache_path: Path) -> dict[str, pd.DataFrame] | None:
+    if not _recipe_cache_dir_trusted():
+        return None
+    try:
+        with open(cache_path, "rb") as f:
+            data = pickle.load(f)
+    except Exception:
+        # 檔案損毀、版本不相容（ImportError / TypeError 等）一律視為未命中，重新解析 Excel
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _write_recipe_cache(cache_path: Path, data: dict[str, pd.DataFrame]) -> None:
+    # 寫入失敗（唯讀環境等）不影響結果，只是下次仍需解析 Excel
+    try:
+        cache_path.parent.mkdir(mode=0o700, exist_ok=True)
+        if not _recipe_cache_dir_trusted():
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+def _parse_recipe_workbook(file_bytes: bytes) -> dict[str, pd.DataFrame] | None:
+    # 一次開檔讀完 4 個 sheet（原本每個 sheet 各自重新解析整本活頁簿）
     try:
-        menu_items = pd.read_excel(_RECIPE_FILE, sheet_name="menu_items")
-        aliases = pd.read_excel(_RECIPE_FILE, sheet_name="menu_item_aliases")
-        recipes = pd.read_excel(_RECIPE_FILE, sheet_name="recipes")
-        checklist = pd.read_excel(_RECIPE_FILE, sheet_name="items_checklist（需確認）", header=None)
+        with pd.ExcelFile(io.BytesIO(file_bytes)) as workbook:
+            menu_items = workbook.parse("menu_items")
+            aliases = workbook.parse("menu_item_aliases")
+            recipes = workbook.parse("recipes")
+            checklist = workbook.parse("items_checklist（需確認）", header=None)
     except Exception:
         return None
 
@@ -156,36 +260,7 @@ def match_items(
 
 
 # ---------------------------------------------------------------------------
-# 4. 配方展開
-# ---------------------------------------------------------------------------
-
-def expand_recipes(
-    matched: list[dict],
-    recipes: pd.DataFrame,
-) -> dict[str, dict]:
-    """展開配方，回傳 {ingredient_name: {total_qty: float, unit: str}}。"""
-    result: dict[str, dict] = {}
-
-    for item in matched:
-        mid = item["menu_item_id"]
-        sale_qty = item["qty"]
-        recs = recipes[recipes["menu_item_id"] == mid]
-
-        for _, r in recs.iterrows():
-            ing = str(r["ingredient_name"]).strip()
-            qty = float(r["qty_per_serving"]) * sale_qty
-            unit = str(r["unit"]).strip()
-
-            if ing in result:
-                result[ing]["total_qty"] += qty
-            else:
-                result[ing] = {"total_qty": qty, "unit": unit}
-
-    return result
-
-
-# ---------------------------------------------------------------------------
-# 5. 半成品拆解
+# 4. 配方圖編譯（半成品遞迴拆到最底層原料）
 # ---------------------------------------------------------------------------
 
 _SEMI_PART_RE = re.compile(r"^(.+?)([\d.]+)(g|kg|ml|L)$")
@@ -212,55 +287,122 @@ def _parse_semi_recipe(formula: str) -> list[dict]:
     return parts
 
 
-def resolve_semi_finished(
-    ingredients: dict[str, dict],
-    checklist: pd.DataFrame,
-) -> dict[str, dict]:
-    """拆解半成品，子原料合併到總表。"""
-    # 找出哪些 ingredient 是半成品
-    semi_map: dict[str, str] = {}
-    for _, row in checklist.iterrows():
-        recipe = str(row.get("semi_recipe", "")).strip()
-        if recipe:
-            semi_map[str(row["ingredient_name"]).strip()] = recipe
+@dataclass(frozen=True)
+class RecipeGraph:
+    """
+    編譯後的配方：matrix[i, j] = 菜單 menu_ids[i] 每份用到的最底層原料 ingredients[j] 數量。
+    半成品已依 checklist 配方按比例拆成子原料（水不計）。
+    """
+    menu_ids: tuple[str, ...]
+    menu_index: dict[str, int]
+    ingredients: tuple[str, ...]
+    units: tuple[str, ...]
+    matrix: np.ndarray
+
+
+def _build_semi_parts(checklist: pd.DataFrame) -> dict[str, list[tuple[str, float]]]:
+    """半成品名 → [(子原料, 每 1g 半成品所需 g)]；無法解析的配方不列入（視為一般原料）。"""
+    semi_parts: dict[str, list[tuple[str, float]]] = {}
+    names = checklist["ingredient_name"].astype(str).str.strip().tolist()
+    formulas = checklist["semi_recipe"].astype(str).str.strip().tolist() if "semi_recipe" in checklist.columns else []
+    for name, formula in zip(names, formulas):
+        if not formula:
+            continue
+        parts = _parse_semi_recipe(formula)
+        batch_total = sum(p["qty_g"] for p in parts)
+        if not parts or batch_total <= 0:
+            semi_parts.pop(name, None)
+            continue
+        semi_parts[name] = [(p["name"], p["qty_g"] / batch_total) for p in parts if p["name"] != "水"]
+    return semi_parts
 
-    resolved: dict[str, dict] = {}
 
-    for ing, data in ingredients.items():
-        if ing not in semi_map:
-            # 非半成品，直接保留
-            if ing in resolved:
-                resolved[ing]["total_qty"] += data["total_qty"]
-            else:
-                resolved[ing] = {"total_qty": data["total_qty"], "unit": data["unit"]}
-            continue
+def _expand_ingredient(name: str, unit: str, semi_parts: dict, path: tuple[str, ...] = ()) -> list[tuple[str, str, float]]:
+    """
+    把 1 單位原料拆成 [(最底層原料, 單位, 係數)]。
+    子原料本身也是半成品時繼續拆；遇到自己或上層半成品（如 鮭魚碎 內含 鮭魚碎）則視為最底層。
+    """
+    if name not in semi_parts or name in path:
+        return [(name, unit, 1.0)]
+    leaves: list[tuple[str, str, float]] = []
+    for sub_name, share in semi_parts[name]:
+        for leaf, leaf_unit, coef in _expand_ingredient(sub_name, "g", semi_parts, path + (name,)):
+            leaves.append((leaf, leaf_unit, share * coef))
+    return leaves
+
+
+def compile_recipe_graph(recipes: pd.DataFrame, checklist: pd.DataFrame) -> RecipeGraph:
+    """由配方表與 checklist 編出菜單 × 最底層原料的用量矩陣。"""
+    semi_parts = _build_semi_parts(checklist)
+    menu_index: dict[str, int] = {}
+    ingredient_index: dict[str, int] = {}
+    units: list[str] = []
+    entries: list[tuple[int, int, float]] = []
+
+    for mid, ing, qty, unit in zip(
+        recipes["menu_item_id"].tolist(),
+        recipes["ingredient_name"].astype(str).str.strip().tolist(),
+        recipes["qty_per_serving"].tolist(),
+        recipes["unit"].astype(str).str.strip().tolist(),
+    ):
+        row = menu_index.setdefault(mid, len(menu_index))
+        for leaf, leaf_unit, coef in _expand_ingredient(ing, unit, semi_parts):
+            col = ingredient_index.get(leaf)
+            if col is None:
+                col = ingredient_index[leaf] = len(units)
+                units.append(leaf_unit)
+            entries.append((row, col, float(qty) * coef))
+
+    matrix = np.zeros((len(menu_index), len(units)), dtype=float)
+    for row, col, value in entries:
+        matrix[row, col] += value
+    return RecipeGraph(
+        menu_ids=tuple(menu_index),
+        menu_index=menu_index,
+        ingredients=tuple(ingredient_index),
+        units=tuple(units),
+        matrix=matrix,
+    )
 
-        # 半成品拆解
-        parts = _parse_semi_recipe(semi_map[ing])
-        if not parts:
-            # 無法解析，保留原樣
-            resolved[ing] = data
-            continue
 
-        batch_total = sum(p["qty_g"] for p in parts)
-        if batch_total <= 0:
-            resolved[ing] = data
-            continue
+def load_recipe_graph() -> RecipeGraph | None:
+    """讀取並編譯配方圖，依配方表 mtime cache。"""
+    mtime = _recipe_file_mtime()
+    if mtime is None:
+        return None
+    return _load_recipe_graph(mtime)
 
-        need_qty = data["total_qty"]  # g
-        ratio = need_qty / batch_total
 
-        for p in parts:
-            sub_name = p["name"]
-            if sub_name == "水":
-                continue
-            sub_qty = p["qty_g"] * ratio
-            if sub_name in resolved:
-                resolved[sub_name]["total_qty"] += sub_qty
-            else:
-                resolved[sub_name] = {"total_qty": sub_qty, "unit": "g"}
+@st.cache_data(show_spinner=False, max_entries=1)
+def _load_recipe_graph(mtime: int) -> RecipeGraph | None:
+    recipe_data = _load_recipe_data(mtime)
+    if recipe_data is None:
+        return None
+    return compile_recipe_graph(recipe_data["recipes"], recipe_data["checklist"])
+
 
-    return resolved
+# ---------------------------------------------------------------------------
+# 5. 配方展開
+# ---------------------------------------------------------------------------
+
+def build_sales_vector(matched: list[dict], graph: RecipeGraph) -> np.ndarray:
+    """比對結果 → 依 graph.menu_ids 排列的銷售份數向量（沒有配方的菜單不計）。"""
+    sales = np.zeros(len(graph.menu_ids), dtype=float)
+    for item in matched:
+        row = graph.menu_index.get(item["menu_item_id"])
+        if row is not None:
+            sales[row] += item["qty"]
+    return sales
+
+
+def expand_recipes(sales: np.ndarray, graph: RecipeGraph) -> dict[str, dict]:
+    """銷售向量 × 配方矩陣，回傳 {最底層原料: {total_qty: float, unit: str}}。"""
+    totals = sales @ graph.matrix
+    used = (sales != 0) @ (graph.matrix != 0)
+    return {
+        graph.ingredients[col]: {"total_qty": float(totals[col]), "unit": graph.units[col]}
+        for col in np.flatnonzero(used)
+    }
 
 
 # ---------------------------------------------------------------------------
@@ -490,7 +632,8 @@ def _process_report_inner(file_bytes: bytes, filename: str) -> dict[str, Any]:
 
     # 2. 讀取配方表
     recipe_data = load_recipe_data()
-    if recipe_data is None:
+    graph = load_recipe_graph()
+    if recipe_data is None or graph is None:
         return {"error": "無法讀取配方表，請確認 data/recipe_table.xlsx 存在"}
 
     # 3. 品名比對
@@ -511,13 +654,10 @@ def _process_report_inner(file_bytes: bytes, filename: str) -> dict[str, Any]:
             "result_df": pd.DataFrame(),
         }
 
-    # 4. 配方展開
-    ingredients = expand_recipes(matched, recipe_data["recipes"])
+    # 4. 配方展開（半成品已在配方圖中拆成最底層原料）
+    resolved = expand_recipes(build_sales_vector(matched, graph), graph)
 
-    # 5. 半成品拆解
-    resolved = resolve_semi_finished(ingredients, recipe_data["checklist"])
-
-    # 6. 包裝換算
+    # 5. 包裝換算
     result_df = convert_to_display(resolved, recipe_data["checklist"])
 
     return {
@@ -528,3 +668,163 @@ def _process_report_inner(file_bytes: bytes, filename: str) -> dict[str, Any]:
         "unmatched": unmatched,
         "result_df": result_df,
     }
+
+
+# ---------------------------------------------------------------------------
+# 8. 批次換算（多份報表 / zip，依期間合併）
+# ---------------------------------------------------------------------------
+
+BATCH_GROUP_PERIOD = "period"
+BATCH_GROUP_MONTH = "month"
+
+# 解析 Excel 主要耗在 CPU（openpyxl 為純 Python，執行緒受 GIL 限制），用多個行程同時處理；
+# 上限避免佔滿主機。Streamlit 伺服器本身是多執行緒，fork 可能複製到持有中的鎖，一律以 spawn 啟動
+_BATCH_MAX_WORKERS = 4
+
+# 每份報表的解析結果依 (檔名, 大小, sha256) 快取；rerun 或換合併方式時不必重新解析
+_PARSE_CACHE_ENTRIES = 256
+
+
+def _collect_report_files(uploaded_files) -> tuple[list[tuple[str, bytes]], list[dict]]:
+    """展開上傳檔（xlsx 或內含 xlsx 的 zip），回傳 ([(檔名, bytes)], [{filename, error}])。"""
+    reports: list[tuple[str, bytes]] = []
+    failed: list[dict] = []
+    for uploaded in uploaded_files or []:
+        name = str(uploaded.name)
+        data = uploaded.getvalue()
+        if not name.lower().endswith(".zip"):
+            reports.append((name, data))
+            continue
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                for member in zf.infolist():
+                    member_name = os.path.basename(member.filename)
+                    if member.is_dir() or member.filename.startswith("__MACOSX/") or not member_name.lower().endswith(".xlsx"):
+                        continue
+                    reports.append((member_name, zf.read(member)))
+        except zipfile.BadZipFile:
+            failed.append({"filename": name, "error": "zip 檔損毀或格式不符"})
+    return reports, failed
+
+
+def _parse_report_job(job: tuple[str, bytes]) -> tuple[str, dict[str, Any]]:
+    # 在子行程執行：只做解析，不可呼叫 st.*
+    filename, file_bytes = job
+    try:
+        return filename, parse_report_file(file_bytes, filename)
+    except Exception as e:
+        return filename, {"error": f"無法讀取 Excel 檔案：{e}"}
+
+
+def _report_fingerprint(filename: str, file_bytes: bytes) -> tuple[str, int, str]:
+    return filename, len(file_bytes), hashlib.sha256(file_bytes).hexdigest()
+
+
+def _parse_reports(reports: list[tuple[str, bytes]]) -> list[tuple[str, dict[str, Any]]]:
+    """解析多份報表（依輸入順序回傳）；已解析過的檔案直接取快取，其餘在行程池中解析。"""
+    fingerprints = [_report_fingerprint(filename, file_bytes) for filename, file_bytes in reports]
+    results: list[tuple[str, dict[str, Any]] | None] = [
+        vm_cache_get("usage_report_parse", fp, max_entries=_PARSE_CACHE_ENTRIES) for fp in fingerprints
+    ]
+    pending = [i for i, hit in enumerate(results) if hit is None]
+    jobs = [reports[i] for i in pending]
+    if len(jobs) <= 1:
+        parsed = [_parse_report_job(job) for job in jobs]
+    else:
+        max_workers = min(_BATCH_MAX_WORKERS, len(jobs), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn")) as executor:
+            parsed = list(executor.map(_parse_report_job, jobs))
+    for i, item in zip(pending, parsed):
+        results[i] = vm_cache_set("usage_report_parse", fingerprints[i], item, max_entries=_PARSE_CACHE_ENTRIES)
+    return results
+
+
+def _batch_period_key(parsed: dict[str, Any], group_by: str) -> str:
+    """
+    合併用的期間標籤。依月份合併時，報表本身只有區間合計、無法按日拆開，
+    跨月的報表自成一組並標示月份範圍（例如 2026/01 ~ 2026/02），不併入起始月份。
+    """
+    if group_by == BATCH_GROUP_MONTH:
+        start_month = parsed["date_start"][:7]
+        end_month = parsed["date_end"][:7]
+        return start_month if start_month == end_month else f"{start_month} ~ {end_month}"
+    return parsed["date_range"]
+
+
+def _build_usage_table(sales: np.ndarray, graph: RecipeGraph, checklist: pd.DataFrame) -> pd.DataFrame:
+    if not sales.any():
+        return pd.DataFrame()
+    return convert_to_display(expand_recipes(sales, graph), checklist)
+
+
+def process_reports_batch(uploaded_files, group_by: str = BATCH_GROUP_PERIOD) -> dict[str, Any]:
+    """
+    多份報表一次換算：各檔在行程池中解析，比對後的銷售份數依期間相加，
+    每個期間只做一次配方展開與包裝換算。
+    group_by：BATCH_GROUP_PERIOD 依報表區間、BATCH_GROUP_MONTH 依月份合併（跨月報表另成一組）。
+    回傳 {error, periods: [{period, platforms, report_count, unmatched, result_df}], total_df, failed}。
+    """
+    failed: list[dict] = []
+    try:
+        reports, failed = _collect_report_files(uploaded_files)
+        if not reports:
+            return {"error": "沒有可換算的報表檔案", "periods": [], "total_df": pd.DataFrame(), "failed": failed}
+
+        recipe_data = load_recipe_data()
+        graph = load_recipe_graph()
+        if recipe_data is None or graph is None:
+            return {"error": "無法讀取配方表，請確認 data/recipe_table.xlsx 存在", "periods": [], "total_df": pd.DataFrame(), "failed": failed}
+
+        periods: dict[str, dict[str, Any]] = {}
+        for filename, parsed in _parse_reports(reports):
+            if parsed.get("error"):
+                failed.append({"filename": filename, "error": parsed["error"]})
+                continue
+            try:
+                matched, unmatched = match_items(
+                    parsed["items_df"],
+                    parsed["platform"],
+                    recipe_data["aliases"],
+                    recipe_data["menu_items"],
+                )
+                sales = build_sales_vector(matched, graph)
+            except Exception as e:
+                # 單一檔案出錯只略過該檔，其餘照常換算
+                failed.append({"filename": filename, "error": f"品名比對失敗：{e}"})
+                continue
+            key = _batch_period_key(parsed, group_by)
+            period = periods.setdefault(key, {
+                "period": key,
+                "platforms": [],
+                "report_count": 0,
+                "unmatched": [],
+                "sales": np.zeros(len(graph.menu_ids), dtype=float),
+            })
+            if parsed["platform"] not in period["platforms"]:
+                period["platforms"].append(parsed["platform"])
+            period["report_count"] += 1
+            period["unmatched"].extend(name for name in unmatched if name not in period["unmatched"])
+            period["sales"] += sales
+
+        if not periods:
+            return {"error": "所有報表都無法換算", "periods": [], "total_df": pd.DataFrame(), "failed": failed}
+
+        checklist = recipe_data["checklist"]
+        total_sales = np.zeros(len(graph.menu_ids), dtype=float)
+        results = []
+        for key in sorted(periods):
+            period = periods[key]
+            sales = period.pop("sales")
+            total_sales += sales
+            period["result_df"] = _build_usage_table(sales, graph, checklist)
+            results.append(period)
+
+        return {
+            "error": None,
+            "periods": results,
+            "total_df": _build_usage_table(total_sales, graph, checklist),
+            "failed": failed,
+        }
+    except Exception as e:
+        # 已知失敗的檔案照樣回報，不因後段出錯而遺失
+        return {"error": f"換算過程發生錯誤：{e}", "periods": [], "total_df": pd.DataFrame(), "failed": failed}
@@ -2,23 +2,39 @@
 
 from datetime import date
 
+import numpy as np
 import pandas as pd
-import streamlit as st
 
 from shared.services.service_reports import (
     build_inventory_history_summary_df,
+    build_inventory_history_summary_multi_df,
     build_latest_item_metrics_df,
     build_purchase_detail_df,
     clean_option_list,
     get_active_df,
     get_base_unit_cost,
     item_display_name,
+    iter_inventory_history_summary_windows,
+    iter_purchase_detail_chunks,
+    iter_stock_detail_chunks,
     norm,
     safe_float,
 )
-from shared.services.data_backend import get_table_versions
-from shared.utils.utils_format import unit_label
-from shared.utils.utils_units import convert_unit, get_base_unit
+from shared.services.data_backend import _partition_versions_signature, get_table_versions
+from shared.utils.utils_export import (
+    EXPORT_CHUNK_ROWS,
+    EXPORT_FORMAT_CSV,
+    EXPORT_FORMAT_XLSX,
+    EXPORT_MIME_TYPES,
+    discard_published_export,
+    iter_frame_chunks,
+    publish_export_file,
+    spool_export,
+)
+from shared.utils.utils_format import unit_label_series
+from shared.utils.utils_units import build_item_unit_graphs, convert_unit, find_unit_factor, get_base_unit
+from shared.services.report_calculations import _STORE_TRANSACTION_TABLES
+from shared.services.view_model_cache import vm_cache_get, vm_cache_set
 
 
 ALL_VENDORS = "全部廠商"
@@ -26,9 +42,63 @@ ALL_ITEMS = "全部品項"
 DISPLAY_MODE_MOBILE = "手機精簡"
 DISPLAY_MODE_FULL = "完整報表"
 
+# 上游歷史資料每份較大，只保留最近幾組期間
+_HISTORY_UPSTREAM_CACHE_ENTRIES = 4
+
+_NO_POSITIONS = np.empty(0, dtype=np.intp)
+
 
 def _build_history_vendor_enriched_df(store_id: str, start_date: date, end_date: date, shared_tables: dict[str, pd.DataFrame]):
     hist_df = build_inventory_history_summary_df(store_id=store_id, start_date=start_date, end_date=end_date)
+    return _enrich_history_vendor(hist_df, shared_tables)
+
+
+def _build_group_index(df: pd.DataFrame, col: str) -> dict[str, np.ndarray]:
+    """
+    以 categorical codes 分組，回傳 {欄位值（strip 後）: 列位置}。
+    廠商 / 品項篩選改成查表後 iloc，不必每次切換選項都整欄做字串比對。
+    """
+    if df is None or df.empty or col not in df.columns:
+        return {}
+    keys = pd.Categorical(df[col].astype(str).str.strip())
+    return {str(key): positions for key, positions in pd.Series(keys).groupby(keys, observed=True, sort=False).indices.items()}
+
+
+def _build_frame_group_index(df: pd.DataFrame, cols: tuple[str, ...] = ("廠商", "品項")) -> dict[str, dict[str, np.ndarray]]:
+    return {col: _build_group_index(df, col) for col in cols}
+
+
+def _take_by_group_index(df: pd.DataFrame, group_index: dict, filters: list[tuple[str, str]]) -> pd.DataFrame:
+    """依 (欄位, 值) 取出符合全部條件的列（保留原順序與 index），結果為複本。"""
+    positions = None
+    for col, value in filters:
+        hit = group_index.get(col, {}).get(str(value).strip(), _NO_POSITIONS)
+        positions = hit if positions is None else np.intersect1d(positions, hit, assume_unique=True)
+    if positions is None:
+        return df.copy()
+    return df.iloc[positions].copy()
+
+
+def _get_indexed_history_vendor_df(store_id: str, start_date: date, end_date: date, shared_tables: dict[str, pd.DataFrame]) -> dict:
+    """
+    帶廠商 / 品項分組索引的歷史資料（快取，回傳值為唯讀共用物件）：
+    {df, group_index, vendor_options, item_options}。
+    """
+    signature = _history_analysis_upstream_signature(store_id, start_date, end_date)
+    entry = vm_cache_get("history_vendor_index", signature, max_entries=_HISTORY_UPSTREAM_CACHE_ENTRIES)
+    if entry is not None:
+        return entry
+    df = _build_history_vendor_enriched_df(store_id=store_id, start_date=start_date, end_date=end_date, shared_tables=shared_tables)
+    entry = {
+        "df": df,
+        "group_index": _build_frame_group_index(df),
+        "vendor_options": clean_option_list(df["廠商"].dropna().tolist()) if (not df.empty and "廠商" in df.columns) else [],
+        "item_options": clean_option_list(df["品項"].dropna().tolist()) if (not df.empty and "品項" in df.columns) else [],
+    }
+    return vm_cache_set("history_vendor_index", signature, entry, max_entries=_HISTORY_UPSTREAM_CACHE_ENTRIES)
+
+
+def _enrich_history_vendor(hist_df: pd.DataFrame, shared_tables: dict[str, pd.DataFrame]):
     if hist_df.empty:
         return hist_df
     if "廠商" in hist_df.columns and hist_df["廠商"].astype(str).str.strip().ne("").any():
@@ -224,16 +294,20 @@ def _build_report_detail_frames(*, detail_df: pd.DataFrame, selected_vendor: str
     return export_df, show_df
 
 
-def _build_history_analysis_shared_upstream(store_id: str, start_date: date, end_date: date, shared_tables: dict[str, pd.DataFrame]):
-    signature = (
+def _history_analysis_upstream_signature(store_id: str, start_date: date, end_date: date):
+    return (
         str(store_id).strip(),
         str(start_date),
         str(end_date),
-        get_table_versions(("stocktakes", "stocktake_lines", "purchase_orders", "purchase_order_lines", "items", "vendors", "prices")),
+        _partition_versions_signature(_STORE_TRANSACTION_TABLES, str(store_id).strip(), end_date),
+        get_table_versions(("items", "vendors", "prices")),
     )
-    cache = st.session_state.get("_history_analysis_upstream_cache")
-    if isinstance(cache, dict) and cache.get("signature") == signature:
-        data = cache.get("data", {})
+
+
+def _build_history_analysis_shared_upstream(store_id: str, start_date: date, end_date: date, shared_tables: dict[str, pd.DataFrame]):
+    signature = _history_analysis_upstream_signature(store_id, start_date, end_date)
+    data = vm_cache_get("history_analysis_upstream", signature, max_entries=_HISTORY_UPSTREAM_CACHE_ENTRIES)
+    if data is not None:
         return {
             "hist_df": data.get("hist_df", pd.DataFrame()).copy(),
             "purchase_filt": data.get("purchase_filt", pd.DataFrame()).copy(),
@@ -241,12 +315,14 @@ def _build_history_analysis_shared_upstream(store_id: str, start_date: date, end
             "vendor_item_option_map": {k: list(v) for k, v in data.get("vendor_item_option_map", {}).items()},
             "base_detail_df": data.get("base_detail_df", pd.DataFrame()).copy(),
             "vendor_summary": data.get("vendor_summary", pd.DataFrame()).copy(),
+            "group_index": data.get("group_index", {}),
         }
 
-    hist_df = _build_history_vendor_enriched_df(store_id=store_id, start_date=start_date, end_date=end_date, shared_tables=shared_tables)
+    indexed = _get_indexed_history_vendor_df(store_id=store_id, start_date=start_date, end_date=end_date, shared_tables=shared_tables)
+    hist_df = indexed["df"].copy()
     purchase_filt = _build_purchase_filtered_df(store_id=store_id, start_date=start_date, end_date=end_date)
     if not hist_df.empty and "廠商" in hist_df.columns:
-        vendor_values = clean_option_list(hist_df["廠商"].dropna().tolist())
+        vendor_values = list(indexed["vendor_options"])
     elif not purchase_filt.empty and "廠商" in purchase_filt.columns:
         vendor_values = clean_option_list(purchase_filt["廠商"].dropna().tolist())
     else:
@@ -262,15 +338,22 @@ def _build_history_analysis_shared_upstream(store_id: str, start_date: date, end
             vendor_summary["庫存金額"] = vendor_summary["庫存金額"].fillna(0.0).round(1)
         else:
             vendor_summary["庫存金額"] = 0.0
+    # 分組索引的列位置對應各 DataFrame 的列順序；取出的複本順序不變，可直接共用
+    group_index = {
+        "base_detail_df": _build_frame_group_index(base_detail_df),
+        "purchase_filt": _build_frame_group_index(purchase_filt, ("廠商",)),
+        "vendor_summary": _build_frame_group_index(vendor_summary, ("廠商",)),
+    }
     data = {
-        "hist_df": hist_df.copy(),
+        "hist_df": indexed["df"],
         "purchase_filt": purchase_filt.copy(),
         "vendor_options": list(vendor_options),
         "vendor_item_option_map": {k: list(v) for k, v in vendor_item_option_map.items()},
         "base_detail_df": base_detail_df.copy(),
         "vendor_summary": vendor_summary.copy(),
+        "group_index": group_index,
     }
-    st.session_state["_history_analysis_upstream_cache"] = {"signature": signature, "data": data}
+    vm_cache_set("history_analysis_upstream", signature, data, max_entries=_HISTORY_UPSTREAM_CACHE_ENTRIES)
     return {
         "hist_df": hist_df,
         "purchase_filt": purchase_filt,
@@ -278,6 +361,7 @@ def _build_history_analysis_shared_upstream(store_id: str, start_date: date, end
         "vendor_item_option_map": vendor_item_option_map,
         "base_detail_df": base_detail_df,
         "vendor_summary": vendor_summary,
+        "group_index": group_index,
     }
 
 
@@ -295,7 +379,9 @@ def format_mmdd_column(df: pd.DataFrame, col: str) -> pd.DataFrame:
     if df.empty or col not in df.columns:
         return df
     out = df.copy()
-    out[col] = out[col].apply(format_mmdd_value)
+    # 同一天的列很多，每個不同的日期只解析一次
+    uniques = out[col].drop_duplicates().tolist()
+    out[col] = out[col].map(dict(zip(uniques, [format_mmdd_value(v) for v in uniques])))
     return out
 
 
@@ -336,19 +422,60 @@ def get_store_scope_options(shared_tables: dict[str, pd.DataFrame], current_stor
     return list(option_map.keys()), option_map
 
 
+def _build_display_factor_map(item_ids: pd.Series, target_unit_series: list[pd.Series], base_unit_map: dict, conversions_df: pd.DataFrame, as_of_date: date) -> dict[tuple[str, str], float]:
+    """
+    預先算好 (item, 目標單位) → 由 base_unit 換算的倍率（換算日固定為 as_of_date）。
+    換算失敗或不需換算的組合不放入，套用時維持原數量。
+    """
+    pairs = pd.concat(
+        [pd.DataFrame({"item_id": item_ids.to_numpy(), "target_unit": units.astype(str).str.strip().to_numpy()}) for units in target_unit_series],
+        ignore_index=True,
+    ).drop_duplicates()
+    graphs = None
+    factor_map: dict[tuple[str, str], float] = {}
+    for item_id, target_unit in zip(pairs["item_id"].tolist(), pairs["target_unit"].tolist()):
+        base_unit = norm(base_unit_map.get(item_id, ""))
+        if not item_id or not target_unit or not base_unit or target_unit == base_unit:
+            continue
+        if graphs is None:
+            graphs = build_item_unit_graphs(conversions_df, as_of_date)
+        try:
+            factor_map[(item_id, target_unit)] = float(find_unit_factor(graphs.get(item_id, {}), item_id, base_unit, target_unit))
+        except Exception:
+            continue
+    return factor_map
+
+
+def _apply_display_factors(qty_series: pd.Series, item_ids: pd.Series, target_units: pd.Series, factor_map: dict) -> pd.Series:
+    qty = pd.to_numeric(qty_series, errors="coerce").fillna(0.0).astype(float)
+    if factor_map:
+        keys = pd.Series(list(zip(item_ids, target_units.astype(str).str.strip())), index=qty.index)
+        qty = qty * keys.map(factor_map).astype(float).fillna(1.0)
+    # 以 Python round 取一位小數：numpy 的 round 會把 0.05 這類值捨成 0，與既有顯示不同
+    return pd.Series([round(v, 1) for v in qty.tolist()], index=qty.index, dtype=float)
+
+
+def _format_qty_with_unit(qty_series: pd.Series, unit_series: pd.Series) -> pd.Series:
+    """數量以 :g 格式輸出，接上單位顯示名稱。"""
+    labels = unit_label_series(unit_series)
+    qty_text = pd.Series([f"{v:g}" for v in pd.to_numeric(qty_series, errors="coerce").fillna(0.0).tolist()], index=qty_series.index)
+    return qty_text + (" " + labels).where(labels != "", "")
+
+
 def build_stock_order_compare_view_model(store_id: str, selected_date: date, selected_vendor: str, shared_tables: dict[str, pd.DataFrame]):
     compare_signature = (
         str(store_id).strip(),
         str(selected_date),
-        get_table_versions(("stocktakes", "stocktake_lines", "purchase_orders", "purchase_order_lines", "items", "vendors", "stores", "unit_conversions")),
+        _partition_versions_signature(_STORE_TRANSACTION_TABLES, str(store_id).strip(), selected_date),
+        get_table_versions(("items", "vendors", "stores", "unit_conversions")),
     )
-    cache = st.session_state.get("_stock_order_compare_vm_cache")
-    if isinstance(cache, dict) and cache.get("signature") == compare_signature:
+    cache = vm_cache_get("stock_order_compare", compare_signature)
+    if cache is not None:
         preview_all = cache.get("preview_all", pd.DataFrame())
         vendor_options = list(cache.get("vendor_options", [ALL_VENDORS]))
         has_source = bool(cache.get("has_source", False))
         if selected_vendor != ALL_VENDORS and not preview_all.empty and "廠商" in preview_all.columns:
-            preview = preview_all[preview_all["廠商"].astype(str).str.strip() == str(selected_vendor).strip()].reset_index(drop=True)
+            preview = _take_by_group_index(preview_all, cache.get("group_index", {}), [("廠商", selected_vendor)]).reset_index(drop=True)
         else:
             preview = preview_all.copy()
         return {"preview": preview, "vendor_options": vendor_options, "has_source": has_source}
@@ -356,7 +483,7 @@ def build_stock_order_compare_view_model(store_id: str, selected_date: date, sel
     latest_df = build_latest_item_metrics_df(store_id=store_id, as_of_date=selected_date)
     if latest_df.empty:
         result = {"preview": pd.DataFrame(), "vendor_options": [ALL_VENDORS], "has_source": False}
-        st.session_state["_stock_order_compare_vm_cache"] = {"signature": compare_signature, "preview_all": pd.DataFrame(), "vendor_options": [ALL_VENDORS], "has_source": False}
+        vm_cache_set("stock_order_compare", compare_signature, {"preview_all": pd.DataFrame(), "vendor_options": [ALL_VENDORS], "has_source": False})
         return result
 
     work = latest_df.copy()
@@ -366,7 +493,7 @@ def build_stock_order_compare_view_model(store_id: str, selected_date: date, sel
         work = work[pd.to_datetime(work["日期"], errors="coerce").dt.date == selected_date].copy()
     if work.empty:
         result = {"preview": pd.DataFrame(), "vendor_options": [ALL_VENDORS], "has_source": True}
-        st.session_state["_stock_order_compare_vm_cache"] = {"signature": compare_signature, "preview_all": pd.DataFrame(), "vendor_options": [ALL_VENDORS], "has_source": True}
+        vm_cache_set("stock_order_compare", compare_signature, {"preview_all": pd.DataFrame(), "vendor_options": [ALL_VENDORS], "has_source": True})
         return result
 
     if "這次庫存" not in work.columns:
@@ -378,7 +505,7 @@ def build_stock_order_compare_view_model(store_id: str, selected_date: date, sel
     work = work[(work["這次庫存"] != 0) | (work["這次叫貨"] != 0)].copy()
     if work.empty:
         result = {"preview": pd.DataFrame(), "vendor_options": [ALL_VENDORS], "has_source": True}
-        st.session_state["_stock_order_compare_vm_cache"] = {"signature": compare_signature, "preview_all": pd.DataFrame(), "vendor_options": [ALL_VENDORS], "has_source": True}
+        vm_cache_set("stock_order_compare", compare_signature, {"preview_all": pd.DataFrame(), "vendor_options": [ALL_VENDORS], "has_source": True})
         return result
 
     items_df = shared_tables["items"]
@@ -427,63 +554,35 @@ def build_stock_order_compare_view_model(store_id: str, selected_date: date, sel
     work["庫存顯示單位"] = item_id_series.map(stock_unit_map).fillna("")
     work["叫貨顯示單位"] = item_id_series.map(order_unit_map).fillna("")
 
-    factor_cache: dict[tuple[str, str, str, str], float | None] = {}
-
-    def _convert_display_values(qty_series: pd.Series, target_unit_series: pd.Series) -> list[float]:
-        out: list[float] = []
-        for item_id, qty, target_unit in zip(item_id_series.tolist(), qty_series.tolist(), target_unit_series.tolist()):
-            qty_num = safe_float(qty, 0)
-            item_key = norm(item_id)
-            target_unit_key = norm(target_unit)
-            if qty_num == 0 or not item_key or not target_unit_key:
-                out.append(round(qty_num, 1))
-                continue
-            base_unit = norm(base_unit_map.get(item_key, ""))
-            if not base_unit or target_unit_key == base_unit:
-                out.append(round(qty_num, 1))
-                continue
-            factor_key = (item_key, base_unit, target_unit_key, str(selected_date))
-            factor = factor_cache.get(factor_key)
-            if factor_key not in factor_cache:
-                try:
-                    factor = convert_unit(
-                        item_id=item_key,
-                        qty=1.0,
-                        from_unit=base_unit,
-                        to_unit=target_unit_key,
-                        conversions_df=conversions_df,
-                        as_of_date=selected_date,
-                    )
-                except Exception:
-                    factor = None
-                factor_cache[factor_key] = factor
-            if factor is None:
-                out.append(round(qty_num, 1))
-            else:
-                out.append(round(qty_num * factor, 1))
-        return out
-
-    work["這次庫存_顯示值"] = _convert_display_values(work["這次庫存"], work["庫存顯示單位"])
-    work["這次叫貨_顯示值"] = _convert_display_values(work["這次叫貨"], work["叫貨顯示單位"])
+    factor_map = _build_display_factor_map(
+        item_id_series,
+        [work["庫存顯示單位"], work["叫貨顯示單位"]],
+        base_unit_map,
+        conversions_df,
+        selected_date,
+    )
+    work["這次庫存_顯示值"] = _apply_display_factors(work["這次庫存"], item_id_series, work["庫存顯示單位"], factor_map)
+    work["這次叫貨_顯示值"] = _apply_display_factors(work["這次叫貨"], item_id_series, work["叫貨顯示單位"], factor_map)
 
     work = work.sort_values(["廠商", "item_id"], ascending=[True, True])
     item_col = "品項" if "品項" in work.columns else "item_id"
     preview_all = work[["廠商", item_col, "這次庫存_顯示值", "庫存顯示單位", "這次叫貨_顯示值", "叫貨顯示單位"]].copy()
     preview_all = preview_all.rename(columns={item_col: "品項", "這次庫存_顯示值": "這次庫存", "這次叫貨_顯示值": "這次叫貨"})
-    preview_all["這次庫存"] = preview_all["這次庫存"].map(lambda v: f"{safe_float(v):g}") + preview_all["庫存顯示單位"].map(lambda v: f" {unit_label(str(v).strip())}" if str(v).strip() else "")
-    preview_all["這次叫貨"] = preview_all["這次叫貨"].map(lambda v: f"{safe_float(v):g}") + preview_all["叫貨顯示單位"].map(lambda v: f" {unit_label(str(v).strip())}" if str(v).strip() else "")
+    preview_all["這次庫存"] = _format_qty_with_unit(preview_all["這次庫存"], preview_all["庫存顯示單位"])
+    preview_all["這次叫貨"] = _format_qty_with_unit(preview_all["這次叫貨"], preview_all["叫貨顯示單位"])
     preview_all = preview_all.drop(columns=["庫存顯示單位", "叫貨顯示單位"]).reset_index(drop=True)
     vendor_options = [ALL_VENDORS] + clean_option_list(preview_all["廠商"].dropna().tolist())
+    group_index = _build_frame_group_index(preview_all, ("廠商",))
 
-    st.session_state["_stock_order_compare_vm_cache"] = {
-        "signature": compare_signature,
+    vm_cache_set("stock_order_compare", compare_signature, {
         "preview_all": preview_all.copy(),
         "vendor_options": list(vendor_options),
         "has_source": True,
-    }
+        "group_index": group_index,
+    })
 
     if selected_vendor != ALL_VENDORS:
-        preview = preview_all[preview_all["廠商"].astype(str).str.strip() == str(selected_vendor).strip()].reset_index(drop=True)
+        preview = _take_by_group_index(preview_all, group_index, [("廠商", selected_vendor)]).reset_index(drop=True)
     else:
         preview = preview_all.copy()
     return {"preview": preview, "vendor_options": vendor_options, "has_source": True}
@@ -497,10 +596,13 @@ def build_history_page_view_model(store_id: str, start_date: date, end_date: dat
     item_values = upstream["vendor_item_option_map"].get(selected_vendor, upstream["vendor_item_option_map"].get(ALL_VENDORS, []))
     item_options = [ALL_ITEMS] + item_values
     detail_df = upstream["base_detail_df"]
+    filters = []
     if selected_vendor != ALL_VENDORS:
-        detail_df = detail_df[detail_df["廠商"].astype(str).str.strip() == str(selected_vendor).strip()].copy()
+        filters.append(("廠商", selected_vendor))
     if selected_item != ALL_ITEMS:
-        detail_df = detail_df[detail_df["品項"].astype(str).str.strip() == str(selected_item).strip()].copy()
+        filters.append(("品項", selected_item))
+    if filters:
+        detail_df = _take_by_group_index(detail_df, upstream["group_index"]["base_detail_df"], filters)
     export_df, show_df = _build_report_detail_frames(
         detail_df=detail_df,
         selected_vendor=selected_vendor,
@@ -511,63 +613,230 @@ def build_history_page_view_model(store_id: str, start_date: date, end_date: dat
     return {"hist_df": hist_df, "vendor_options": vendor_options, "item_options": item_options, "detail_df": detail_df, "export_df": export_df, "show_df": show_df}
 
 
+EXPORT_TYPE_PURCHASE_DETAIL = "今日進貨明細"
+EXPORT_TYPE_ANALYSIS = "進銷存分析"
+
+
+def _filter_vendor_item(df: pd.DataFrame, vendor_col: str, item_col: str, selected_vendor: str, selected_item: str) -> pd.DataFrame:
+    if not df.empty and selected_vendor != ALL_VENDORS:
+        df = df[df[vendor_col].astype(str).str.strip() == selected_vendor].copy()
+    if not df.empty and selected_item != ALL_ITEMS:
+        df = df[df[item_col].astype(str).str.strip() == selected_item].copy()
+    return df
+
+
+def _purchase_export_date_field(df: pd.DataFrame) -> str:
+    return "delivery_date_dt" if "delivery_date_dt" in df.columns else "order_date_dt"
+
+
+def _filter_purchase_export_df(df: pd.DataFrame, store_id: str, start: date, end: date) -> pd.DataFrame:
+    if df.empty:
+        return df
+    date_field = _purchase_export_date_field(df)
+    df = df[df["store_id"].astype(str).str.strip() == str(store_id).strip()].copy()
+    return df[(df[date_field].notna()) & (df[date_field] >= start) & (df[date_field] <= end)].copy()
+
+
+def _build_purchase_export_preview(df: pd.DataFrame, store_name: str) -> pd.DataFrame:
+    if df.empty:
+        return pd.DataFrame()
+    date_field = _purchase_export_date_field(df)
+    return pd.DataFrame({"日期": pd.to_datetime(df[date_field], errors="coerce").dt.strftime("%m/%d"), "分店": store_name, "廠商": df.get("vendor_name_disp", ""), "品項": df.get("item_name_disp", ""), "數量": pd.to_numeric(df.get("order_qty_num", 0), errors="coerce").fillna(0), "單位": df.get("order_unit_disp", ""), "金額": pd.to_numeric(df.get("amount_num", 0), errors="coerce").fillna(0)}).reset_index(drop=True)
+
+
+def _build_history_export_preview(export_type: str, df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return pd.DataFrame()
+    if export_type == EXPORT_TYPE_ANALYSIS:
+        df = df[(df["上次庫存"] != 0) | (df["期間進貨"] != 0) | (df["期間消耗"] != 0) | (df["這次庫存"] != 0) | (df["這次叫貨"] != 0)].copy()
+        preview = df[[c for c in ["日期", "廠商", "品項", "上次庫存", "期間進貨", "庫存合計", "這次庫存", "期間消耗", "這次叫貨", "日平均"] if c in df.columns]].copy().reset_index(drop=True)
+        return format_mmdd_column(preview, "日期")
+    df = df[(df["上次庫存"] != 0) | (df["期間進貨"] != 0) | (df["期間消耗"] != 0) | (df["這次庫存"] != 0) | (df.get("這次叫貨", 0) != 0)].copy()
+    preview = df[[c for c in ["日期顯示", "廠商", "品項", "上次庫存", "期間進貨", "庫存合計", "這次庫存", "期間消耗", "這次叫貨", "日平均"] if c in df.columns]].copy().reset_index(drop=True)
+    if "日期顯示" in preview.columns:
+        preview = preview.rename(columns={"日期顯示": "日期"})
+    return format_mmdd_column(preview, "日期")
+
+
+def _export_filename(export_type: str, selected_store_name: str, start: date, end: date) -> str:
+    if export_type == EXPORT_TYPE_PURCHASE_DETAIL:
+        return f"今日進貨明細_{selected_store_name}_{start}_{end}.csv"
+    if export_type == EXPORT_TYPE_ANALYSIS:
+        return f"進銷存分析_{selected_store_name}_{start}_{end}.csv"
+    return f"歷史叫貨紀錄_{selected_store_name}_{start}_{end}.csv"
+
+
 def build_export_view_model(export_type: str, selected_store_id: str, selected_store_name: str, start: date, end: date, selected_vendor: str, selected_item: str, shared_tables: dict[str, pd.DataFrame]):
     vendor_options = [ALL_VENDORS]
     item_options = [ALL_ITEMS]
     preview = pd.DataFrame()
-    filename = f"匯出資料_{selected_store_name}_{start}_{end}.csv"
-    if export_type == "今日進貨明細":
-        df = build_purchase_detail_df()
-        if not df.empty:
-            date_field = "delivery_date_dt" if "delivery_date_dt" in df.columns else "order_date_dt"
-            df = df[df["store_id"].astype(str).str.strip() == str(selected_store_id).strip()].copy()
-            df = df[(df[date_field].notna()) & (df[date_field] >= start) & (df[date_field] <= end)].copy()
+    if export_type == EXPORT_TYPE_PURCHASE_DETAIL:
+        df = _filter_purchase_export_df(build_purchase_detail_df(), selected_store_id, start, end)
         if not df.empty and "vendor_name_disp" in df.columns:
             vendor_options += clean_option_list(df["vendor_name_disp"].dropna().tolist())
         if not df.empty and "item_name_disp" in df.columns:
             item_options += clean_option_list(df["item_name_disp"].dropna().tolist())
-        if not df.empty and selected_vendor != ALL_VENDORS:
-            df = df[df["vendor_name_disp"].astype(str).str.strip() == selected_vendor].copy()
-        if not df.empty and selected_item != ALL_ITEMS:
-            df = df[df["item_name_disp"].astype(str).str.strip() == selected_item].copy()
-        if not df.empty:
-            preview = pd.DataFrame({"日期": pd.to_datetime(df[date_field], errors="coerce").dt.strftime("%m/%d"), "分店": selected_store_name, "廠商": df.get("vendor_name_disp", ""), "品項": df.get("item_name_disp", ""), "數量": pd.to_numeric(df.get("order_qty_num", 0), errors="coerce").fillna(0), "單位": df.get("order_unit_disp", ""), "金額": pd.to_numeric(df.get("amount_num", 0), errors="coerce").fillna(0)}).reset_index(drop=True)
-        filename = f"今日進貨明細_{selected_store_name}_{start}_{end}.csv"
-    elif export_type == "進銷存分析":
-        df = build_analysis_with_vendor(store_id=selected_store_id, start_date=start, end_date=end, shared_tables=shared_tables)
-        if not df.empty and "廠商" in df.columns:
-            vendor_options += clean_option_list(df["廠商"].dropna().tolist())
-        if not df.empty and "品項" in df.columns:
-            item_options += clean_option_list(df["品項"].dropna().tolist())
-        if not df.empty and selected_vendor != ALL_VENDORS:
-            df = df[df["廠商"].astype(str).str.strip() == selected_vendor].copy()
-        if not df.empty and selected_item != ALL_ITEMS:
-            df = df[df["品項"].astype(str).str.strip() == selected_item].copy()
-        if not df.empty:
-            df = df[(df["上次庫存"] != 0) | (df["期間進貨"] != 0) | (df["期間消耗"] != 0) | (df["這次庫存"] != 0) | (df["這次叫貨"] != 0)].copy()
-            preview = df[[c for c in ["日期", "廠商", "品項", "上次庫存", "期間進貨", "庫存合計", "這次庫存", "期間消耗", "這次叫貨", "日平均"] if c in df.columns]].copy().reset_index(drop=True)
-            preview = format_mmdd_column(preview, "日期")
-        filename = f"進銷存分析_{selected_store_name}_{start}_{end}.csv"
+        df = _filter_vendor_item(df, "vendor_name_disp", "item_name_disp", selected_vendor, selected_item)
+        preview = _build_purchase_export_preview(df, selected_store_name)
     else:
-        df = build_history_with_vendor(store_id=selected_store_id, start_date=start, end_date=end, shared_tables=shared_tables)
-        if not df.empty and "廠商" in df.columns:
-            vendor_options += clean_option_list(df["廠商"].dropna().tolist())
-        if not df.empty and "品項" in df.columns:
-            item_options += clean_option_list(df["品項"].dropna().tolist())
+        indexed = _get_indexed_history_vendor_df(store_id=selected_store_id, start_date=start, end_date=end, shared_tables=shared_tables)
+        df = indexed["df"]
+        vendor_options += indexed["vendor_options"]
+        item_options += indexed["item_options"]
+        filters = []
         if not df.empty and selected_vendor != ALL_VENDORS:
-            df = df[df["廠商"].astype(str).str.strip() == selected_vendor].copy()
+            filters.append(("廠商", selected_vendor))
         if not df.empty and selected_item != ALL_ITEMS:
-            df = df[df["品項"].astype(str).str.strip() == selected_item].copy()
-        if not df.empty:
-            df = df[(df["上次庫存"] != 0) | (df["期間進貨"] != 0) | (df["期間消耗"] != 0) | (df["這次庫存"] != 0) | (df.get("這次叫貨", 0) != 0)].copy()
-            preview = df[[c for c in ["日期顯示", "廠商", "品項", "上次庫存", "期間進貨", "庫存合計", "這次庫存", "期間消耗", "這次叫貨", "日平均"] if c in df.columns]].copy().reset_index(drop=True)
-            if "日期顯示" in preview.columns:
-                preview = preview.rename(columns={"日期顯示": "日期"})
-            preview = format_mmdd_column(preview, "日期")
-        filename = f"歷史叫貨紀錄_{selected_store_name}_{start}_{end}.csv"
+            filters.append(("品項", selected_item))
+        df = _take_by_group_index(df, indexed["group_index"], filters)
+        preview = _build_history_export_preview(export_type, df)
+    filename = _export_filename(export_type, selected_store_name, start, end)
     return {"vendor_options": vendor_options, "item_options": item_options, "preview": preview, "filename": filename}
 
 
+EXPORT_PREVIEW_ROWS = 200
+
+_EXPORT_PREVIEW_CACHE_ENTRIES = 4
+
+
+def _export_store_ids(store_targets: list[tuple[str, str]]) -> list[str]:
+    return [str(store_id).strip() for store_id, _ in store_targets if str(store_id).strip()]
+
+
+def _export_versions_signature(store_ids: list[str], end: date) -> tuple:
+    return (
+        tuple(_partition_versions_signature(_STORE_TRANSACTION_TABLES, store_id, end) for store_id in store_ids),
+        get_table_versions(("items", "vendors", "stores", "prices", "unit_conversions")),
+    )
+
+
+# 選單只需要名稱，明細只查這幾欄
+_OPTION_STOCK_COLUMNS = "id,stocktake_id,item_id,vendor_id"
+_OPTION_PURCHASE_COLUMNS = "id,po_id,item_id,delivery_date"
+
+
+def build_export_filter_options(export_type: str, store_targets: list[tuple[str, str]], start: date, end: date) -> dict:
+    """
+    匯出頁的廠商 / 品項選單：逐店分批讀取區間內明細的名稱欄，不計算進銷存彙總、不讀整張明細表；
+    依條件與各分店資料版本快取，重新整理畫面時不重查。
+    """
+    store_ids = _export_store_ids(store_targets)
+    signature = (export_type, tuple(store_ids), str(start), str(end), _export_versions_signature(store_ids, end))
+    cached = vm_cache_get("export_filter_options", signature, max_entries=_EXPORT_PREVIEW_CACHE_ENTRIES)
+    if cached is not None:
+        return cached
+    vendors: set[str] = set()
+    items: set[str] = set()
+    for store_id in store_ids:
+        if export_type == EXPORT_TYPE_PURCHASE_DETAIL:
+            chunks = iter_purchase_detail_chunks(store_id=store_id, start_date=start, end_date=end, columns=_OPTION_PURCHASE_COLUMNS)
+        else:
+            chunks = iter_stock_detail_chunks(store_id=store_id, start_date=start, end_date=end, columns=_OPTION_STOCK_COLUMNS)
+        for chunk in chunks:
+            vendors.update(chunk["vendor_name_disp"].dropna().unique().tolist())
+            items.update(chunk["item_name_disp"].dropna().unique().tolist())
+    options = {
+        "vendor_options": [ALL_VENDORS] + clean_option_list(list(vendors)),
+        "item_options": [ALL_ITEMS] + clean_option_list(list(items)),
+    }
+    return vm_cache_set("export_filter_options", signature, options, max_entries=_EXPORT_PREVIEW_CACHE_ENTRIES)
+
+
+def build_export_preview(export_type: str, store_targets: list[tuple[str, str]], start: date, end: date, selected_vendor: str, selected_item: str, shared_tables: dict[str, pd.DataFrame], *, preview_rows: int = EXPORT_PREVIEW_ROWS) -> pd.DataFrame:
+    """
+    預覽只取匯出串流的前 preview_rows 列：進銷存 / 歷史紀錄從第一間分店最新的月份算起，
+    湊滿列數就停止，不組出整份結果；依條件與各分店資料版本快取，重新整理畫面時不重算。
+    """
+    store_ids = _export_store_ids(store_targets)
+    signature = (
+        export_type,
+        tuple(store_targets),
+        str(start),
+        str(end),
+        selected_vendor,
+        selected_item,
+        int(preview_rows),
+        _export_versions_signature(store_ids, end),
+    )
+    cached = vm_cache_get("export_preview", signature, max_entries=_EXPORT_PREVIEW_CACHE_ENTRIES)
+    if cached is not None:
+        return cached
+    frames = iter_export_frames(export_type, store_targets, start, end, selected_vendor, selected_item, shared_tables, chunk_rows=preview_rows)
+    parts: list[pd.DataFrame] = []
+    remaining = int(preview_rows)
+    for frame in frames:
+        parts.append(frame.iloc[:remaining])
+        remaining -= len(parts[-1])
+        if remaining <= 0:
+            break
+    frames.close()
+    preview = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    return vm_cache_set("export_preview", signature, preview, max_entries=_EXPORT_PREVIEW_CACHE_ENTRIES)
+
+
+def iter_export_frames(export_type: str, store_targets: list[tuple[str, str]], start: date, end: date, selected_vendor: str, selected_item: str, shared_tables: dict[str, pd.DataFrame], *, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """
+    分段產生匯出資料（每段最多 chunk_rows 列），不組出整份 DataFrame，也不讀整張明細表。
+    進貨明細逐店依叫貨單分批查詢；進銷存 / 歷史紀錄逐店依月份由新到舊計算，
+    同一時間只保留一間分店一個月份（加上回溯盤點）的明細。
+    單一分店時輸出與 build_export_view_model 的 preview 相同，多分店時前面加上「分店」欄。
+    """
+    if export_type == EXPORT_TYPE_PURCHASE_DETAIL:
+        for store_id, store_name in store_targets:
+            for detail_df in iter_purchase_detail_chunks(store_id=store_id, start_date=start, end_date=end):
+                df = _filter_purchase_export_df(detail_df, store_id, start, end)
+                df = _filter_vendor_item(df, "vendor_name_disp", "item_name_disp", selected_vendor, selected_item)
+                for chunk in iter_frame_chunks(df, chunk_rows):
+                    yield _build_purchase_export_preview(chunk, store_name)
+        return
+
+    multi_store = len(store_targets) > 1
+    for store_id, store_name in store_targets:
+        for summary_df in iter_inventory_history_summary_windows(store_id=store_id, start_date=start, end_date=end):
+            hist_df = _enrich_history_vendor(summary_df.drop(columns=["store_id"]).reset_index(drop=True), shared_tables)
+            del summary_df
+            hist_df = _filter_vendor_item(hist_df, "廠商", "品項", selected_vendor, selected_item)
+            preview = _build_history_export_preview(export_type, hist_df)
+            if preview.empty:
+                continue
+            if multi_store:
+                preview.insert(0, "分店", store_name)
+            yield from iter_frame_chunks(preview, chunk_rows)
+
+
+def build_export_file(export_type: str, store_targets: list[tuple[str, str]], start: date, end: date, selected_vendor: str, selected_item: str, shared_tables: dict[str, pd.DataFrame], file_format: str = EXPORT_FORMAT_CSV):
+    """
+    串流寫出匯出檔；回傳 {file, row_count, size, filename, mime, url}，file 為已移到開頭的暫存檔，
+    url 為靜態檔路由的下載網址（逐段送出）；未開啟靜態檔服務或檔案過大時為 None。
+    """
+    frames = iter_export_frames(export_type, store_targets, start, end, selected_vendor, selected_item, shared_tables)
+    export_file, row_count = spool_export(frames, file_format)
+    store_label = store_targets[0][1] if len(store_targets) == 1 else "全部分店"
+    filename = _export_filename(export_type, store_label, start, end)
+    if file_format == EXPORT_FORMAT_XLSX:
+        filename = filename[:-len(".csv")] + ".xlsx"
+    export_file.seek(0, 2)
+    size = export_file.tell()
+    export_file.seek(0)
+    url = publish_export_file(export_file, filename) if row_count > 0 else None
+    return {"file": export_file, "row_count": row_count, "size": size, "filename": filename, "mime": EXPORT_MIME_TYPES[file_format], "url": url}
+
+
+def read_export_file(export_file) -> bytes:
+    """
+    未開啟靜態檔服務時的備援：download_button 按下時才讀出暫存檔內容（在背景執行緒呼叫）。
+    會整份讀進記憶體，呼叫端只對不超過 EXPORT_DOWNLOAD_MAX_BYTES 的檔案使用。
+    """
+    export_file.seek(0)
+    return export_file.read()
+
+
+def discard_export_file(export: dict) -> None:
+    """關閉暫存檔並刪除已發佈的下載檔。"""
+    export["file"].close()
+    discard_published_export(export.get("url"))
+
+
 
 def _build_base_unit_cost_lookup(items_df: pd.DataFrame, prices_df: pd.DataFrame, conversions_df: pd.DataFrame):
     if items_df.empty or prices_df.empty or "item_id" not in items_df.columns or "item_id" not in prices_df.columns:
@@ -710,100 +979,84 @@ def _compute_total_stock_amount(hist_df: pd.DataFrame, shared_tables: dict[str,
     return float((work["base_qty"] * work["base_unit_cost"]).sum())
 
 
-def _get_analysis_page_cache(signature, upstream: dict, shared_tables: dict[str, pd.DataFrame]):
-    cache_root = st.session_state.setdefault("_analysis_page_vm_cache", {})
-    cache = cache_root.get(signature)
-    if isinstance(cache, dict):
-        return cache
+# 分析頁快取：頁面總計與各廠商 / 顯示模式的衍生表各自一筆 vm_cache，
+# 寫入時就估算位元組，切換廠商補進來的表也受 64 MB 上限控管
+_ANALYSIS_PAGE_CACHE_ENTRIES = 64
 
-    purchase_filt = upstream["purchase_filt"]
-    base_detail_df = upstream["base_detail_df"]
-    vendor_summary = upstream["vendor_summary"]
 
-    cache = {
-        "total_purchase_amount_all": float(purchase_filt["進貨金額"].sum()) if (not purchase_filt.empty and "進貨金額" in purchase_filt.columns) else 0.0,
-        "total_purchase_amount_map": None,
-        "total_stock_amount_all": _compute_total_stock_amount(base_detail_df, shared_tables),
-        "total_stock_amount_map": {},
-        "vendor_summary_map": None,
-        "purchase_filt_map": {},
-        "detail_df_map": {},
-        "detail_display_map": {},
-    }
-    cache_root[signature] = cache
-    return cache
+def _analysis_cached(signature, part: tuple, build):
+    key = (signature, *part)
+    cached = vm_cache_get("analysis_page", key, max_entries=_ANALYSIS_PAGE_CACHE_ENTRIES)
+    if cached is not None:
+        return cached
+    return vm_cache_set("analysis_page", key, build(), max_entries=_ANALYSIS_PAGE_CACHE_ENTRIES)
+
+
+def _get_analysis_page_totals(signature, upstream: dict, shared_tables: dict[str, pd.DataFrame]) -> dict:
+    def _build():
+        purchase_filt = upstream["purchase_filt"]
+        return {
+            "total_purchase_amount_all": float(purchase_filt["進貨金額"].sum()) if (not purchase_filt.empty and "進貨金額" in purchase_filt.columns) else 0.0,
+            "total_stock_amount_all": _compute_total_stock_amount(upstream["base_detail_df"], shared_tables),
+        }
 
+    return _analysis_cached(signature, ("totals",), _build)
 
-def _get_analysis_vendor_purchase_df(cache: dict, purchase_filt: pd.DataFrame, selected_vendor: str):
+
+def _get_analysis_vendor_purchase_df(signature, purchase_filt: pd.DataFrame, selected_vendor: str, group_index: dict):
     if selected_vendor == ALL_VENDORS:
         return purchase_filt
-    purchase_map = cache["purchase_filt_map"]
-    if selected_vendor not in purchase_map:
+
+    def _build():
         if purchase_filt.empty or "廠商" not in purchase_filt.columns:
-            purchase_map[selected_vendor] = pd.DataFrame()
-        else:
-            purchase_map[selected_vendor] = purchase_filt.loc[purchase_filt["廠商"].eq(selected_vendor)].copy()
-    return purchase_map[selected_vendor]
+            return pd.DataFrame()
+        return _take_by_group_index(purchase_filt, group_index, [("廠商", selected_vendor)])
+
+    return _analysis_cached(signature, ("purchase_filt", selected_vendor), _build)
 
 
-def _get_analysis_vendor_detail_df(cache: dict, base_detail_df: pd.DataFrame, selected_vendor: str):
+def _get_analysis_vendor_detail_df(signature, base_detail_df: pd.DataFrame, selected_vendor: str, group_index: dict):
     if selected_vendor == ALL_VENDORS:
         return base_detail_df
-    detail_map = cache["detail_df_map"]
-    if selected_vendor not in detail_map:
-        if base_detail_df.empty or "廠商" not in base_detail_df.columns:
-            detail_map[selected_vendor] = pd.DataFrame()
-        else:
-            detail_map[selected_vendor] = base_detail_df.loc[base_detail_df["廠商"].eq(selected_vendor)].copy()
-    return detail_map[selected_vendor]
 
+    def _build():
+        if base_detail_df.empty or "廠商" not in base_detail_df.columns:
+            return pd.DataFrame()
+        return _take_by_group_index(base_detail_df, group_index, [("廠商", selected_vendor)])
 
+    return _analysis_cached(signature, ("detail_df", selected_vendor), _build)
 
 
-def _get_analysis_vendor_purchase_total(cache: dict, purchase_filt: pd.DataFrame, selected_vendor: str):
-    if selected_vendor == ALL_VENDORS:
-        return cache["total_purchase_amount_all"]
-    total_purchase_amount_map = cache.get("total_purchase_amount_map")
-    if total_purchase_amount_map is None:
-        total_purchase_amount_map = {}
-        if not purchase_filt.empty and {"廠商", "進貨金額"}.issubset(purchase_filt.columns):
-            vendor_purchase_totals = (
-                purchase_filt.groupby("廠商", sort=False)["進貨金額"]
-                .sum()
-                .reset_index()
-            )
-            total_purchase_amount_map = dict(zip(vendor_purchase_totals["廠商"], vendor_purchase_totals["進貨金額"]))
-        cache["total_purchase_amount_map"] = total_purchase_amount_map
-    return float(total_purchase_amount_map.get(selected_vendor, 0.0))
+def _get_analysis_vendor_purchase_total(vendor_purchase_df: pd.DataFrame) -> float:
+    # vendor_purchase_df 已是單一廠商的進貨列，直接加總
+    if vendor_purchase_df.empty or "進貨金額" not in vendor_purchase_df.columns:
+        return 0.0
+    return float(vendor_purchase_df["進貨金額"].sum())
 
 
-def _get_analysis_vendor_summary(cache: dict, vendor_summary: pd.DataFrame, selected_vendor: str):
+def _get_analysis_vendor_summary(signature, vendor_summary: pd.DataFrame, selected_vendor: str):
     if selected_vendor == ALL_VENDORS:
         return vendor_summary
-    vendor_summary_map = cache.get("vendor_summary_map")
-    if vendor_summary_map is None:
-        vendor_summary_map = {}
-        if not vendor_summary.empty and "廠商" in vendor_summary.columns:
-            vendor_summary_map = {
-                str(vendor): group.reset_index(drop=True).copy()
-                for vendor, group in vendor_summary.groupby("廠商", sort=False)
-            }
-        cache["vendor_summary_map"] = vendor_summary_map
-    return vendor_summary_map.get(selected_vendor, pd.DataFrame())
-
-def _get_analysis_vendor_total_stock_amount(cache: dict, detail_df: pd.DataFrame, selected_vendor: str, shared_tables: dict[str, pd.DataFrame]):
-    if selected_vendor == ALL_VENDORS:
-        return cache["total_stock_amount_all"]
-    total_map = cache["total_stock_amount_map"]
-    if selected_vendor not in total_map:
-        total_map[selected_vendor] = _compute_total_stock_amount(detail_df, shared_tables)
-    return total_map[selected_vendor]
 
+    def _build():
+        if vendor_summary.empty or "廠商" not in vendor_summary.columns:
+            return pd.DataFrame()
+        mask = vendor_summary["廠商"].astype(str) == selected_vendor
+        return vendor_summary.loc[mask].reset_index(drop=True).copy()
+
+    return _analysis_cached(signature, ("vendor_summary", selected_vendor), _build)
 
-def _get_analysis_detail_frames(cache: dict, detail_df: pd.DataFrame, selected_vendor: str, display_mode: str, shared_tables: dict[str, pd.DataFrame] | None = None):
-    cache_key = (selected_vendor, display_mode)
-    display_map = cache["detail_display_map"]
-    if cache_key not in display_map:
+
+def _get_analysis_vendor_total_stock_amount(signature, detail_df: pd.DataFrame, selected_vendor: str, shared_tables: dict[str, pd.DataFrame]):
+    return _analysis_cached(
+        signature,
+        ("total_stock_amount", selected_vendor),
+        lambda: _compute_total_stock_amount(detail_df, shared_tables),
+    )
+
+
+def _get_analysis_detail_frames(signature, detail_df: pd.DataFrame, selected_vendor: str, display_mode: str, shared_tables: dict[str, pd.DataFrame] | None = None):
+    def _build():
         # Enrich with monetary amounts (庫存金額 / 叫貨金額)
         enriched = (
             _enrich_detail_df_with_stock_amount(detail_df, shared_tables)
@@ -830,8 +1083,9 @@ def _get_analysis_detail_frames(cache: dict, detail_df: pd.DataFrame, selected_v
         else:
             full_show_cols = [c for c in ["日期", "品項", "這次庫存", "這次叫貨"] if c in export_df.columns]
             show_df = export_df[full_show_cols].copy()
-        display_map[cache_key] = (export_df, show_df)
-    export_df, show_df = display_map[cache_key]
+        return (export_df, show_df)
+
+    export_df, show_df = _analysis_cached(signature, ("detail_frames", selected_vendor, display_mode), _build)
     return export_df, show_df
 
 
@@ -843,22 +1097,22 @@ def build_analysis_page_view_model(store_id: str, start: date, end: date, select
     base_detail_df = upstream["base_detail_df"]
     vendor_summary = upstream["vendor_summary"]
 
-    upstream_cache = st.session_state.get("_history_analysis_upstream_cache", {})
-    upstream_signature = upstream_cache.get("signature")
-    cache = _get_analysis_page_cache(upstream_signature, upstream, shared_tables)
+    upstream_signature = _history_analysis_upstream_signature(store_id, start, end)
+    totals = _get_analysis_page_totals(upstream_signature, upstream, shared_tables)
 
     if selected_vendor == ALL_VENDORS:
         detail_df = base_detail_df
-        total_purchase_amount = cache["total_purchase_amount_all"]
-        total_stock_amount = cache["total_stock_amount_all"]
-        export_df, show_df = _get_analysis_detail_frames(cache, detail_df, selected_vendor, display_mode, shared_tables)
+        total_purchase_amount = totals["total_purchase_amount_all"]
+        total_stock_amount = totals["total_stock_amount_all"]
+        export_df, show_df = _get_analysis_detail_frames(upstream_signature, detail_df, selected_vendor, display_mode, shared_tables)
     else:
-        purchase_filt = _get_analysis_vendor_purchase_df(cache, purchase_filt, selected_vendor)
-        detail_df = _get_analysis_vendor_detail_df(cache, base_detail_df, selected_vendor)
-        total_purchase_amount = _get_analysis_vendor_purchase_total(cache, purchase_filt, selected_vendor)
-        total_stock_amount = _get_analysis_vendor_total_stock_amount(cache, detail_df, selected_vendor, shared_tables)
-        vendor_summary = _get_analysis_vendor_summary(cache, vendor_summary, selected_vendor)
-        export_df, show_df = _get_analysis_detail_frames(cache, detail_df, selected_vendor, display_mode, shared_tables)
+        group_index = upstream["group_index"]
+        purchase_filt = _get_analysis_vendor_purchase_df(upstream_signature, purchase_filt, selected_vendor, group_index["purchase_filt"])
+        detail_df = _get_analysis_vendor_detail_df(upstream_signature, base_detail_df, selected_vendor, group_index["base_detail_df"])
+        total_purchase_amount = _get_analysis_vendor_purchase_total(purchase_filt)
+        total_stock_amount = _get_analysis_vendor_total_stock_amount(upstream_signature, detail_df, selected_vendor, shared_tables)
+        vendor_summary = _get_analysis_vendor_summary(upstream_signature, vendor_summary, selected_vendor)
+        export_df, show_df = _get_analysis_detail_frames(upstream_signature, detail_df, selected_vendor, display_mode, shared_tables)
 
     return {"hist_df": hist_df, "purchase_filt": purchase_filt, "vendor_options": vendor_options, "total_purchase_amount": total_purchase_amount, "total_stock_amount": total_stock_amount, "vendor_summary": vendor_summary, "detail_df": detail_df, "export_df": export_df, "show_df": show_df}
 
@@ -950,6 +1204,13 @@ def build_analysis_all_vendor_view(upstream: dict, shared_tables: dict[str, pd.D
     }
 
 
+def _upstream_group_index(upstream: dict, frame_key: str) -> dict:
+    group_index = upstream.get("group_index", {}).get(frame_key)
+    if group_index is None:
+        group_index = _build_frame_group_index(upstream.get(frame_key, pd.DataFrame()), ("廠商",))
+    return group_index
+
+
 def build_analysis_period_vendor_detail_view(upstream: dict, selected_vendor: str) -> dict:
     """Period mode – selected vendor: per-date monetary detail from vendor_summary.
     Columns: 日期 / 廠商 / 這次進貨金額 / 這次庫存金額
@@ -958,8 +1219,8 @@ def build_analysis_period_vendor_detail_view(upstream: dict, selected_vendor: st
     vendor_summary = upstream.get("vendor_summary", pd.DataFrame())
     if vendor_summary.empty or selected_vendor == ALL_VENDORS:
         return {"table_df": pd.DataFrame(), "total_purchase": 0.0, "total_stock": 0.0}
-    mask = vendor_summary["廠商"].astype(str).str.strip() == str(selected_vendor).strip()
-    filtered = vendor_summary.loc[mask].copy().sort_values("日期", ascending=False).reset_index(drop=True)
+    filtered = _take_by_group_index(vendor_summary, _upstream_group_index(upstream, "vendor_summary"), [("廠商", selected_vendor)])
+    filtered = filtered.sort_values("日期", ascending=False).reset_index(drop=True)
     if filtered.empty:
         return {"table_df": pd.DataFrame(), "total_purchase": 0.0, "total_stock": 0.0}
     table_df = filtered[["日期", "廠商", "進貨金額", "庫存金額"]].rename(
@@ -980,8 +1241,7 @@ def build_analysis_single_day_vendor_detail_view(upstream: dict, selected_vendor
     base_detail_df = upstream.get("base_detail_df", pd.DataFrame())
     if base_detail_df.empty or selected_vendor == ALL_VENDORS:
         return {"table_df": pd.DataFrame()}
-    mask = base_detail_df["廠商"].astype(str).str.strip() == str(selected_vendor).strip()
-    filtered = base_detail_df.loc[mask].copy()
+    filtered = _take_by_group_index(base_detail_df, _upstream_group_index(upstream, "base_detail_df"), [("廠商", selected_vendor)])
     if filtered.empty:
         return {"table_df": pd.DataFrame()}
     date_col = "日期顯示" if "日期顯示" in filtered.columns else "日期"
@@ -991,6 +1251,46 @@ def build_analysis_single_day_vendor_detail_view(upstream: dict, selected_vendor
     return {"table_df": table_df}
 
 
+def build_analysis_store_compare_view(store_ids: list[str], store_label_map: dict[str, str], start_date: date, end_date: date, shared_tables: dict[str, pd.DataFrame]) -> dict:
+    """各分店比較：多門市進銷存彙總一次計算（同時回填單店快取），再逐店加總金額。
+    Columns: 分店 / 品項數 / 進貨金額 / 庫存金額
+    Returns: {table_df, total_purchase, total_stock}
+    """
+    empty = {"table_df": pd.DataFrame(), "total_purchase": 0.0, "total_stock": 0.0}
+    store_ids = [str(s).strip() for s in (store_ids or []) if str(s).strip()]
+    if not store_ids:
+        return empty
+    summary_df = build_inventory_history_summary_multi_df(store_ids=store_ids, start_date=start_date, end_date=end_date)
+    if not summary_df.empty and "store_id" in summary_df.columns:
+        store_groups = {str(k): v for k, v in summary_df.groupby(summary_df["store_id"].astype(str).str.strip(), sort=False)}
+    else:
+        store_groups = {}
+
+    rows = []
+    for store_id in store_ids:
+        detail_df = _build_nonzero_detail_df(store_groups.get(store_id, pd.DataFrame()))
+        purchase_filt = _build_purchase_filtered_df(store_id=store_id, start_date=start_date, end_date=end_date)
+        purchase_amount = float(purchase_filt["進貨金額"].sum()) if not purchase_filt.empty and "進貨金額" in purchase_filt.columns else 0.0
+        stock_amount = float(_compute_total_stock_amount(detail_df, shared_tables)) if not detail_df.empty else 0.0
+        item_count = int(detail_df["item_id"].astype(str).str.strip().nunique()) if not detail_df.empty and "item_id" in detail_df.columns else 0
+        if item_count == 0 and purchase_amount == 0:
+            continue
+        rows.append({
+            "分店": store_label_map.get(store_id, store_id),
+            "品項數": item_count,
+            "進貨金額": round(purchase_amount, 1),
+            "庫存金額": round(stock_amount, 1),
+        })
+    if not rows:
+        return empty
+    table_df = pd.DataFrame(rows)
+    return {
+        "table_df": table_df,
+        "total_purchase": float(table_df["進貨金額"].sum()),
+        "total_stock": float(table_df["庫存金額"].sum()),
+    }
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 
 def resolve_history_filter_state(*, selected_vendor: str, previous_vendor: str, current_item_filter: str, item_options: list[str], default_item: str):
@@ -9,7 +9,9 @@ from analysis.logic.report_view_model import (
     build_analysis_all_vendor_view,
     build_analysis_period_vendor_detail_view,
     build_analysis_single_day_vendor_detail_view,
+    build_analysis_store_compare_view,
     build_analysis_upstream_data,
+    get_store_scope_options,
 )
 from ui_text import t
 
@@ -28,6 +30,13 @@ _PERIOD_VENDOR_CFG = {
     "這次庫存金額": st.column_config.NumberColumn(format="%.1f", width="small"),
 }
 
+_STORE_COMPARE_CFG = {
+    "分店": st.column_config.TextColumn(width="medium"),
+    "品項數": st.column_config.NumberColumn(format="%d", width="small"),
+    "進貨金額": st.column_config.NumberColumn(format="%.1f", width="small"),
+    "庫存金額": st.column_config.NumberColumn(format="%.1f", width="small"),
+}
+
 _SINGLE_VENDOR_CFG = {
     "日期": st.column_config.TextColumn(width="small"),
     "品項": st.column_config.TextColumn(width="medium"),
@@ -116,9 +125,33 @@ def _render_period_mode():
         else:
             render_report_dataframe(detail["table_df"], column_config=_PERIOD_VENDOR_CFG)
 
+    _render_store_compare(start, end, shared_tables)
     _back_to_landing()
 
 
+def _render_store_compare(start, end, shared_tables):
+    """管理者可看的各分店比較；只有一間可選門市時不顯示，展開後才計算。"""
+    store_ids, store_label_map = get_store_scope_options(
+        shared_tables,
+        str(st.session_state.get("store_id", "")).strip(),
+        str(st.session_state.get("store_name", "")).strip(),
+        str(st.session_state.get("login_role_id", "")).strip(),
+    )
+    if len(store_ids) <= 1:
+        return
+    st.markdown("---")
+    if not st.toggle("🏬 各分店比較", key="ana_p_store_compare"):
+        return
+    view = build_analysis_store_compare_view(store_ids, store_label_map, start, end, shared_tables)
+    c_m1, c_m2 = st.columns(2)
+    c_m1.metric(t("metric_total_purchase"), f"{view['total_purchase']:,.1f}")
+    c_m2.metric(t("metric_total_stock"), f"{view['total_stock']:,.1f}")
+    if view["table_df"].empty:
+        st.info(t("current_condition_no_amount"))
+    else:
+        render_report_dataframe(view["table_df"], column_config=_STORE_COMPARE_CFG)
+
+
 # ── 單日模式 ─────────────────────────────────────────────────────────────────
 
 def _render_single_day_mode():
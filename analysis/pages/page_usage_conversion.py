@@ -1,30 +1,47 @@
 """使用量換算頁面。
 
 上傳外送平台銷售報表 → 左欄顯示銷售明細 → 右欄顯示換算結果。
+一次上傳多份報表（或 zip）時改為批次模式：依期間合併顯示原料用量。
 """
 from __future__ import annotations
 
 import streamlit as st
 
-from analysis.logic.logic_usage_conversion import process_report
+from analysis.logic.logic_usage_conversion import (
+    BATCH_GROUP_MONTH,
+    BATCH_GROUP_PERIOD,
+    process_report,
+    process_reports_batch,
+)
+
+_BATCH_GROUP_LABELS = {
+    BATCH_GROUP_PERIOD: "依報表區間",
+    BATCH_GROUP_MONTH: "依月份",
+}
 
 
 def page_usage_conversion():
     st.title("📋 使用量換算")
 
-    uploaded = st.file_uploader(
+    uploaded_files = st.file_uploader(
         "上傳外送平台銷售報表",
-        type=["xlsx"],
+        type=["xlsx", "zip"],
+        accept_multiple_files=True,
         key="usage_upload",
         label_visibility="collapsed",
     )
 
-    if not uploaded:
+    if not uploaded_files:
         st.caption("請上傳 report_UberEats_YYYYMMDD_YYYYMMDD.xlsx 或 report_foodpanda_YYYYMMDD_YYYYMMDD.xlsx")
+        st.caption("可一次選多份報表或上傳 zip，依期間合併換算")
+        return
+
+    if len(uploaded_files) > 1 or uploaded_files[0].name.lower().endswith(".zip"):
+        _render_batch(uploaded_files)
         return
 
     try:
-        result = process_report(uploaded)
+        result = process_report(uploaded_files[0])
     except Exception as e:
         st.error(f"處理報表時發生錯誤：{e}")
         return
@@ -61,6 +78,55 @@ def page_usage_conversion():
             return
 
         st.subheader(f"換算結果（{len(rdf)} 項）")
-        display = rdf[["item_name", "display_qty", "display_unit"]].copy()
-        display.columns = ["品項名稱", "數量", "單位"]
-        st.dataframe(display, use_container_width=True, hide_index=True, height=500)
+        _show_usage_table(rdf, height=500)
+
+
+def _show_usage_table(rdf, *, height: int = 400):
+    display = rdf[["item_name", "display_qty", "display_unit"]].copy()
+    display.columns = ["品項名稱", "數量", "單位"]
+    st.dataframe(display, use_container_width=True, hide_index=True, height=height)
+
+
+def _render_batch(uploaded_files):
+    group_by = st.radio(
+        "合併方式",
+        options=list(_BATCH_GROUP_LABELS),
+        format_func=_BATCH_GROUP_LABELS.get,
+        horizontal=True,
+        key="usage_batch_group_by",
+    )
+
+    with st.spinner("換算中..."):
+        result = process_reports_batch(uploaded_files, group_by=group_by)
+
+    for failed in result.get("failed", []):
+        st.warning(f"⚠ {failed['filename']}：{failed['error']}")
+    if result.get("error"):
+        st.error(result["error"])
+        return
+
+    periods = result.get("periods", [])
+    report_count = sum(p["report_count"] for p in periods)
+    st.info(f"共 {report_count} 份報表　｜　{len(periods)} 個期間")
+    if group_by == BATCH_GROUP_MONTH and any("~" in p["period"] for p in periods):
+        st.caption("跨月的報表只有整段合計、無法按日拆開，另列為月份範圍，不併入單月")
+
+    total_df = result.get("total_df")
+    st.subheader("全部期間合計")
+    if total_df is None or total_df.empty:
+        st.info("無可換算的品項")
+    else:
+        _show_usage_table(total_df)
+
+    for period in periods:
+        rdf = period["result_df"]
+        title = f"{period['period']}（{' / '.join(period['platforms'])}，{period['report_count']} 份）"
+        with st.expander(title, expanded=len(periods) == 1):
+            if rdf is None or rdf.empty:
+                st.info("無可換算的品項")
+            else:
+                _show_usage_table(rdf, height=300)
+            unmatched = period.get("unmatched", [])
+            if unmatched:
+                st.warning(f"⚠ 尚未有轉換資料（{len(unmatched)} 項）")
+                st.caption("、".join(unmatched))
@@ -12,11 +12,17 @@ from analysis.logic.report_view_model import (
     ALL_VENDORS,
     DISPLAY_MODE_FULL,
     DISPLAY_MODE_MOBILE,
+    build_export_file,
+    build_export_filter_options,
+    build_export_preview,
     build_export_view_model,
+    discard_export_file,
     format_mmdd_column,
     get_store_scope_options,
+    read_export_file,
     short_item_name,
 )
+from shared.utils.utils_export import EXPORT_DOWNLOAD_MAX_BYTES, EXPORT_FORMAT_CSV, EXPORT_FORMAT_XLSX
 from ui_text import t
 
 
@@ -39,7 +45,60 @@ def download_csv_block(preview, filename: str):
     render_report_dataframe(preview)
 
 
-def select_export_store(key: str):
+def export_format_selector(key: str) -> str:
+    return st.radio(
+        t("label_export_format"),
+        options=[EXPORT_FORMAT_CSV, EXPORT_FORMAT_XLSX],
+        format_func=lambda x: x.upper(),
+        horizontal=True,
+        key=key,
+    )
+
+
+def download_export_file_block(export_type: str, store_targets: list[tuple[str, str]], start, end, selected_vendor: str, selected_item: str, shared_tables, file_format: str):
+    """按下才串流產生匯出檔；session 只保留暫存檔物件與下載網址，下載時由靜態檔路由逐段送出。"""
+    signature = (export_type, tuple(store_targets), str(start), str(end), selected_vendor, selected_item, file_format)
+    state = st.session_state.get("_export_file_state")
+    if isinstance(state, dict) and state.get("signature") != signature:
+        discard_export_file(state)
+        st.session_state.pop("_export_file_state", None)
+        state = None
+
+    if st.button(t("prepare_export_file"), use_container_width=True, key="prepare_export_file"):
+        if state is not None:
+            discard_export_file(state)
+        export = build_export_file(export_type, store_targets, start, end, selected_vendor, selected_item, shared_tables, file_format)
+        state = {"signature": signature, **export}
+        st.session_state["_export_file_state"] = state
+
+    if state is None:
+        return
+    if state["row_count"] <= 0:
+        st.info(t("no_export_data"))
+        return
+    st.caption(t("export_file_rows").format(rows=state["row_count"]))
+    if state.get("url"):
+        st.link_button(t("download_export_file"), state["url"], use_container_width=True)
+        return
+    if state["size"] > EXPORT_DOWNLOAD_MAX_BYTES:
+        st.warning(t("export_file_too_large").format(mb=EXPORT_DOWNLOAD_MAX_BYTES // (1024 * 1024)))
+        return
+    export_file = state["file"]
+    st.download_button(
+        t("download_export_file"),
+        lambda: read_export_file(export_file),
+        file_name=state["filename"],
+        mime=state["mime"],
+        use_container_width=True,
+        key="download_export_file",
+    )
+
+
+_ALL_STORES_OPTION = "__all_stores__"
+
+
+def select_export_store_targets(key: str) -> list[tuple[str, str]]:
+    """回傳要匯出的 [(store_id, 分店名稱)]；可看多間分店時多一個「全部分店」選項。"""
     shared_tables = load_report_shared_tables()
     store_ids, store_label_map = get_store_scope_options(
         shared_tables,
@@ -48,17 +107,20 @@ def select_export_store(key: str):
         str(st.session_state.get("login_role_id", "")).strip(),
     )
     if not store_ids:
-        return "", ""
+        return []
+    options = ([_ALL_STORES_OPTION] if len(store_ids) > 1 else []) + store_ids
     current_store_id = str(st.session_state.get("store_id", "")).strip()
-    default_index = store_ids.index(current_store_id) if current_store_id in store_ids else 0
-    selected_store_id = st.selectbox(
+    default_index = options.index(current_store_id) if current_store_id in options else 0
+    selected = st.selectbox(
         t("select_store"),
-        options=store_ids,
+        options=options,
         index=default_index,
-        format_func=lambda x: store_label_map.get(x, x),
+        format_func=lambda x: t("all_stores") if x == _ALL_STORES_OPTION else store_label_map.get(x, x),
         key=key,
     )
-    return selected_store_id, store_label_map.get(selected_store_id, selected_store_id)
+    if selected == _ALL_STORES_OPTION:
+        return [(store_id, store_label_map.get(store_id, store_id)) for store_id in store_ids]
+    return [(selected, store_label_map.get(selected, selected))]
 
 
 __all__ = [
@@ -66,15 +128,19 @@ __all__ = [
     "ALL_VENDORS",
     "DISPLAY_MODE_FULL",
     "DISPLAY_MODE_MOBILE",
+    "build_export_filter_options",
+    "build_export_preview",
     "build_export_view_model",
     "date",
     "display_mode_selector",
     "download_csv_block",
+    "download_export_file_block",
+    "export_format_selector",
     "format_mmdd_column",
     "get_store_scope_options",
     "load_report_shared_tables",
     "render_report_dataframe",
-    "select_export_store",
+    "select_export_store_targets",
     "short_item_name",
     "st",
     "t",
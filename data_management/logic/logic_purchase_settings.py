@@ -4,8 +4,16 @@ from datetime import date
 
 import pandas as pd
 
+from shared.services.data_backend import get_table_versions
+from shared.services.service_item_search import (
+    ItemSearchIndex,
+    build_item_search_index,
+    get_item_search_index,
+    normalize_search_text,
+)
+from shared.services.view_model_cache import vm_cache_get, vm_cache_set
 from shared.utils.common_helpers import _norm
-from shared.utils.utils_format import unit_label
+from shared.utils.utils_format import unit_label, unit_label_series
 from data_management.services.service_purchase import (
     PurchaseServiceError,
     create_item,
@@ -29,6 +37,13 @@ from data_management.services.service_purchase import (
     update_vendor,
     revert_latest_price,
 )
+from data_management.services.service_master_import import (
+    apply_import_plan,
+    build_import_plan,
+    build_import_template,
+    import_plan_frames,
+    read_import_files,
+)
 
 
 __all__ = [
@@ -54,24 +69,61 @@ __all__ = [
     "submit_create_unit_conversion",
     "submit_update_unit_conversion",
     "submit_revert_latest_price",
+    "build_master_import_preview",
+    "get_master_import_template",
+    "submit_master_import",
 ]
 
 
+_ACTIVE_TEXTS = ["true", "1", "yes", "y"]
+
+# 選項字典 / 顯示表依資料表版本快取；Streamlit 每次 rerun 直接重用
+_CONTEXT_CACHE = "purchase_settings_context"
+_CONTEXT_CACHE_ENTRIES = 24
+
+_VENDOR_CONTEXT_TABLES = ("vendors", "brands")
+_UNIT_CONTEXT_TABLES = ("units", "brands")
+_ITEM_CONTEXT_TABLES = ("items", "vendors", "units", "brands")
+_ITEM_PICKER_TABLES = ("items", "vendors", "units")
+
+
 def bool_text(v) -> str:
     text = str(v).strip().lower()
     return "啟用" if text in {"true", "1", "yes", "y"} else "停用"
 
 
-def vendor_label_from_row(r: pd.Series) -> str:
-    return _norm(r.get("vendor_name_zh")) or _norm(r.get("vendor_name"))
+def _text_column(df: pd.DataFrame, col: str) -> pd.Series:
+    """欄位轉成去空白字串（空值 → 空字串）；欄位不存在時回傳整欄空字串。"""
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[col].astype("string").str.strip().fillna("").astype(object)
+
+
+def _first_text(df: pd.DataFrame, cols: list[str]) -> pd.Series:
+    """依序取第一個非空白的欄位值。"""
+    out = pd.Series("", index=df.index, dtype=object)
+    for col in reversed(cols):
+        text = _text_column(df, col)
+        out = text.where(text != "", out)
+    return out
 
 
-def unit_label_from_row(r: pd.Series) -> str:
-    return _norm(r.get("unit_name_zh")) or _norm(r.get("unit_name"))
+def _bool_text_column(df: pd.DataFrame, col: str = "is_active") -> pd.Series:
+    active = _text_column(df, col).str.lower().isin(_ACTIVE_TEXTS)
+    return active.map({True: "啟用", False: "停用"}).astype(object)
 
 
-def item_label_from_row(r: pd.Series) -> str:
-    return _norm(r.get("item_name_zh")) or _norm(r.get("item_name"))
+def _option_map(labels: pd.Series, values: pd.Series) -> dict[str, str]:
+    # 與逐列建 dict 相同：標籤重複時以最後一筆為準
+    return dict(zip(labels.tolist(), values.tolist()))
+
+
+def _cached_context(kind: str, tables: tuple[str, ...], args: tuple, build):
+    signature = (kind, args, get_table_versions(tables))
+    hit = vm_cache_get(_CONTEXT_CACHE, signature, max_entries=_CONTEXT_CACHE_ENTRIES)
+    if hit is not None:
+        return hit
+    return vm_cache_set(_CONTEXT_CACHE, signature, build(), max_entries=_CONTEXT_CACHE_ENTRIES)
 
 
 def fmt_price_1(v) -> str:
@@ -99,28 +151,28 @@ def filter_items_by_vendor(items_df: pd.DataFrame, vendor_id: str) -> pd.DataFra
 def build_vendor_options(vendors_df: pd.DataFrame) -> dict[str, str]:
     if vendors_df.empty:
         return {}
-    return {vendor_label_from_row(r): _norm(r.get("vendor_id")) for _, r in vendors_df.iterrows()}
+    return _option_map(_first_text(vendors_df, ["vendor_name_zh", "vendor_name"]), _text_column(vendors_df, "vendor_id"))
 
 
 def build_unit_options(units_df: pd.DataFrame) -> dict[str, str]:
     if units_df.empty:
         return {}
-    return {
-        unit_label_from_row(r): _norm(r.get("unit_name_zh") or r.get("unit_name") or r.get("unit_id"))
-        for _, r in units_df.iterrows()
-    }
+    return _option_map(
+        _first_text(units_df, ["unit_name_zh", "unit_name"]),
+        _first_text(units_df, ["unit_name_zh", "unit_name", "unit_id"]),
+    )
 
 
 def build_unit_id_options(units_df: pd.DataFrame) -> dict[str, str]:
     if units_df.empty:
         return {}
-    return {unit_label_from_row(r): _norm(r.get("unit_id")) for _, r in units_df.iterrows()}
+    return _option_map(_first_text(units_df, ["unit_name_zh", "unit_name"]), _text_column(units_df, "unit_id"))
 
 
 def build_item_options(items_df: pd.DataFrame) -> dict[str, str]:
     if items_df.empty:
         return {}
-    return {item_label_from_row(r): _norm(r.get("item_id")) for _, r in items_df.iterrows()}
+    return _option_map(_first_text(items_df, ["item_name_zh", "item_name"]), _text_column(items_df, "item_id"))
 
 
 def filter_active_rows(df: pd.DataFrame) -> pd.DataFrame:
@@ -141,7 +193,7 @@ def build_vendor_display_df(vendors_df: pd.DataFrame, show_inactive: bool) -> pd
             "聯絡人": view_df.get("contact_name", ""),
             "電話": view_df.get("phone", ""),
             "LINE": view_df.get("line_id", ""),
-            "狀態": view_df.get("is_active", "").apply(bool_text),
+            "狀態": _bool_text_column(view_df),
         }
     )
 
@@ -157,37 +209,67 @@ def build_unit_display_df(units_df: pd.DataFrame, show_inactive: bool) -> pd.Dat
             "單位名稱": view_df["unit_name_zh"].replace("", pd.NA).fillna(view_df["unit_name"]),
             "符號": view_df.get("unit_symbol", ""),
             "類型": view_df.get("unit_type", ""),
-            "狀態": view_df.get("is_active", "").apply(bool_text),
+            "狀態": _bool_text_column(view_df),
         }
     )
 
 
-def build_item_display_df(items_df: pd.DataFrame, search_text: str, show_inactive: bool) -> pd.DataFrame:
-    view_df = items_df.copy()
-    keyword = _norm(search_text).lower()
-    if keyword:
-        name_zh = view_df.get("item_name_zh", pd.Series(dtype=str)).astype(str).str.lower()
-        name_en = view_df.get("item_name", pd.Series(dtype=str)).astype(str).str.lower()
-        view_df = view_df[name_zh.str.contains(keyword, na=False) | name_en.str.contains(keyword, na=False)]
-    if not show_inactive:
-        view_df = filter_active_rows(view_df)
-    if view_df.empty:
-        return pd.DataFrame()
+def _build_item_display_frame(view_df: pd.DataFrame) -> pd.DataFrame:
+    orderable = _text_column(view_df, "orderable_units")
     return pd.DataFrame(
         {
             "品項名稱": view_df["item_name_zh"].replace("", pd.NA).fillna(view_df["item_name"]),
             "分類": view_df.get("category", ""),
-            "基準單位": view_df.get("base_unit", "").apply(unit_label),
-            "庫存單位": view_df.get("default_stock_unit", "").apply(unit_label),
-            "叫貨單位": view_df.get("default_order_unit", "").apply(unit_label),
-            "可叫貨單位": view_df.get("orderable_units", "").apply(
-                lambda x: "、".join(unit_label(v.strip()) for v in str(x or "").split(",") if v.strip())
+            "基準單位": unit_label_series(view_df.get("base_unit", "")),
+            "庫存單位": unit_label_series(view_df.get("default_stock_unit", "")),
+            "叫貨單位": unit_label_series(view_df.get("default_order_unit", "")),
+            "可叫貨單位": orderable.map(
+                lambda x: "、".join(unit_label(v.strip()) for v in x.split(",") if v.strip())
             ),
-            "狀態": view_df.get("is_active", "").apply(bool_text),
+            "狀態": _bool_text_column(view_df),
         }
     )
 
 
+def _item_positions_by_id(items_df: pd.DataFrame) -> dict[str, int]:
+    # 同一 item_id 重複時保留第一列
+    positions: dict[str, int] = {}
+    for pos, item_id in enumerate(_text_column(items_df, "item_id").tolist()):
+        positions.setdefault(item_id, pos)
+    return positions
+
+
+def _select_item_display_rows(base: dict, search_text: str, show_inactive: bool, index: ItemSearchIndex) -> pd.DataFrame:
+    """
+    由快取的完整顯示表取出搜尋結果，不重掃 DataFrame。
+    有關鍵字時依相符程度排序，同分維持原列順序；沒有關鍵字時顯示全部。
+    """
+    if normalize_search_text(search_text):
+        ranked = index.rank(search_text)
+        positions_by_id = base["positions_by_id"]
+        hits = sorted((score, positions_by_id[item_id]) for item_id, score in ranked.items() if item_id in positions_by_id)
+        positions = [pos for _, pos in hits]
+    else:
+        positions = list(range(len(base["active_mask"])))
+    if not show_inactive:
+        active = base["active_mask"]
+        positions = [pos for pos in positions if active[pos]]
+    if not positions:
+        return pd.DataFrame()
+    return base["display_all"].iloc[positions]
+
+
+def build_item_display_df(items_df: pd.DataFrame, search_text: str, show_inactive: bool) -> pd.DataFrame:
+    if items_df.empty:
+        return pd.DataFrame()
+    base = {
+        "positions_by_id": _item_positions_by_id(items_df),
+        "active_mask": _text_column(items_df, "is_active").str.lower().isin(_ACTIVE_TEXTS).tolist(),
+        "display_all": _build_item_display_frame(items_df),
+    }
+    return _select_item_display_rows(base, search_text, show_inactive, build_item_search_index(items_df))
+
+
 def build_price_display_df(prices_df: pd.DataFrame) -> pd.DataFrame:
     if prices_df.empty:
         return pd.DataFrame()
@@ -195,9 +277,9 @@ def build_price_display_df(prices_df: pd.DataFrame) -> pd.DataFrame:
         {
             "生效日期": prices_df.get("effective_date", ""),
             "單價": prices_df.get("unit_price", ""),
-            "單位": prices_df.get("price_unit", "").apply(unit_label),
+            "單位": unit_label_series(prices_df.get("price_unit", "")),
             "結束日期": prices_df.get("end_date", ""),
-            "狀態": prices_df.get("is_active", "").apply(bool_text),
+            "狀態": _bool_text_column(prices_df),
         }
     )
 
@@ -207,11 +289,9 @@ def build_conversion_display_df(conv_df: pd.DataFrame) -> pd.DataFrame:
         return pd.DataFrame()
     return pd.DataFrame(
         {
-            "換算": conv_df.apply(
-                lambda r: f"1{unit_label(r.get('from_unit'))} = {_norm(r.get('ratio'))}{unit_label(r.get('to_unit'))}",
-                axis=1,
-            ),
-            "狀態": conv_df.get("is_active", "").apply(bool_text),
+            "換算": "1" + unit_label_series(conv_df["from_unit"]) + " = "
+            + conv_df["ratio"].map(_norm) + unit_label_series(conv_df["to_unit"]),
+            "狀態": _bool_text_column(conv_df),
         }
     )
 
@@ -260,92 +340,124 @@ def get_row_by_id(df: pd.DataFrame, id_column: str, value: str) -> pd.Series:
 
 
 def build_vendor_context(show_inactive: bool = False) -> dict:
-    vendors_df = list_vendors()
-    brand_labels, brand_map = normalize_brand_options()
-    return {
-        "vendors_df": vendors_df,
-        "brand_keys": brand_labels,
-        "brand_map": brand_map,
-        "vendor_options": build_vendor_options(vendors_df),
-        "display_df": build_vendor_display_df(vendors_df, show_inactive=show_inactive),
-    }
+    def _build() -> dict:
+        vendors_df = list_vendors()
+        brand_labels, brand_map = normalize_brand_options()
+        return {
+            "vendors_df": vendors_df,
+            "brand_keys": brand_labels,
+            "brand_map": brand_map,
+            "vendor_options": build_vendor_options(vendors_df),
+            "display_df": build_vendor_display_df(vendors_df, show_inactive=show_inactive),
+        }
+
+    return _cached_context("vendor", _VENDOR_CONTEXT_TABLES, (bool(show_inactive),), _build)
 
 
 def build_unit_context(show_inactive: bool = False) -> dict:
-    units_df = list_units()
-    brand_labels, brand_map = normalize_brand_options()
-    return {
-        "units_df": units_df,
-        "brand_keys": brand_labels,
-        "brand_map": brand_map,
-        "unit_options": build_unit_id_options(units_df),
-        "display_df": build_unit_display_df(units_df, show_inactive=show_inactive),
-    }
+    def _build() -> dict:
+        units_df = list_units()
+        brand_labels, brand_map = normalize_brand_options()
+        return {
+            "units_df": units_df,
+            "brand_keys": brand_labels,
+            "brand_map": brand_map,
+            "unit_options": build_unit_id_options(units_df),
+            "display_df": build_unit_display_df(units_df, show_inactive=show_inactive),
+        }
+
+    return _cached_context("unit", _UNIT_CONTEXT_TABLES, (bool(show_inactive),), _build)
+
+
+def _get_item_tab_base(vendor_id: str) -> dict:
+    """品項頁同一供應商的選項與完整顯示表；搜尋字與停用篩選在取用時套用。"""
+    def _build() -> dict:
+        items_df = list_items()
+        vendors_df = list_active_vendors()
+        units_df = list_active_units()
+        brand_labels, brand_map = normalize_brand_options()
+        filtered_items_df = filter_items_by_vendor(items_df, vendor_id)
+        return {
+            "vendors_df": vendors_df,
+            "units_df": units_df,
+            "brand_keys": brand_labels,
+            "brand_map": brand_map,
+            "vendor_options": build_vendor_options(vendors_df),
+            "unit_options": build_unit_id_options(units_df),
+            "filtered_items_df": filtered_items_df,
+            "item_options": build_item_options(filtered_items_df),
+            "positions_by_id": _item_positions_by_id(filtered_items_df),
+            "active_mask": _text_column(filtered_items_df, "is_active").str.lower().isin(_ACTIVE_TEXTS).tolist(),
+            "display_all": _build_item_display_frame(filtered_items_df) if not filtered_items_df.empty else pd.DataFrame(),
+        }
+
+    return _cached_context("item", _ITEM_CONTEXT_TABLES, (_norm(vendor_id),), _build)
 
 
 def build_item_context(vendor_id: str, search_text: str = "", show_inactive: bool = False) -> dict:
-    items_df = list_items()
-    vendors_df = list_active_vendors()
-    units_df = list_active_units()
-    brand_labels, brand_map = normalize_brand_options()
-    filtered_items_df = filter_items_by_vendor(items_df, vendor_id)
+    base = _get_item_tab_base(vendor_id)
     return {
-        "vendors_df": vendors_df,
-        "units_df": units_df,
-        "brand_keys": brand_labels,
-        "brand_map": brand_map,
-        "vendor_options": build_vendor_options(vendors_df),
-        "unit_options": build_unit_id_options(units_df),
-        "filtered_items_df": filtered_items_df,
-        "item_options": build_item_options(filtered_items_df),
-        "display_df": build_item_display_df(filtered_items_df, search_text=search_text, show_inactive=show_inactive),
+        "vendors_df": base["vendors_df"],
+        "units_df": base["units_df"],
+        "brand_keys": base["brand_keys"],
+        "brand_map": base["brand_map"],
+        "vendor_options": base["vendor_options"],
+        "unit_options": base["unit_options"],
+        "filtered_items_df": base["filtered_items_df"],
+        "item_options": base["item_options"],
+        # 搜尋走 session 內的全品項索引（新增 / 修改品項時就地更新）
+        "display_df": _select_item_display_rows(base, search_text, show_inactive, get_item_search_index()),
     }
 
 
+def _build_item_picker_context(vendor_id: str) -> dict:
+    """價格 / 換算頁共用：先選供應商，再選該供應商的啟用品項。"""
+    def _build() -> dict:
+        vendors_df = list_active_vendors()
+        items_df = list_active_items()
+        units_df = list_active_units()
+        filtered_items_df = filter_items_by_vendor(items_df, vendor_id)
+        return {
+            "vendors_df": vendors_df,
+            "filtered_items_df": filtered_items_df,
+            "vendor_options": build_vendor_options(vendors_df),
+            "unit_options": build_unit_id_options(units_df),
+            "item_options": build_item_options(filtered_items_df),
+        }
+
+    return _cached_context("item_picker", _ITEM_PICKER_TABLES, (_norm(vendor_id),), _build)
+
+
 def build_price_context(vendor_id: str) -> dict:
-    vendors_df = list_active_vendors()
-    items_df = list_active_items()
-    units_df = list_active_units()
-    filtered_items_df = filter_items_by_vendor(items_df, vendor_id)
-    return {
-        "vendors_df": vendors_df,
-        "filtered_items_df": filtered_items_df,
-        "vendor_options": build_vendor_options(vendors_df),
-        "unit_options": build_unit_id_options(units_df),
-        "item_options": build_item_options(filtered_items_df),
-    }
+    return _build_item_picker_context(vendor_id)
 
 
 def build_price_item_context(item_id: str) -> dict:
-    prices_df = list_prices(item_id=item_id)
-    return {
-        "prices_df": prices_df,
-        "price_options": build_price_option_map(prices_df),
-        "display_df": build_price_display_df(prices_df),
-    }
+    def _build() -> dict:
+        prices_df = list_prices(item_id=item_id)
+        return {
+            "prices_df": prices_df,
+            "price_options": build_price_option_map(prices_df),
+            "display_df": build_price_display_df(prices_df),
+        }
+
+    return _cached_context("price_item", ("prices", "units"), (_norm(item_id),), _build)
 
 
 def build_unit_conversion_context(vendor_id: str) -> dict:
-    vendors_df = list_active_vendors()
-    items_df = list_active_items()
-    units_df = list_active_units()
-    filtered_items_df = filter_items_by_vendor(items_df, vendor_id)
-    return {
-        "vendors_df": vendors_df,
-        "filtered_items_df": filtered_items_df,
-        "vendor_options": build_vendor_options(vendors_df),
-        "unit_options": build_unit_id_options(units_df),
-        "item_options": build_item_options(filtered_items_df),
-    }
+    return _build_item_picker_context(vendor_id)
 
 
 def build_conversion_item_context(item_id: str) -> dict:
-    conv_df = list_unit_conversions(item_id=item_id)
-    return {
-        "conv_df": conv_df,
-        "conversion_options": build_conversion_option_map(conv_df),
-        "display_df": build_conversion_display_df(conv_df),
-    }
+    def _build() -> dict:
+        conv_df = list_unit_conversions(item_id=item_id)
+        return {
+            "conv_df": conv_df,
+            "conversion_options": build_conversion_option_map(conv_df),
+            "display_df": build_conversion_display_df(conv_df),
+        }
+
+    return _cached_context("conversion_item", ("unit_conversions", "units"), (_norm(item_id),), _build)
 
 
 def get_vendor_edit_values(vendors_df: pd.DataFrame, vendor_id: str, brand_map: dict[str, str]) -> dict:
@@ -531,3 +643,21 @@ def submit_create_unit_conversion(**payload):
 def submit_update_unit_conversion(**payload):
     validate_conversion_payload(payload)
     return update_unit_conversion(**payload)
+
+
+# ============================================================
+# 批次匯入
+# ============================================================
+def build_master_import_preview(files: list[tuple[str, bytes]]) -> dict:
+    """讀檔並乾跑檢查；回傳 tables（確認匯入時再用）、plan、各表差異 frames。"""
+    tables, fingerprint = read_import_files(files)
+    plan = build_import_plan(tables, fingerprint)
+    return {"tables": tables, "plan": plan, "frames": import_plan_frames(plan)}
+
+
+def get_master_import_template() -> bytes:
+    return build_import_template()
+
+
+def submit_master_import(preview: dict):
+    return apply_import_plan(preview["tables"], preview["plan"])
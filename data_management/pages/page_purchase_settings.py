@@ -2,7 +2,7 @@
 # ORIVIA OMS
 # 檔案：pages/page_purchase_settings.py
 # 說明：採購設定主入口頁
-# 功能：整合廠商、品項、價格、單位與單位換算五個子頁模組
+# 功能：整合廠商、品項、價格、單位、單位換算與批次匯入六個子頁模組
 # ============================================================
 
 """
@@ -14,6 +14,7 @@
 3. 價格管理
 4. 單位管理
 5. 單位換算
+6. 批次匯入（品項 / 價格 / 單位換算）
 
 本檔只保留主入口與頁籤切換。
 各子頁邏輯已拆到 pages/purchase_settings/ 內，方便後續獨立維護。
@@ -24,6 +25,7 @@ from __future__ import annotations
 import streamlit as st
 
 from shared.utils.permissions import require_permission
+from data_management.pages.purchase_settings.tab_import import _tab_import
 from data_management.pages.purchase_settings.tab_items import _tab_items
 from data_management.pages.purchase_settings.tab_prices import _tab_prices
 from data_management.pages.purchase_settings.tab_unit_conversions import _tab_unit_conversions
@@ -37,8 +39,8 @@ def page_purchase_settings():
     st.title("🛒 採購設定")
     st.caption("目前先以 item-only 模型管理主資料：廠商、品項、價格、單位、單位換算。")
 
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(
-        ["廠商管理", "品項管理", "價格管理", "單位管理", "單位換算"]
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(
+        ["廠商管理", "品項管理", "價格管理", "單位管理", "單位換算", "批次匯入"]
     )
 
     with tab1:
@@ -55,3 +57,6 @@ def page_purchase_settings():
 
     with tab5:
         _tab_unit_conversions()
+
+    with tab6:
+        _tab_import()
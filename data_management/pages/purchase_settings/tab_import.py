@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from data_management.logic import logic_purchase_settings as purchase_logic
+from .shared import _render_section_title, st
+
+_PREVIEW_KEY = "_master_import_preview"
+_TABLE_TITLES = {"items": "品項", "unit_conversions": "單位換算", "prices": "價格"}
+
+
+def _tab_import():
+    _render_section_title(
+        "批次匯入",
+        "上傳 XLSX（工作表 items / prices / unit_conversions）或 CSV，先預覽差異，確認後一次寫入。",
+    )
+    st.download_button(
+        "下載空白範本",
+        data=purchase_logic.get_master_import_template(),
+        file_name="master_import_template.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        key="master_import_template",
+    )
+
+    uploaded_files = st.file_uploader(
+        "選擇匯入檔",
+        type=["xlsx", "csv"],
+        accept_multiple_files=True,
+        key="master_import_upload",
+    )
+    if not uploaded_files:
+        st.session_state.pop(_PREVIEW_KEY, None)
+        return
+
+    upload_key = tuple((f.name, f.size) for f in uploaded_files)
+    state = st.session_state.get(_PREVIEW_KEY)
+    if not state or state.get("upload_key") != upload_key:
+        try:
+            preview = purchase_logic.build_master_import_preview([(f.name, f.getvalue()) for f in uploaded_files])
+        except purchase_logic.PurchaseServiceError as e:
+            st.session_state.pop(_PREVIEW_KEY, None)
+            st.error(str(e))
+            return
+        state = {"upload_key": upload_key, "preview": preview}
+        st.session_state[_PREVIEW_KEY] = state
+
+    preview = state["preview"]
+    plan = preview["plan"]
+    counts = plan.counts()
+    cols = st.columns(len(_TABLE_TITLES))
+    for col, (table, title) in zip(cols, _TABLE_TITLES.items()):
+        c = counts[table]
+        col.metric(title, f"新增 {c['新增']}｜更新 {c['更新']}", f"不變 {c['不變']}", delta_color="off")
+
+    for table, title in _TABLE_TITLES.items():
+        frame = preview["frames"][table]
+        if frame.empty:
+            continue
+        with st.expander(f"{title}（{len(frame)} 列）", expanded=table == "items"):
+            st.dataframe(frame, width="stretch", hide_index=True)
+
+    if plan.errors:
+        st.error("檢查未通過，請修正檔案後重新上傳：\n\n" + "\n".join(f"- {e}" for e in plan.errors))
+    if plan.warnings:
+        with st.expander(f"提醒（{len(plan.warnings)}）"):
+            st.markdown("\n".join(f"- {w}" for w in plan.warnings))
+    if not plan.errors and not plan.pending:
+        st.info("資料與系統相同，沒有需要寫入的內容")
+
+    if st.button("確認匯入", key="master_import_apply", disabled=not plan.can_apply, width="stretch"):
+        try:
+            with st.spinner("匯入中…"):
+                result = purchase_logic.submit_master_import(preview)
+        except purchase_logic.PurchaseServiceError as e:
+            st.session_state.pop(_PREVIEW_KEY, None)
+            st.error(str(e))
+            return
+        st.session_state.pop(_PREVIEW_KEY, None)
+        summary = "、".join(
+            f"{_TABLE_TITLES[t]} 新增 {c['新增']} / 更新 {c['更新']}" for t, c in result.items()
+        )
+        st.success(f"匯入完成：{summary}")
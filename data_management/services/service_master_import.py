@@ -0,0 +1,736 @@
+from __future__ import annotations
+
+# ============================================================
+# ORIVIA OMS
+# 檔案：data_management/services/service_master_import.py
+# 說明：主資料批次匯入（品項 / 價格 / 單位換算）
+# 功能：讀取 XLSX / CSV → 全部在記憶體內依 TABLE_CONTRACT 與既有單位換算圖檢查
+#       → 產生預覽差異（新增 / 更新 / 不變）→ 確認後一次配號、分批 upsert。
+# ============================================================
+
+"""
+匯入檔格式：
+
+- XLSX：工作表名稱為 items / prices / unit_conversions（或 品項 / 價格 / 單位換算）
+- CSV：每個檔案一張表，依欄位自動判斷是哪一張表
+
+欄位（* 為必填）：
+- items：item_id（留空為新增，或以品項名稱比對既有品項）、item_name_zh*、item_name、
+  category、spec、default_vendor*、base_unit*、default_stock_unit*、default_order_unit*、
+  orderable_units（逗號分隔，留空 = 預設叫貨單位）、is_active
+- prices：item*、unit_price*、price_unit*、effective_date*、is_active
+- unit_conversions：item*、from_unit*、to_unit*、ratio*、is_active
+
+廠商 / 單位 / 品項欄位可填 ID 或名稱；價格與換算可引用同一檔案內新增的品項名稱。
+"""
+
+import hashlib
+import io
+import math
+from dataclasses import dataclass, field
+from datetime import date
+
+import pandas as pd
+
+from data_management.services.service_purchase import (
+    PurchaseServiceError,
+    _backfill_price_end_dates_for_items,
+    _brand_id_or_default,
+    _db_value,
+    _normalize_multi_units,
+    _to_bool_num,
+    list_items,
+    list_units,
+    list_vendors,
+)
+from shared.services.data_backend import read_table, upsert_fields_by_primary_key, upsert_rows_by_primary_key
+from shared.services.service_id import allocate_ids_map
+from shared.services.table_contract import TABLE_CONTRACT
+from shared.utils.common_helpers import _norm, _now_ts, _safe_float
+from shared.utils.utils_units import build_item_unit_graphs, find_unit_factor
+
+IMPORT_TABLES: tuple[str, ...] = ("items", "unit_conversions", "prices")
+
+IMPORT_TEMPLATE_COLUMNS: dict[str, list[str]] = {
+    "items": [
+        "item_id", "item_name_zh", "item_name", "category", "spec", "default_vendor",
+        "base_unit", "default_stock_unit", "default_order_unit", "orderable_units", "is_active",
+    ],
+    "prices": ["item", "unit_price", "price_unit", "effective_date", "is_active"],
+    "unit_conversions": ["item", "from_unit", "to_unit", "ratio", "is_active"],
+}
+
+_SHEET_ALIASES: dict[str, str] = {
+    "items": "items",
+    "品項": "items",
+    "prices": "prices",
+    "價格": "prices",
+    "unit_conversions": "unit_conversions",
+    "conversions": "unit_conversions",
+    "單位換算": "unit_conversions",
+    "換算規則": "unit_conversions",
+}
+
+# 中文表頭對照（方便直接用中文欄名整理檔案）
+_COLUMN_ALIASES: dict[str, str] = {
+    "品項id": "item_id",
+    "品項名稱": "item_name_zh",
+    "系統名稱": "item_name",
+    "分類": "category",
+    "規格": "spec",
+    "供應商": "default_vendor",
+    "廠商": "default_vendor",
+    "default_vendor_id": "default_vendor",
+    "基準單位": "base_unit",
+    "庫存單位": "default_stock_unit",
+    "叫貨單位": "default_order_unit",
+    "預設叫貨單位": "default_order_unit",
+    "可叫貨單位": "orderable_units",
+    "狀態": "is_active",
+    "啟用": "is_active",
+    "品項": "item",
+    "item_id_or_name": "item",
+    "單價": "unit_price",
+    "價格單位": "price_unit",
+    "生效日期": "effective_date",
+    "來源單位": "from_unit",
+    "目標單位": "to_unit",
+    "比例": "ratio",
+}
+
+IMPORT_CHUNK_ROWS = 500
+
+ACTION_CREATE = "新增"
+ACTION_UPDATE = "更新"
+ACTION_UNCHANGED = "不變"
+
+_TRUE_TEXTS = {"1", "true", "yes", "y", "是", "啟用", "v"}
+_FALSE_TEXTS = {"0", "false", "no", "n", "否", "停用", "x"}
+_RATIO_TOLERANCE = 1e-6
+
+
+@dataclass
+class ImportChange:
+    table_name: str
+    row_no: int                 # 檔案中的列號（表頭為第 1 列）
+    action: str
+    key: str                    # 既有主鍵；新增時為空，寫入前才配號
+    label: str
+    record: dict                # 要寫入的欄位（不含新配的主鍵）
+    changes: dict = field(default_factory=dict)   # 欄位 -> (舊值, 新值)
+    new_item_ref: str = ""      # 價格 / 換算引用同檔新增品項時，記錄其正規化名稱
+
+
+@dataclass
+class ImportPlan:
+    fingerprint: str
+    changes: list[ImportChange]
+    errors: list[str]
+    warnings: list[str]
+
+    def counts(self) -> dict[str, dict[str, int]]:
+        out = {t: {ACTION_CREATE: 0, ACTION_UPDATE: 0, ACTION_UNCHANGED: 0} for t in IMPORT_TABLES}
+        for change in self.changes:
+            out[change.table_name][change.action] += 1
+        return out
+
+    @property
+    def pending(self) -> list[ImportChange]:
+        return [c for c in self.changes if c.action != ACTION_UNCHANGED]
+
+    @property
+    def can_apply(self) -> bool:
+        return not self.errors and bool(self.pending)
+
+    def signature(self) -> tuple:
+        """預覽與實際寫入時比對用：同樣的檔案、同樣的既有資料會得到同樣的簽章。"""
+        return tuple(
+            (c.table_name, c.row_no, c.action, c.key, tuple(sorted(c.changes)))
+            for c in self.changes
+        )
+
+
+# ============================================================
+# [I1] 讀檔
+# ============================================================
+def _clean_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and math.isnan(value):
+        return ""
+    if isinstance(value, (pd.Timestamp, date)):
+        return value.strftime("%Y-%m-%d")
+    text = str(value).strip()
+    # Excel 把整數讀成 1.0 時還原成 1
+    if text.endswith(".0") and text[:-2].lstrip("-").isdigit():
+        return text[:-2]
+    return text
+
+
+def _normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    columns = []
+    for col in df.columns:
+        key = _norm(col).lower()
+        columns.append(_COLUMN_ALIASES.get(key, key))
+    out = pd.DataFrame({col: [_clean_cell(v) for v in df.iloc[:, i].tolist()] for i, col in enumerate(columns)})
+    # 整列空白（常見於 Excel 尾端）不算資料
+    if out.empty:
+        return out
+    return out[(out != "").any(axis=1)]
+
+
+def _detect_table(columns) -> str:
+    cols = set(columns)
+    if {"from_unit", "to_unit"} <= cols:
+        return "unit_conversions"
+    if "unit_price" in cols:
+        return "prices"
+    if "item_name_zh" in cols:
+        return "items"
+    return ""
+
+
+def read_import_files(files: list[tuple[str, bytes]]) -> tuple[dict[str, pd.DataFrame], str]:
+    """
+    讀取上傳檔 [(檔名, 內容)]，回傳 ({table_name: DataFrame}, 指紋)。
+    DataFrame 全部為去空白字串，保留檔案列順序（index 從 0 起）。
+    """
+    tables: dict[str, list[pd.DataFrame]] = {}
+    hasher = hashlib.sha256()
+    for name, data in files:
+        hasher.update(name.encode("utf-8"))
+        hasher.update(data)
+        lower = name.lower()
+        if lower.endswith((".xlsx", ".xlsm")):
+            sheets = pd.read_excel(io.BytesIO(data), sheet_name=None, dtype=object, engine="openpyxl")
+            for sheet_name, raw in sheets.items():
+                frame = _normalize_frame(raw)
+                table = _SHEET_ALIASES.get(_norm(sheet_name).lower()) or _detect_table(frame.columns)
+                if table:
+                    tables.setdefault(table, []).append(frame)
+        elif lower.endswith(".csv"):
+            raw = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, encoding="utf-8-sig")
+            frame = _normalize_frame(raw)
+            table = _detect_table(frame.columns)
+            if not table:
+                raise PurchaseServiceError(f"{name}：無法判斷是品項、價格還是單位換算，請確認表頭")
+            tables.setdefault(table, []).append(frame)
+        else:
+            raise PurchaseServiceError(f"{name}：只支援 XLSX / CSV")
+    merged = {t: pd.concat(frames, ignore_index=True) for t, frames in tables.items()}
+    if not merged:
+        raise PurchaseServiceError("檔案內沒有 items / prices / unit_conversions 資料")
+    return merged, hasher.hexdigest()
+
+
+def build_import_template() -> bytes:
+    """空白範本（每張表一個工作表，只有表頭）。"""
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        for table, columns in IMPORT_TEMPLATE_COLUMNS.items():
+            pd.DataFrame(columns=columns).to_excel(writer, sheet_name=table, index=False)
+    return buffer.getvalue()
+
+
+# ============================================================
+# [I2] 既有資料查找
+# ============================================================
+def _text_values(df: pd.DataFrame, col: str) -> list[str]:
+    if df.empty or col not in df.columns:
+        return [""] * len(df)
+    return df[col].astype("string").str.strip().fillna("").tolist()
+
+
+def _lookup_map(df: pd.DataFrame, id_col: str, name_cols: list[str]) -> dict[str, str]:
+    """ID 與各名稱欄位（小寫）→ ID；ID 優先，名稱重複時以第一筆為準。"""
+    if df.empty or id_col not in df.columns:
+        return {}
+    ids = _text_values(df, id_col)
+    out: dict[str, str] = {}
+    for col in name_cols:
+        for name, value in zip(_text_values(df, col), ids):
+            if name and value:
+                out.setdefault(name.lower(), value)
+    for value in ids:
+        if value:
+            out[value.lower()] = value
+    return out
+
+
+def _parse_bool(text: str, default: bool) -> bool | None:
+    value = _norm(text).lower()
+    if not value:
+        return default
+    if value in _TRUE_TEXTS:
+        return True
+    if value in _FALSE_TEXTS:
+        return False
+    return None
+
+
+def _parse_date(text: str) -> str:
+    value = _norm(text)
+    if not value:
+        return ""
+    parsed = pd.to_datetime(value, errors="coerce")
+    if pd.isna(parsed):
+        return ""
+    return parsed.strftime("%Y-%m-%d")
+
+
+def _same_value(old, new) -> bool:
+    old_text = "" if _db_value(old) is None else _norm(old)
+    new_text = "" if new is None else _norm(new)
+    if old_text == new_text:
+        return True
+    try:
+        return math.isclose(float(old_text), float(new_text), rel_tol=0, abs_tol=1e-9)
+    except ValueError:
+        return False
+
+
+def _same_field(field_name: str, old, new) -> bool:
+    # is_active 在 items 存布林、在 prices / unit_conversions 存 0/1，依語意比較
+    if field_name == "is_active":
+        return _parse_bool(_norm(_db_value(old) or ""), True) == _parse_bool(_norm(new), True)
+    return _same_value(old, new)
+
+
+def _diff_fields(existing: dict, record: dict, fields: list[str]) -> dict:
+    return {
+        f: (_db_value(existing.get(f)), record[f])
+        for f in fields
+        if f in record and not _same_field(f, existing.get(f), record[f])
+    }
+
+
+def _unit_graph_add(graph: dict, from_unit: str, to_unit: str, ratio: float) -> None:
+    graph.setdefault(from_unit, []).append((to_unit, ratio))
+    graph.setdefault(to_unit, []).append((from_unit, 1 / ratio))
+
+
+def _unit_factor(graph: dict, from_unit: str, to_unit: str) -> float | None:
+    """1 from_unit = ? to_unit；沒有換算路徑回傳 None。"""
+    try:
+        return find_unit_factor(graph, "", from_unit, to_unit)
+    except ValueError:
+        return None
+
+
+# ============================================================
+# [I3] 建立預覽
+# ============================================================
+class _PlanBuilder:
+    def __init__(self, tables: dict[str, pd.DataFrame], fingerprint: str):
+        self.tables = tables
+        self.plan = ImportPlan(fingerprint=fingerprint, changes=[], errors=[], warnings=[])
+
+        self.items_df = list_items()
+        self.vendor_lookup = _lookup_map(list_vendors(), "vendor_id", ["vendor_name_zh", "vendor_name"])
+        self.unit_lookup = _lookup_map(list_units(), "unit_id", ["unit_name_zh", "unit_name", "unit_symbol"])
+        self.item_lookup = _lookup_map(self.items_df, "item_id", ["item_name_zh"])
+        self.items_by_id = {
+            _norm(r.get("item_id")): r
+            for r in self.items_df.to_dict("records")
+        } if not self.items_df.empty else {}
+
+        self.prices_df = read_table("prices")
+        self.conversions_df = read_table("unit_conversions")
+        # 同檔新增的品項：正規化名稱 -> 基準單位
+        self.new_items: dict[str, str] = {}
+        # 品項 key（既有 item_id 或 "new:<名稱>"）-> 換算圖
+        self.graphs: dict[str, dict] = {}
+        self.item_rows: list[tuple[int, str, dict]] = []
+
+    # ---------- 共用 ----------
+    def error(self, table: str, row_no: int, message: str) -> None:
+        self.plan.errors.append(f"{table} 第 {row_no} 列：{message}")
+
+    def warn(self, table: str, row_no: int, message: str) -> None:
+        self.plan.warnings.append(f"{table} 第 {row_no} 列：{message}")
+
+    def resolve_unit(self, text: str) -> str:
+        return self.unit_lookup.get(_norm(text).lower(), "")
+
+    def resolve_item(self, text: str) -> tuple[str, str]:
+        """回傳 (既有 item_id, 同檔新增品項的名稱 key)；兩者皆空代表找不到。"""
+        key = _norm(text).lower()
+        if key in self.new_items:
+            return "", key
+        return self.item_lookup.get(key, ""), ""
+
+    def graph_for(self, item_id: str, new_ref: str) -> dict:
+        graph_key = item_id or f"new:{new_ref}"
+        if graph_key not in self.graphs:
+            self.graphs[graph_key] = {}
+        return self.graphs[graph_key]
+
+    def rows(self, table: str):
+        df = self.tables.get(table)
+        if df is None or df.empty:
+            return
+        missing = [c for c in IMPORT_TEMPLATE_COLUMNS[table] if c not in df.columns and c not in ("item_id",)]
+        required = {
+            "items": ["item_name_zh", "default_vendor", "base_unit", "default_stock_unit", "default_order_unit"],
+            "prices": ["item", "unit_price", "price_unit", "effective_date"],
+            "unit_conversions": ["item", "from_unit", "to_unit", "ratio"],
+        }[table]
+        missing_required = [c for c in required if c in missing]
+        if missing_required:
+            self.plan.errors.append(f"{table}：缺少欄位 {', '.join(missing_required)}")
+            return
+        for pos, row in enumerate(df.to_dict("records")):
+            yield pos + 2, {k: _norm(v) for k, v in row.items()}
+
+    # ---------- 換算圖 ----------
+    def load_existing_graphs(self) -> None:
+        # 以目前有效的換算規則建圖；新增的規則之後直接加進同一張圖
+        self.graphs.update(build_item_unit_graphs(self.conversions_df, as_of_date=date.today()))
+
+    # ---------- 品項 ----------
+    def build_items(self) -> None:
+        seen_names: set[str] = set()
+        default_brand = _brand_id_or_default("")
+        for row_no, row in self.rows("items"):
+            name_zh = row.get("item_name_zh", "")
+            if not name_zh:
+                self.error("items", row_no, "品項名稱不可空白")
+                continue
+            name_key = name_zh.lower()
+            if name_key in seen_names:
+                self.error("items", row_no, f"品項名稱「{name_zh}」在檔案內重複")
+                continue
+            seen_names.add(name_key)
+
+            vendor_id = self.vendor_lookup.get(row.get("default_vendor", "").lower(), "")
+            if not vendor_id:
+                self.error("items", row_no, f"找不到供應商「{row.get('default_vendor', '')}」")
+            units = {}
+            for col in ("base_unit", "default_stock_unit", "default_order_unit"):
+                units[col] = self.resolve_unit(row.get(col, ""))
+                if not units[col]:
+                    self.error("items", row_no, f"{col} 找不到單位「{row.get(col, '')}」")
+            orderable_texts = [t for t in row.get("orderable_units", "").replace("、", ",").split(",") if _norm(t)]
+            orderable = [self.resolve_unit(t) for t in orderable_texts]
+            for text, unit_id in zip(orderable_texts, orderable):
+                if not unit_id:
+                    self.error("items", row_no, f"可叫貨單位找不到「{_norm(text)}」")
+            if not orderable_texts and units["default_order_unit"]:
+                orderable = [units["default_order_unit"]]
+            orderable_text = _normalize_multi_units([u for u in orderable if u])
+            if units["default_order_unit"] and units["default_order_unit"] not in orderable_text.split(","):
+                self.error("items", row_no, "預設叫貨單位必須包含在可叫貨單位中")
+
+            item_id = row.get("item_id", "")
+            if item_id and item_id not in self.items_by_id:
+                self.error("items", row_no, f"item_id「{item_id}」不存在")
+                continue
+            if not item_id:
+                item_id = self.item_lookup.get(name_key, "")
+            existing = self.items_by_id.get(item_id, {}) if item_id else {}
+
+            # 狀態未填時：新品項預設啟用，既有品項維持原狀態
+            current_active = _parse_bool(_norm(existing.get("is_active")), True) is not False if existing else True
+            is_active = _parse_bool(row.get("is_active", ""), current_active)
+            if is_active is None:
+                self.error("items", row_no, f"is_active「{row.get('is_active')}」無法判讀")
+                is_active = True
+
+            record = {
+                "default_vendor_id": vendor_id,
+                "item_name": row.get("item_name", "") or name_zh,
+                "item_name_zh": name_zh,
+                "base_unit": units["base_unit"],
+                "default_stock_unit": units["default_stock_unit"],
+                "default_order_unit": units["default_order_unit"],
+                "orderable_units": orderable_text,
+                "is_active": is_active,
+                "category": row.get("category", ""),
+                "note": row.get("spec", ""),
+            }
+            if existing:
+                # 未填的選填欄位沿用既有值
+                for col, src in (
+                    ("category", "category"),
+                    ("note", "spec"),
+                    ("item_name", "item_name"),
+                    ("orderable_units", "orderable_units"),
+                ):
+                    if not row.get(src, "") and _norm(_db_value(existing.get(col)) or ""):
+                        record[col] = _norm(existing.get(col))
+                changes = _diff_fields(existing, record, list(record))
+                action = ACTION_UPDATE if changes else ACTION_UNCHANGED
+            else:
+                record.update({"item_type": "ingredient", "brand_id": default_brand})
+                changes = {f: (None, v) for f, v in record.items()}
+                action = ACTION_CREATE
+                self.new_items[name_key] = units["base_unit"]
+            self.plan.changes.append(ImportChange("items", row_no, action, item_id, name_zh, record, changes))
+            self.item_rows.append((row_no, item_id or "", record))
+
+    # ---------- 單位換算 ----------
+    def build_conversions(self) -> None:
+        existing = {}
+        df = self.conversions_df
+        if not df.empty:
+            for record in df.to_dict("records"):
+                key = (_norm(record.get("item_id")), _norm(record.get("from_unit")), _norm(record.get("to_unit")))
+                existing.setdefault(key, record)
+        seen: set[tuple] = set()
+        for row_no, row in self.rows("unit_conversions"):
+            item_id, new_ref = self.resolve_item(row.get("item", ""))
+            if not item_id and not new_ref:
+                self.error("unit_conversions", row_no, f"找不到品項「{row.get('item', '')}」")
+                continue
+            from_unit = self.resolve_unit(row.get("from_unit", ""))
+            to_unit = self.resolve_unit(row.get("to_unit", ""))
+            if not from_unit or not to_unit:
+                self.error("unit_conversions", row_no, "來源或目標單位找不到")
+                continue
+            if from_unit == to_unit:
+                self.error("unit_conversions", row_no, "來源單位與目標單位不可相同")
+                continue
+            ratio = _safe_float(row.get("ratio"), 0.0)
+            if ratio <= 0:
+                self.error("unit_conversions", row_no, "比例必須大於 0")
+                continue
+            is_active = _parse_bool(row.get("is_active", ""), True)
+            if is_active is None:
+                self.error("unit_conversions", row_no, f"is_active「{row.get('is_active')}」無法判讀")
+                continue
+            key = (item_id or f"new:{new_ref}", from_unit, to_unit)
+            if key in seen or (key[0], to_unit, from_unit) in seen:
+                self.error("unit_conversions", row_no, "同一品項的相同換算在檔案內重複")
+                continue
+            seen.add(key)
+
+            graph = self.graph_for(item_id, new_ref)
+            old = existing.get((item_id, from_unit, to_unit)) if item_id else None
+            label = f"{row.get('item', '')}：1{row.get('from_unit', '')} = {ratio:g}{row.get('to_unit', '')}"
+            record = {"from_unit": from_unit, "to_unit": to_unit, "ratio": ratio, "is_active": _to_bool_num(is_active)}
+            if old is not None:
+                changes = _diff_fields(old, record, ["ratio", "is_active"])
+                action = ACTION_UPDATE if changes else ACTION_UNCHANGED
+                if "ratio" in changes:
+                    self.warn("unit_conversions", row_no, f"既有比例 {old.get('ratio')} 將改為 {ratio:g}，舊單據的換算結果會跟著改變")
+                self.plan.changes.append(ImportChange(
+                    "unit_conversions", row_no, action, _norm(old.get("conversion_id")), label,
+                    {**record, "item_id": item_id}, changes,
+                ))
+                continue
+
+            implied = _unit_factor(graph, from_unit, to_unit) if is_active else None
+            if implied is not None and not math.isclose(implied, ratio, rel_tol=_RATIO_TOLERANCE):
+                self.error(
+                    "unit_conversions", row_no,
+                    f"與既有換算衝突：目前 1{row.get('from_unit', '')} = {implied:g}{row.get('to_unit', '')}",
+                )
+                continue
+            if implied is not None:
+                self.warn("unit_conversions", row_no, "可由既有換算推得，仍會新增")
+            if is_active:
+                _unit_graph_add(graph, from_unit, to_unit, ratio)
+            self.plan.changes.append(ImportChange(
+                "unit_conversions", row_no, ACTION_CREATE, "", label,
+                {**record, "item_id": item_id}, {f: (None, v) for f, v in record.items()}, new_ref,
+            ))
+
+    # ---------- 品項單位可換算檢查 ----------
+    def check_item_units(self) -> None:
+        for row_no, item_id, record in self.item_rows:
+            base = record["base_unit"]
+            if not base:
+                continue
+            graph = self.graph_for(item_id, "" if item_id else record["item_name_zh"].lower())
+            units = {record["default_stock_unit"], record["default_order_unit"], *record["orderable_units"].split(",")}
+            missing = sorted(u for u in units if u and u != base and _unit_factor(graph, u, base) is None)
+            if missing:
+                self.warn("items", row_no, f"單位 {', '.join(missing)} 尚無換算到基準單位的規則")
+
+    # ---------- 價格 ----------
+    def build_prices(self) -> None:
+        existing = {}
+        df = self.prices_df
+        if not df.empty:
+            for record in df.to_dict("records"):
+                key = (_norm(record.get("item_id")), _parse_date(_norm(record.get("effective_date"))), _norm(record.get("price_unit")))
+                existing.setdefault(key, record)
+        seen: set[tuple] = set()
+        for row_no, row in self.rows("prices"):
+            item_id, new_ref = self.resolve_item(row.get("item", ""))
+            if not item_id and not new_ref:
+                self.error("prices", row_no, f"找不到品項「{row.get('item', '')}」")
+                continue
+            price_unit = self.resolve_unit(row.get("price_unit", ""))
+            if not price_unit:
+                self.error("prices", row_no, f"找不到價格單位「{row.get('price_unit', '')}」")
+                continue
+            effective_date = _parse_date(row.get("effective_date", ""))
+            if not effective_date:
+                self.error("prices", row_no, f"生效日期「{row.get('effective_date', '')}」無法判讀")
+                continue
+            price_text = row.get("unit_price", "")
+            try:
+                price = float(price_text)
+            except ValueError:
+                self.error("prices", row_no, f"單價「{price_text}」不是數字")
+                continue
+            require_price = True
+            if item_id:
+                flag = _norm(self.items_by_id.get(item_id, {}).get("require_price", True)).lower()
+                require_price = flag not in ("false", "0", "no")
+            if price < 0 or (require_price and price == 0):
+                self.error("prices", row_no, "單價必須大於 0")
+                continue
+            is_active = _parse_bool(row.get("is_active", ""), True)
+            if is_active is None:
+                self.error("prices", row_no, f"is_active「{row.get('is_active')}」無法判讀")
+                continue
+            key = (item_id or f"new:{new_ref}", effective_date, price_unit)
+            if key in seen:
+                self.error("prices", row_no, "同一品項、生效日期與單位的價格在檔案內重複")
+                continue
+            seen.add(key)
+
+            base = self.items_by_id.get(item_id, {}).get("base_unit") if item_id else self.new_items.get(new_ref)
+            graph = self.graph_for(item_id, new_ref)
+            if _norm(base) and _unit_factor(graph, price_unit, _norm(base)) is None:
+                self.warn("prices", row_no, f"價格單位「{row.get('price_unit', '')}」尚無換算到基準單位的規則")
+
+            label = f"{row.get('item', '')}｜{effective_date}｜{price:g}/{row.get('price_unit', '')}"
+            record = {"price_unit": price_unit, "effective_date": effective_date, "unit_price": price, "is_active": _to_bool_num(is_active)}
+            old = existing.get((item_id, effective_date, price_unit)) if item_id else None
+            if old is not None:
+                changes = _diff_fields(old, record, ["unit_price", "is_active"])
+                action = ACTION_UPDATE if changes else ACTION_UNCHANGED
+                self.plan.changes.append(ImportChange(
+                    "prices", row_no, action, _norm(old.get("price_id")), label,
+                    {**record, "item_id": item_id}, changes,
+                ))
+                continue
+            self.plan.changes.append(ImportChange(
+                "prices", row_no, ACTION_CREATE, "", label,
+                {**record, "item_id": item_id}, {f: (None, v) for f, v in record.items()}, new_ref,
+            ))
+
+    def build(self) -> ImportPlan:
+        self.build_items()
+        self.load_existing_graphs()
+        self.build_conversions()
+        self.check_item_units()
+        self.build_prices()
+        return self.plan
+
+
+def build_import_plan(tables: dict[str, pd.DataFrame], fingerprint: str = "") -> ImportPlan:
+    """只讀不寫：檢查匯入資料並列出每一列會被新增 / 更新 / 略過（不變）。"""
+    return _PlanBuilder(tables, fingerprint).build()
+
+
+def import_plan_frames(plan: ImportPlan) -> dict[str, pd.DataFrame]:
+    """預覽用：每張表一個差異表（列號、動作、名稱、異動欄位）。"""
+    frames: dict[str, pd.DataFrame] = {}
+    for table in IMPORT_TABLES:
+        rows = [
+            {
+                "列號": c.row_no,
+                "動作": c.action,
+                "名稱": c.label,
+                "ID": c.key,
+                "異動": "、".join(
+                    f"{col}: {'' if old is None else old} → {new}" if c.action == ACTION_UPDATE else f"{col}={new}"
+                    for col, (old, new) in c.changes.items()
+                ),
+            }
+            for c in plan.changes
+            if c.table_name == table
+        ]
+        frames[table] = pd.DataFrame(rows, columns=["列號", "動作", "名稱", "ID", "異動"])
+    return frames
+
+
+# ============================================================
+# [I4] 寫入
+# ============================================================
+def _upsert_by_key_set(table: str, rows: list[dict], upsert) -> None:
+    """
+    依欄位組合分組後各自 upsert：PostgREST 批次 upsert 以各列欄位的聯集送出、缺少的欄位補 NULL，
+    混在同一批會讓新品項的 require_price 等欄位變成 NULL 而不是 DEFAULT，更新列則被清空未異動的欄位。
+    """
+    groups: dict[tuple, list[dict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for group in groups.values():
+        upsert(table, group, chunk_rows=IMPORT_CHUNK_ROWS)
+
+
+def apply_import_plan(tables: dict[str, pd.DataFrame], confirmed: ImportPlan) -> dict[str, dict[str, int]]:
+    """
+    以最新資料重新檢查一次，確認與預覽相同後：
+    一次配好全部新 ID → 依 品項 → 換算 → 價格 順序分批 upsert → 補價格結束日期。
+    新增列只帶匯入欄位（其餘欄位走資料庫 DEFAULT）；更新列只帶主鍵、異動欄位與 updated_at。
+    回傳各表的新增 / 更新筆數。
+    """
+    plan = build_import_plan(tables, confirmed.fingerprint)
+    if plan.errors:
+        raise PurchaseServiceError("匯入資料檢查未通過：" + "；".join(plan.errors[:5]))
+    if plan.signature() != confirmed.signature():
+        raise PurchaseServiceError("預覽後資料已被異動，請重新預覽再匯入")
+    pending = plan.pending
+    if not pending:
+        return plan.counts()
+
+    create_counts = {t: sum(1 for c in pending if c.table_name == t and c.action == ACTION_CREATE) for t in IMPORT_TABLES}
+    allocated = allocate_ids_map({t: n for t, n in create_counts.items() if n})
+    next_ids = {t: iter(allocated.get(t, [])) for t in IMPORT_TABLES}
+    now = _now_ts()
+
+    new_item_ids: dict[str, str] = {}
+    created: dict[str, list[dict]] = {t: [] for t in IMPORT_TABLES}
+    updated: dict[str, list[dict]] = {t: [] for t in IMPORT_TABLES}
+    pk = {t: TABLE_CONTRACT[t]["primary_key"] for t in IMPORT_TABLES}
+
+    for table in IMPORT_TABLES:
+        for change in pending:
+            if change.table_name != table:
+                continue
+            if change.action == ACTION_CREATE:
+                record = dict(change.record)
+                if record.get("item_id") == "" and change.new_item_ref:
+                    record["item_id"] = new_item_ids[change.new_item_ref]
+                new_id = next(next_ids[table])
+                if table == "items":
+                    new_item_ids[change.label.lower()] = new_id
+                    record["is_active"] = bool(record["is_active"])
+                created[table].append({**record, pk[table]: new_id, "created_at": now, "updated_at": now})
+            else:
+                row = {f: change.record[f] for f in change.changes}
+                if table == "items" and "is_active" in row:
+                    row["is_active"] = bool(row["is_active"])
+                updated[table].append({**row, pk[table]: change.key, "updated_at": now})
+
+    for table in IMPORT_TABLES:
+        _upsert_by_key_set(table, created[table], upsert_rows_by_primary_key)
+        _upsert_by_key_set(table, updated[table], upsert_fields_by_primary_key)
+
+    price_items = {row["item_id"] for row in created["prices"]}
+    price_items.update(c.record["item_id"] for c in pending if c.table_name == "prices" and c.action == ACTION_UPDATE)
+    if price_items:
+        _backfill_price_end_dates_for_items(price_items, now)
+    return plan.counts()
+
+
+__all__ = [
+    "ACTION_CREATE",
+    "ACTION_UNCHANGED",
+    "ACTION_UPDATE",
+    "IMPORT_TABLES",
+    "IMPORT_TEMPLATE_COLUMNS",
+    "ImportChange",
+    "ImportPlan",
+    "apply_import_plan",
+    "build_import_plan",
+    "build_import_template",
+    "import_plan_frames",
+    "read_import_files",
+]
@@ -21,14 +21,15 @@ from datetime import date, timedelta
 import pandas as pd
 
 from shared.utils.common_helpers import _norm, _now_ts, _safe_float
-from shared.utils.utils_format import clear_unit_label_cache
 from shared.services.data_backend import (
     append_rows_by_header as sheet_append,
     bust_cache,
     delete_row_by_match as sheet_delete,
     get_header,
+    get_table_version,
     read_table,
     update_row_by_match as sheet_update,
+    upsert_fields_by_primary_key,
 )
 from shared.services.service_id import (
     allocate_item_id,
@@ -37,6 +38,7 @@ from shared.services.service_id import (
     allocate_unit_id,
     allocate_vendor_id,
 )
+from shared.services.service_item_search import note_item_written
 
 
 # ============================================================
@@ -359,28 +361,61 @@ def create_item(
         "updated_at": now,
     }
 
+    items_version = get_table_version("items")
     header = get_header("items")
     sheet_append("items", header, [row])
     bust_cache("items")
-    clear_unit_label_cache()
+    note_item_written(new_id, row, since_version=items_version)
     return new_id
 
 
-def _backfill_price_end_dates(item_id: str, now: str) -> None:
-    """補全同品項所有歷史價格的結束日期（依生效日期排序，相鄰兩筆自動補上缺漏的結束日期）。"""
-    df = list_prices(item_id=item_id)
-    if df.empty or "effective_date" not in df.columns:
+def _db_value(value):
+    # DataFrame 內的 NaN / NaT 轉回 NULL，numpy 純量轉成 Python 型別
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        return value
+    return value.item() if hasattr(value, "item") else value
+
+
+def _backfill_price_end_dates_for_items(item_ids, now: str) -> None:
+    """
+    補全品項歷史價格的結束日期（各品項依生效日期排序，結束日期空白者補上下一筆生效日前一天）。
+    所有需要補的列一次 upsert 寫回（只帶 price_id / end_date / updated_at，
+    不覆蓋其他欄位的並行修改），prices 快取只清一次。
+    """
+    targets = {_norm(i) for i in item_ids if _norm(i)}
+    df = read_table("prices")
+    if not targets or df.empty or "effective_date" not in df.columns or "item_id" not in df.columns:
         return
-    df = df.copy()
-    df["_eff_dt"] = pd.to_datetime(df["effective_date"], errors="coerce")
-    df = df.dropna(subset=["_eff_dt"]).sort_values("_eff_dt", ascending=True).reset_index(drop=True)
-    for i in range(len(df) - 1):
-        curr_row = df.iloc[i]
-        next_row = df.iloc[i + 1]
-        curr_end = _norm(str(curr_row.get("end_date", "") or ""))
-        if not curr_end:
-            expected_end = (next_row["_eff_dt"] - timedelta(days=1)).strftime("%Y-%m-%d")
-            sheet_update("prices", "price_id", _norm(curr_row.get("price_id")), {"end_date": expected_end, "updated_at": now})
+    item_key = df["item_id"].astype("string").str.strip().fillna("")
+    df = df[item_key.isin(targets)].assign(
+        _item_key=item_key,
+        _eff_dt=pd.to_datetime(df["effective_date"], errors="coerce"),
+    )
+    df = df.dropna(subset=["_eff_dt"]).sort_values(["_item_key", "_eff_dt"], kind="stable")
+    next_eff = df.groupby("_item_key", sort=False)["_eff_dt"].shift(-1)
+    if "end_date" in df.columns:
+        end_blank = df["end_date"].astype("string").str.strip().fillna("") == ""
+    else:
+        end_blank = pd.Series(True, index=df.index)
+    need = end_blank & next_eff.notna()
+    if not need.any():
+        return
+
+    expected_end = (next_eff[need] - timedelta(days=1)).dt.strftime("%Y-%m-%d")
+    rows = [
+        {"price_id": _norm(price_id), "end_date": end_date, "updated_at": now}
+        for price_id, end_date in zip(df.loc[need, "price_id"].tolist(), expected_end.tolist())
+    ]
+    upsert_fields_by_primary_key("prices", rows)
+
+
+def _backfill_price_end_dates(item_id: str, now: str) -> None:
+    _backfill_price_end_dates_for_items([item_id], now)
 
 
 def create_price(
@@ -528,7 +563,6 @@ def update_unit(
     }
     sheet_update("units", "unit_id", unit_id, updates)
     bust_cache("units")
-    clear_unit_label_cache()
 
 
 def update_item(
@@ -577,8 +611,10 @@ def update_item(
         "note": _norm(spec),
         "updated_at": now,
     }
+    items_version = get_table_version("items")
     sheet_update("items", "item_id", item_id, updates)
     bust_cache("items")
+    note_item_written(item_id, updates, since_version=items_version)
 
 
 def update_price(
@@ -24,6 +24,7 @@ from shared.utils.common_helpers import (
 from shared.services.id_allocation import _make_id, allocate_ids
 from shared.services.report_calculations import (
     _build_inventory_history_summary_df,
+    _build_inventory_history_summary_multi_df,
     _build_latest_item_metrics_df,
     _build_purchase_detail_df,
     _build_purchase_summary_df,
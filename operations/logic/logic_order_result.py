@@ -5,11 +5,19 @@ from datetime import date, datetime
 import pandas as pd
 
 from operations.logic.order_query_common import load_order_page_tables
+from operations.logic.order_view_model import get_store_selection_view_model
 from operations.logic.logic_purchase_orders import confirm_purchase_order
 from shared.services import service_order_core
+from shared.services.data_backend import _partition_versions_signature, get_table_versions
 from shared.services.service_line import send_line_message as _send_line_message
+from shared.services.service_line import send_line_messages as _send_line_messages
+from shared.services.service_line import send_line_messages_to_stores as _send_line_messages_to_stores
+from shared.services.view_model_cache import vm_cache_get, vm_cache_set
+from shared.utils.permissions import filter_stores_by_scope
 from shared.utils.utils_format import unit_label
 
+_ORDER_MESSAGE_TABLES = ("purchase_orders", "purchase_order_lines")
+
 
 def _fmt_qty(v):
     try:
@@ -51,6 +59,24 @@ def _fmt_arrival_text(arrival_date_value):
 
 
 def build_order_message_detail_view_model(*, store_id: str, store_name: str, selected_date: date) -> dict:
+    signature = (
+        str(store_id).strip(),
+        str(store_name),
+        str(selected_date),
+        _partition_versions_signature(_ORDER_MESSAGE_TABLES, str(store_id).strip(), selected_date),
+        get_table_versions(("vendors", "items", "units")),
+    )
+    model = vm_cache_get("order_message_detail", signature)
+    if model is None:
+        model = vm_cache_set("order_message_detail", signature, _build_order_message_detail_view_model(
+            store_id=store_id,
+            store_name=store_name,
+            selected_date=selected_date,
+        ))
+    return {k: list(v) if isinstance(v, list) else v for k, v in model.items()}
+
+
+def _build_order_message_detail_view_model(*, store_id: str, store_name: str, selected_date: date) -> dict:
     page_tables = load_order_page_tables()
     po_df = page_tables["purchase_orders"]
     pol_df = page_tables["purchase_order_lines"]
@@ -141,8 +167,10 @@ def build_order_message_detail_view_model(*, store_id: str, store_name: str, sel
         return {"status": "info", "message": "這一天目前沒有需要顯示的品項"}
 
     lines = []
+    vendor_messages: list[str] = []
     store_short_name = _get_store_short_name(store_name)
-    lines.append(_fmt_line_date(selected_date))
+    date_text = _fmt_line_date(selected_date)
+    lines.append(date_text)
     lines.append("")
 
     merged = merged.sort_values(
@@ -153,19 +181,22 @@ def build_order_message_detail_view_model(*, store_id: str, store_name: str, sel
 
     for (vendor_name, delivery_dt), group in merged.groupby(["vendor_name", "delivery_date_dt"], sort=False, dropna=False):
         show_vendor = str(vendor_name).strip() if str(vendor_name).strip() else "未分類廠商"
-        lines.append(show_vendor)
+        vendor_lines = [show_vendor]
 
         if store_short_name:
-            lines.append(store_short_name)
+            vendor_lines.append(store_short_name)
 
         for _, r in group.iterrows():
             item_name = _simplify_line_item_name(r.get("item_name", ""))
             qty = _fmt_qty(r.get(qty_col, ""))
             unit = unit_label(str(r.get(unit_col, "")).strip())
-            lines.append(f"{item_name} {qty}{unit}")
+            vendor_lines.append(f"{item_name} {qty}{unit}")
 
-        lines.append(_fmt_arrival_text(delivery_dt))
+        vendor_lines.append(_fmt_arrival_text(delivery_dt))
+        lines.extend(vendor_lines)
         lines.append("")
+        # 批次模式：每個廠商一則獨立訊息（自帶日期），發送時再依 LINE 上限打包
+        vendor_messages.append("\n".join([date_text, ""] + vendor_lines))
 
     # 計算本次顯示範圍中仍為 draft 的 PO（供發送 LINE 時一併確認用）
     draft_po_ids: list[str] = []
@@ -178,6 +209,7 @@ def build_order_message_detail_view_model(*, store_id: str, store_name: str, sel
     return {
         "status": "ok",
         "line_message": "\n".join(lines).strip(),
+        "vendor_messages": vendor_messages,
         "draft_po_ids": draft_po_ids,
     }
 
@@ -196,3 +228,51 @@ def confirm_draft_pos(
 
 def dispatch_line_message(*, line_message: str, store_id: str) -> bool:
     return _send_line_message(line_message=line_message, store_id=store_id)
+
+
+def dispatch_line_messages(*, vendor_messages: list[str], store_id: str) -> bool:
+    """批次模式：各廠商訊息打包成最少次數的 push 呼叫。"""
+    return _send_line_messages(messages=vendor_messages, store_id=store_id)
+
+
+def build_all_stores_dispatch_targets(*, selected_date: date, split_by_vendor: bool) -> list[dict]:
+    """
+    目前帳號可存取的每間分店各自組出當日叫貨訊息，供一次發送所有分店。
+    沒有叫貨資料的分店略過；回傳 [{store_id, store_name, messages, draft_po_ids}]。
+    """
+    view_model = get_store_selection_view_model()
+    if view_model["error_message"]:
+        return []
+    stores_df = filter_stores_by_scope(view_model["stores_df"])
+    if stores_df is None or stores_df.empty:
+        return []
+
+    targets: list[dict] = []
+    for store_id, store_label in zip(
+        stores_df["store_id"].astype(str).str.strip(),
+        stores_df["store_label"].astype(str),
+    ):
+        if not store_id:
+            continue
+        detail = build_order_message_detail_view_model(
+            store_id=store_id,
+            store_name=store_label,
+            selected_date=selected_date,
+        )
+        if detail.get("status") != "ok":
+            continue
+        messages = detail.get("vendor_messages", []) if split_by_vendor else [detail.get("line_message", "")]
+        targets.append({
+            "store_id": store_id,
+            "store_name": store_label,
+            "messages": messages,
+            "draft_po_ids": detail.get("draft_po_ids", []),
+        })
+    return targets
+
+
+def dispatch_line_messages_to_stores(*, targets: list[dict]) -> dict[str, bool]:
+    """各分店群組同時發送（群組之間互不相依），回傳 {store_id: 是否成功}。"""
+    return _send_line_messages_to_stores(
+        messages_by_store={t["store_id"]: t["messages"] for t in targets},
+    )
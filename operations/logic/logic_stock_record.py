@@ -5,6 +5,9 @@ from datetime import date
 import pandas as pd
 
 from shared.services import service_order_core
+from shared.services.data_backend import _partition_versions_signature, get_table_versions
+from shared.services.report_calculations import _ITEM_METRICS_MASTER_TABLES, _STORE_TRANSACTION_TABLES
+from shared.services.view_model_cache import vm_cache_get, vm_cache_set
 from shared.utils.utils_units import convert_unit
 from operations.logic.order_query_common import load_order_page_tables
 
@@ -55,10 +58,44 @@ def build_daily_stock_order_record_view_model(*, store_id: str, store_name: str,
     if vendors_df.empty or items_df.empty:
         return {"status": "warning", "message": "⚠️ 廠商或品項資料讀取失敗"}
 
+    # 廠商選項與最新指標只跟分店 / 日期與資料版本有關，來回切換日期時直接沿用
+    signature = (
+        str(store_id).strip(),
+        str(selected_date),
+        _partition_versions_signature(_STORE_TRANSACTION_TABLES, str(store_id).strip(), selected_date),
+        get_table_versions(_ITEM_METRICS_MASTER_TABLES),
+    )
+    derived = vm_cache_get("daily_stock_order_record", signature)
+    if derived is None:
+        derived = vm_cache_set("daily_stock_order_record", signature, _build_daily_record_derived(
+            store_id=store_id,
+            selected_date=selected_date,
+            vendors_df=vendors_df,
+            items_df=items_df,
+        ))
+    if not derived["vendor_options"]:
+        return {"status": "info", "message": "目前沒有可用廠商"}
+
+    return {
+        "status": "ok",
+        "page_tables": page_tables,
+        "vendor_options": [dict(option) for option in derived["vendor_options"]],
+        "latest_metrics_map": derived["latest_metrics_map"],
+        "store_name": store_name,
+        "selected_date": selected_date,
+        "po_df": po_df,
+        "pol_df": pol_df,
+        "stocktakes_df": stocktakes_df,
+        "stocktake_lines_df": stocktake_lines_df,
+        "items_df": items_df,
+    }
+
+
+def _build_daily_record_derived(*, store_id: str, selected_date: date, vendors_df: pd.DataFrame, items_df: pd.DataFrame) -> dict:
     item_vendor_ids = set(items_df.get("default_vendor_id", pd.Series(dtype=str)).astype(str).str.strip())
     vendors = vendors_df[vendors_df["vendor_id"].astype(str).str.strip().isin(item_vendor_ids)].copy()
     if vendors.empty:
-        return {"status": "info", "message": "目前沒有可用廠商"}
+        return {"vendor_options": [], "latest_metrics_map": {}}
 
     vendors["vendor_label"] = vendors.apply(service_order_core.label_vendor, axis=1)
     vendors = vendors.sort_values(by=["vendor_label"], ascending=True).reset_index(drop=True)
@@ -84,19 +121,7 @@ def build_daily_stock_order_record_view_model(*, store_id: str, store_name: str,
         for _, m in latest_metrics_df.iterrows():
             latest_metrics_map[service_order_core.norm(m.get("item_id", ""))] = m.to_dict()
 
-    return {
-        "status": "ok",
-        "page_tables": page_tables,
-        "vendor_options": vendor_options,
-        "latest_metrics_map": latest_metrics_map,
-        "store_name": store_name,
-        "selected_date": selected_date,
-        "po_df": po_df,
-        "pol_df": pol_df,
-        "stocktakes_df": stocktakes_df,
-        "stocktake_lines_df": stocktake_lines_df,
-        "items_df": items_df,
-    }
+    return {"vendor_options": vendor_options, "latest_metrics_map": latest_metrics_map}
 
 
 def build_vendor_daily_record_rows(
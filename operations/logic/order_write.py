@@ -45,5 +45,9 @@ def _save_order_entry(
         is_initial_stock=is_initial_stock,
     )
     rpc_save_order_transaction(payload)
-    bust_cache(["stocktakes", "stocktake_lines", "purchase_orders", "purchase_order_lines"])
+    bust_cache(
+        ["stocktakes", "stocktake_lines", "purchase_orders", "purchase_order_lines"],
+        store_id=store_id,
+        dates=[record_date, delivery_date],
+    )
     return payload["_meta"]["po_id"]
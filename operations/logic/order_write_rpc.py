@@ -32,25 +32,104 @@ from shared.utils.utils_units import convert_to_base
 from shared.services.data_backend import read_table
 
 
-def _sanitize_payload(obj, _path: str = "") -> object:
-    """遞迴將 payload 內的 NaN / inf / -inf / pd.NA 轉為 0。
+# RPC payload 明細欄位型別：與 SQL function 內 (v_row->>'col')::numeric 的欄位一一對應。
+# 數值欄位 NaN / inf 一律寫 0；其餘文字欄位 NaN 寫 None（JSON null）；None 一律保留。
+_RPC_LINE_NUMERIC_COLUMNS: dict[str, tuple[str, ...]] = {
+    "stocktake_lines": ("qty", "stock_qty", "base_qty"),
+    "purchase_order_lines": ("qty", "order_qty", "base_qty", "unit_price", "amount"),
+}
+
+
+def _clean_scalar(value):
+    """單一值清理：NaN / inf / pd.NA / NaT 轉 0，None 保留。"""
+    if value is None or type(value) in (str, int, bool):
+        return value
+    if isinstance(value, float):
+        return value if math.isfinite(value) else 0
+    try:
+        if pd.isna(value):
+            return 0
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+def _sanitize_record(record):
+    """將 header / audit 等單筆 dict（含巢狀 dict / list）內的 NaN / inf / pd.NA 轉為 0。
     注意：None 必須保留為 None（JSON null），不可轉 0，
     否則 purchase_order=None 會變成 0，導致 SQL 誤判為非 null 而 INSERT 空 PO。
     """
-    if obj is None:
-        return None  # 保留 None → JSON null，讓 SQL NULLIF 邏輯正常運作
-    if isinstance(obj, dict):
-        return {k: _sanitize_payload(v, f"{_path}.{k}") for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_sanitize_payload(item, f"{_path}[{i}]") for i, item in enumerate(obj)]
-    if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
+    if record is None:
+        return None
+    if isinstance(record, dict):
+        return {k: _sanitize_record(v) for k, v in record.items()}
+    if isinstance(record, list):
+        return [_sanitize_record(v) for v in record]
+    return _clean_scalar(record)
+
+
+def _numeric_cell(table: str, col: str, value):
+    """數值欄位：NaN / inf / pd.NA 寫 0，None 保留；無法轉成數值時拋 UserDisplayError。"""
+    if value is None:
+        return None
+    value_type = type(value)
+    if value_type is float:
+        return value if math.isfinite(value) else 0
+    if value_type is int:
+        return value
+    if value is pd.NA or value is pd.NaT:
         return 0
     try:
-        if pd.isna(obj):
-            return 0
+        number = float(value)
     except (TypeError, ValueError):
-        pass
-    return obj
+        raise UserDisplayError(f"{table}.{col} 不是有效數值：{value}")
+    return number if math.isfinite(number) else 0
+
+
+def _text_cell(value):
+    """文字欄位：NaN / pd.NA / NaT 寫 None（JSON null），其餘原樣保留。"""
+    if value is None or type(value) is str:
+        return value
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if value is pd.NA or value is pd.NaT:
+        return None
+    return value
+
+
+def _serialize_line_records(table: str, records: list[dict]) -> list[dict]:
+    """
+    依欄位型別逐欄轉換明細（同一欄位只決定一次轉換規則）：
+    數值欄位 NaN / inf 寫 0；文字欄位 NaN 寫 None；None 一律保留。
+    """
+    if not records:
+        return []
+
+    numeric_cols = _RPC_LINE_NUMERIC_COLUMNS.get(table, ())
+    columns = list(dict.fromkeys(col for record in records for col in record))
+    converted = []
+    for col in columns:
+        values = [record.get(col) for record in records]
+        if col in numeric_cols:
+            converted.append([_numeric_cell(table, col, v) for v in values])
+        else:
+            converted.append(list(map(_text_cell, values)))
+    return [dict(zip(columns, row)) for row in zip(*converted)]
+
+
+def serialize_order_rpc_payload(payload: dict) -> dict:
+    """
+    依 payload 結構整理成可直接送出的 dict：
+    明細走欄位型別轉換，header / audit 走單筆清理，_meta 原樣保留。
+    """
+    return {
+        "stocktake": _sanitize_record(payload.get("stocktake")),
+        "stocktake_lines": _serialize_line_records("stocktake_lines", payload.get("stocktake_lines") or []),
+        "purchase_order": _sanitize_record(payload.get("purchase_order")),
+        "purchase_order_lines": _serialize_line_records("purchase_order_lines", payload.get("purchase_order_lines") or []),
+        "audit_logs": [_sanitize_record(row) for row in payload.get("audit_logs") or []],
+        "_meta": dict(payload.get("_meta") or {}),
+    }
 
 
 def build_order_write_rpc_payload(
@@ -321,4 +400,4 @@ def build_order_write_rpc_payload(
             "po_id": po_id or "",
         },
     }
-    return _sanitize_payload(_payload)
+    return serialize_order_rpc_payload(_payload)
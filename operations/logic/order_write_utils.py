@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import pandas as pd
 import streamlit as st
 
 from operations.logic.order_errors import SystemProcessError
@@ -71,8 +70,7 @@ def _update_row_by_id(sheet_name: str, id_field: str, entity_id: str, updates: d
 
 def _write_audit_log(action: str, table_name: str, entity_id: str, note: str, before_json: str = "{}", after_json: str = "{}"):
     import json as _json
-    import traceback as _traceback
-    from shared.services.supabase_client import _get_client
+    from shared.services.service_audit import write_audit
 
     # --- actor fallback（不可空）---
     login_user = norm(st.session_state.get("login_user", ""))
@@ -91,23 +89,19 @@ def _write_audit_log(action: str, table_name: str, entity_id: str, note: str, be
         except Exception:
             return None
 
-    audit_id = f"AUDIT_{pd.Timestamp.now().strftime('%Y%m%d%H%M%S%f')}"
-    row = {
-        "audit_id": audit_id,
-        "action": action,
-        "user_id": actor,
-        "table_name": table_name,
-        "entity_id": str(entity_id) if entity_id else None,
-        "before_json": _to_jsonb(before_json),
-        "after_json": _to_jsonb(after_json),
-        "note": note or None,
-    }
-
+    # 只放進稽核佇列，由背景批次寫入；失敗時落地重送，不阻擋存檔流程
     try:
-        client = _get_client()
-        client.table("audit_logs").insert(row).execute()
+        write_audit(
+            action,
+            table_name,
+            entity_id,
+            user_id=actor,
+            before=_to_jsonb(before_json),
+            after=_to_jsonb(after_json),
+            note=note,
+        )
     except Exception as exc:
-        print(f"[audit_log] write failed: {exc}\n{_traceback.format_exc()}")
+        print(f"[audit_log] enqueue failed: {exc}")
 
 
 
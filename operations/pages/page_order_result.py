@@ -43,18 +43,31 @@ def page_order_message_detail():
 
     line_message = view_model.get("line_message", "")
     draft_po_ids = view_model.get("draft_po_ids", [])
+    vendor_messages = view_model.get("vendor_messages", [])
 
     st.markdown("### LINE 顯示內容")
     st.code(line_message, language="text")
 
+    split_by_vendor = st.checkbox(
+        "依廠商分則發送",
+        value=False,
+        key="order_message_detail_split_by_vendor",
+    )
+
     c1, c2 = st.columns(2)
     with c1:
         if has_permission("operation.order.execute"):
             if st.button("📤 發送到 LINE", type="primary", use_container_width=True):
-                ok = logic_order_result.dispatch_line_message(
-                    line_message=line_message,
-                    store_id=str(store_id).strip(),
-                )
+                if split_by_vendor:
+                    ok = logic_order_result.dispatch_line_messages(
+                        vendor_messages=vendor_messages,
+                        store_id=str(store_id).strip(),
+                    )
+                else:
+                    ok = logic_order_result.dispatch_line_message(
+                        line_message=line_message,
+                        store_id=str(store_id).strip(),
+                    )
                 if ok:
                     actor = str(st.session_state.get("login_user", "system")).strip()
                     logic_order_result.confirm_draft_pos(
@@ -71,3 +84,35 @@ def page_order_message_detail():
     with c2:
         if st.button("⬅️ 返回功能選單", use_container_width=True, key="back_from_order_message_detail"):
             goto("select_vendor")
+
+    if has_permission("operation.order.execute"):
+        _render_all_stores_dispatch(selected_date, split_by_vendor)
+
+
+def _render_all_stores_dispatch(selected_date: date, split_by_vendor: bool):
+    """可存取多間分店時，一次把當日各分店的叫貨訊息同時送到各自的 LINE 群組。"""
+    with st.expander("📤 一次發送所有分店", expanded=False):
+        st.caption("依上方日期與分則設定，各分店的叫貨內容會同時送到各自的 LINE 群組；發送成功的分店才會確認叫貨單。")
+        if not st.button("發送所有分店到 LINE", use_container_width=True, key="order_message_detail_send_all"):
+            return
+
+        targets = logic_order_result.build_all_stores_dispatch_targets(
+            selected_date=selected_date,
+            split_by_vendor=split_by_vendor,
+        )
+        if not targets:
+            st.info("這一天沒有任何分店的叫貨資料")
+            return
+
+        results = logic_order_result.dispatch_line_messages_to_stores(targets=targets)
+        actor = str(st.session_state.get("login_user", "system")).strip()
+        for target in targets:
+            if results.get(target["store_id"]):
+                logic_order_result.confirm_draft_pos(
+                    po_ids=target["draft_po_ids"],
+                    actor=actor,
+                    delivery_date=selected_date,
+                )
+                st.success(f"✅ {target['store_name']}：已發送到 LINE")
+            else:
+                st.error(f"❌ {target['store_name']}：LINE 發送失敗，請檢查 line_bot / line_groups 設定")
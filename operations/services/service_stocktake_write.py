@@ -8,12 +8,13 @@
 
 from __future__ import annotations
 
+from dataclasses import dataclass
 from datetime import date
 
 import pandas as pd
 
 from shared.services.data_backend import append_rows_by_header, read_table
-from shared.services.report_calculations import get_base_unit_cost
+from shared.services.report_calculations import get_base_unit_costs
 from shared.services.service_id import (
     allocate_purchase_order_id,
     allocate_purchase_order_line_ids,
@@ -22,7 +23,7 @@ from shared.services.service_id import (
 )
 from shared.services.table_contract import TABLE_CONTRACT
 from shared.utils.common_helpers import _norm, _now_ts
-from shared.utils.utils_units import convert_to_base
+from shared.utils.utils_units import build_item_unit_graphs, find_unit_factor
 
 
 # ============================================================
@@ -44,13 +45,13 @@ def _build_display_to_unit_id_map() -> dict[str, str]:
     result: dict[str, str] = {}
     try:
         units_raw = read_table("units")
-        if not units_raw.empty:
-            for _, row in units_raw.iterrows():
-                unit_id = _norm(row.get("unit_id", ""))
-                display = (
-                    _norm(row.get("unit_name_zh", ""))
-                    or _norm(row.get("unit_name", ""))
-                )
+        if not units_raw.empty and "unit_id" in units_raw.columns:
+            empty = pd.Series("", index=units_raw.index)
+            unit_ids = units_raw["unit_id"].map(_norm)
+            names_zh = units_raw.get("unit_name_zh", empty).map(_norm)
+            names = units_raw.get("unit_name", empty).map(_norm)
+            displays = names_zh.where(names_zh != "", names)
+            for unit_id, display in zip(unit_ids, displays):
                 if unit_id:
                     if display:
                         result[display] = unit_id  # display → unit_id
@@ -70,68 +71,111 @@ def _resolve_unit_id(display_name: str, name_to_id: dict[str, str]) -> str:
     return name_to_id.get(text, text)
 
 
-def _safe_base_qty(
-    *,
-    item_id: str,
-    qty: float,
-    from_unit_display: str,
-    items_df: pd.DataFrame,
-    conversions_df: pd.DataFrame,
-    name_to_id: dict[str, str],
-    today: date,
-) -> float:
+# ============================================================
+# [W1-1] 寫入 context：單次送出共用的預先索引資料
+# ============================================================
+@dataclass
+class _StocktakeWriteContext:
+    today: date
+    name_to_id: dict[str, str]
+    base_units: dict[str, str]
+    unit_graphs: dict[str, dict]
+    items_df: pd.DataFrame
+    conversions_df: pd.DataFrame
+    prices_df: pd.DataFrame
+
+
+def _build_write_context(items_df: pd.DataFrame, today: date) -> _StocktakeWriteContext:
+    """載入單位、換算與價格資料（各一次），預先建好索引供全部明細共用。"""
+    conversions_df = read_table("unit_conversions")
+    prices_df = read_table("prices")
+
+    base_units: dict[str, str] = {}
+    if not items_df.empty and {"item_id", "base_unit"}.issubset(items_df.columns):
+        for item_id, base_unit in zip(items_df["item_id"].map(_norm), items_df["base_unit"].map(_norm)):
+            if item_id:
+                base_units.setdefault(item_id, base_unit)
+
+    try:
+        unit_graphs = build_item_unit_graphs(conversions_df, as_of_date=today)
+    except Exception:
+        unit_graphs = {}
+
+    return _StocktakeWriteContext(
+        today=today,
+        name_to_id=_build_display_to_unit_id_map(),
+        base_units=base_units,
+        unit_graphs=unit_graphs,
+        items_df=items_df,
+        conversions_df=conversions_df,
+        prices_df=prices_df,
+    )
+
+
+def _base_factor(ctx: _StocktakeWriteContext, item_id: str, from_unit: str) -> float:
     """
-    將操作單位數量安全轉換成 base unit 數量。
-    若找不到換算規則，以 1:1 為 fallback（qty 原值，不拋例外）。
+    1 個 from_unit 等於多少 base unit。
+    若找不到換算規則，以 1:1 為 fallback（不拋例外）。
     """
-    from_unit = _resolve_unit_id(from_unit_display, name_to_id)
+    base_unit = ctx.base_units.get(item_id, "")
+    if not base_unit or not from_unit:
+        return 1.0
     try:
-        base_qty, _ = convert_to_base(
-            item_id=item_id,
-            qty=qty,
-            from_unit=from_unit,
-            items_df=items_df,
-            conversions_df=conversions_df,
-            as_of_date=today,
-        )
-        return round(float(base_qty), 4)
-    except Exception:
+        return find_unit_factor(ctx.unit_graphs.get(item_id, {}), item_id, from_unit, base_unit)
+    except ValueError:
         # Fallback：找不到換算規則時以原數量作為 base_qty（1:1 假設）
-        return round(float(qty), 4)
+        return 1.0
 
 
-def _safe_unit_price(
-    *,
-    item_id: str,
-    order_qty: float,
-    order_base_qty: float,
-    items_df: pd.DataFrame,
-    prices_df: pd.DataFrame,
-    conversions_df: pd.DataFrame,
-    today: date,
-) -> tuple[float, float]:
+def _base_unit_costs(ctx: _StocktakeWriteContext, item_ids) -> dict[str, float]:
     """
-    查詢 base_unit_cost 並計算 unit_price 與 amount。
+    批次查詢 base_unit_cost。
     遵守 require_price=false 制度（CLAUDE.md § 6.4）：
-    找不到有效價格時安全落地 unit_price=0, amount=0，不拋例外。
-    回傳 (unit_price, amount)。
+    找不到有效價格時落地 0，不拋例外。
     """
     try:
-        buc = get_base_unit_cost(
-            item_id=item_id,
-            target_date=today,
-            items_df=items_df,
-            prices_df=prices_df,
-            conversions_df=conversions_df,
+        costs = get_base_unit_costs(
+            item_ids,
+            ctx.today,
+            ctx.items_df,
+            ctx.prices_df,
+            ctx.conversions_df,
         )
-        buc_f = float(buc) if buc is not None else 0.0
-        if buc_f > 0:
-            amount = round(order_base_qty * buc_f, 1)
-            unit_price = round(amount / order_qty, 4) if order_qty > 0 else 0.0
-            return unit_price, amount
     except Exception:
-        pass
-    return 0.0, 0.0
+        return {}
+    return {item_id: float(cost) for item_id, cost in costs.items() if cost is not None}
+
+
+def _prepare_lines(ctx: _StocktakeWriteContext, lines_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    一次完成全部明細的單位解析、base 換算與計價。
+    換算率只依不重複的 (item_id, unit) 計算，成本一次批次查詢，其餘皆為欄位運算。
+    """
+    out = lines_df.copy()
+    for prefix in ("stock", "order"):
+        out[f"{prefix}_unit_id"] = out[f"{prefix}_unit"].map(lambda x: _resolve_unit_id(x, ctx.name_to_id))
+        pairs = out[["item_id", f"{prefix}_unit_id"]].drop_duplicates()
+        factor_map = {
+            (item_id, unit_id): _base_factor(ctx, item_id, unit_id)
+            for item_id, unit_id in pairs.itertuples(index=False, name=None)
+        }
+        factors = pd.Series(
+            [factor_map[key] for key in zip(out["item_id"], out[f"{prefix}_unit_id"])],
+            index=out.index,
+            dtype="float64",
+        )
+        out[f"{prefix}_base_qty"] = (out[f"{prefix}_qty"] * factors).round(4)
+
+    # 價格查詢（require_price=false：找不到價格安全落地 0，不阻擋送出）
+    has_order = out["order_qty"] > 0
+    cost_map = _base_unit_costs(ctx, out.loc[has_order, "item_id"])
+    costs = out["item_id"].map(cost_map).fillna(0.0).where(has_order, 0.0)
+    has_cost = costs > 0
+    amount = (out["order_base_qty"] * costs).round(1).where(has_cost, 0.0)
+    has_qty = has_cost & has_order
+    out["amount"] = amount
+    out["unit_price"] = (amount / out["order_qty"].where(has_qty, 1.0)).round(4).where(has_qty, 0.0)
+    return out
 
 
 # ============================================================
@@ -176,43 +220,57 @@ def submit_stocktake(
     today = date.today()
     now = _now_ts()
 
-    # 載入換算與價格資料（各一次，供全部廠商群組共用）
-    conversions_df = read_table("unit_conversions")
-    prices_df = read_table("prices")
-    name_to_id = _build_display_to_unit_id_map()
+    ctx = _build_write_context(items_df, today)
 
     # 建立 item_id → item 資訊快查表
     item_lookup: dict[str, dict] = {}
-    for _, row in items_df.iterrows():
-        item_id = _norm(row.get("item_id", ""))
-        if item_id:
-            item_lookup[item_id] = {
-                "name": _norm(row.get("name", "") or item_id),
-                "vendor_id": _norm(row.get("default_vendor_id", "")),
-                "base_unit": _norm(row.get("base_unit", "")),
-            }
-
-    # 依廠商分組 results
-    vendor_groups: dict[str, list[dict]] = {}
+    if not items_df.empty and "item_id" in items_df.columns:
+        empty = pd.Series("", index=items_df.index)
+        for item_id, name, vendor_id, base_unit in zip(
+            items_df["item_id"].map(_norm),
+            items_df.get("name", empty),
+            items_df.get("default_vendor_id", empty).map(_norm),
+            items_df.get("base_unit", empty).map(_norm),
+        ):
+            if item_id:
+                item_lookup[item_id] = {
+                    "name": _norm(name or item_id),
+                    "vendor_id": vendor_id,
+                    "base_unit": base_unit,
+                }
+
+    # 過濾有效明細（無廠商的品項跳過，需在品項主資料設定 default_vendor_id）
+    line_records: list[dict] = []
     for result in results:
         item_id = _norm(result.get("item_id", ""))
         if not item_id or item_id not in item_lookup:
             continue
         vendor_id = item_lookup[item_id]["vendor_id"]
         if not vendor_id:
-            # 無廠商的品項跳過（需在品項主資料設定 default_vendor_id）
             continue
-        vendor_groups.setdefault(vendor_id, []).append(result)
-
-    if not vendor_groups:
+        line_records.append({
+            "item_id": item_id,
+            "vendor_id": vendor_id,
+            "item_name": item_lookup[item_id].get("name", item_id),
+            "stock_qty": float(result.get("stock_qty", 0) or 0),
+            "stock_unit": _norm(result.get("stock_unit", "")),
+            "order_qty": float(result.get("order_qty", 0) or 0),
+            "order_unit": _norm(result.get("order_unit", "")),
+        })
+
+    if not line_records:
         raise StocktakeWriteError(
             "無有效品項可寫入：請確認品項已設定廠商（default_vendor_id）"
         )
 
+    lines_df = _prepare_lines(ctx, pd.DataFrame(line_records))
+
     created_stocktake_ids: list[str] = []
     created_po_ids: list[str] = []
 
-    for vendor_id, vendor_results in vendor_groups.items():
+    # 依廠商分組（維持 results 中廠商首次出現的順序）
+    for vendor_id, vendor_lines in lines_df.groupby("vendor_id", sort=False):
+        vendor_records = vendor_lines.to_dict("records")
 
         # ── Step 1: stocktakes 主記錄 ──────────────────────────────
         stocktake_id = allocate_stocktake_id()
@@ -229,45 +287,24 @@ def submit_stocktake(
         append_rows_by_header("stocktakes", _STOCKTAKE_HEADER, [stocktake_row])
 
         # ── Step 2: stocktake_lines 明細 ──────────────────────────
-        line_ids = allocate_stocktake_line_ids(len(vendor_results))
+        line_ids = allocate_stocktake_line_ids(len(vendor_records))
         line_rows: list[dict] = []
 
-        for i, result in enumerate(vendor_results):
-            item_id = _norm(result.get("item_id", ""))
-            meta = item_lookup.get(item_id, {})
-
-            stock_qty = float(result.get("stock_qty", 0) or 0)
-            order_qty = float(result.get("order_qty", 0) or 0)
-            stock_unit_display = _norm(result.get("stock_unit", ""))
-            order_unit_display = _norm(result.get("order_unit", ""))
-
-            stock_unit_id = _resolve_unit_id(stock_unit_display, name_to_id)
-            order_unit_id = _resolve_unit_id(order_unit_display, name_to_id)
-
-            base_qty = _safe_base_qty(
-                item_id=item_id,
-                qty=stock_qty,
-                from_unit_display=stock_unit_display,
-                items_df=items_df,
-                conversions_df=conversions_df,
-                name_to_id=name_to_id,
-                today=today,
-            )
-
+        for i, line in enumerate(vendor_records):
             line_rows.append({
                 "stocktake_line_id": line_ids[i],
                 "stocktake_id": stocktake_id,
                 "store_id": store_id,
                 "vendor_id": vendor_id,
-                "item_id": item_id,
-                "item_name": meta.get("name", item_id),
-                "stock_qty": stock_qty,
-                "stock_unit_id": stock_unit_id,
-                "stock_unit": stock_unit_display,
-                "base_qty": base_qty,
+                "item_id": line["item_id"],
+                "item_name": line["item_name"],
+                "stock_qty": line["stock_qty"],
+                "stock_unit_id": line["stock_unit_id"],
+                "stock_unit": line["stock_unit"],
+                "base_qty": line["stock_base_qty"],
                 "suggested_order_qty": 0,
-                "order_qty": order_qty,
-                "order_unit_id": order_unit_id,
+                "order_qty": line["order_qty"],
+                "order_unit_id": line["order_unit_id"],
                 "created_at": now,
             })
 
@@ -275,10 +312,7 @@ def submit_stocktake(
         created_stocktake_ids.append(stocktake_id)
 
         # ── Step 3: purchase_orders（僅 order_qty > 0 的品項）──────
-        order_items = [
-            r for r in vendor_results
-            if float(r.get("order_qty", 0) or 0) > 0
-        ]
+        order_items = [line for line in vendor_records if line["order_qty"] > 0]
         if not order_items:
             continue
 
@@ -301,49 +335,21 @@ def submit_stocktake(
         pol_ids = allocate_purchase_order_line_ids(len(order_items))
         pol_rows: list[dict] = []
 
-        for i, result in enumerate(order_items):
-            item_id = _norm(result.get("item_id", ""))
-            meta = item_lookup.get(item_id, {})
-
-            order_qty = float(result.get("order_qty", 0) or 0)
-            order_unit_display = _norm(result.get("order_unit", ""))
-            order_unit_id = _resolve_unit_id(order_unit_display, name_to_id)
-
-            order_base_qty = _safe_base_qty(
-                item_id=item_id,
-                qty=order_qty,
-                from_unit_display=order_unit_display,
-                items_df=items_df,
-                conversions_df=conversions_df,
-                name_to_id=name_to_id,
-                today=today,
-            )
-
-            # 價格查詢（require_price=false：找不到價格安全落地 0，不阻擋送出）
-            unit_price, amount = _safe_unit_price(
-                item_id=item_id,
-                order_qty=order_qty,
-                order_base_qty=order_base_qty,
-                items_df=items_df,
-                prices_df=prices_df,
-                conversions_df=conversions_df,
-                today=today,
-            )
-
+        for i, line in enumerate(order_items):
             pol_rows.append({
                 "po_line_id": pol_ids[i],
                 "po_id": po_id,
                 "store_id": store_id,
                 "vendor_id": vendor_id,
-                "item_id": item_id,
-                "item_name": meta.get("name", item_id),
-                "qty": order_qty,
-                "order_qty": order_qty,
-                "unit_id": order_unit_id,
-                "order_unit": order_unit_display,
-                "base_qty": order_base_qty,
-                "unit_price": unit_price,
-                "amount": amount,
+                "item_id": line["item_id"],
+                "item_name": line["item_name"],
+                "qty": line["order_qty"],
+                "order_qty": line["order_qty"],
+                "unit_id": line["order_unit_id"],
+                "order_unit": line["order_unit"],
+                "base_qty": line["order_base_qty"],
+                "unit_price": line["unit_price"],
+                "amount": line["amount"],
                 "created_at": now,
             })
 
@@ -7,5 +7,4 @@ __all__ = [
     "app_shell",
     "app_runtime",
     "navigation",
-    "audit_writer",
 ]
\ No newline at end of file
@@ -4,10 +4,17 @@ from pathlib import Path
 
 import pandas as pd
 import streamlit as st
-from shared.services.supabase_client import delete_rows, fetch_table, insert_rows, update_rows
+from shared.services.supabase_client import (
+    delete_rows,
+    fetch_table,
+    insert_rows,
+    iter_filtered_pages,
+    update_rows,
+    upsert_rows,
+)
 from shared.services.table_contract import TABLE_CONTRACT
 
-from shared.utils.common_helpers import _norm
+from shared.utils.common_helpers import _norm, _parse_date
 
 BASE_DIR = Path(__file__).resolve().parent
 LOCAL_SERVICE_ACCOUNT = BASE_DIR / "service_account.json"
@@ -53,6 +60,75 @@ def _table_versions_signature(sheet_names: list[str] | tuple[str, ...]) -> tuple
     return tuple((str(name).strip(), get_table_version(name)) for name in sheet_names)
 
 
+# ---------------------------------------------------------------------------
+# 分區版本號（partition-aware）
+# 寫入時若指定 store_id（與日期），只讓該分店 / 月份的版本 +1；
+# 依分店計算的衍生快取改用分區簽章，其他分店的寫入不會讓它失效。
+# ---------------------------------------------------------------------------
+_PARTITION_ALL = "__all__"
+
+
+def _get_partition_version_map() -> dict:
+    """每張表依分店、月份細分的快取版本號。"""
+    return st.session_state.setdefault("_table_partition_versions", {})
+
+
+def _month_key(value) -> str:
+    parsed = _parse_date(value)
+    return parsed.strftime("%Y-%m") if parsed else ""
+
+
+def get_partition_version(sheet_name: str, store_id: str, through_date=None) -> tuple[int, int, int]:
+    """
+    回傳 (整表版本, 分店版本, 月份版本合計)。
+    through_date 有值時只計入該日期所在月份（含）以前的寫入，
+    之後月份的寫入不影響截至該日期的衍生資料。
+    """
+    table_entry = _get_partition_version_map().get(_norm(sheet_name), {})
+    store_entry = table_entry.get(_norm(store_id), {})
+    through_month = _month_key(through_date) if through_date is not None else ""
+    month_total = sum(
+        int(count)
+        for month, count in store_entry.get("months", {}).items()
+        if not through_month or month <= through_month
+    )
+    return (
+        int(table_entry.get(_PARTITION_ALL, 0)),
+        int(store_entry.get(_PARTITION_ALL, 0)),
+        month_total,
+    )
+
+
+def _partition_versions_signature(
+    sheet_names: list[str] | tuple[str, ...],
+    store_id: str,
+    through_date=None,
+) -> tuple[tuple[str, tuple[int, int, int]], ...]:
+    """把多張表在指定分店（截至 through_date 月份）的版本整理成簽章。"""
+    return tuple(
+        (str(name).strip(), get_partition_version(name, store_id, through_date))
+        for name in sheet_names
+    )
+
+
+def _bump_partition_versions(targets: list[str], store_id: str | None, dates) -> None:
+    partition_versions = _get_partition_version_map()
+    store_key = _norm(store_id) if store_id else ""
+    month_keys = sorted({m for m in (_month_key(d) for d in (dates or [])) if m})
+    for name in targets:
+        table_entry = partition_versions.setdefault(_norm(name), {_PARTITION_ALL: 0})
+        if not store_key:
+            table_entry[_PARTITION_ALL] = int(table_entry.get(_PARTITION_ALL, 0)) + 1
+            continue
+        store_entry = table_entry.setdefault(store_key, {_PARTITION_ALL: 0, "months": {}})
+        if not month_keys:
+            store_entry[_PARTITION_ALL] = int(store_entry.get(_PARTITION_ALL, 0)) + 1
+            continue
+        months = store_entry.setdefault("months", {})
+        for month in month_keys:
+            months[month] = int(months.get(month, 0)) + 1
+
+
 def _get_runtime_df_cache() -> dict:
     """取得 session 內衍生 DataFrame 快取。"""
     return st.session_state.setdefault("_runtime_df_cache", {})
@@ -154,6 +230,53 @@ def read_table(sheet_name: str, force_refresh: bool = False) -> pd.DataFrame:
         return pd.DataFrame()
 
 
+# in_ 條件每次查詢最多帶幾個值（PostgREST 條件放在 URL，過長會被拒）
+_IN_FILTER_CHUNK = 200
+
+
+def read_table_where(
+    sheet_name: str,
+    *,
+    columns: str = "*",
+    eq: dict | None = None,
+    in_: dict | None = None,
+    is_null: tuple[str, ...] = (),
+    gte: dict | None = None,
+    lte: dict | None = None,
+    order_col: str | None = None,
+) -> pd.DataFrame:
+    """
+    依條件讀取部分資料列（條件在資料庫端過濾），不經過整表快取。
+    供分店 / 日期區段的分段計算使用；in_ 的第一個欄位依 _IN_FILTER_CHUNK 分批查詢。
+    """
+    in_ = {k: list(dict.fromkeys(v)) for k, v in (in_ or {}).items()}
+    if any(not values for values in in_.values()):
+        return pd.DataFrame()
+    chunk_col = next(iter(in_), None)
+    chunk_values = in_[chunk_col] if chunk_col else [None]
+    step = _IN_FILTER_CHUNK if chunk_col else 1
+    rows: list[dict] = []
+    for start in range(0, len(chunk_values), step):
+        if chunk_col:
+            in_[chunk_col] = chunk_values[start:start + step]
+        for batch in iter_filtered_pages(
+            sheet_name,
+            columns=columns,
+            eq=eq,
+            in_=in_,
+            is_null=is_null,
+            gte=gte,
+            lte=lte,
+            order_col=order_col,
+        ):
+            rows.extend(batch)
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame(rows)
+    df.columns = [_norm(c) for c in df.columns]
+    return df
+
+
 def get_header(sheet_name: str, force_refresh: bool = False) -> list[str]:
     cache = _get_runtime_header_cache()
     cache_key, current_version = _resolve_table_version(sheet_name, force_refresh=force_refresh)
@@ -306,6 +429,54 @@ def update_row_by_match(sheet_name: str, key_field: str, key_value: str, updates
     bust_cache(sheet_name)
 
 
+def upsert_rows_by_primary_key(sheet_name: str, rows: list[dict], *, chunk_rows: int = 500):
+    """
+    多筆資料依 chunk_rows 分批 upsert（以 TABLE_CONTRACT 的 primary_key 判斷衝突），
+    全部寫完後只 bust 一次快取；中途失敗時已送出的批次仍會清快取。
+    每列需帶完整欄位：PostgreSQL 在判斷衝突前就會檢查 NOT NULL，只帶部分欄位會失敗。
+    """
+    if not rows:
+        return
+    contract = _get_table_contract(sheet_name)
+    if not contract or not contract.get("primary_key"):
+        raise ValueError(f"{sheet_name} 未定義 primary_key，無法批次 upsert")
+    for row in rows:
+        _validate_required_columns(sheet_name, row)
+        _validate_primary_key_presence(sheet_name, row)
+    step = max(int(chunk_rows), 1)
+    try:
+        for start in range(0, len(rows), step):
+            upsert_rows(sheet_name, rows[start:start + step], on_conflict=contract["primary_key"])
+    finally:
+        bust_cache(sheet_name)
+
+
+def upsert_fields_by_primary_key(sheet_name: str, rows: list[dict], *, chunk_rows: int = 500):
+    """
+    只更新既有資料的部分欄位：每列只帶 primary_key 與要改的欄位，其他欄位保持資料庫現值，
+    不會用快取中的舊整列覆蓋別人剛存的修改。
+    PostgREST 批次 upsert 會以各列欄位的聯集送出、缺少的欄位補 NULL，
+    因此同一次呼叫的每列欄位必須一致；欄位組合不同請分開呼叫。
+    只用於 primary_key 已存在的列（不檢查 required_columns），新增資料請用 upsert_rows_by_primary_key。
+    """
+    if not rows:
+        return
+    contract = _get_table_contract(sheet_name)
+    if not contract or not contract.get("primary_key"):
+        raise ValueError(f"{sheet_name} 未定義 primary_key，無法批次 upsert")
+    keys = set(rows[0])
+    for row in rows:
+        _validate_primary_key_presence(sheet_name, row)
+        if set(row) != keys:
+            raise ValueError(f"[{sheet_name}] 部分欄位 upsert 的每列欄位必須一致：{sorted(keys)} ≠ {sorted(row)}")
+    step = max(int(chunk_rows), 1)
+    try:
+        for start in range(0, len(rows), step):
+            upsert_rows(sheet_name, rows[start:start + step], on_conflict=contract["primary_key"])
+    finally:
+        bust_cache(sheet_name)
+
+
 def delete_row_by_match(sheet_name: str, key_field: str, key_value: str):
     """依指定鍵值刪除單筆資料，寫入 Supabase。"""
     key_value = _norm(key_value)
@@ -321,13 +492,20 @@ def _safe_clear_callable_cache(fn):
         clear_fn()
 
 
-def bust_cache(sheet_names: str | list[str] | tuple[str, ...] | None = None):
+def bust_cache(
+    sheet_names: str | list[str] | tuple[str, ...] | None = None,
+    *,
+    store_id: str | None = None,
+    dates=None,
+):
     """
     清除資料快取。
 
     規則：
     1. 不指定表名：維持舊行為，全部清掉
     2. 指定表名：只讓該表版本號 +1，並清除該表的 session 快取
+    3. 另指定 store_id（與 dates）：分區版本只在該分店（該月份）+1，
+       其他分店依分區簽章的衍生快取保留
     """
     if not sheet_names:
         _safe_clear_callable_cache(_read_table_remote)
@@ -338,6 +516,11 @@ def bust_cache(sheet_names: str | list[str] | tuple[str, ...] | None = None):
         st.session_state.pop("_runtime_df_cache", None)
         st.session_state.pop("_runtime_sheet_snapshot_cache", None)
         st.session_state.pop("_table_cache_versions", None)
+        st.session_state.pop("_table_partition_versions", None)
+        st.session_state.pop("_view_model_cache", None)
+        st.session_state.pop("_label_map_cache", None)
+        st.session_state.pop("_item_search_index", None)
+        st.session_state.pop("_users_index", None)
         return
 
     if isinstance(sheet_names, str):
@@ -376,6 +559,8 @@ def bust_cache(sheet_names: str | list[str] | tuple[str, ...] | None = None):
         for stale_df_key in stale_df_keys:
             df_cache.pop(stale_df_key, None)
 
+    _bump_partition_versions(targets, store_id, dates)
+
 
 # ---------------------------------------------------------------------------
 # 以下為資料存取功能層，供 app_runtime / service_stores /
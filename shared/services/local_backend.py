@@ -0,0 +1,775 @@
+from __future__ import annotations
+
+# ============================================================
+# ORIVIA OMS
+# 檔案：shared/services/local_backend.py
+# 說明：本機 SQLite 後端 — 提供與 supabase-py client 相同的鏈式 API
+#       （table().select/insert/update/upsert/delete + eq 類篩選 + order/range，
+#       以及 rpc("rpc_save_order_transaction")），讓 supabase_client 的
+#       fetch_table / insert_rows / update_rows / upsert_rows / delete_rows
+#       與 service_order_rpc 不改一行就能切到本機檔案。
+#       schema 由 supabase/migrations 轉譯後依序套用（已套用的檔名記在
+#       _local_migrations），再以 TABLE_CONTRACT 補齊 Dashboard 手動加過、
+#       migrations 沒記錄的欄位。欄位保留 PostgreSQL 宣告型別，寫入時依型別
+#       檢查輸入（"" 寫進 DATE / TIMESTAMP 一樣失敗），upsert 的 on_conflict、
+#       批次寫入的欄位聯集補 NULL 也與 PostgREST 相同，本機能通過的寫入線上也能通過。
+#       用途：頁面壓測、可重現的 benchmark、門市離線備援。
+# ============================================================
+
+import json
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from types import SimpleNamespace
+
+from shared.services.table_contract import TABLE_CONTRACT
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / "supabase" / "migrations"
+
+# migrations 之外（由 Supabase Dashboard 建立）但應用層會讀寫的表；
+# 026 / 027 / 030 的 seed 會寫入這兩張表，必須先存在。
+_BASE_SCHEMA: tuple[str, ...] = (
+    "CREATE TABLE IF NOT EXISTS permissions ("
+    " permission_id TEXT PRIMARY KEY, permission_key TEXT)",
+    "CREATE TABLE IF NOT EXISTS role_permissions ("
+    " role_id TEXT NOT NULL, permission_id TEXT NOT NULL,"
+    " PRIMARY KEY (role_id, permission_id))",
+    # 型別對齊 rpc_save_order_transaction 寫入時的轉型（ts::timestamptz、before_json / after_json 為 jsonb）
+    "CREATE TABLE IF NOT EXISTS audit_logs ("
+    " audit_id TEXT PRIMARY KEY, ts TIMESTAMPTZ, user_id TEXT, action TEXT, table_name TEXT,"
+    " entity_id TEXT, before_json JSONB, after_json JSONB, note TEXT)",
+)
+
+_LEDGER_TABLE = "_local_migrations"
+
+# 只對 PostgreSQL 有意義的語句：RLS / policy / 權限 / plpgsql 函式與 DO 區塊。
+# rpc_save_order_transaction 由本模組以 Python 實作（見 _rpc_save_order_transaction）。
+_SKIP_PREFIXES: tuple[str, ...] = (
+    "CREATE OR REPLACE FUNCTION", "CREATE FUNCTION", "DROP FUNCTION",
+    "DO ", "DO$", "GRANT ", "REVOKE ", "CREATE POLICY", "DROP POLICY", "COMMENT ON",
+)
+
+_IDENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_DOLLAR_TAG_RE = re.compile(r"\$[A-Za-z_]*\$")
+_PUBLIC_RE = re.compile(r"\bpublic\.", re.IGNORECASE)
+_NOW_RE = re.compile(r"\bnow\(\)", re.IGNORECASE)
+_SERIAL_RE = re.compile(r"\b(\w+)\s+(?:BIG)?SERIAL\b", re.IGNORECASE)
+_NUMERIC_TYPE_RE = re.compile(r"^(?:NUMERIC|DECIMAL|INTEGER|INT|BIGINT|SMALLINT|REAL|DOUBLE|FLOAT)\b")
+_ALTER_TABLE_RE = re.compile(r"^ALTER\s+TABLE\s+(?:IF\s+EXISTS\s+)?(\w+)\s+(.*)$", re.IGNORECASE | re.DOTALL)
+_ADD_COLUMN_RE = re.compile(r"^ADD\s+COLUMN\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*(.*)$", re.IGNORECASE | re.DOTALL)
+
+# PostgreSQL boolean 接受的文字輸入
+_PG_TRUE = {"t", "true", "y", "yes", "on", "1"}
+_PG_FALSE = {"f", "false", "n", "no", "off", "0"}
+
+
+def _ident(name: str) -> str:
+    name = str(name or "").strip()
+    if not _IDENT_RE.match(name):
+        raise ValueError(f"不合法的資料表或欄位名稱：{name!r}")
+    return f'"{name}"'
+
+
+def _encode(value):
+    """寫入前轉換：dict / list（jsonb 欄位）轉 JSON 字串，其餘交給 sqlite3。"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+@lru_cache(maxsize=None)
+def _type_kind(declared: str) -> str:
+    """PRAGMA table_info 的宣告型別 → 寫入檢查類別；未宣告型別（TABLE_CONTRACT 補的欄位）視為 text。"""
+    declared = declared.upper()
+    if declared == "DATE":
+        return "date"
+    if declared.startswith("TIMESTAMP"):
+        return "timestamp"
+    if declared in ("JSON", "JSONB"):
+        return "json"
+    if declared in ("BOOLEAN", "BOOL"):
+        return "boolean"
+    if _NUMERIC_TYPE_RE.match(declared):
+        return "numeric"
+    return "text"
+
+
+def _invalid_input(kind: str, column: str, value) -> ValueError:
+    return ValueError(f"invalid input syntax for type {kind}: {value!r}（{column}）")
+
+
+def _parse_datetime(text: str) -> datetime:
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return datetime.fromisoformat(text.replace("/", "-"))
+
+
+def _coerce(kind: str, column: str, value):
+    """
+    table() 寫入前依欄位的 PG 型別檢查並轉換，對應 PostgREST 把 JSON 值轉成欄位型別：
+    jsonb 一律存 JSON 文字（Python 字串也是 JSON 字串值），空字串或無法解析的日期 / 時間 /
+    數字 / 布林直接拋錯，DATE 只留日期部分。
+    """
+    if value is None:
+        return None
+    if kind == "json":
+        return json.dumps(value, ensure_ascii=False)
+    if kind == "text":
+        return _encode(value)
+    if kind == "boolean":
+        if isinstance(value, bool):
+            return int(value)
+        text = str(value).strip().lower()
+        if text in _PG_TRUE:
+            return 1
+        if text in _PG_FALSE:
+            return 0
+        raise _invalid_input(kind, column, value)
+    if kind == "numeric":
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        try:
+            float(str(value).strip())
+        except ValueError:
+            raise _invalid_input(kind, column, value) from None
+        return str(value).strip()
+    # date / timestamp
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        parsed = datetime(value.year, value.month, value.day)
+    else:
+        try:
+            parsed = _parse_datetime(str(value).strip())
+        except ValueError:
+            raise _invalid_input(kind, column, value) from None
+    if kind == "date":
+        return parsed.date().isoformat()
+    return value if isinstance(value, str) else parsed.isoformat()
+
+
+# ---------------------------------------------------------------------------
+# migrations 轉譯
+# ---------------------------------------------------------------------------
+
+def split_sql_statements(sql: str) -> list[str]:
+    """依分號切分 SQL；略過 -- 註解，字串與 $$ … $$ 區塊內的分號不切。"""
+    out: list[str] = []
+    buf: list[str] = []
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if sql.startswith("--", i):
+            j = sql.find("\n", i)
+            i = n if j < 0 else j
+            continue
+        if ch == "'":
+            j = i + 1
+            while j < n:
+                if sql[j] == "'":
+                    if sql.startswith("''", j):
+                        j += 2
+                        continue
+                    break
+                j += 1
+            buf.append(sql[i:j + 1])
+            i = j + 1
+            continue
+        if ch == "$":
+            m = _DOLLAR_TAG_RE.match(sql, i)
+            if m:
+                j = sql.find(m.group(0), m.end())
+                j = n if j < 0 else j + len(m.group(0))
+                buf.append(sql[i:j])
+                i = j
+                continue
+        if ch == ";":
+            stmt = "".join(buf).strip()
+            if stmt:
+                out.append(stmt)
+            buf = []
+            i += 1
+            continue
+        buf.append(ch)
+        i += 1
+    stmt = "".join(buf).strip()
+    if stmt:
+        out.append(stmt)
+    return out
+
+
+def _translate_ddl(sql: str) -> str:
+    """
+    PostgreSQL DDL 轉 SQLite：只把 SERIAL 換成 INTEGER PRIMARY KEY AUTOINCREMENT。
+    DATE / TIMESTAMP / JSONB 等型別名稱照原樣保留（SQLite 接受任意型別名稱），
+    寫入時才能依宣告型別檢查；這些型別在 SQLite 為 NUMERIC affinity，ISO 日期與 JSON 文字照原樣存。
+    """
+    for col in _SERIAL_RE.findall(sql):
+        sql = re.sub(rf",\s*PRIMARY\s+KEY\s*\(\s*{col}\s*\)", "", sql, flags=re.IGNORECASE)
+    return _SERIAL_RE.sub(r"\1 INTEGER PRIMARY KEY AUTOINCREMENT", sql)
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> dict[str, str]:
+    """欄位名稱 → 宣告型別（大寫）；表不存在時回傳空字典。"""
+    return {str(r[1]): str(r[2] or "").upper() for r in conn.execute(f"PRAGMA table_info({_ident(table)})")}
+
+
+def _apply_statement(conn: sqlite3.Connection, stmt: str) -> None:
+    head = " ".join(stmt.split()).upper()
+    if head.startswith(_SKIP_PREFIXES) or "ROW LEVEL SECURITY" in head or " ADD CONSTRAINT " in head:
+        return
+    sql = _NOW_RE.sub("CURRENT_TIMESTAMP", _PUBLIC_RE.sub("", stmt))
+    if head.startswith("CREATE TABLE"):
+        conn.execute(_translate_ddl(sql))
+        return
+    m = _ALTER_TABLE_RE.match(sql.strip())
+    if m and "ADD COLUMN" in head:
+        # SQLite 沒有 ADD COLUMN IF NOT EXISTS，也不能一句加多欄：逐欄比對後補上
+        table, rest = m.group(1), m.group(2)
+        existing = _table_columns(conn, table)
+        for clause in re.split(r",\s*(?=ADD\s+COLUMN\b)", rest.strip(), flags=re.IGNORECASE):
+            cm = _ADD_COLUMN_RE.match(clause.strip())
+            if not cm:
+                raise ValueError(f"無法轉譯的 ALTER TABLE 子句：{clause.strip()}")
+            col, definition = cm.group(1), _translate_ddl(cm.group(2).strip())
+            if col not in existing:
+                conn.execute(f"ALTER TABLE {_ident(table)} ADD COLUMN {_ident(col)} {definition}")
+                existing[col] = definition.upper()
+        return
+    conn.execute(sql)
+
+
+def _ensure_contract_columns(conn: sqlite3.Connection) -> None:
+    """TABLE_CONTRACT 有、migrations 沒建的欄位（線上由 Dashboard 加上）以不指定型別補齊。"""
+    for table, contract in TABLE_CONTRACT.items():
+        columns = list(contract.get("columns_order") or [])
+        existing = _table_columns(conn, table)
+        if not existing:
+            pk = contract.get("primary_key")
+            defs = [f"{_ident(c)} TEXT PRIMARY KEY" if c == pk else _ident(c) for c in columns]
+            conn.execute(f"CREATE TABLE {_ident(table)} ({', '.join(defs)})")
+            continue
+        for col in columns:
+            if col not in existing:
+                conn.execute(f"ALTER TABLE {_ident(table)} ADD COLUMN {_ident(col)}")
+
+
+# ---------------------------------------------------------------------------
+# table() 查詢物件：對應 supabase-py 的 request builder
+# ---------------------------------------------------------------------------
+
+class _LocalQuery:
+    """單次 table 操作；鏈式呼叫只累積條件，execute() 時才存取資料庫。"""
+
+    def __init__(self, backend: "LocalSqliteBackend", table: str):
+        self._backend = backend
+        self._table = table
+        self._op = "select"
+        self._payload = None
+        self._on_conflict: str | None = None
+        self._select: list[str] | None = None
+        self._filters: list[tuple[str, str, object]] = []
+        self._order: list[tuple[str, bool]] = []
+        self._offset = 0
+        self._limit: int | None = None
+
+    def select(self, *columns: str):
+        """select("a,b") / select("a", "b")；"*" 或不帶參數為全部欄位。"""
+        names = [c.strip() for text in columns for c in str(text).split(",") if c.strip()]
+        self._op = "select"
+        self._select = None if not names or "*" in names else names
+        return self
+
+    def insert(self, rows):
+        self._op, self._payload = "insert", rows
+        return self
+
+    def update(self, values: dict):
+        self._op, self._payload = "update", values
+        return self
+
+    def upsert(self, rows, on_conflict: str | None = None):
+        self._op, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self._filters.append((column, "=", value))
+        return self
+
+    def neq(self, column: str, value):
+        self._filters.append((column, "<>", value))
+        return self
+
+    def in_(self, column: str, values):
+        self._filters.append((column, "IN", list(values)))
+        return self
+
+    def is_(self, column: str, value):
+        self._filters.append((column, "IS", value))
+        return self
+
+    def gt(self, column: str, value):
+        self._filters.append((column, ">", value))
+        return self
+
+    def gte(self, column: str, value):
+        self._filters.append((column, ">=", value))
+        return self
+
+    def lt(self, column: str, value):
+        self._filters.append((column, "<", value))
+        return self
+
+    def lte(self, column: str, value):
+        self._filters.append((column, "<=", value))
+        return self
+
+    def order(self, column: str, *, desc: bool = False):
+        self._order.append((column, bool(desc)))
+        return self
+
+    def range(self, start: int, end: int):
+        self._offset = max(int(start), 0)
+        self._limit = max(int(end) - self._offset + 1, 0)
+        return self
+
+    def limit(self, size: int):
+        self._limit = max(int(size), 0)
+        return self
+
+    def _where(self) -> tuple[str, list]:
+        parts: list[str] = []
+        params: list = []
+        for column, op, value in self._filters:
+            col = _ident(column)
+            if op == "IN":
+                if not value:
+                    parts.append("0")
+                    continue
+                parts.append(f"{col} IN ({', '.join('?' * len(value))})")
+                params.extend(_encode(v) for v in value)
+            elif op == "IS":
+                # PostgREST is.null / is.true / is.false
+                text = str(value).strip().lower() if value is not None else "null"
+                parts.append(f"{col} IS {'NULL' if text == 'null' else ('1' if text == 'true' else '0')}")
+            else:
+                parts.append(f"{col} {op} ?")
+                params.append(_encode(value))
+        return (" WHERE " + " AND ".join(parts)) if parts else "", params
+
+    def execute(self):
+        return SimpleNamespace(data=self._backend._execute(self), count=None)
+
+
+class _LocalRpcCall:
+    def __init__(self, backend: "LocalSqliteBackend", fn: str, params: dict | None):
+        self._backend = backend
+        self._fn = fn
+        self._params = dict(params or {})
+
+    def execute(self):
+        return SimpleNamespace(data=self._backend._call_rpc(self._fn, self._params), count=None)
+
+
+# ---------------------------------------------------------------------------
+# 後端本體
+# ---------------------------------------------------------------------------
+
+class LocalSqliteBackend:
+    """
+    以單一 SQLite 檔案模擬 Supabase：開檔時套用尚未套用的 migrations。
+    Streamlit 多個 session 共用同一連線，所有存取以鎖序列化；
+    每次 execute() / rpc() 為一個交易，失敗整批 rollback（與 PostgREST 單次請求一致）。
+    """
+
+    def __init__(self, path: str | Path, *, migrations_dir: str | Path | None = MIGRATIONS_DIR):
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA busy_timeout = 5000")
+        if self.path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode = WAL")
+        self._columns: dict[str, dict[str, str]] = {}
+        self._conflict_targets: dict[str, set[frozenset[str]]] = {}
+        self.applied_migrations: list[str] = []
+        self.migrate(migrations_dir)
+
+    # -- 交易 / schema ------------------------------------------------------
+
+    @contextmanager
+    def _transaction(self, *, write: bool = True):
+        with self._lock:
+            # 寫入一開始就取得寫鎖，避免多個行程同時壓測時在交易中途才撞到 SQLITE_BUSY
+            self._conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def migrate(self, migrations_dir: str | Path | None = MIGRATIONS_DIR) -> list[str]:
+        """依檔名順序套用尚未套用的 *.sql；每個檔案一個交易，回傳本次套用的檔名。"""
+        applied: list[str] = []
+        with self._transaction() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {_LEDGER_TABLE} (filename TEXT PRIMARY KEY, applied_at TEXT)")
+            for stmt in _BASE_SCHEMA:
+                conn.execute(stmt)
+        done = {r[0] for r in self._conn.execute(f"SELECT filename FROM {_LEDGER_TABLE}")}
+        files = sorted(Path(migrations_dir).glob("*.sql")) if migrations_dir else []
+        for file in files:
+            if file.name in done:
+                continue
+            with self._transaction() as conn:
+                for stmt in split_sql_statements(file.read_text(encoding="utf-8")):
+                    try:
+                        _apply_statement(conn, stmt)
+                    except sqlite3.Error as e:
+                        raise RuntimeError(f"{file.name} 轉譯套用失敗：{e}\n{stmt[:200]}") from e
+                conn.execute(
+                    f"INSERT INTO {_LEDGER_TABLE} (filename, applied_at) VALUES (?, CURRENT_TIMESTAMP)",
+                    (file.name,),
+                )
+            applied.append(file.name)
+        with self._transaction() as conn:
+            _ensure_contract_columns(conn)
+        self._columns.clear()
+        self._conflict_targets.clear()
+        self.applied_migrations.extend(applied)
+        return applied
+
+    def _table_columns(self, table: str) -> dict[str, str]:
+        cols = self._columns.get(table)
+        if cols is None:
+            cols = _table_columns(self._conn, table)
+            if not cols:
+                raise LookupError(f"本機資料庫沒有資料表：{table}")
+            self._columns[table] = cols
+        return cols
+
+    def _primary_key(self, table: str) -> list[str]:
+        rows = [r for r in self._conn.execute(f"PRAGMA table_info({_ident(table)})") if r[5]]
+        return [str(r[1]) for r in sorted(rows, key=lambda r: r[5])]
+
+    def _check_conflict_target(self, table: str, target: tuple[str, ...]) -> None:
+        """
+        PostgREST 的 on_conflict 只能對到主鍵或一般（非 partial）的 UNIQUE 限制，
+        只有 partial unique index 的欄位在 PostgreSQL 會失敗，本機也直接拒絕。
+        """
+        targets = self._conflict_targets.get(table)
+        if targets is None:
+            targets = set()
+            pk = self._primary_key(table)
+            if pk:
+                targets.add(frozenset(pk))
+            for index in self._conn.execute(f"PRAGMA index_list({_ident(table)})"):
+                # (seq, name, unique, origin, partial)
+                if not index[2] or index[4]:
+                    continue
+                cols = [r[2] for r in self._conn.execute(f"PRAGMA index_info({_ident(index[1])})")]
+                if cols and None not in cols:
+                    targets.add(frozenset(str(c) for c in cols))
+            self._conflict_targets[table] = targets
+        if frozenset(target) not in targets:
+            raise ValueError(
+                f"there is no unique or exclusion constraint matching the ON CONFLICT specification："
+                f"{table}({', '.join(target)})"
+            )
+
+    def _prepare_rows(self, table: str, rows: list[dict]) -> list[dict]:
+        """
+        對應 postgrest-py 批次寫入：欄位取各列聯集，某列缺少的欄位送 NULL（default_to_null），
+        不會套用欄位 DEFAULT；再依宣告型別檢查每個值。不存在的欄位與 PostgREST 一樣拒絕。
+        """
+        cols = self._table_columns(table)
+        names = list(dict.fromkeys(c for row in rows for c in row))
+        unknown = [c for c in names if c not in cols]
+        if unknown:
+            raise ValueError(f"{table} 沒有欄位：{', '.join(unknown)}")
+        kinds = {c: _type_kind(cols[c]) for c in names}
+        return [{c: _coerce(kinds[c], c, row.get(c)) for c in names} for row in rows]
+
+    def _decode(self, table: str, row: sqlite3.Row) -> dict:
+        cols = self._table_columns(table)
+        out = dict(row)
+        for key, value in out.items():
+            if value is None:
+                continue
+            kind = _type_kind(cols.get(key, ""))
+            if kind == "boolean":
+                out[key] = bool(value)
+            elif kind == "json":
+                out[key] = json.loads(value) if isinstance(value, str) else value
+        return out
+
+    # -- 公開 API（對應 supabase-py client）------------------------------------
+
+    def table(self, table_name: str) -> _LocalQuery:
+        return _LocalQuery(self, table_name)
+
+    def rpc(self, fn: str, params: dict | None = None) -> _LocalRpcCall:
+        return _LocalRpcCall(self, fn, params)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # -- 執行 -----------------------------------------------------------------
+
+    def _execute(self, q: _LocalQuery) -> list[dict]:
+        table = _ident(q._table)
+        where, params = q._where()
+        with self._transaction(write=q._op != "select") as conn:
+            self._table_columns(q._table)
+            if q._op == "select":
+                order = ", ".join(f"{_ident(c)} {'DESC' if d else 'ASC'} NULLS LAST" for c, d in q._order) or "rowid"
+                columns = ", ".join(_ident(c) for c in q._select) if q._select else "*"
+                sql = f"SELECT {columns} FROM {table}{where} ORDER BY {order}"
+                if q._limit is not None or q._offset:
+                    sql += " LIMIT ? OFFSET ?"
+                    params = [*params, -1 if q._limit is None else q._limit, q._offset]
+                return [self._decode(q._table, r) for r in conn.execute(sql, params)]
+            if q._op in ("update", "delete") and not q._filters:
+                # 與 Supabase（pg_safeupdate）一致：不帶條件的 UPDATE / DELETE 直接拒絕
+                raise ValueError(f"{q._op.upper()} 必須帶篩選條件：{q._table}")
+            if q._op == "update":
+                if not q._payload:
+                    return []
+                values = self._prepare_rows(q._table, [dict(q._payload)])[0]
+                assignments = ", ".join(f"{_ident(c)} = ?" for c in values)
+                sql = f"UPDATE {table} SET {assignments}{where} RETURNING *"
+                rows = conn.execute(sql, [*values.values(), *params]).fetchall()
+                return [self._decode(q._table, r) for r in rows]
+            if q._op == "delete":
+                rows = conn.execute(f"DELETE FROM {table}{where} RETURNING *", params).fetchall()
+                return [self._decode(q._table, r) for r in rows]
+            rows = self._prepare_rows(q._table, q._payload if isinstance(q._payload, list) else [q._payload])
+            if q._op == "insert":
+                return [self._decode(q._table, r) for r in self._insert_rows(conn, q._table, rows)]
+            target = tuple(c.strip() for c in (q._on_conflict or "").split(",") if c.strip()) or tuple(
+                self._primary_key(q._table)
+            )
+            if not target:
+                raise ValueError(f"{q._table} 沒有主鍵，upsert 必須指定 on_conflict")
+            self._check_conflict_target(q._table, target)
+            return [self._decode(q._table, r) for r in self._upsert_rows(conn, q._table, rows, target)]
+
+    def _insert_rows(self, conn: sqlite3.Connection, table: str, rows: list[dict]) -> list[sqlite3.Row]:
+        out = []
+        for row in rows:
+            cols = list(row)
+            sql = (
+                f"INSERT INTO {_ident(table)} ({', '.join(_ident(c) for c in cols)}) "
+                f"VALUES ({', '.join('?' * len(cols))}) RETURNING *"
+            ) if cols else f"INSERT INTO {_ident(table)} DEFAULT VALUES RETURNING *"
+            out.extend(conn.execute(sql, [_encode(row[c]) for c in cols]).fetchall())
+        return out
+
+    def _upsert_rows(
+        self,
+        conn: sqlite3.Connection,
+        table: str,
+        rows: list[dict],
+        target: tuple[str, ...],
+        *,
+        update_columns: tuple[str, ...] | None = None,
+        ignore_duplicates: bool = False,
+        conflict_where: str = "",
+    ) -> list[sqlite3.Row]:
+        """
+        INSERT … ON CONFLICT (target) DO UPDATE SET 這筆帶到的欄位（PostgREST merge-duplicates）。
+        update_columns 指定時只更新這些欄位（RPC 用，對應 SQL 的 DO UPDATE SET 清單）；
+        conflict_where 對應 SQL 的 ON CONFLICT (…) WHERE …，只有 RPC 對 partial unique index 時使用。
+        """
+        predicate = f" WHERE {conflict_where}" if conflict_where else ""
+        out = []
+        for row in rows:
+            cols = list(row)
+            updates = [c for c in (update_columns or cols) if c not in target and c in row]
+            action = (
+                "DO NOTHING" if ignore_duplicates or not updates
+                else "DO UPDATE SET " + ", ".join(f"{_ident(c)} = excluded.{_ident(c)}" for c in updates)
+            )
+            sql = (
+                f"INSERT INTO {_ident(table)} ({', '.join(_ident(c) for c in cols)}) "
+                f"VALUES ({', '.join('?' * len(cols))}) "
+                f"ON CONFLICT ({', '.join(_ident(c) for c in target)}){predicate} {action} RETURNING *"
+            )
+            out.extend(conn.execute(sql, [_encode(row[c]) for c in cols]).fetchall())
+        return out
+
+    def _call_rpc(self, fn: str, params: dict) -> dict:
+        handler = _RPC_FUNCTIONS.get(fn)
+        if handler is None:
+            raise NotImplementedError(f"本機後端未實作 RPC：{fn}")
+        with self._transaction() as conn:
+            return handler(self, conn, **params)
+
+
+# ---------------------------------------------------------------------------
+# rpc_save_order_transaction（對應 migrations/024_fix_rpc_audit_jsonb_extract.sql）
+# 欄位清單、型別轉換與 DO UPDATE 欄位逐一對齊 SQL 版本；任何一段失敗整筆 rollback。
+# ---------------------------------------------------------------------------
+
+def _jtext(value):
+    """對應 jsonb ->>：JSON null / 缺欄 → None，其餘轉文字。"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _cast(src: dict, key: str, kind: str):
+    if kind == "json":
+        # jsonb ->：缺欄為 NULL，值為 null 時仍是 JSON 'null'
+        return json.dumps(src[key], ensure_ascii=False) if key in src else None
+    text = _jtext(src.get(key))
+    if kind == "nullif":
+        return text or None
+    if text is None or kind == "text":
+        return text
+    if kind == "numeric":
+        try:
+            return int(text)
+        except ValueError:
+            try:
+                return float(text)
+            except ValueError:
+                raise ValueError(f"invalid input syntax for type numeric: {text!r}（{key}）") from None
+    if kind == "date":
+        try:
+            return date.fromisoformat(text.strip()[:10]).isoformat()
+        except ValueError:
+            raise ValueError(f"invalid input syntax for type date: {text!r}（{key}）") from None
+    if kind == "timestamptz" and not text.strip():
+        raise ValueError(f"invalid input syntax for type timestamp with time zone: ''（{key}）")
+    return text
+
+
+_TS = "timestamptz"
+
+_RPC_STOCKTAKE_COLUMNS = (
+    ("stocktake_id", "text"), ("store_id", "text"), ("vendor_id", "text"), ("stocktake_date", "date"),
+    ("stocktake_type", "nullif"), ("status", "text"), ("note", "text"),
+    ("created_at", _TS), ("created_by", "text"), ("updated_at", _TS), ("updated_by", "text"),
+)
+# stocktake_type 不在 DO UPDATE：保留初次建立時的 type
+_RPC_STOCKTAKE_UPDATE = (
+    "store_id", "vendor_id", "stocktake_date", "status", "note", "updated_at", "updated_by",
+)
+
+_RPC_STOCKTAKE_LINE_COLUMNS = (
+    ("stocktake_line_id", "text"), ("stocktake_id", "text"), ("store_id", "text"), ("vendor_id", "text"),
+    ("item_id", "text"), ("item_name", "text"), ("qty", "numeric"), ("stock_qty", "numeric"),
+    ("unit_id", "text"), ("stock_unit", "text"), ("stock_unit_id", "text"),
+    ("base_qty", "numeric"), ("base_unit", "text"),
+    ("created_at", _TS), ("created_by", "text"), ("updated_at", _TS), ("updated_by", "text"),
+)
+# 明細表只有 partial unique index，ON CONFLICT 必須帶與索引相同的 WHERE（同 SQL 版本）
+_RPC_STOCKTAKE_LINE_WHERE = "stocktake_line_id IS NOT NULL AND stocktake_line_id <> ''"
+# created_by 不在 DO UPDATE：保留原始建立者
+_RPC_STOCKTAKE_LINE_UPDATE = (
+    "stocktake_id", "store_id", "vendor_id", "item_id", "item_name", "qty", "stock_qty",
+    "unit_id", "stock_unit", "stock_unit_id", "base_qty", "base_unit", "updated_at", "updated_by",
+)
+
+_RPC_PO_COLUMNS = (
+    ("po_id", "text"), ("stocktake_id", "nullif"), ("store_id", "text"), ("vendor_id", "text"),
+    ("po_date", "date"), ("order_date", "date"), ("expected_date", "date"), ("delivery_date", "date"),
+    ("status", "text"), ("created_at", _TS), ("created_by", "text"), ("updated_at", _TS), ("updated_by", "text"),
+)
+_RPC_PO_UPDATE = (
+    "stocktake_id", "store_id", "vendor_id", "po_date", "order_date", "expected_date", "delivery_date",
+    "status", "updated_at", "updated_by",
+)
+
+_RPC_PO_LINE_COLUMNS = (
+    ("po_line_id", "text"), ("po_id", "text"), ("store_id", "text"), ("vendor_id", "text"),
+    ("item_id", "text"), ("item_name", "text"), ("qty", "numeric"), ("order_qty", "numeric"),
+    ("unit_id", "text"), ("order_unit", "text"), ("base_qty", "numeric"), ("base_unit", "text"),
+    ("unit_price", "numeric"), ("amount", "numeric"), ("delivery_date", "date"),
+    ("created_at", _TS), ("created_by", "text"), ("updated_at", _TS), ("updated_by", "text"),
+)
+_RPC_PO_LINE_WHERE = "po_line_id IS NOT NULL AND po_line_id <> ''"
+# created_by 不在 DO UPDATE：保留原始建立者
+_RPC_PO_LINE_UPDATE = (
+    "po_id", "store_id", "vendor_id", "item_id", "item_name", "qty", "order_qty", "unit_id", "order_unit",
+    "base_qty", "base_unit", "unit_price", "amount", "delivery_date", "updated_at", "updated_by",
+)
+
+_RPC_AUDIT_COLUMNS = (
+    ("audit_id", "text"), ("ts", _TS), ("user_id", "text"), ("action", "text"), ("table_name", "text"),
+    ("entity_id", "text"), ("before_json", "json"), ("after_json", "json"), ("note", "text"),
+)
+
+
+def _rpc_rows(value, name: str) -> list[dict]:
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise ValueError(f"cannot extract elements from a scalar（{name}）")
+    return value
+
+
+def _rpc_save_order_transaction(backend: LocalSqliteBackend, conn: sqlite3.Connection, p_payload: dict) -> dict:
+    payload = p_payload or {}
+    st_row = payload.get("stocktake")
+    po_row = payload.get("purchase_order")
+
+    def upsert(table, sources, columns, target, update_columns, *, ignore_duplicates=False, conflict_where=""):
+        rows = [{col: _cast(src, col, kind) for col, kind in columns} for src in sources]
+        backend._upsert_rows(
+            conn, table, rows, target, update_columns=update_columns,
+            ignore_duplicates=ignore_duplicates, conflict_where=conflict_where,
+        )
+
+    if st_row is not None:
+        upsert("stocktakes", [st_row], _RPC_STOCKTAKE_COLUMNS, ("stocktake_id",), _RPC_STOCKTAKE_UPDATE)
+    upsert(
+        "stocktake_lines", _rpc_rows(payload.get("stocktake_lines"), "stocktake_lines"),
+        _RPC_STOCKTAKE_LINE_COLUMNS, ("stocktake_line_id",), _RPC_STOCKTAKE_LINE_UPDATE,
+        conflict_where=_RPC_STOCKTAKE_LINE_WHERE,
+    )
+    if po_row is not None:
+        upsert("purchase_orders", [po_row], _RPC_PO_COLUMNS, ("po_id",), _RPC_PO_UPDATE)
+    upsert(
+        "purchase_order_lines", _rpc_rows(payload.get("purchase_order_lines"), "purchase_order_lines"),
+        _RPC_PO_LINE_COLUMNS, ("po_line_id",), _RPC_PO_LINE_UPDATE,
+        conflict_where=_RPC_PO_LINE_WHERE,
+    )
+    upsert(
+        "audit_logs", _rpc_rows(payload.get("audit_logs"), "audit_logs"),
+        _RPC_AUDIT_COLUMNS, ("audit_id",), (), ignore_duplicates=True,
+    )
+    return {
+        "ok": True,
+        "stocktake_id": _jtext((st_row or {}).get("stocktake_id")) or "",
+        "po_id": _jtext((po_row or {}).get("po_id")) or "",
+    }
+
+
+_RPC_FUNCTIONS = {
+    "rpc_save_order_transaction": _rpc_save_order_transaction,
+}
+
+
+__all__ = [
+    "MIGRATIONS_DIR",
+    "LocalSqliteBackend",
+    "split_sql_statements",
+]
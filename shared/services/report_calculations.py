@@ -1,12 +1,18 @@
 from __future__ import annotations
 
-from datetime import date
+from datetime import date, timedelta
 import copy
 
 import numpy as np
 import pandas as pd
 
-from shared.utils.utils_units import convert_to_base, convert_unit, get_base_unit
+from shared.utils.utils_units import (
+    build_item_unit_graphs,
+    convert_to_base,
+    convert_unit,
+    find_unit_factor,
+    get_base_unit,
+)
 from shared.utils.common_helpers import (
     _get_active_df,
     _item_display_name,
@@ -20,10 +26,17 @@ from shared.utils.common_helpers import (
 from shared.services.data_backend import (
     _session_df_cache_get,
     _session_df_cache_set,
+    _partition_versions_signature,
     _table_versions_signature,
+    _IN_FILTER_CHUNK,
     read_table,
+    read_table_where,
 )
 
+# 交易表依分店 / 月份分區計版本；主檔異動影響所有分店
+_STORE_TRANSACTION_TABLES = ("stocktakes", "stocktake_lines", "purchase_orders", "purchase_order_lines")
+_ITEM_METRICS_MASTER_TABLES = ("items", "vendors", "stores", "unit_conversions")
+
 
 def _parse_vendor_id_from_note(note: str) -> str:
     text = _norm(note)
@@ -96,7 +109,10 @@ def _convert_base_qty_with_cache(
     conversions_df: pd.DataFrame,
     as_of_date: date | None,
     factor_cache: dict,
+    graphs_by_date: dict | None = None,
+    graph_cache: dict | None = None,
 ) -> float:
+    """graphs_by_date 有傳入時，同一日期的換算圖只建一次（批次換算用）；graph_cache 見 build_item_unit_graphs。"""
     if base_qty == 0:
         return 0.0
     if not base_unit or not display_unit or base_unit == display_unit:
@@ -106,16 +122,31 @@ def _convert_base_qty_with_cache(
     factor = factor_cache.get(cache_key)
     if factor is None:
         try:
-            factor = float(
-                convert_unit(
-                    item_id=item_id,
-                    qty=1.0,
-                    from_unit=base_unit,
-                    to_unit=display_unit,
-                    conversions_df=conversions_df,
-                    as_of_date=as_of_date,
+            if graphs_by_date is None:
+                factor = float(
+                    convert_unit(
+                        item_id=item_id,
+                        qty=1.0,
+                        from_unit=base_unit,
+                        to_unit=display_unit,
+                        conversions_df=conversions_df,
+                        as_of_date=as_of_date,
+                    )
+                )
+            else:
+                date_key = cache_key[3]
+                if date_key not in graphs_by_date:
+                    graphs_by_date[date_key] = build_item_unit_graphs(
+                        conversions_df, as_of_date, graph_cache=graph_cache,
+                    )
+                factor = float(
+                    find_unit_factor(
+                        graphs_by_date[date_key].get(cache_key[0], {}),
+                        cache_key[0],
+                        cache_key[1],
+                        cache_key[2],
+                    )
                 )
-            )
         except Exception:
             factor = None
         factor_cache[cache_key] = factor
@@ -153,7 +184,9 @@ def _compute_display_qty_series(
     conversions_df: pd.DataFrame,
     *,
     round_digits: int = 1,
+    unit_graphs: dict | None = None,
 ) -> pd.Series:
+    """unit_graphs 為換算圖快取（依當日有效規則組合），有傳入時沿用呼叫端的快取以便跨批次共用。"""
     if len(base_qtys) == 0:
         return pd.Series(dtype="float64")
 
@@ -173,11 +206,14 @@ def _compute_display_qty_series(
     )
     out = work["base_qty"].astype(float).copy()
     factor_cache: dict = {}
+    graphs_by_date: dict = {}
+    graph_cache: dict = {} if unit_graphs is None else unit_graphs
 
     pending = work.loc[~mask_direct, ["item_id", "base_qty", "base_unit", "display_unit", "as_of_date"]].copy()
     if not pending.empty:
         pending["conv_key"] = list(zip(
             pending["item_id"],
+            pending["base_qty"],
             pending["base_unit"],
             pending["display_unit"],
             pending["as_of_date"],
@@ -194,6 +230,8 @@ def _compute_display_qty_series(
                 conversions_df=conversions_df,
                 as_of_date=row.as_of_date,
                 factor_cache=factor_cache,
+                graphs_by_date=graphs_by_date,
+                graph_cache=graph_cache,
             )
         out.loc[pending.index] = pending["conv_key"].map(qty_map).astype(float)
 
@@ -278,6 +316,100 @@ def get_base_unit_cost(item_id, target_date, items_df, prices_df, conversions_df
 
     return round(unit_price / ratio, 4)
 
+def get_base_unit_costs(item_ids, target_date, items_df, prices_df, conversions_df) -> dict[str, float | None]:
+    """
+    批次版 get_base_unit_cost：一次處理多個品項，回傳 {item_id: base_unit_cost 或 None}。
+    價格篩選、取最新一筆與單位換算皆以欄位運算完成，不逐品項掃描整張表。
+    """
+    wanted = list(dict.fromkeys(_norm(i) for i in item_ids if _norm(i)))
+    result: dict[str, float | None] = {item_id: None for item_id in wanted}
+    if not wanted or items_df.empty or prices_df.empty:
+        return result
+    if "item_id" not in items_df.columns or "base_unit" not in items_df.columns or "item_id" not in prices_df.columns:
+        return result
+
+    items_key = items_df["item_id"].astype(str).str.strip()
+    item_rows = pd.DataFrame({
+        "item_id": items_key,
+        "base_unit": items_df["base_unit"].astype(str).str.strip(),
+    })
+    item_rows = item_rows[item_rows["item_id"].isin(wanted)].drop_duplicates(subset=["item_id"], keep="first")
+    item_rows = item_rows[item_rows["base_unit"] != ""]
+    if item_rows.empty:
+        return result
+
+    price_rows = prices_df.copy()
+    price_rows["item_id"] = price_rows["item_id"].astype(str).str.strip()
+    price_rows = price_rows[price_rows["item_id"].isin(item_rows["item_id"])]
+
+    if "is_active" in price_rows.columns:
+        price_rows = price_rows[
+            price_rows["is_active"].apply(
+                lambda x: str(x).strip() in ["1", "True", "true", "YES", "yes", "是"]
+            )
+        ]
+    if price_rows.empty:
+        return result
+
+    price_rows["__eff"] = price_rows["effective_date"].apply(_parse_date)
+    price_rows["__end"] = price_rows["end_date"].apply(_parse_date)
+    price_rows = price_rows[
+        (price_rows["__eff"].isna() | (price_rows["__eff"] <= target_date))
+        & (price_rows["__end"].isna() | (price_rows["__end"] >= target_date))
+    ]
+    if price_rows.empty:
+        return result
+
+    # 與 get_base_unit_cost 相同：依生效日排序取最後一筆（無生效日者排最後）
+    price_rows["__eff_ts"] = pd.to_datetime(price_rows["__eff"], errors="coerce")
+    latest = (
+        price_rows.sort_values("__eff_ts", ascending=True, kind="mergesort", na_position="last")
+        .groupby("item_id", sort=False)
+        .tail(1)
+    )
+    latest = latest.merge(item_rows, on="item_id", how="inner")
+    latest["__unit_price"] = latest["unit_price"].map(_safe_float) if "unit_price" in latest.columns else 0.0
+    latest["__price_unit"] = latest["price_unit"].astype(str).str.strip() if "price_unit" in latest.columns else ""
+    latest = latest[latest["__unit_price"] != 0]
+    if latest.empty:
+        return result
+
+    name_to_id: dict[str, str] = {}
+    try:
+        _units = read_table("units")
+        if not _units.empty and {"unit_id", "unit_name"}.issubset(_units.columns):
+            name_to_id = {
+                str(n).strip(): str(i).strip()
+                for n, i in zip(_units["unit_name"], _units["unit_id"])
+                if str(n).strip() and str(i).strip()
+            }
+    except Exception:
+        pass
+
+    same_unit = (
+        latest["__price_unit"].eq(latest["base_unit"])
+        | latest["__price_unit"].eq("")
+        | latest["__price_unit"].map(name_to_id).eq(latest["base_unit"])
+    )
+    for item_id, unit_price in zip(latest.loc[same_unit, "item_id"], latest.loc[same_unit, "__unit_price"]):
+        result[item_id] = unit_price
+
+    need_conv = latest[~same_unit]
+    if need_conv.empty or conversions_df.empty:
+        return result
+
+    conv = pd.DataFrame({
+        "item_id": conversions_df["item_id"].astype(str).str.strip(),
+        "__price_unit": conversions_df["from_unit"].astype(str).str.strip(),
+        "base_unit": conversions_df["to_unit"].astype(str).str.strip(),
+        "__ratio": conversions_df["ratio"].map(_safe_float),
+    }).drop_duplicates(subset=["item_id", "__price_unit", "base_unit"], keep="first")
+    need_conv = need_conv.merge(conv, on=["item_id", "__price_unit", "base_unit"], how="inner")
+    need_conv = need_conv[need_conv["__ratio"] != 0]
+    for item_id, unit_price, ratio in zip(need_conv["item_id"], need_conv["__unit_price"], need_conv["__ratio"]):
+        result[item_id] = round(unit_price / ratio, 4)
+    return result
+
 def _get_latest_price_for_item(prices_df: pd.DataFrame, item_id: str, target_date: date) -> float:
     if prices_df.empty or "item_id" not in prices_df.columns:
         return 0.0
@@ -421,18 +553,31 @@ def _build_purchase_detail_df() -> pd.DataFrame:
     if cached is not None:
         return cached
 
-    po_df = read_table("purchase_orders")
-    pol_df = read_table("purchase_order_lines")
-    vendors_df = read_table("vendors")
-    items_df = read_table("items")
-    stores_df = read_table("stores")
-    units_df = read_table("units")
+    merged = _enrich_purchase_detail_df(
+        read_table("purchase_orders"),
+        read_table("purchase_order_lines"),
+        read_table("vendors"),
+        read_table("items"),
+        read_table("stores"),
+        read_table("units"),
+    )
+    return _set_derived_cache(cache_key, table_names, merged)
 
+
+def _enrich_purchase_detail_df(
+    po_df: pd.DataFrame,
+    pol_df: pd.DataFrame,
+    vendors_df: pd.DataFrame,
+    items_df: pd.DataFrame,
+    stores_df: pd.DataFrame,
+    units_df: pd.DataFrame,
+) -> pd.DataFrame:
+    """叫貨明細併表頭與主檔名稱；整表快取與分店 / 日期分段讀取共用。"""
     if po_df.empty or pol_df.empty:
-        return _set_derived_cache(cache_key, table_names, pd.DataFrame())
+        return pd.DataFrame()
 
     if "po_id" not in po_df.columns or "po_id" not in pol_df.columns:
-        return _set_derived_cache(cache_key, table_names, pd.DataFrame())
+        return pd.DataFrame()
 
     pol = pol_df.copy()
     if "base_unit" in pol.columns:
@@ -556,9 +701,7 @@ def _build_purchase_detail_df() -> pd.DataFrame:
     tail_positions = [idx for idx, col in enumerate(col_list) if col in purchase_tail_order]
     head_positions = [idx for idx, col in enumerate(col_list) if col not in purchase_tail_order]
     ordered_positions = head_positions + [col_list.index(col) for col in purchase_tail_order if col in col_list]
-    merged = merged.iloc[:, ordered_positions]
-
-    return _set_derived_cache(cache_key, table_names, merged)
+    return merged.iloc[:, ordered_positions]
 
 def _build_stock_detail_df() -> pd.DataFrame:
     table_names = ("stocktakes", "stocktake_lines", "items", "vendors", "stores", "unit_conversions")
@@ -567,18 +710,33 @@ def _build_stock_detail_df() -> pd.DataFrame:
     if cached is not None:
         return cached
 
-    st_df = read_table("stocktakes")
-    stl_df = read_table("stocktake_lines")
-    items_df = read_table("items")
-    vendors_df = read_table("vendors")
-    stores_df = read_table("stores")
-    conversions_df = _get_active_df(read_table("unit_conversions"))
+    merged = _enrich_stock_detail_df(
+        read_table("stocktakes"),
+        read_table("stocktake_lines"),
+        read_table("items"),
+        read_table("vendors"),
+        read_table("stores"),
+        _get_active_df(read_table("unit_conversions")),
+    )
+    return _set_derived_cache(cache_key, table_names, merged)
+
 
+def _enrich_stock_detail_df(
+    st_df: pd.DataFrame,
+    stl_df: pd.DataFrame,
+    items_df: pd.DataFrame,
+    vendors_df: pd.DataFrame,
+    stores_df: pd.DataFrame,
+    conversions_df: pd.DataFrame,
+    *,
+    unit_graphs: dict | None = None,
+) -> pd.DataFrame:
+    """盤點明細併表頭、主檔名稱與顯示單位數量；整表快取與分店 / 日期分段讀取共用。"""
     if st_df.empty or stl_df.empty:
-        return _set_derived_cache(cache_key, table_names, pd.DataFrame())
+        return pd.DataFrame()
 
     if "stocktake_id" not in st_df.columns or "stocktake_id" not in stl_df.columns:
-        return _set_derived_cache(cache_key, table_names, pd.DataFrame())
+        return pd.DataFrame()
 
     stl = stl_df.copy()
     if "base_unit" in stl.columns:
@@ -677,6 +835,7 @@ def _build_stock_detail_df() -> pd.DataFrame:
         merged["stocktake_date_dt"],
         conversions_df,
         round_digits=1,
+        unit_graphs=unit_graphs,
     )
 
     if "display_order" in merged.columns:
@@ -684,7 +843,7 @@ def _build_stock_detail_df() -> pd.DataFrame:
     else:
         merged["display_order_num"] = 999999
 
-    return _set_derived_cache(cache_key, table_names, merged)
+    return merged
 
 def _sum_purchase_qty_in_display_unit(
     item_po: pd.DataFrame,
@@ -722,36 +881,104 @@ def _sum_purchase_qty_in_display_unit(
 
     return round(total, 1)
 
+def _inventory_history_summary_signature(store_id: str, start_date: date, end_date: date) -> tuple:
+    return (
+        store_id,
+        str(start_date),
+        str(end_date),
+        _partition_versions_signature(_STORE_TRANSACTION_TABLES, store_id, end_date),
+        _table_versions_signature(_ITEM_METRICS_MASTER_TABLES),
+    )
+
+
+def _slice_store_summary(summary_df: pd.DataFrame, store_id: str) -> pd.DataFrame:
+    if summary_df.empty or "store_id" not in summary_df.columns:
+        return pd.DataFrame()
+    out = summary_df[summary_df["store_id"].eq(store_id)]
+    if out.empty:
+        return pd.DataFrame()
+    return out.drop(columns=["store_id"]).reset_index(drop=True)
+
+
 def _build_inventory_history_summary_df(store_id: str, start_date: date, end_date: date) -> pd.DataFrame:
     store_id_norm = str(store_id).strip()
-    signature = (
+    signature = _inventory_history_summary_signature(store_id_norm, start_date, end_date)
+    cache_key = f"derived::inventory_history_summary::{store_id_norm}::{start_date}::{end_date}"
+    cached = _session_df_cache_get(cache_key, signature)
+    if cached is not None:
+        return cached
+
+    out = _slice_store_summary(
+        _compute_inventory_history_summary([store_id_norm], start_date, end_date),
         store_id_norm,
+    )
+    _session_df_cache_set(cache_key, signature, out)
+    return out
+
+
+def _build_inventory_history_summary_multi_df(store_ids: list[str], start_date: date, end_date: date) -> pd.DataFrame:
+    """
+    多門市進銷存彙總：所有門市一次分組計算（以 store × item × vendor 分組），
+    結果帶 store_id 欄；同時回填各門市的單店快取，單店畫面直接切片取得。
+    """
+    store_ids_norm = list(dict.fromkeys(str(s).strip() for s in (store_ids or []) if str(s).strip()))
+    if not store_ids_norm:
+        return pd.DataFrame()
+
+    signature = (
+        tuple(store_ids_norm),
         str(start_date),
         str(end_date),
-        _table_versions_signature(("stocktakes", "stocktake_lines", "purchase_orders", "purchase_order_lines", "items", "vendors", "stores", "unit_conversions")),
+        tuple(_partition_versions_signature(_STORE_TRANSACTION_TABLES, s, end_date) for s in store_ids_norm),
+        _table_versions_signature(_ITEM_METRICS_MASTER_TABLES),
     )
-    cache_key = f"derived::inventory_history_summary::{store_id_norm}::{start_date}::{end_date}"
+    cache_key = f"derived::inventory_history_summary_multi::{','.join(store_ids_norm)}::{start_date}::{end_date}"
     cached = _session_df_cache_get(cache_key, signature)
     if cached is not None:
         return cached
 
-    stock_df = _build_stock_detail_df()
-    po_df = _build_purchase_detail_df()
+    out = _compute_inventory_history_summary(store_ids_norm, start_date, end_date)
+    _session_df_cache_set(cache_key, signature, out)
+    for store_id_norm in store_ids_norm:
+        _session_df_cache_set(
+            f"derived::inventory_history_summary::{store_id_norm}::{start_date}::{end_date}",
+            _inventory_history_summary_signature(store_id_norm, start_date, end_date),
+            _slice_store_summary(out, store_id_norm),
+        )
+    return out
+
+
+def _compute_inventory_history_summary(
+    store_ids: list[str],
+    start_date: date,
+    end_date: date,
+    *,
+    stock_df: pd.DataFrame | None = None,
+    po_df: pd.DataFrame | None = None,
+    unit_graphs: dict | None = None,
+) -> pd.DataFrame:
+    """
+    進銷存彙總核心計算；store_ids 內所有門市同一次 groupby 處理，輸出含 store_id 欄。
+    stock_df / po_df 未指定時使用整表快取的明細；分段計算時由呼叫端傳入已切好的明細。
+    """
+    if stock_df is None:
+        stock_df = _build_stock_detail_df()
+    if po_df is None:
+        po_df = _build_purchase_detail_df()
     conversions_df = _get_active_df(read_table("unit_conversions"))
 
     if stock_df.empty or "store_id" not in stock_df.columns or "stocktake_date_dt" not in stock_df.columns:
-        out = pd.DataFrame()
-        _session_df_cache_set(cache_key, signature, out)
-        return out
+        return pd.DataFrame()
 
-    stock_store_mask = stock_df["store_id"].astype(str).str.strip().eq(store_id_norm)
+    store_set = set(store_ids)
+    stock_store_ids = stock_df["store_id"].astype(str).str.strip()
+    stock_store_mask = stock_store_ids.isin(store_set)
     stock_work = stock_df.loc[stock_store_mask].copy()
+    stock_work["__store_id"] = stock_store_ids[stock_store_mask].to_numpy()
     stock_work = stock_work[stock_work["stocktake_date_dt"].notna()].copy()
 
     if stock_work.empty:
-        out = pd.DataFrame()
-        _session_df_cache_set(cache_key, signature, out)
-        return out
+        return pd.DataFrame()
 
     if "display_order_num" not in stock_work.columns:
         if "display_order" in stock_work.columns:
@@ -774,21 +1001,18 @@ def _build_inventory_history_summary_df(store_id: str, start_date: date, end_dat
     stock_work["__sort_created"] = pd.to_datetime(stock_work["stocktake_created_at"], errors="coerce")
 
     stock_work = stock_work.sort_values(
-        ["stocktake_date_dt", "vendor_id", "item_id", "__sort_updated", "__sort_created", "stocktake_id"],
-        ascending=[True, True, True, True, True, True],
+        ["__store_id", "stocktake_date_dt", "vendor_id", "item_id", "__sort_updated", "__sort_created", "stocktake_id"],
+        ascending=[True, True, True, True, True, True, True],
         kind="mergesort",
     ).drop_duplicates(
-        subset=["stocktake_date_dt", "vendor_id", "item_id"],
+        subset=["__store_id", "stocktake_date_dt", "vendor_id", "item_id"],
         keep="last",
     ).copy()
 
-    stock_work = stock_work.sort_values(
-        ["item_id", "__effective_vendor_id", "stocktake_date_dt", "display_order_num", "item_name_disp"],
-        ascending=[True, True, True, True, True],
-        kind="mergesort",
-    ).copy()
+    sort_cols = ["__store_id", "item_id", "__effective_vendor_id", "stocktake_date_dt", "display_order_num", "item_name_disp"]
+    stock_work = stock_work.sort_values(sort_cols, ascending=[True] * len(sort_cols), kind="mergesort").copy()
 
-    group_cols = ["item_id", "__effective_vendor_id"]
+    group_cols = ["__store_id", "item_id", "__effective_vendor_id"]
 
     # 查詢範圍內的盤點資料
     target_stock = stock_work[
@@ -796,60 +1020,55 @@ def _build_inventory_history_summary_df(store_id: str, start_date: date, end_dat
     ].copy()
 
     if target_stock.empty:
-        out = pd.DataFrame()
-        _session_df_cache_set(cache_key, signature, out)
-        return out
+        return pd.DataFrame()
 
-    # 錨點：每個 (item, vendor) 在 start_date 之前最後一筆，使第一筆 prev_date 可正確計算
+    # 錨點：每個 (store, item, vendor) 在 start_date 之前最後一筆，使第一筆 prev_date 可正確計算
     before_range = stock_work[stock_work["stocktake_date_dt"] < start_date]
     if not before_range.empty:
         anchor_rows = before_range.groupby(group_cols, sort=False).tail(1).copy()
         anchor_rows["__is_anchor"] = True
         target_stock["__is_anchor"] = False
         combined = pd.concat([anchor_rows, target_stock], ignore_index=True)
-        combined = combined.sort_values(
-            ["item_id", "__effective_vendor_id", "stocktake_date_dt", "display_order_num", "item_name_disp"],
-            ascending=[True, True, True, True, True],
-            kind="mergesort",
-        ).copy()
+        combined = combined.sort_values(sort_cols, ascending=[True] * len(sort_cols), kind="mergesort").copy()
     else:
         combined = target_stock.copy()
         combined["__is_anchor"] = False
 
-    combined["prev_date"] = combined.groupby(group_cols, sort=False)["stocktake_date_dt"].shift(1)
-    combined["prev_qty"] = pd.to_numeric(
-        combined.groupby(group_cols, sort=False)["display_stock_qty"].shift(1),
-        errors="coerce",
-    ).fillna(0.0)
-    combined["prev_base_qty"] = pd.to_numeric(
-        combined.groupby(group_cols, sort=False)["base_qty_num"].shift(1),
-        errors="coerce",
-    ).fillna(0.0)
+    combined_groups = combined.groupby(group_cols, sort=False)
+    combined["prev_date"] = combined_groups["stocktake_date_dt"].shift(1)
+    combined["prev_qty"] = pd.to_numeric(combined_groups["display_stock_qty"].shift(1), errors="coerce").fillna(0.0)
+    combined["prev_base_qty"] = pd.to_numeric(combined_groups["base_qty_num"].shift(1), errors="coerce").fillna(0.0)
 
     # 還原為查詢範圍內的資料（過濾掉錨點列）
-    target_stock = combined[~combined["__is_anchor"]].copy()
+    target_stock = combined[~combined["__is_anchor"]].reset_index(drop=True)
 
     po_work = pd.DataFrame()
     po_date_field = "operation_date_dt" if "operation_date_dt" in po_df.columns else "order_date_dt"
     if not po_df.empty and "store_id" in po_df.columns and po_date_field in po_df.columns:
-        po_store_mask = po_df["store_id"].astype(str).str.strip().eq(store_id_norm)
+        po_store_ids = po_df["store_id"].astype(str).str.strip()
+        po_store_mask = po_store_ids.isin(store_set)
         po_work = po_df.loc[po_store_mask].copy()
+        po_work["__store_id"] = po_store_ids[po_store_mask].to_numpy()
         po_work = po_work[po_work[po_date_field].notna()].copy()
 
     if not po_work.empty:
         po_work["item_id"] = _normalize_key_series(po_work["item_id"])
         po_work["vendor_id"] = _normalize_key_series(po_work["vendor_id"])
 
-        latest_item_vendor = target_stock.drop_duplicates(subset=["item_id", "__effective_vendor_id"], keep="last")
-        latest_item = target_stock.drop_duplicates(subset=["item_id"], keep="last")
+        latest_item_vendor = target_stock.drop_duplicates(subset=group_cols, keep="last")
+        latest_item = target_stock.drop_duplicates(subset=["__store_id", "item_id"], keep="last")
 
-        display_unit_map = latest_item_vendor.set_index(["item_id", "__effective_vendor_id"])["display_stock_unit"].to_dict()
-        fallback_display_unit_map = latest_item.set_index("item_id")["display_stock_unit"].to_dict()
-        fallback_base_unit_map = latest_item.set_index("item_id")["base_unit"].to_dict()
+        display_unit_map = latest_item_vendor.set_index(group_cols)["display_stock_unit"].to_dict()
+        fallback_display_unit_map = latest_item.set_index(["__store_id", "item_id"])["display_stock_unit"].to_dict()
+        fallback_base_unit_map = latest_item.set_index(["__store_id", "item_id"])["base_unit"].to_dict()
 
-        po_display_unit = pd.Series(list(zip(po_work["item_id"], po_work["vendor_id"])), index=po_work.index).map(display_unit_map)
-        po_display_unit = po_display_unit.fillna(po_work["item_id"].map(fallback_display_unit_map))
-        po_display_unit = po_display_unit.fillna(po_work["item_id"].map(fallback_base_unit_map)).fillna("")
+        po_item_keys = pd.Series(list(zip(po_work["__store_id"], po_work["item_id"])), index=po_work.index)
+        po_display_unit = pd.Series(
+            list(zip(po_work["__store_id"], po_work["item_id"], po_work["vendor_id"])),
+            index=po_work.index,
+        ).map(display_unit_map)
+        po_display_unit = po_display_unit.fillna(po_item_keys.map(fallback_display_unit_map))
+        po_display_unit = po_display_unit.fillna(po_item_keys.map(fallback_base_unit_map)).fillna("")
         po_work["display_stock_unit"] = po_display_unit.astype(str).str.strip()
 
         po_work["order_display_qty_num"] = _compute_display_qty_series(
@@ -860,82 +1079,85 @@ def _build_inventory_history_summary_df(store_id: str, start_date: date, end_dat
             as_of_dates=po_work[po_date_field],
             conversions_df=conversions_df,
             round_digits=1,
+            unit_graphs=unit_graphs,
         )
 
+        po_keys = ["__store_id", "item_id", "vendor_id"]
         po_daily = (
-            po_work.groupby(["item_id", "vendor_id", po_date_field], as_index=False)
+            po_work.groupby(po_keys + [po_date_field], as_index=False)
             .agg(
                 order_display_qty_num=("order_display_qty_num", "sum"),
                 order_base_qty_num=("order_base_qty_num", "sum"),
             )
-            .sort_values(["item_id", "vendor_id", po_date_field], ascending=[True, True, True], kind="mergesort")
+            .sort_values(po_keys + [po_date_field], ascending=[True] * 4, kind="mergesort")
             .reset_index(drop=True)
         )
-        po_daily["cum_display_qty"] = po_daily.groupby(["item_id", "vendor_id"], sort=False)["order_display_qty_num"].cumsum()
-        po_daily["cum_base_qty"] = po_daily.groupby(["item_id", "vendor_id"], sort=False)["order_base_qty_num"].cumsum()
+        po_daily["cum_display_qty"] = po_daily.groupby(po_keys, sort=False)["order_display_qty_num"].cumsum()
+        po_daily["cum_base_qty"] = po_daily.groupby(po_keys, sort=False)["order_base_qty_num"].cumsum()
 
         same_day = po_daily.rename(columns={
             po_date_field: "stocktake_date_dt",
             "order_display_qty_num": "這次叫貨",
             "order_base_qty_num": "這次叫貨_base_qty",
-        })[["item_id", "vendor_id", "stocktake_date_dt", "這次叫貨", "這次叫貨_base_qty"]]
+            "vendor_id": "__effective_vendor_id",
+        })[group_cols + ["stocktake_date_dt", "這次叫貨", "這次叫貨_base_qty"]]
 
         target_stock = target_stock.merge(
             same_day,
-            left_on=["item_id", "__effective_vendor_id", "stocktake_date_dt"],
-            right_on=["item_id", "vendor_id", "stocktake_date_dt"],
+            on=group_cols + ["stocktake_date_dt"],
             how="left",
             sort=False,
         )
-        if "vendor_id_y" in target_stock.columns:
-            target_stock = target_stock.drop(columns=["vendor_id_y"])
-        if "vendor_id_x" in target_stock.columns:
-            target_stock = target_stock.rename(columns={"vendor_id_x": "vendor_id"})
 
         target_stock["這次叫貨"] = pd.to_numeric(target_stock["這次叫貨"], errors="coerce").fillna(0.0).round(1)
         target_stock["這次叫貨_base_qty"] = pd.to_numeric(target_stock["這次叫貨_base_qty"], errors="coerce").fillna(0.0).round(4)
 
-        po_lookup: dict[tuple[str, str], tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
-        for key, grp in po_daily.groupby(["item_id", "vendor_id"], sort=False):
-            po_lookup[key] = (
-                grp[po_date_field].to_numpy(dtype="datetime64[ns]"),
-                grp["cum_display_qty"].to_numpy(dtype="float64"),
-                grp["cum_base_qty"].to_numpy(dtype="float64"),
-            )
-
-        target_stock["期間進貨"] = 0.0
-        target_stock["期間進貨_base_qty"] = 0.0
-        for key, row_index in target_stock.groupby(group_cols, sort=False).groups.items():
-            dates_arr, cum_display_arr, cum_base_arr = po_lookup.get(
-                key,
-                (np.array([], dtype="datetime64[ns]"), np.array([], dtype="float64"), np.array([], dtype="float64")),
-            )
-            if dates_arr.size == 0:
-                target_stock.loc[row_index, "期間進貨"] = target_stock.loc[row_index, "這次叫貨"].to_numpy(dtype="float64")
-                target_stock.loc[row_index, "期間進貨_base_qty"] = target_stock.loc[row_index, "這次叫貨_base_qty"].to_numpy(dtype="float64")
-                continue
-
-            curr_dates = pd.to_datetime(target_stock.loc[row_index, "stocktake_date_dt"], errors="coerce").to_numpy(dtype="datetime64[ns]")
-            prev_dates = pd.to_datetime(target_stock.loc[row_index, "prev_date"], errors="coerce").to_numpy(dtype="datetime64[ns]")
-            curr_pos = np.searchsorted(dates_arr, curr_dates, side="right") - 1
-            prev_pos = np.searchsorted(dates_arr, prev_dates, side="right") - 1
-
-            curr_cum_display = np.where(curr_pos >= 0, cum_display_arr[np.clip(curr_pos, 0, None)], 0.0)
-            curr_cum_base = np.where(curr_pos >= 0, cum_base_arr[np.clip(curr_pos, 0, None)], 0.0)
-            prev_cum_display = np.where(prev_pos >= 0, cum_display_arr[np.clip(prev_pos, 0, None)], 0.0)
-            prev_cum_base = np.where(prev_pos >= 0, cum_base_arr[np.clip(prev_pos, 0, None)], 0.0)
-
-            period_display = np.round(curr_cum_display - prev_cum_display, 1)
-            period_base = np.round(curr_cum_base - prev_cum_base, 4)
-            first_mask = pd.isna(target_stock.loc[row_index, "prev_date"]).to_numpy()
-            if first_mask.any():
-                same_day_display_vals = target_stock.loc[row_index, "這次叫貨"].to_numpy(dtype="float64")
-                same_day_base_vals = target_stock.loc[row_index, "這次叫貨_base_qty"].to_numpy(dtype="float64")
-                period_display = np.where(first_mask, same_day_display_vals, period_display)
-                period_base = np.where(first_mask, same_day_base_vals, period_base)
-
-            target_stock.loc[row_index, "期間進貨"] = period_display
-            target_stock.loc[row_index, "期間進貨_base_qty"] = period_base
+        # 期間進貨 = 截至本次盤點日的累計叫貨 − 截至上次盤點日的累計叫貨（同 store × item × vendor）
+        # 以單一整數鍵做 asof 對齊（多欄字串 by 在部分 pandas 版本會錯配）
+        key_codes, _ = pd.MultiIndex.from_arrays(
+            [pd.concat([target_stock[c], po_daily[p]], ignore_index=True) for c, p in zip(group_cols, po_keys)]
+        ).factorize()
+        stock_key = key_codes[:len(target_stock)]
+        cum_lookup = pd.DataFrame({
+            "__key": key_codes[len(target_stock):],
+            "__po_date": pd.to_datetime(po_daily[po_date_field], errors="coerce").astype("datetime64[ns]").to_numpy(),
+            "cum_display_qty": po_daily["cum_display_qty"].to_numpy(dtype="float64"),
+            "cum_base_qty": po_daily["cum_base_qty"].to_numpy(dtype="float64"),
+        }).sort_values("__po_date", kind="mergesort")
+
+        def _cum_as_of(as_of_dates: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+            dates = pd.to_datetime(as_of_dates, errors="coerce").astype("datetime64[ns]")
+            probe = pd.DataFrame({
+                "__key": stock_key,
+                "__as_of": dates.fillna(pd.Timestamp.min).to_numpy(),
+                "__row": np.arange(len(target_stock)),
+            })
+            matched = pd.merge_asof(
+                probe.sort_values("__as_of", kind="mergesort"),
+                cum_lookup,
+                left_on="__as_of",
+                right_on="__po_date",
+                by="__key",
+                direction="backward",
+            ).sort_values("__row", kind="mergesort")
+            missing = dates.isna().to_numpy()
+            cum_display = np.where(missing, 0.0, matched["cum_display_qty"].fillna(0.0).to_numpy(dtype="float64"))
+            cum_base = np.where(missing, 0.0, matched["cum_base_qty"].fillna(0.0).to_numpy(dtype="float64"))
+            return cum_display, cum_base
+
+        curr_cum_display, curr_cum_base = _cum_as_of(target_stock["stocktake_date_dt"])
+        prev_cum_display, prev_cum_base = _cum_as_of(target_stock["prev_date"])
+        first_mask = target_stock["prev_date"].isna().to_numpy()
+        target_stock["期間進貨"] = np.where(
+            first_mask,
+            target_stock["這次叫貨"].to_numpy(dtype="float64"),
+            np.round(curr_cum_display - prev_cum_display, 1),
+        )
+        target_stock["期間進貨_base_qty"] = np.where(
+            first_mask,
+            target_stock["這次叫貨_base_qty"].to_numpy(dtype="float64"),
+            np.round(curr_cum_base - prev_cum_base, 4),
+        )
     else:
         target_stock["這次叫貨"] = 0.0
         target_stock["這次叫貨_base_qty"] = 0.0
@@ -998,11 +1220,13 @@ def _build_inventory_history_summary_df(store_id: str, start_date: date, end_dat
         "天數",
         "item_id",
         "display_order_num",
+        "__store_id",
     ]].rename(columns={
         "stocktake_date_dt": "日期",
         "vendor_name_disp": "廠商",
         "__effective_vendor_id": "vendor_id",
         "item_name_disp": "品項",
+        "__store_id": "store_id",
     }).copy()
 
     out["廠商"] = out["廠商"].astype(str).str.strip()
@@ -1014,22 +1238,308 @@ def _build_inventory_history_summary_df(store_id: str, start_date: date, end_dat
     out.loc[out["品項"].eq(""), "品項"] = "未指定"
 
     if out.empty:
-        _session_df_cache_set(cache_key, signature, out)
         return out
 
     out["日期_dt"] = pd.to_datetime(out["日期"], errors="coerce")
     out["日期顯示"] = out["日期_dt"].dt.strftime("%m-%d")
+    # 排序穩定：切出單一門市後的順序與單店計算一致
     out = out.sort_values(["日期_dt", "display_order_num", "品項"], ascending=[False, True, True], kind="mergesort").reset_index(drop=True)
-    _session_df_cache_set(cache_key, signature, out)
     return out
 
-def _build_latest_item_metrics_df(store_id: str, as_of_date: date) -> pd.DataFrame:
+
+
+# ---------------------------------------------------------------------------
+# 分店 / 日期分段讀取（大量匯出用）
+# 只向資料庫查詢該分店、該區段需要的明細，不建立整表快取；
+# 主檔（品項 / 廠商 / 分店 / 單位 / 換算）仍走 read_table 快取。
+# ---------------------------------------------------------------------------
+
+def _load_detail_masters() -> dict[str, pd.DataFrame]:
+    return {
+        "items": read_table("items"),
+        "vendors": read_table("vendors"),
+        "stores": read_table("stores"),
+        "units": read_table("units"),
+        "conversions": _get_active_df(read_table("unit_conversions")),
+    }
+
+
+def _load_store_headers(table_name: str, store_id: str, pk: str, date_cols: list[str]) -> pd.DataFrame:
+    """讀出單一分店的表頭（筆數約為天數 × 廠商數），__date 為 date_cols 依序補值後的日期。"""
+    headers = read_table_where(table_name, eq={"store_id": store_id}, order_col=pk)
+    if headers.empty or pk not in headers.columns:
+        return pd.DataFrame()
+    date_parts = [headers[c].astype("object") for c in date_cols if c in headers.columns]
+    if not date_parts:
+        return pd.DataFrame()
+    header_date = date_parts[0]
+    for part in date_parts[1:]:
+        header_date = header_date.combine_first(part)
+    headers["__date"] = pd.to_datetime(header_date, errors="coerce").dt.date
+    return headers
+
+
+def _headers_between(headers: pd.DataFrame, start_date: date, end_date: date) -> pd.DataFrame:
+    if headers.empty:
+        return headers
+    dates = headers["__date"]
+    mask = dates.notna() & (dates >= start_date) & (dates <= end_date)
+    return headers.loc[mask]
+
+
+def _sort_by_line_id(lines: pd.DataFrame) -> pd.DataFrame:
+    # 與整表讀取相同的資料列順序（明細表依自動編號 id 寫入）
+    if lines.empty or "id" not in lines.columns:
+        return lines
+    order = pd.to_numeric(lines["id"], errors="coerce")
+    return lines.iloc[order.argsort(kind="mergesort")].reset_index(drop=True)
+
+
+def _load_stock_block(
+    headers: pd.DataFrame,
+    masters: dict[str, pd.DataFrame],
+    start_date: date,
+    end_date: date,
+    *,
+    item_ids: set[str] | None = None,
+    columns: str = "*",
+    unit_graphs: dict | None = None,
+) -> pd.DataFrame:
+    """盤點日在 [start_date, end_date] 的盤點明細（可只查指定品項），格式同 _build_stock_detail_df。"""
+    block = _headers_between(headers, start_date, end_date)
+    if block.empty:
+        return pd.DataFrame()
+    in_ = {"stocktake_id": block["stocktake_id"].tolist()}
+    if item_ids is not None:
+        in_["item_id"] = sorted(item_ids)
+    lines = read_table_where("stocktake_lines", columns=columns, in_=in_, order_col="id")
+    return _enrich_stock_detail_df(
+        block.drop(columns=["__date"]),
+        _sort_by_line_id(lines),
+        masters["items"],
+        masters["vendors"],
+        masters["stores"],
+        masters["conversions"],
+        unit_graphs=unit_graphs,
+    )
+
+
+def _load_purchase_block(
+    headers: pd.DataFrame,
+    masters: dict[str, pd.DataFrame],
+    start_date: date,
+    end_date: date,
+    *,
+    item_ids: set[str] | None = None,
+) -> pd.DataFrame:
+    """叫貨日在 [start_date, end_date] 的叫貨明細（可只查指定品項），格式同 _build_purchase_detail_df。"""
+    block = _headers_between(headers, start_date, end_date)
+    if block.empty:
+        return pd.DataFrame()
+    in_ = {"po_id": block["po_id"].tolist()}
+    if item_ids is not None:
+        in_["item_id"] = sorted(item_ids)
+    lines = read_table_where("purchase_order_lines", in_=in_, order_col="id")
+    return _enrich_purchase_detail_df(
+        block.drop(columns=["__date"]),
+        _sort_by_line_id(lines),
+        masters["vendors"],
+        masters["items"],
+        masters["stores"],
+        masters["units"],
+    )
+
+
+def _stock_group_key_series(stock_df: pd.DataFrame) -> pd.Series:
+    """(item_id, 有效廠商) 分組鍵，與 _compute_inventory_history_summary 的 group_cols 相同規則。"""
+    vendor = _normalize_key_series(stock_df["vendor_id"])
+    if "default_vendor_id" in stock_df.columns:
+        default_vendor = _normalize_key_series(stock_df["default_vendor_id"])
+    else:
+        default_vendor = pd.Series("", index=stock_df.index, dtype="object")
+    effective_vendor = vendor.where(vendor != "", default_vendor)
+    return pd.Series(list(zip(_normalize_key_series(stock_df["item_id"]), effective_vendor)), index=stock_df.index)
+
+
+def _iter_month_windows_desc(start_date: date, end_date: date):
+    """[start_date, end_date] 依月份切段，由新到舊。"""
+    window_end = end_date
+    while window_end >= start_date:
+        window_start = max(window_end.replace(day=1), start_date)
+        yield window_start, window_end
+        window_end = window_start - timedelta(days=1)
+
+
+def _months_back_start(day: date, months: int) -> date:
+    """day 所在月份往前共 months 個月份的第一天。"""
+    index = day.year * 12 + day.month - 1 - (max(int(months), 1) - 1)
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _iter_inventory_history_summary_windows(store_id: str, start_date: date, end_date: date):
+    """
+    單一分店進銷存彙總，依月份由新到舊逐段產生；各段與整段計算結果中該月份的列相同，
+    依序串接即為整段結果（日期由新到舊）。
+    每段只讀該月份的盤點 / 叫貨明細，加上算「上次庫存」需要的較早盤點：
+    前一個月份整段讀入（下一段直接沿用），更早的只查仍找不到上一筆盤點的品項，回溯區段逐次加倍。
+    """
+    store_id = str(store_id).strip()
+    st_headers = _load_store_headers("stocktakes", store_id, "stocktake_id", ["stocktake_date"])
+    if st_headers.empty or st_headers["__date"].notna().sum() == 0:
+        return
+    earliest = st_headers["__date"].dropna().min()
+    masters = _load_detail_masters()
+    unit_graphs: dict = {}
+    po_headers = _load_store_headers("purchase_orders", store_id, "po_id", ["order_date"])
+
+    carried = None
+    for window_start, window_end in _iter_month_windows_desc(start_date, end_date):
+        window_rows = carried if carried is not None else _load_stock_block(
+            st_headers, masters, window_start, window_end, unit_graphs=unit_graphs,
+        )
+        carried = None
+        if window_rows.empty:
+            continue
+
+        # 回溯較早的盤點，直到每個 (品項, 廠商) 都找到上一筆或已到最早的盤點日
+        pending = set(_stock_group_key_series(window_rows))
+        anchors: list[pd.DataFrame] = []
+        deep_anchors: list[pd.DataFrame] = []
+        common_from = window_start
+        lookback_end = window_start - timedelta(days=1)
+        months = 1
+        first_block = True
+        while pending and lookback_end >= earliest:
+            if first_block and lookback_end >= start_date:
+                # 前一個月份就是下一段，整段讀入並沿用
+                block_start = max(lookback_end.replace(day=1), start_date)
+                block = _load_stock_block(
+                    st_headers, masters, block_start, lookback_end, unit_graphs=unit_graphs,
+                )
+                carried = block
+            else:
+                block_start = _months_back_start(lookback_end, months)
+                block = _load_stock_block(
+                    st_headers, masters, block_start, lookback_end,
+                    item_ids={item_id for item_id, _ in pending},
+                    unit_graphs=unit_graphs,
+                )
+                months *= 2
+            if first_block:
+                common_from = block_start
+            target = anchors if first_block else deep_anchors
+            first_block = False
+            if not block.empty:
+                block_keys = _stock_group_key_series(block)
+                hit = block_keys.isin(pending)
+                if hit.any():
+                    target.append(block.loc[hit])
+                    pending -= set(block_keys[hit])
+            lookback_end = block_start - timedelta(days=1)
+
+        # 叫貨：common_from 起全部品項；更早才找到上一筆的品項另外補讀到該筆盤點日
+        po_parts = [_load_purchase_block(po_headers, masters, common_from, window_end)]
+        if deep_anchors:
+            deep_df = pd.concat(deep_anchors, ignore_index=True)
+            po_parts.append(_load_purchase_block(
+                po_headers, masters,
+                deep_df["stocktake_date_dt"].min(),
+                common_from - timedelta(days=1),
+                item_ids=set(_normalize_key_series(deep_df["item_id"])),
+            ))
+            anchors.append(deep_df)
+        po_parts = [p for p in po_parts if not p.empty]
+        po_df = pd.concat(po_parts, ignore_index=True) if po_parts else pd.DataFrame()
+        stock_df = pd.concat([window_rows, *anchors], ignore_index=True) if anchors else window_rows
+
+        summary = _compute_inventory_history_summary(
+            [store_id], window_start, window_end,
+            stock_df=stock_df, po_df=po_df, unit_graphs=unit_graphs,
+        )
+        del stock_df, po_df, window_rows, anchors
+        if not summary.empty:
+            yield summary
+
+
+def _iter_stock_detail_chunks(store_id: str, start_date: date, end_date: date, *, columns: str = "*"):
+    """單一分店盤點日在區間內的盤點明細，依表頭分批產生（格式同 _build_stock_detail_df）。"""
+    headers = _headers_between(
+        _load_store_headers("stocktakes", str(store_id).strip(), "stocktake_id", ["stocktake_date"]),
+        start_date,
+        end_date,
+    )
+    if headers.empty:
+        return
+    masters = _load_detail_masters()
+    unit_graphs: dict = {}
+    for pos in range(0, len(headers), _IN_FILTER_CHUNK):
+        chunk = headers.iloc[pos:pos + _IN_FILTER_CHUNK]
+        df = _load_stock_block(
+            chunk, masters, start_date, end_date, columns=columns, unit_graphs=unit_graphs,
+        )
+        if not df.empty:
+            yield df
+
+
+def _iter_purchase_detail_chunks(store_id: str, start_date: date, end_date: date, *, columns: str = "*"):
+    """
+    單一分店到貨日在區間內的叫貨明細，依表頭（叫貨日、po_id 排序）分批產生，格式同 _build_purchase_detail_df。
+    到貨日以明細 delivery_date 為主，空白才用表頭 delivery_date / expected_date，
+    因此每批分兩次查：明細自帶到貨日且落在區間內的列，以及明細沒有到貨日、表頭日期落在區間內的列。
+    """
+    headers = _load_store_headers("purchase_orders", str(store_id).strip(), "po_id", ["delivery_date", "expected_date"])
+    if headers.empty:
+        return
+    order_dates = pd.to_datetime(headers["order_date"], errors="coerce") if "order_date" in headers.columns else pd.Series(pd.NaT, index=headers.index)
+    headers = headers.assign(__order=order_dates).sort_values(["__order", "po_id"], kind="mergesort").drop(columns=["__order"])
+    masters = _load_detail_masters()
+    for pos in range(0, len(headers), _IN_FILTER_CHUNK):
+        chunk = headers.iloc[pos:pos + _IN_FILTER_CHUNK]
+        parts = [
+            read_table_where(
+                "purchase_order_lines",
+                columns=columns,
+                in_={"po_id": chunk["po_id"].tolist()},
+                gte={"delivery_date": str(start_date)},
+                lte={"delivery_date": str(end_date)},
+                order_col="id",
+            ),
+            read_table_where(
+                "purchase_order_lines",
+                columns=columns,
+                in_={"po_id": _headers_between(chunk, start_date, end_date)["po_id"].tolist()},
+                is_null=("delivery_date",),
+                order_col="id",
+            ),
+        ]
+        parts = [p for p in parts if not p.empty]
+        if not parts:
+            continue
+        df = _enrich_purchase_detail_df(
+            chunk.drop(columns=["__date"]),
+            _sort_by_line_id(pd.concat(parts, ignore_index=True)),
+            masters["vendors"],
+            masters["items"],
+            masters["stores"],
+            masters["units"],
+        )
+        if not df.empty:
+            yield df
+
+
+def _build_item_metrics_rollup_df(store_id: str) -> pd.DataFrame:
+    """
+    門市每日品項指標彙總（每個 item × vendor × 盤點日一列）。
+    每列只依賴該列與前一次盤點之間的資料，與查詢日期無關，
+    因此整段歷史只算一次；各日期的「最新指標」直接由此表切片取得。
+    """
+    store_id_norm = str(store_id).strip()
     signature = (
-        str(store_id).strip(),
-        str(as_of_date),
-        _table_versions_signature(("stocktakes", "stocktake_lines", "purchase_orders", "purchase_order_lines", "items", "vendors", "stores", "unit_conversions")),
+        store_id_norm,
+        _partition_versions_signature(_STORE_TRANSACTION_TABLES, store_id_norm),
+        _table_versions_signature(_ITEM_METRICS_MASTER_TABLES),
     )
-    cache_key = f"derived::latest_item_metrics::{str(store_id).strip()}::{as_of_date}"
+    cache_key = f"derived::item_metrics_rollup::{store_id_norm}"
     cached = _session_df_cache_get(cache_key, signature)
     if cached is not None:
         return cached
@@ -1041,10 +1551,9 @@ def _build_latest_item_metrics_df(store_id: str, as_of_date: date) -> pd.DataFra
         return out
 
     stock_work = stock_df[
-        stock_df["store_id"].astype(str).str.strip() == str(store_id).strip()
+        stock_df["store_id"].astype(str).str.strip() == store_id_norm
     ].copy()
     stock_work = stock_work[stock_work["stocktake_date_dt"].notna()].copy()
-    stock_work = stock_work[stock_work["stocktake_date_dt"] <= as_of_date].copy()
 
     if stock_work.empty:
         out = pd.DataFrame()
@@ -1079,246 +1588,162 @@ def _build_latest_item_metrics_df(store_id: str, as_of_date: date) -> pd.DataFra
         keep="last",
     ).copy()
 
-    stock_work["stocktake_date_dt"] = pd.to_datetime(stock_work["stocktake_date_dt"], errors="coerce")
+    stock_work["stocktake_date_dt"] = pd.to_datetime(stock_work["stocktake_date_dt"], errors="coerce").astype("datetime64[ns]")
     stock_work = stock_work.sort_values(
         ["item_id", "vendor_id", "stocktake_date_dt", "display_order_num", "item_name_disp"],
         ascending=[True, True, True, True, True],
     ).reset_index(drop=True)
 
     group_cols = ["item_id", "vendor_id"]
-    stock_work["prev_date"] = stock_work.groupby(group_cols)["stocktake_date_dt"].shift(1)
-    stock_work["prev_qty"] = stock_work.groupby(group_cols)["display_stock_qty"].shift(1).fillna(0.0)
-    stock_work["prev_base_qty"] = stock_work.groupby(group_cols)["base_qty_num"].shift(1).fillna(0.0)
-
-    latest = stock_work.groupby(group_cols, as_index=False).tail(1).copy()
-    if latest.empty:
-        out = pd.DataFrame()
-        _session_df_cache_set(cache_key, signature, out)
-        return out
-
-    latest["prev_date"] = pd.to_datetime(latest["prev_date"], errors="coerce")
-    latest["item_name"] = latest["item_name_disp"].map(_norm).replace("", "未指定")
-    latest["vendor_name"] = latest["vendor_name_disp"].map(_norm)
-    latest.loc[latest["vendor_name"] == "", "vendor_name"] = latest["vendor_id"].where(latest["vendor_id"] != "", "-")
-    latest["curr_qty"] = latest["display_stock_qty"].astype(float)
-    latest["curr_base_qty"] = latest["base_qty_num"].astype(float)
-
-    latest["window_start"] = latest["prev_date"].where(latest["prev_date"].notna(), latest["stocktake_date_dt"])
-    latest["window_end"] = latest["stocktake_date_dt"]
-
-    summary_window_start = latest["window_start"].min()
-    if pd.isna(summary_window_start):
-        summary_window_start = latest["stocktake_date_dt"].min()
-    summary_window_start = pd.to_datetime(summary_window_start, errors="coerce")
-
-    summary_signature = (
-        str(store_id).strip(),
-        str(summary_window_start.date()) if pd.notna(summary_window_start) else str(as_of_date),
-        str(as_of_date),
-        _table_versions_signature(("stocktakes", "stocktake_lines", "purchase_orders", "purchase_order_lines", "items", "vendors", "stores", "unit_conversions")),
-    )
-    summary_cache_key = f"derived::inventory_history_summary::{str(store_id).strip()}::{summary_window_start.date() if pd.notna(summary_window_start) else as_of_date}::{as_of_date}"
-    summary_cached = _session_df_cache_get(summary_cache_key, summary_signature)
-    if summary_cached is not None and not summary_cached.empty:
-        summary_latest = summary_cached.copy()
-        summary_latest["日期_dt"] = pd.to_datetime(summary_latest.get("日期_dt", summary_latest.get("日期")), errors="coerce")
-        summary_latest = summary_latest[summary_latest["日期_dt"].notna()].copy()
-        summary_latest = summary_latest.sort_values(["item_id", "vendor_id", "日期_dt"], ascending=[True, True, True])
-        summary_latest = summary_latest.groupby(["item_id", "vendor_id"], as_index=False).tail(1).copy()
-        summary_latest = summary_latest.sort_values(["display_order_num", "品項"], ascending=[True, True]).reset_index(drop=True)
-        _session_df_cache_set(cache_key, signature, summary_latest)
-        return summary_latest
+    rows = stock_work
+    rows["prev_date"] = rows.groupby(group_cols)["stocktake_date_dt"].shift(1)
+    rows["prev_qty"] = rows.groupby(group_cols)["display_stock_qty"].shift(1).fillna(0.0)
+    rows["prev_base_qty"] = rows.groupby(group_cols)["base_qty_num"].shift(1).fillna(0.0)
+    rows["__row_id"] = np.arange(len(rows))
+
+    if "display_stock_unit" not in rows.columns:
+        rows["display_stock_unit"] = ""
+    if "base_unit" not in rows.columns:
+        rows["base_unit"] = ""
+    row_display_unit = rows["display_stock_unit"].map(_norm)
+    rows["__display_unit"] = row_display_unit.where(row_display_unit != "", rows["base_unit"].map(_norm))
+
+    rows["current_order_qty"] = 0.0
+    rows["current_order_base_qty"] = 0.0
+    rows["order_sum"] = 0.0
+    rows["order_sum_base_qty"] = 0.0
 
     po_df = _build_purchase_detail_df()
     po_date_field = "operation_date_dt" if "operation_date_dt" in po_df.columns else "order_date_dt"
-    po_daily = pd.DataFrame()
-
     if not po_df.empty and "store_id" in po_df.columns and po_date_field in po_df.columns:
         po_work = po_df[
-            po_df["store_id"].astype(str).str.strip() == str(store_id).strip()
+            po_df["store_id"].astype(str).str.strip() == store_id_norm
         ].copy()
         po_work = po_work[po_work[po_date_field].notna()].copy()
-        po_work[po_date_field] = pd.to_datetime(po_work[po_date_field], errors="coerce")
-        if pd.notna(summary_window_start):
-            po_work = po_work[po_work[po_date_field] >= summary_window_start].copy()
-        po_work = po_work[po_work[po_date_field] <= pd.Timestamp(as_of_date)].copy()
-
         if not po_work.empty:
-            po_work = po_work.loc[:, [
-                col for col in ["item_id", "vendor_id", po_date_field, "order_base_qty_num", "order_base_unit_disp"]
-                if col in po_work.columns
-            ]].copy()
-            po_work["item_id"] = _normalize_key_series(po_work.get("item_id", pd.Series(dtype="object")))
-            po_work["vendor_id"] = _normalize_key_series(po_work.get("vendor_id", pd.Series(dtype="object")))
-            po_work["order_base_qty_num"] = pd.to_numeric(po_work.get("order_base_qty_num", 0), errors="coerce").fillna(0.0)
-            po_work["order_base_unit_disp"] = po_work.get("order_base_unit_disp", pd.Series("", index=po_work.index)).astype(str)
-
-            latest_windows = latest[["item_id", "vendor_id", "window_start", "window_end"]].drop_duplicates(subset=["item_id", "vendor_id"], keep="last")
-            po_work = po_work.merge(latest_windows, on=["item_id", "vendor_id"], how="inner", copy=False)
-            po_work = po_work[
-                (po_work[po_date_field] >= po_work["window_start"])
-                & (po_work[po_date_field] <= po_work["window_end"])
+            po_work = pd.DataFrame({
+                "item_id": _normalize_key_series(po_work.get("item_id", pd.Series("", index=po_work.index))),
+                "vendor_id": _normalize_key_series(po_work.get("vendor_id", pd.Series("", index=po_work.index))),
+                "po_date": pd.to_datetime(po_work[po_date_field], errors="coerce").astype("datetime64[ns]"),
+                "order_base_qty_num": pd.to_numeric(po_work.get("order_base_qty_num", 0), errors="coerce").fillna(0.0),
+                "order_base_unit_disp": po_work.get("order_base_unit_disp", pd.Series("", index=po_work.index)).astype(str),
+            })
+            po_work = po_work[po_work["po_date"].notna()]
+
+            # 每筆叫貨歸屬到「同 item × vendor、日期 >= 叫貨日」的第一次盤點，即其所在的 (上次盤點, 這次盤點] 區間
+            assigned = pd.merge_asof(
+                po_work.sort_values("po_date", kind="mergesort"),
+                rows[["item_id", "vendor_id", "stocktake_date_dt", "prev_date", "__row_id", "__display_unit"]].sort_values("stocktake_date_dt", kind="mergesort"),
+                left_on="po_date",
+                right_on="stocktake_date_dt",
+                by=group_cols,
+                direction="forward",
+            )
+            assigned = assigned[assigned["__row_id"].notna()].copy()
+            # 第一次盤點沒有上次區間，只計入當天叫貨
+            assigned = assigned[
+                assigned["prev_date"].notna() | assigned["po_date"].eq(assigned["stocktake_date_dt"])
             ].copy()
 
-            if not po_work.empty:
+            if not assigned.empty:
                 conversions_df = _get_active_df(read_table("unit_conversions"))
-
-                latest_unit_by_pair = latest.set_index(["item_id", "vendor_id"])["display_stock_unit"].astype(str).to_dict()
-                latest_unit_by_item = latest.drop_duplicates(subset=["item_id"], keep="last").set_index("item_id")["display_stock_unit"].astype(str).to_dict()
-                latest_base_unit_by_item = latest.drop_duplicates(subset=["item_id"], keep="last").set_index("item_id")["base_unit"].astype(str).to_dict()
-
-                po_work["display_unit"] = [
-                    _norm(latest_unit_by_pair.get((item_id, vendor_id), ""))
-                    or _norm(latest_unit_by_item.get(item_id, ""))
-                    or _norm(latest_base_unit_by_item.get(item_id, ""))
-                    for item_id, vendor_id in zip(po_work["item_id"], po_work["vendor_id"])
-                ]
-
-                factor_keys = (
-                    po_work[["item_id", "order_base_unit_disp", "display_unit", po_date_field]]
-                    .drop_duplicates()
-                    .reset_index(drop=True)
-                )
-                factor_cache: dict = {}
-                factor_map: dict[tuple[str, str, str, pd.Timestamp], float] = {}
-                for item_id, base_unit, display_unit, curr_date in factor_keys.itertuples(index=False, name=None):
-                    item_key = _norm(item_id)
-                    base_unit_key = _norm(base_unit)
-                    display_unit_key = _norm(display_unit)
-                    date_key = pd.Timestamp(curr_date)
-                    key = (item_key, base_unit_key, display_unit_key, date_key)
-                    factor_map[key] = 1.0
-                    if base_unit_key and display_unit_key and base_unit_key != display_unit_key:
-                        qty = _convert_base_qty_with_cache(
-                            item_id=item_key,
-                            base_qty=1.0,
-                            base_unit=base_unit_key,
-                            display_unit=display_unit_key,
-                            conversions_df=conversions_df,
-                            as_of_date=date_key,
-                            factor_cache=factor_cache,
-                        )
-                        factor_map[key] = float(qty)
-
-                po_keys = list(zip(po_work["item_id"], po_work["order_base_unit_disp"], po_work["display_unit"], po_work[po_date_field]))
-                po_factors = [factor_map.get((_norm(item_id), _norm(base_unit), _norm(display_unit), pd.Timestamp(curr_date)), 1.0) for item_id, base_unit, display_unit, curr_date in po_keys]
-                po_work["order_display_qty_num"] = (po_work["order_base_qty_num"].astype(float) * pd.Series(po_factors, index=po_work.index)).round(1)
-
-                po_daily = (
-                    po_work.groupby(["item_id", "vendor_id", po_date_field], as_index=False)
-                    .agg(
-                        order_display_qty_num=("order_display_qty_num", "sum"),
-                        order_base_qty_num=("order_base_qty_num", "sum"),
-                    )
-                    .sort_values(["item_id", "vendor_id", po_date_field], ascending=[True, True, True])
-                    .reset_index(drop=True)
-                )
-                po_daily["cum_display_qty"] = po_daily.groupby(["item_id", "vendor_id"])["order_display_qty_num"].cumsum()
-                po_daily["cum_base_qty"] = po_daily.groupby(["item_id", "vendor_id"])["order_base_qty_num"].cumsum()
-
-    latest = latest.sort_values(["item_id", "vendor_id", "stocktake_date_dt"], ascending=[True, True, True]).reset_index(drop=True)
-    latest["current_order_qty"] = 0.0
-    latest["current_order_base_qty"] = 0.0
-    latest["curr_cum_display"] = 0.0
-    latest["curr_cum_base"] = 0.0
-    latest["prev_cum_display"] = 0.0
-    latest["prev_cum_base"] = 0.0
-
-    if not po_daily.empty:
-        po_daily = po_daily.sort_values(["item_id", "vendor_id", po_date_field], ascending=[True, True, True]).reset_index(drop=True)
-        po_daily_idx = po_daily.set_index(["item_id", "vendor_id", po_date_field])
-        same_day_display = po_daily_idx["order_display_qty_num"].to_dict()
-        same_day_base = po_daily_idx["order_base_qty_num"].to_dict()
-        cum_by_group = {
-            key: grp[[po_date_field, "cum_display_qty", "cum_base_qty"]].sort_values(po_date_field).reset_index(drop=True)
-            for key, grp in po_daily.groupby(["item_id", "vendor_id"], sort=False)
-        }
-
-        latest["current_order_qty"] = [
-            round(_safe_float(same_day_display.get((item_id, vendor_id, curr_date), 0.0)), 1)
-            for item_id, vendor_id, curr_date in zip(latest["item_id"], latest["vendor_id"], latest["stocktake_date_dt"])
-        ]
-        latest["current_order_base_qty"] = [
-            round(_safe_float(same_day_base.get((item_id, vendor_id, curr_date), 0.0)), 4)
-            for item_id, vendor_id, curr_date in zip(latest["item_id"], latest["vendor_id"], latest["stocktake_date_dt"])
-        ]
-
-        curr_cum_display_vals = []
-        curr_cum_base_vals = []
-        prev_cum_display_vals = []
-        prev_cum_base_vals = []
-        for item_id, vendor_id, curr_date, prev_date in zip(latest["item_id"], latest["vendor_id"], latest["stocktake_date_dt"], latest["prev_date"]):
-            grp = cum_by_group.get((item_id, vendor_id))
-            curr_display = 0.0
-            curr_base = 0.0
-            prev_display = 0.0
-            prev_base = 0.0
-            if grp is not None and not grp.empty:
-                dates = grp[po_date_field]
-                curr_pos = dates.searchsorted(curr_date, side="right") - 1
-                prev_pos = dates.searchsorted(prev_date, side="right") - 1 if pd.notna(prev_date) else -1
-                if curr_pos >= 0:
-                    curr_display = float(grp.iloc[curr_pos]["cum_display_qty"])
-                    curr_base = float(grp.iloc[curr_pos]["cum_base_qty"])
-                if prev_pos >= 0:
-                    prev_display = float(grp.iloc[prev_pos]["cum_display_qty"])
-                    prev_base = float(grp.iloc[prev_pos]["cum_base_qty"])
-            curr_cum_display_vals.append(curr_display)
-            curr_cum_base_vals.append(curr_base)
-            prev_cum_display_vals.append(prev_display)
-            prev_cum_base_vals.append(prev_base)
-
-        latest["curr_cum_display"] = curr_cum_display_vals
-        latest["curr_cum_base"] = curr_cum_base_vals
-        latest["prev_cum_display"] = prev_cum_display_vals
-        latest["prev_cum_base"] = prev_cum_base_vals
-
-    has_prev = latest["prev_date"].notna()
-    latest["order_sum"] = latest["current_order_qty"]
-    latest["order_sum_base_qty"] = latest["current_order_base_qty"]
-    latest.loc[has_prev, "order_sum"] = (latest.loc[has_prev, "curr_cum_display"] - latest.loc[has_prev, "prev_cum_display"]).round(1)
-    latest.loc[has_prev, "order_sum_base_qty"] = (latest.loc[has_prev, "curr_cum_base"] - latest.loc[has_prev, "prev_cum_base"]).round(4)
-
-    latest["total_stock"] = (latest["prev_qty"] + latest["order_sum"]).round(1)
-    latest["total_stock_base_qty"] = (latest["prev_base_qty"] + latest["order_sum_base_qty"]).round(4)
-    latest["usage"] = 0.0
-    latest["usage_base_qty"] = 0.0
-    latest.loc[has_prev, "usage"] = (latest.loc[has_prev, "total_stock"] - latest.loc[has_prev, "curr_qty"]).round(1)
-    latest.loc[has_prev, "usage_base_qty"] = (latest.loc[has_prev, "total_stock_base_qty"] - latest.loc[has_prev, "curr_base_qty"]).round(4)
-    latest["days"] = 0
-    latest.loc[has_prev, "days"] = (latest.loc[has_prev, "stocktake_date_dt"] - latest.loc[has_prev, "prev_date"]).dt.days.clip(lower=1).astype(int)
-    latest["daily_avg"] = [
+                assigned["__row_id"] = assigned["__row_id"].astype(int)
+                assigned["order_display_qty_num"] = _compute_display_qty_series(
+                    item_ids=assigned["item_id"],
+                    base_qtys=assigned["order_base_qty_num"],
+                    base_units=assigned["order_base_unit_disp"],
+                    display_units=assigned["__display_unit"],
+                    as_of_dates=assigned["po_date"],
+                    conversions_df=conversions_df,
+                    round_digits=1,
+                ).to_numpy()
+
+                window_sum = assigned.groupby("__row_id")[["order_display_qty_num", "order_base_qty_num"]].sum()
+                same_day = assigned[assigned["po_date"].eq(assigned["stocktake_date_dt"])]
+                same_day_sum = same_day.groupby("__row_id")[["order_display_qty_num", "order_base_qty_num"]].sum()
+
+                rows["order_sum"] = rows["__row_id"].map(window_sum["order_display_qty_num"]).fillna(0.0).round(1)
+                rows["order_sum_base_qty"] = rows["__row_id"].map(window_sum["order_base_qty_num"]).fillna(0.0).round(4)
+                rows["current_order_qty"] = rows["__row_id"].map(same_day_sum["order_display_qty_num"]).fillna(0.0).round(1)
+                rows["current_order_base_qty"] = rows["__row_id"].map(same_day_sum["order_base_qty_num"]).fillna(0.0).round(4)
+
+    rows["item_name"] = rows["item_name_disp"].map(_norm).replace("", "未指定")
+    rows["vendor_name"] = rows["vendor_name_disp"].map(_norm)
+    rows.loc[rows["vendor_name"] == "", "vendor_name"] = rows["vendor_id"].where(rows["vendor_id"] != "", "-")
+    rows["curr_qty"] = rows["display_stock_qty"].astype(float)
+    rows["curr_base_qty"] = rows["base_qty_num"].astype(float)
+
+    has_prev = rows["prev_date"].notna()
+    rows["total_stock"] = (rows["prev_qty"] + rows["order_sum"]).round(1)
+    rows["total_stock_base_qty"] = (rows["prev_base_qty"] + rows["order_sum_base_qty"]).round(4)
+    rows["usage"] = 0.0
+    rows["usage_base_qty"] = 0.0
+    rows.loc[has_prev, "usage"] = (rows.loc[has_prev, "total_stock"] - rows.loc[has_prev, "curr_qty"]).round(1)
+    rows.loc[has_prev, "usage_base_qty"] = (rows.loc[has_prev, "total_stock_base_qty"] - rows.loc[has_prev, "curr_base_qty"]).round(4)
+    rows["days"] = 0
+    rows.loc[has_prev, "days"] = (rows.loc[has_prev, "stocktake_date_dt"] - rows.loc[has_prev, "prev_date"]).dt.days.clip(lower=1).astype(int)
+    rows["daily_avg"] = [
         round((_safe_float(usage) / int(days)), 1) if int(days) > 0 else 0.0
-        for usage, days in zip(latest["usage"], latest["days"])
+        for usage, days in zip(rows["usage"], rows["days"])
     ]
 
     out = pd.DataFrame(
         {
-            "日期": latest["stocktake_date_dt"].dt.date,
-            "廠商": latest["vendor_name"],
-            "vendor_id": latest["vendor_id"],
-            "品項": latest["item_name"],
-            "上次庫存": latest["prev_qty"].round(1),
-            "上次庫存_base_qty": latest["prev_base_qty"].round(4),
-            "期間進貨": latest["order_sum"].round(1),
-            "期間進貨_base_qty": latest["order_sum_base_qty"].round(4),
-            "庫存合計": latest["total_stock"].round(1),
-            "庫存合計_base_qty": latest["total_stock_base_qty"].round(4),
-            "這次庫存": latest["curr_qty"].round(1),
-            "這次庫存_base_qty": latest["curr_base_qty"].round(4),
-            "期間消耗": latest["usage"].round(1),
-            "期間消耗_base_qty": latest["usage_base_qty"].round(4),
-            "這次叫貨": latest["current_order_qty"].round(1),
-            "這次叫貨_base_qty": latest["current_order_base_qty"].round(4),
-            "日平均": latest["daily_avg"].round(1),
-            "天數": latest["days"].astype(int),
-            "item_id": latest["item_id"],
-            "display_order_num": pd.to_numeric(latest["display_order_num"], errors="coerce").fillna(999999),
+            "日期": rows["stocktake_date_dt"].dt.date,
+            "廠商": rows["vendor_name"],
+            "vendor_id": rows["vendor_id"],
+            "品項": rows["item_name"],
+            "上次庫存": rows["prev_qty"].round(1),
+            "上次庫存_base_qty": rows["prev_base_qty"].round(4),
+            "期間進貨": rows["order_sum"].round(1),
+            "期間進貨_base_qty": rows["order_sum_base_qty"].round(4),
+            "庫存合計": rows["total_stock"].round(1),
+            "庫存合計_base_qty": rows["total_stock_base_qty"].round(4),
+            "這次庫存": rows["curr_qty"].round(1),
+            "這次庫存_base_qty": rows["curr_base_qty"].round(4),
+            "期間消耗": rows["usage"].round(1),
+            "期間消耗_base_qty": rows["usage_base_qty"].round(4),
+            "這次叫貨": rows["current_order_qty"].round(1),
+            "這次叫貨_base_qty": rows["current_order_base_qty"].round(4),
+            "日平均": rows["daily_avg"].round(1),
+            "天數": rows["days"].astype(int),
+            "item_id": rows["item_id"],
+            "display_order_num": pd.to_numeric(rows["display_order_num"], errors="coerce").fillna(999999),
         }
     )
-
     out["日期_dt"] = pd.to_datetime(out["日期"], errors="coerce")
     out["日期顯示"] = out["日期_dt"].dt.strftime("%m-%d")
+    _session_df_cache_set(cache_key, signature, out)
+    return out
+
+
+def _build_latest_item_metrics_df(store_id: str, as_of_date: date) -> pd.DataFrame:
+    """每個 item × vendor 截至 as_of_date 的最後一次盤點指標（由每日彙總表切片）。"""
+    signature = (
+        str(store_id).strip(),
+        str(as_of_date),
+        _partition_versions_signature(_STORE_TRANSACTION_TABLES, str(store_id).strip(), as_of_date),
+        _table_versions_signature(_ITEM_METRICS_MASTER_TABLES),
+    )
+    cache_key = f"derived::latest_item_metrics::{str(store_id).strip()}::{as_of_date}"
+    cached = _session_df_cache_get(cache_key, signature)
+    if cached is not None:
+        return cached
+
+    rollup = _build_item_metrics_rollup_df(store_id)
+    if rollup.empty:
+        out = pd.DataFrame()
+        _session_df_cache_set(cache_key, signature, out)
+        return out
+
+    out = rollup[rollup["日期_dt"] <= pd.Timestamp(as_of_date)]
+    if out.empty:
+        out = pd.DataFrame()
+        _session_df_cache_set(cache_key, signature, out)
+        return out
+
+    # 彙總表已依 (item_id, vendor_id, 日期) 排序，tail(1) 即為各組最新一列
+    out = out.groupby(["item_id", "vendor_id"], as_index=False, sort=False).tail(1)
     out = out.sort_values(["display_order_num", "品項"], ascending=[True, True]).reset_index(drop=True)
     _session_df_cache_set(cache_key, signature, out)
     return out
@@ -1,37 +1,398 @@
 from __future__ import annotations
 
-from datetime import datetime
+# ============================================================
+# ORIVIA OMS
+# 檔案：shared/services/service_audit.py
+# 說明：Audit Log 寫入管線 — 所有 audit_logs 寫入的唯一入口。
+#       呼叫端只把紀錄放進行程內佇列就返回；背景執行緒依筆數 / 時間
+#       批次 upsert。audit_id 在本地產生（ULID 格式），重送不會重複。
+#       寫入失敗的紀錄落地到有上限的重送檔，下次批次成功後補送；
+#       行程結束時會把佇列內剩下的紀錄送出（送不出去就落地）。
+# ============================================================
+
+import atexit
 import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any
 
 import streamlit as st
 
-from shared.services.service_id import allocate_audit_id
-from shared.services.data_backend import append_rows_by_header as sheet_append, get_header as sheet_get_header
+from shared.services.supabase_client import upsert_rows
+from shared.services.table_contract import TABLE_CONTRACT
 
+AUDIT_TABLE = "audit_logs"
+AUDIT_COLUMNS: list[str] = list(TABLE_CONTRACT[AUDIT_TABLE]["columns_order"])
+AUDIT_PRIMARY_KEY: str = TABLE_CONTRACT[AUDIT_TABLE]["primary_key"]
 
-def _now_ts() -> str:
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+# 佇列累積到此筆數立即送出；不足時最多等這麼久
+AUDIT_FLUSH_ROWS = 50
+AUDIT_FLUSH_SECONDS = 2.0
+# 佇列上限：後端長時間無法寫入時，超過的紀錄直接落地，避免記憶體無限成長
+_AUDIT_QUEUE_MAX_ROWS = 5000
+# 重送檔上限：超過時保留最新的紀錄
+_RETRY_MAX_BYTES = 4 * 1024 * 1024
+_RETRY_PATH = Path(tempfile.gettempdir()) / f"oms_audit_retry_{os.getuid() if hasattr(os, 'getuid') else 'user'}.jsonl"
+# 行程結束時等待背景送出的上限（秒）
+_SHUTDOWN_TIMEOUT = 10.0
 
+_CROCKFORD32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def new_audit_id(now: float | None = None) -> str:
+    """
+    產生 audit_id：AUDIT_ + 26 碼 ULID（48 位元毫秒時間 + 80 位元亂數，Crockford base32）。
+    同前綴下字串排序即時間排序；不需向 id_sequences 取號。
+    """
+    ms = int((time.time() if now is None else now) * 1000) & ((1 << 48) - 1)
+    value = (ms << 80) | int.from_bytes(os.urandom(10), "big")
+    chars = []
+    for _ in range(26):
+        chars.append(_CROCKFORD32[value & 31])
+        value >>= 5
+    return "AUDIT_" + "".join(reversed(chars))
 
-def audit_log(action: str, entity_id: str, before: dict | None, after: dict | None, note: str = ""):
-    try:
-        try:
-            audit_id = allocate_audit_id()
-        except Exception:
-            audit_id = f"AUDIT_{datetime.now().strftime('%Y%m%d%H%M%S')}"
 
+def _jsonable(value):
+    # 在呼叫端執行緒轉成純 JSON 結構：numpy / Timestamp 等轉成字串，之後落地與送出都不會失敗
+    if value is None:
+        return None
+    return json.loads(json.dumps(value, ensure_ascii=False, default=str))
+
+
+@dataclass(frozen=True)
+class AuditEvent:
+    action: str                 # create/update/toggle/...
+    table_name: str             # users/stores/purchase_orders/...
+    entity_id: str              # user_id/store_id/po_id/...
+    user_id: str                # 操作者
+    before: dict[str, Any] | None = None
+    after: dict[str, Any] | None = None
+    note: str = ""
+    audit_id: str = field(default_factory=new_audit_id)
+    ts: str = field(default_factory=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    def to_row(self) -> dict:
+        """轉成 audit_logs 的列；每列欄位固定，批次 upsert 時各列欄位一致。"""
         row = {
-            "audit_id": audit_id,
-            "ts": _now_ts(),
-            "user_id": st.session_state.get("login_user", ""),
-            "action": action,
-            "table_name": "users",
-            "entity_id": entity_id,
-            "before_json": json.dumps(before or {}, ensure_ascii=False),
-            "after_json": json.dumps(after or {}, ensure_ascii=False),
-            "note": note,
+            "audit_id": self.audit_id,
+            "ts": self.ts,
+            "user_id": self.user_id or None,
+            "action": self.action,
+            "table_name": self.table_name,
+            "entity_id": str(self.entity_id) if self.entity_id else None,
+            "before_json": _jsonable(self.before),
+            "after_json": _jsonable(self.after),
+            "note": self.note or None,
         }
-        header = sheet_get_header("audit_logs")
-        sheet_append("audit_logs", header, [row])
+        return {col: row.get(col) for col in AUDIT_COLUMNS}
+
+
+# ---------------------------------------------------------------------------
+# 佇列與背景執行緒
+# ---------------------------------------------------------------------------
+
+_cond = threading.Condition()
+_pending: deque[dict] = deque()
+_inflight = 0
+_flush_requested = False
+_stopping = False
+_worker: threading.Thread | None = None
+_atexit_registered = False
+# 重送檔只在持有此鎖時讀寫（背景執行緒與佇列滿時的呼叫端都會碰到）
+_retry_lock = threading.Lock()
+
+
+def _ensure_worker() -> None:
+    # 呼叫端已持有 _cond
+    global _worker, _atexit_registered
+    if _worker is not None and _worker.is_alive():
+        return
+    _worker = threading.Thread(target=_run_worker, name="oms-audit-writer", daemon=True)
+    _worker.start()
+    if not _atexit_registered:
+        atexit.register(shutdown_audit_writer)
+        _atexit_registered = True
+
+
+def submit_audit_events(events: list[AuditEvent]) -> list[str]:
+    """
+    一次放進多筆稽核紀錄（只取一次鎖、只叫醒一次背景執行緒），回傳 audit_id 清單。
+    批次操作用這個，整批通常會在同一次 upsert 寫入。
+    """
+    rows = [event.to_row() for event in events]
+    if not rows:
+        return []
+    overflow: list[dict] = []
+    with _cond:
+        if _stopping:
+            overflow.extend(rows)
+        else:
+            was_empty = not _pending
+            _pending.extend(rows)
+            while len(_pending) > _AUDIT_QUEUE_MAX_ROWS:
+                overflow.append(_pending.popleft())
+            _ensure_worker()
+            if len(_pending) >= AUDIT_FLUSH_ROWS or was_empty:
+                # 滿一批立即送出；佇列由空變非空時叫醒背景執行緒開始計時
+                _cond.notify_all()
+    if overflow:
+        _append_retry_rows(overflow)
+    return [event.audit_id for event in events]
+
+
+def submit_audit_event(event: AuditEvent) -> str:
+    """把一筆稽核紀錄放進佇列後立即返回 audit_id；實際寫入由背景執行緒批次處理。"""
+    return submit_audit_events([event])[0]
+
+
+def write_audit(
+    action: str,
+    table_name: str,
+    entity_id: str,
+    *,
+    user_id: str,
+    before: dict | None = None,
+    after: dict | None = None,
+    note: str = "",
+) -> str:
+    """submit_audit_event 的便利版本；session 資訊（操作者）須由呼叫端先取好。"""
+    return submit_audit_event(AuditEvent(
+        action=action,
+        table_name=table_name,
+        entity_id=entity_id,
+        user_id=user_id,
+        before=before,
+        after=after,
+        note=note,
+    ))
+
+
+def _next_batch() -> list[dict] | None:
+    """等到佇列滿一批、等待逾時或被要求送出，取出一批；停止且佇列已空時回傳 None。"""
+    global _inflight, _flush_requested
+    with _cond:
+        while not _pending:
+            if _stopping:
+                return None
+            _flush_requested = False
+            _cond.wait()
+        deadline = time.monotonic() + AUDIT_FLUSH_SECONDS
+        while len(_pending) < AUDIT_FLUSH_ROWS and not (_stopping or _flush_requested):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _cond.wait(remaining)
+        count = min(len(_pending), AUDIT_FLUSH_ROWS)
+        batch = [_pending.popleft() for _ in range(count)]
+        _inflight += count
+        return batch
+
+
+def _run_worker() -> None:
+    """背景執行緒：不可呼叫 st.*；所有例外都在這裡吃掉，不影響使用者操作。"""
+    global _inflight
+    while True:
+        batch = _next_batch()
+        if batch is None:
+            return
+        try:
+            _write_batch(batch)
+        except Exception:
+            print(f"[audit_log] worker error:\n{traceback.format_exc()}")
+        finally:
+            with _cond:
+                _inflight -= len(batch)
+                _cond.notify_all()
+
+
+def _write_batch(batch: list[dict]) -> None:
+    try:
+        upsert_rows(AUDIT_TABLE, batch, on_conflict=AUDIT_PRIMARY_KEY)
+    except Exception as exc:
+        print(f"[audit_log] write failed, {len(batch)} rows kept for retry: {exc}")
+        _append_retry_rows(batch)
+        return
+    # 這批成功代表後端可寫，順便補送之前失敗的紀錄
+    _replay_retry_rows()
+
+
+# ---------------------------------------------------------------------------
+# 重送檔
+# ---------------------------------------------------------------------------
+
+def _read_retry_lines() -> list[str]:
+    try:
+        with open(_RETRY_PATH, encoding="utf-8") as f:
+            return [line for line in f.read().splitlines() if line.strip()]
+    except OSError:
+        return []
+
+
+def _write_retry_lines(lines: list[str]) -> None:
+    # 超過上限時從最舊的開始丟
+    total = sum(len(line.encode("utf-8")) + 1 for line in lines)
+    start = 0
+    while start < len(lines) and total > _RETRY_MAX_BYTES:
+        total -= len(lines[start].encode("utf-8")) + 1
+        start += 1
+    if start:
+        print(f"[audit_log] retry buffer full, dropped {start} oldest rows")
+    lines = lines[start:]
+    if not lines:
+        try:
+            os.remove(_RETRY_PATH)
+        except OSError:
+            pass
+        return
+    tmp_path = f"{_RETRY_PATH}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, _RETRY_PATH)
+
+
+def _append_retry_rows(rows: list[dict]) -> None:
+    try:
+        with _retry_lock:
+            lines = _read_retry_lines()
+            lines.extend(json.dumps(row, ensure_ascii=False, default=str) for row in rows)
+            _write_retry_lines(lines)
+    except OSError as exc:
+        print(f"[audit_log] cannot persist {len(rows)} rows: {exc}")
+
+
+def _replay_retry_rows() -> None:
+    with _retry_lock:
+        lines = _read_retry_lines()
+        if not lines:
+            return
+        rows = []
+        for line in lines:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                continue
+        sent = 0
+        try:
+            for start in range(0, len(rows), AUDIT_FLUSH_ROWS):
+                chunk = rows[start:start + AUDIT_FLUSH_ROWS]
+                upsert_rows(AUDIT_TABLE, chunk, on_conflict=AUDIT_PRIMARY_KEY)
+                sent += len(chunk)
+        except Exception as exc:
+            print(f"[audit_log] retry failed, {len(rows) - sent} rows remain: {exc}")
+        remaining = [json.dumps(row, ensure_ascii=False) for row in rows[sent:]]
+        try:
+            _write_retry_lines(remaining)
+        except OSError as exc:
+            print(f"[audit_log] cannot update retry buffer: {exc}")
+
+
+def pending_retry_count() -> int:
+    """重送檔內尚未送出的紀錄筆數（供系統頁面檢查）。"""
+    with _retry_lock:
+        return len(_read_retry_lines())
+
+
+# ---------------------------------------------------------------------------
+# 送出 / 關閉
+# ---------------------------------------------------------------------------
+
+def flush_audit_log(timeout: float | None = None) -> bool:
+    """要求背景執行緒立即送出佇列內容，等到送完（或逾時）；回傳是否已清空。"""
+    global _flush_requested
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _cond:
+        if not _pending and not _inflight:
+            return True
+        _ensure_worker()
+        _flush_requested = True
+        _cond.notify_all()
+        while _pending or _inflight:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            _cond.wait(remaining)
+            if _pending and not _flush_requested:
+                _flush_requested = True
+                _cond.notify_all()
+        return True
+
+
+def shutdown_audit_writer(timeout: float = _SHUTDOWN_TIMEOUT) -> None:
+    """行程結束時呼叫（已註冊 atexit）：送出剩下的紀錄，逾時未送出的落地到重送檔。"""
+    global _stopping
+    with _cond:
+        _stopping = True
+        _cond.notify_all()
+        worker = _worker
+    if worker is not None and worker.is_alive():
+        worker.join(timeout)
+    with _cond:
+        leftover = list(_pending)
+        _pending.clear()
+    if leftover:
+        _append_retry_rows(leftover)
+
+
+# ---------------------------------------------------------------------------
+# 使用者管理稽核
+# ---------------------------------------------------------------------------
+
+def audit_log(action: str, entity_id: str, before: dict | None, after: dict | None, note: str = ""):
+    """記錄使用者管理操作；只放進稽核佇列，不等待寫入。"""
+    try:
+        write_audit(
+            action,
+            "users",
+            entity_id,
+            user_id=st.session_state.get("login_user", ""),
+            before=before or {},
+            after=after or {},
+            note=note,
+        )
+    except Exception:
+        pass
+
+
+def audit_log_many(action: str, changes: list[tuple[str, dict | None, dict | None]], note: str = ""):
+    """批次版 audit_log：changes 為 [(entity_id, before, after)]，整批一次放進佇列。"""
+    try:
+        actor = st.session_state.get("login_user", "")
+        submit_audit_events([
+            AuditEvent(
+                action=action,
+                table_name="users",
+                entity_id=entity_id,
+                user_id=actor,
+                before=before or {},
+                after=after or {},
+                note=note,
+            )
+            for entity_id, before, after in changes
+        ])
     except Exception:
         pass
+
+
+__all__ = [
+    "AUDIT_FLUSH_ROWS",
+    "AUDIT_FLUSH_SECONDS",
+    "AuditEvent",
+    "audit_log",
+    "audit_log_many",
+    "flush_audit_log",
+    "new_audit_id",
+    "pending_retry_count",
+    "shutdown_audit_writer",
+    "submit_audit_event",
+    "submit_audit_events",
+    "write_audit",
+]
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+# ============================================================
+# ORIVIA OMS
+# 檔案：shared/services/service_item_search.py
+# 說明：品項搜尋索引 — 品名 / 系統名稱 / item_id / 分類 / 規格正規化後
+#       建 1-gram + 2-gram 倒排表，查詢時先以 gram 交集縮小候選，
+#       再確認子字串並排序（完全相同 > 開頭相同 > 包含）。
+#       索引存在 session 內；新增 / 修改品項時就地更新，不整份重建。
+# ============================================================
+
+import unicodedata
+from collections import defaultdict
+
+import pandas as pd
+import streamlit as st
+
+from shared.services.data_backend import get_table_version, read_table
+
+# 依重要性排序：越前面的欄位相符時排名越前
+ITEM_SEARCH_FIELDS: tuple[str, ...] = ("item_name_zh", "item_name", "item_id", "category", "note", "spec_value")
+
+_INDEX_KEY = "_item_search_index"
+
+_MATCH_EXACT = 0
+_MATCH_PREFIX = 1
+_MATCH_CONTAINS = 2
+
+
+def normalize_search_text(value) -> str:
+    """全形轉半形、轉小寫、去掉空白，讓「ＡＢ 醬」與「ab醬」視為相同。"""
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKC", str(value)).lower()
+    return "".join(text.split())
+
+
+def _grams(text: str) -> set[str]:
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def _clean(value) -> str:
+    if value is None:
+        return ""
+    try:
+        if pd.isna(value):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    return str(value).strip()
+
+
+class ItemSearchIndex:
+    """item_id → 各欄位正規化文字，加上 gram → item_id 的倒排表。"""
+
+    def __init__(self, fields: tuple[str, ...] = ITEM_SEARCH_FIELDS):
+        self.fields = fields
+        self._docs: dict[str, dict[str, str]] = {}
+        self._keys: dict[str, tuple[str, ...]] = {}
+        self._order: dict[str, int] = {}
+        self._postings: defaultdict[str, set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, item_id: str) -> bool:
+        return _clean(item_id) in self._docs
+
+    def upsert(self, item_id: str, values: dict) -> None:
+        """新增或更新一筆品項；values 只需帶有變動的欄位，其餘沿用舊值。"""
+        item_id = _clean(item_id)
+        if not item_id:
+            return
+        doc = dict(self._docs.get(item_id, {}))
+        doc["item_id"] = item_id
+        for field in self.fields:
+            if field in values:
+                doc[field] = _clean(values.get(field))
+        keys = tuple(normalize_search_text(doc.get(field, "")) for field in self.fields)
+        old_keys = self._keys.get(item_id)
+        self._docs[item_id] = doc
+        self._order.setdefault(item_id, len(self._order))
+        if keys == old_keys:
+            return
+        old_grams = set().union(*(_grams(k) for k in old_keys)) if old_keys else set()
+        new_grams = set().union(*(_grams(k) for k in keys))
+        for gram in old_grams - new_grams:
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(item_id)
+                if not posting:
+                    del self._postings[gram]
+        for gram in new_grams - old_grams:
+            self._postings[gram].add(item_id)
+        self._keys[item_id] = keys
+
+    def remove(self, item_id: str) -> None:
+        item_id = _clean(item_id)
+        keys = self._keys.pop(item_id, None)
+        self._docs.pop(item_id, None)
+        self._order.pop(item_id, None)
+        if not keys:
+            return
+        for gram in set().union(*(_grams(k) for k in keys)):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(item_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def _candidates(self, keyword: str) -> set[str]:
+        grams = [keyword] if len(keyword) == 1 else [keyword[i:i + 2] for i in range(len(keyword) - 1)]
+        postings = sorted((self._postings.get(g, set()) for g in set(grams)), key=len)
+        if not postings or not postings[0]:
+            return set()
+        out = set(postings[0])
+        for posting in postings[1:]:
+            out &= posting
+            if not out:
+                break
+        return out
+
+    def rank(self, text: str) -> dict[str, tuple[int, int, int]]:
+        """
+        回傳 {item_id: 排序鍵}，鍵越小越前：(相符程度, 欄位順位, 相符位置)。
+        關鍵字空白時回傳空字典（呼叫端自行決定是否顯示全部）。
+        """
+        keyword = normalize_search_text(text)
+        if not keyword:
+            return {}
+        ranked: dict[str, tuple[int, int, int]] = {}
+        for item_id in self._candidates(keyword):
+            best = None
+            for field_rank, key in enumerate(self._keys[item_id]):
+                pos = key.find(keyword)
+                if pos < 0:
+                    continue
+                kind = _MATCH_EXACT if key == keyword else (_MATCH_PREFIX if pos == 0 else _MATCH_CONTAINS)
+                score = (kind, field_rank, pos)
+                if best is None or score < best:
+                    best = score
+            if best is not None:
+                ranked[item_id] = best
+        return ranked
+
+    def search(self, text: str, limit: int | None = None) -> list[str]:
+        """依相符程度排序的 item_id；同分時依加入索引的順序。"""
+        ranked = self.rank(text)
+        ordered = sorted(ranked, key=lambda item_id: (ranked[item_id], self._order[item_id]))
+        return ordered if limit is None else ordered[:limit]
+
+
+def build_item_search_index(items_df: pd.DataFrame, fields: tuple[str, ...] = ITEM_SEARCH_FIELDS) -> ItemSearchIndex:
+    """依 items_df 的列順序建立索引；缺少的欄位視為空字串。"""
+    index = ItemSearchIndex(fields)
+    if items_df is None or items_df.empty or "item_id" not in items_df.columns:
+        return index
+    columns = [c for c in fields if c in items_df.columns]
+    for values in items_df[columns].itertuples(index=False, name=None):
+        row = dict(zip(columns, values))
+        index.upsert(row.get("item_id"), row)
+    return index
+
+
+# ---------------------------------------------------------------------------
+# session 內的全品項索引
+# ---------------------------------------------------------------------------
+
+def get_item_search_index() -> ItemSearchIndex:
+    """目前 items 版本的全品項索引；版本不符時重建。"""
+    state = st.session_state.get(_INDEX_KEY)
+    version = get_table_version("items")
+    if isinstance(state, dict) and state.get("version") == version:
+        return state["index"]
+    index = build_item_search_index(read_table("items"))
+    st.session_state[_INDEX_KEY] = {"version": version, "index": index}
+    return index
+
+
+def note_item_written(item_id: str, values: dict, *, since_version: int) -> None:
+    """
+    新增 / 修改品項並 bust_cache("items") 之後呼叫，since_version 為寫入前的 items 版本。
+    索引若正是該版本，就地更新這個品項並跟上目前版本；
+    否則代表中間還有未通知的寫入，直接丟掉，下次查詢重建。
+    """
+    state = st.session_state.get(_INDEX_KEY)
+    if not isinstance(state, dict):
+        return
+    if state.get("version") != since_version:
+        st.session_state.pop(_INDEX_KEY, None)
+        return
+    state["index"].upsert(item_id, values)
+    state["version"] = get_table_version("items")
+
+
+def search_item_ids(text: str, limit: int | None = None) -> list[str]:
+    return get_item_search_index().search(text, limit=limit)
+
+
+__all__ = [
+    "ITEM_SEARCH_FIELDS",
+    "ItemSearchIndex",
+    "build_item_search_index",
+    "get_item_search_index",
+    "normalize_search_text",
+    "note_item_written",
+    "search_item_ids",
+]
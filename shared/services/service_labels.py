@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+# ============================================================
+# ORIVIA OMS
+# 檔案：shared/services/service_labels.py
+# 說明：主資料顯示名稱對照（單位 / 廠商 / 品項 / 分店）。
+#       每張表的 id → 名稱字典以向量化方式建立，存在 session 內，
+#       依 get_table_version 失效；寫入後 bust_cache 即自動重建。
+# ============================================================
+
+import pandas as pd
+import streamlit as st
+
+from shared.services.data_backend import get_table_version, read_table
+
+_LABEL_CACHE_KEY = "_label_map_cache"
+
+# table -> (key 欄位, 依序採用的名稱欄位)；名稱都空白時以 key 本身顯示
+LABEL_SPECS: dict[str, tuple[str, tuple[str, ...]]] = {
+    "units": ("unit_id", ("unit_name_zh", "unit_name")),
+    "vendors": ("vendor_id", ("vendor_name_zh", "vendor_name")),
+    "items": ("item_id", ("item_name_zh", "item_name")),
+    "stores": ("store_id", ("store_name_zh", "store_name")),
+}
+
+
+def _clean_text_series(series: pd.Series) -> pd.Series:
+    # 空值與空白字串一律視為空字串
+    return series.astype("string").str.strip().fillna("")
+
+
+def build_label_map(df: pd.DataFrame, key_col: str, label_cols: tuple[str, ...] | list[str]) -> dict[str, str]:
+    """由資料表建立 key → 顯示名稱；同一 key 重複時以最後一筆為準。"""
+    if df is None or df.empty or key_col not in df.columns:
+        return {}
+    keys = _clean_text_series(df[key_col])
+    labels = pd.Series(pd.NA, index=df.index, dtype="string")
+    for col in label_cols:
+        if col in df.columns:
+            labels = labels.fillna(_clean_text_series(df[col]).replace("", pd.NA))
+    labels = labels.fillna(keys)
+    work = pd.DataFrame({"key": keys, "label": labels})
+    work = work[work["key"] != ""].drop_duplicates(subset=["key"], keep="last")
+    return dict(zip(work["key"].tolist(), work["label"].tolist()))
+
+
+def get_label_map(table_name: str) -> dict[str, str]:
+    """
+    取得 table_name 的 id → 顯示名稱字典（唯讀，請勿就地修改）。
+    表版本沒變就直接重用；讀取失敗回傳空字典，不寫入快取。
+    """
+    key_col, label_cols = LABEL_SPECS[table_name]
+    cache = st.session_state.setdefault(_LABEL_CACHE_KEY, {})
+    version = get_table_version(table_name)
+    hit = cache.get(table_name)
+    if isinstance(hit, dict) and hit.get("version") == version:
+        return hit["map"]
+
+    try:
+        df = read_table(table_name)
+    except Exception:
+        return {}
+    label_map = build_label_map(df, key_col, label_cols)
+    cache[table_name] = {"version": version, "map": label_map}
+    return label_map
+
+
+def label_of(table_name: str, value) -> str:
+    """單一值的顯示名稱；找不到時原樣回傳（去除前後空白）。"""
+    text = str(value).strip() if value is not None else ""
+    if not text:
+        return ""
+    return get_label_map(table_name).get(text, text)
+
+
+def label_series(table_name: str, series: pd.Series) -> pd.Series:
+    """整欄轉成顯示名稱（向量化）；找不到的值原樣保留，空值輸出空字串。"""
+    keys = _clean_text_series(series)
+    label_map = get_label_map(table_name)
+    if not label_map:
+        return keys.astype(object)
+    return keys.map(label_map).fillna(keys).astype(object)
+
+
+def clear_label_cache(table_name: str | None = None) -> None:
+    """強制下次重建字典；一般寫入後 bust_cache 讓版本 +1 即可，不需呼叫。"""
+    if table_name is None:
+        st.session_state.pop(_LABEL_CACHE_KEY, None)
+        return
+    cache = st.session_state.get(_LABEL_CACHE_KEY)
+    if isinstance(cache, dict):
+        cache.pop(table_name, None)
+
+
+__all__ = [
+    "LABEL_SPECS",
+    "build_label_map",
+    "clear_label_cache",
+    "get_label_map",
+    "label_of",
+    "label_series",
+]
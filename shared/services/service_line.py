@@ -1,74 +1,194 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import streamlit as st
 
+LINE_PUSH_URL = "https://api.line.me/v2/bot/message/push"
 
-def send_line_message(*, line_message: str, store_id: str) -> bool:
-    try:
-        store_id = str(store_id or "").strip()
+# LINE Messaging API：單次 push 最多 5 則訊息、單則文字最多 5000 字
+LINE_PUSH_MAX_MESSAGES = 5
+LINE_TEXT_MAX_CHARS = 5000
 
-        channel_access_token = str(
-            st.secrets.get("LINE_CHANNEL_ACCESS_TOKEN", "")
-        ).strip()
+# 不同群組之間互不相依，可同時發送；上限避免一次開太多連線
+_LINE_PUSH_MAX_WORKERS = 8
 
-        if not channel_access_token:
-            try:
-                line_bot_cfg = st.secrets.get("line_bot", {})
-                channel_access_token = str(
-                    line_bot_cfg.get("channel_access_token", "")
-                ).strip()
-            except Exception:
-                channel_access_token = ""
 
-        group_id = ""
+def _get_channel_access_token() -> str:
+    channel_access_token = str(
+        st.secrets.get("LINE_CHANNEL_ACCESS_TOKEN", "")
+    ).strip()
 
+    if not channel_access_token:
         try:
-            line_groups_cfg = st.secrets.get("line_groups", {})
-            if store_id:
-                group_id = str(line_groups_cfg.get(store_id, "")).strip()
+            line_bot_cfg = st.secrets.get("line_bot", {})
+            channel_access_token = str(
+                line_bot_cfg.get("channel_access_token", "")
+            ).strip()
         except Exception:
-            group_id = ""
+            channel_access_token = ""
+    return channel_access_token
 
-        if not group_id:
-            group_id = str(st.secrets.get("LINE_GROUP_ID", "")).strip()
 
-        if not channel_access_token:
-            st.error(
-                "缺少 LINE token，請檢查 Streamlit secrets："
-                "LINE_CHANNEL_ACCESS_TOKEN 或 [line_bot].channel_access_token"
-            )
-            return False
-
-        if not group_id:
-            if store_id:
-                st.error(
-                    f"找不到分店 {store_id} 對應的 LINE 群組，"
-                    "請檢查 [line_groups] 或 LINE_GROUP_ID 設定。"
-                )
-            else:
-                st.error("缺少 LINE 群組設定，請檢查 [line_groups] 或 LINE_GROUP_ID。")
-            return False
-
-        response = requests.post(
-            "https://api.line.me/v2/bot/message/push",
-            headers={
-                "Authorization": f"Bearer {channel_access_token}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "to": group_id,
-                "messages": [{"type": "text", "text": line_message}],
-            },
-            timeout=15,
+def _get_group_id(store_id: str) -> str:
+    group_id = ""
+
+    try:
+        line_groups_cfg = st.secrets.get("line_groups", {})
+        if store_id:
+            group_id = str(line_groups_cfg.get(store_id, "")).strip()
+    except Exception:
+        group_id = ""
+
+    if not group_id:
+        group_id = str(st.secrets.get("LINE_GROUP_ID", "")).strip()
+    return group_id
+
+
+def _resolve_push_target(store_id: str) -> tuple[str, str, str]:
+    """回傳 (channel_access_token, group_id, error_message)；設定完整時 error_message 為空。"""
+    channel_access_token = _get_channel_access_token()
+    group_id = _get_group_id(store_id)
+
+    if not channel_access_token:
+        return "", "", (
+            "缺少 LINE token，請檢查 Streamlit secrets："
+            "LINE_CHANNEL_ACCESS_TOKEN 或 [line_bot].channel_access_token"
         )
 
-        if response.status_code == 200:
-            return True
+    if not group_id:
+        if store_id:
+            return channel_access_token, "", (
+                f"找不到分店 {store_id} 對應的 LINE 群組，"
+                "請檢查 [line_groups] 或 LINE_GROUP_ID 設定。"
+            )
+        return channel_access_token, "", "缺少 LINE 群組設定，請檢查 [line_groups] 或 LINE_GROUP_ID。"
+
+    return channel_access_token, group_id, ""
+
+
+def _push_text_messages(*, channel_access_token: str, group_id: str, texts: list[str]) -> str:
+    """單次 push 呼叫；成功回傳空字串，失敗回傳錯誤訊息。
+    此函式可能在背景執行緒執行，不可呼叫 st.* 顯示元件。
+    """
+    response = requests.post(
+        LINE_PUSH_URL,
+        headers={
+            "Authorization": f"Bearer {channel_access_token}",
+            "Content-Type": "application/json",
+        },
+        json={
+            "to": group_id,
+            "messages": [{"type": "text", "text": text} for text in texts],
+        },
+        timeout=15,
+    )
+
+    if response.status_code == 200:
+        return ""
+    return f"LINE API 錯誤：{response.status_code} / {response.text}"
 
-        st.error(f"LINE API 錯誤：{response.status_code} / {response.text}")
-        return False
 
+def _split_long_text(text: str) -> list[str]:
+    """超過單則字數上限的文字依換行拆成多則；單一行仍超過上限時再依字數切開。"""
+    if len(text) <= LINE_TEXT_MAX_CHARS:
+        return [text]
+    parts: list[str] = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > LINE_TEXT_MAX_CHARS:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:LINE_TEXT_MAX_CHARS])
+            line = line[LINE_TEXT_MAX_CHARS:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > LINE_TEXT_MAX_CHARS:
+            parts.append(current)
+            current = line
+        else:
+            current = candidate
+    parts.append(current)
+    return [p.strip() for p in parts if p.strip()]
+
+
+def pack_line_messages(messages: list[str]) -> list[list[str]]:
+    """將多則文字依 LINE 單次 push 上限分批，保留原本順序。
+    空白訊息略過；超過單則字數上限的訊息拆成多則送出，不截斷內容。
+    """
+    texts = [
+        part
+        for m in (messages or [])
+        if str(m or "").strip()
+        for part in _split_long_text(str(m).strip())
+    ]
+    return [
+        texts[i:i + LINE_PUSH_MAX_MESSAGES]
+        for i in range(0, len(texts), LINE_PUSH_MAX_MESSAGES)
+    ]
+
+
+def _push_batches_to_store(*, store_id: str, messages: list[str]) -> str:
+    """同一群組的批次依序送出（維持訊息順序）；回傳第一個錯誤訊息或空字串。"""
+    try:
+        channel_access_token, group_id, error = _resolve_push_target(store_id)
+        if error:
+            return error
+
+        batches = pack_line_messages(messages)
+        if not batches:
+            # 沒有任何內容可送時視為失敗，避免呼叫端誤以為已通知而確認叫貨單
+            return "沒有可發送的 LINE 訊息內容"
+
+        for batch in batches:
+            error = _push_text_messages(
+                channel_access_token=channel_access_token,
+                group_id=group_id,
+                texts=batch,
+            )
+            if error:
+                return error
+        return ""
     except Exception as exc:
-        st.error(f"發送 LINE 時發生錯誤：{exc}")
+        return f"發送 LINE 時發生錯誤：{exc}"
+
+
+def send_line_message(*, line_message: str, store_id: str) -> bool:
+    return send_line_messages(messages=[line_message], store_id=store_id)
+
+
+def send_line_messages(*, messages: list[str], store_id: str) -> bool:
+    """批次模式：多則訊息以每次最多 LINE_PUSH_MAX_MESSAGES 則打包成一次 push。"""
+    error = _push_batches_to_store(store_id=str(store_id or "").strip(), messages=messages)
+    if error:
+        st.error(error)
         return False
+    return True
+
+
+def send_line_messages_to_stores(*, messages_by_store: dict[str, list[str]]) -> dict[str, bool]:
+    """多個分店群組同時發送（群組之間互不相依），回傳 {store_id: 是否成功}。
+    錯誤訊息統一於主執行緒顯示。
+    """
+    targets = {
+        str(store_id or "").strip(): list(messages or [])
+        for store_id, messages in (messages_by_store or {}).items()
+    }
+    if not targets:
+        return {}
+
+    max_workers = min(_LINE_PUSH_MAX_WORKERS, len(targets))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            store_id: executor.submit(_push_batches_to_store, store_id=store_id, messages=messages)
+            for store_id, messages in targets.items()
+        }
+        errors = {store_id: future.result() for store_id, future in futures.items()}
+
+    results: dict[str, bool] = {}
+    for store_id, error in errors.items():
+        if error:
+            st.error(error)
+        results[store_id] = not error
+    return results
@@ -12,6 +12,8 @@ from __future__ import annotations
 #     或參數結構（p_payload）
 #   - SQL function 位於 migrations/007_fix_rpc_on_conflict_partial.sql，
 #     修改需重新驗證並輸出 rpc_transaction_validation_report
+#   - OMS_DATA_BACKEND=sqlite 時 _get_client() 為本機後端，同名 RPC 由
+#     shared/services/local_backend.py 以 Python 實作；修改 SQL function 時需同步
 # =============================================================================
 
 from shared.services.supabase_client import _get_client
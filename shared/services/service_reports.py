@@ -15,6 +15,10 @@ from shared.utils.common_helpers import (
 )
 from shared.services.report_calculations import (
     _build_inventory_history_summary_df,
+    _build_inventory_history_summary_multi_df,
+    _iter_inventory_history_summary_windows,
+    _iter_purchase_detail_chunks,
+    _iter_stock_detail_chunks,
     _build_latest_item_metrics_df,
     _build_purchase_detail_df,
     get_base_unit_cost,
@@ -48,6 +52,25 @@ def build_inventory_history_summary_df(*, store_id: str, start_date: date, end_d
     return _build_inventory_history_summary_df(store_id=store_id, start_date=start_date, end_date=end_date)
 
 
+def build_inventory_history_summary_multi_df(*, store_ids: list[str], start_date: date, end_date: date) -> pd.DataFrame:
+    return _build_inventory_history_summary_multi_df(store_ids=store_ids, start_date=start_date, end_date=end_date)
+
+
+def iter_inventory_history_summary_windows(*, store_id: str, start_date: date, end_date: date):
+    """單一分店進銷存彙總，依月份由新到舊分段產生；只查該分店需要的明細，不寫入快取（分段匯出用）。"""
+    return _iter_inventory_history_summary_windows(store_id, start_date, end_date)
+
+
+def iter_stock_detail_chunks(*, store_id: str, start_date: date, end_date: date, columns: str = "*"):
+    """單一分店盤點日在區間內的盤點明細，分批產生（格式同 build_stock_detail_df）。"""
+    return _iter_stock_detail_chunks(store_id, start_date, end_date, columns=columns)
+
+
+def iter_purchase_detail_chunks(*, store_id: str, start_date: date, end_date: date, columns: str = "*"):
+    """單一分店到貨日在區間內的叫貨明細，分批產生（格式同 build_purchase_detail_df）。"""
+    return _iter_purchase_detail_chunks(store_id, start_date, end_date, columns=columns)
+
+
 def build_latest_item_metrics_df(*, store_id: str, as_of_date: date) -> pd.DataFrame:
     return _build_latest_item_metrics_df(store_id=store_id, as_of_date=as_of_date)
 
@@ -83,6 +106,7 @@ def safe_float(value, default: float = 0.0) -> float:
 __all__ = [
     "REPORT_SHARED_TABLES",
     "build_inventory_history_summary_df",
+    "build_inventory_history_summary_multi_df",
     "build_latest_item_metrics_df",
     "build_purchase_detail_df",
     "clean_option_list",
@@ -90,6 +114,9 @@ __all__ = [
     "get_base_unit_cost",
     "get_report_shared_table_versions",
     "item_display_name",
+    "iter_inventory_history_summary_windows",
+    "iter_purchase_detail_chunks",
+    "iter_stock_detail_chunks",
     "norm",
     "parse_date",
     "read_report_table",
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import os
+import threading
 
 import streamlit as st
 
@@ -50,14 +51,58 @@ def get_supabase_key() -> str:
     )
 
 
+# ----------------------------------------------------------------
+# 資料後端選擇：OMS_DATA_BACKEND（st.secrets 優先，其次環境變數）
+#   "supabase"（預設）：遠端 Supabase
+#   "sqlite"          ：本機 SQLite 檔（OMS_LOCAL_DB_PATH），schema 由
+#                       supabase/migrations 轉譯；供壓測 / benchmark / 離線備援
+# 兩者提供相同的 table() / rpc() 介面，本檔其餘函式不需區分。
+# ----------------------------------------------------------------
+DATA_BACKENDS = ("supabase", "sqlite")
+_DEFAULT_LOCAL_DB_PATH = os.path.join("data", "oms_local.sqlite3")
+
+
+def get_data_backend() -> str:
+    name = (
+        _get_secret("OMS_DATA_BACKEND")
+        or os.environ.get("OMS_DATA_BACKEND", "")
+        or "supabase"
+    ).strip().lower()
+    if name not in DATA_BACKENDS:
+        raise ValueError(f"OMS_DATA_BACKEND 只能是 {' / '.join(DATA_BACKENDS)}，目前為：{name}")
+    return name
+
+
+def get_local_db_path() -> str:
+    return (
+        _get_secret("OMS_LOCAL_DB_PATH")
+        or os.environ.get("OMS_LOCAL_DB_PATH", "")
+        or _DEFAULT_LOCAL_DB_PATH
+    )
+
+
 # ----------------------------------------------------------------
 # 延遲初始化 client：避免 import 時即崩潰
 # ----------------------------------------------------------------
 _supabase_client = None
+_local_client = None
+_local_client_lock = threading.Lock()
+
+
+def _get_local_client():
+    global _local_client
+    if _local_client is None:
+        with _local_client_lock:
+            if _local_client is None:
+                from shared.services.local_backend import LocalSqliteBackend
+                _local_client = LocalSqliteBackend(get_local_db_path())
+    return _local_client
 
 
 def _get_client():
     global _supabase_client
+    if get_data_backend() == "sqlite":
+        return _get_local_client()
     if _supabase_client is not None:
         return _supabase_client
 
@@ -83,21 +128,65 @@ _DEFAULT_TABLE_ORDER: dict[str, str] = {
 }
 
 
-def fetch_table(table_name: str):
-    _PAGE_SIZE = 1000
-    all_rows: list = []
+def iter_table_pages(table_name: str, *, page_size: int = 1000, order_col: str | None = None):
+    """逐頁讀取整張表（每次 yield 一頁 list[dict]），供大表串流處理使用。"""
+    order_col = order_col or _DEFAULT_TABLE_ORDER.get(table_name)
     start = 0
-    order_col = _DEFAULT_TABLE_ORDER.get(table_name)
     while True:
         query = _get_client().table(table_name).select("*")
         if order_col:
             query = query.order(order_col)
-        res = query.range(start, start + _PAGE_SIZE - 1).execute()
+        res = query.range(start, start + page_size - 1).execute()
         batch = res.data or []
-        all_rows.extend(batch)
-        if len(batch) < _PAGE_SIZE:
+        if batch:
+            yield batch
+        if len(batch) < page_size:
+            break
+        start += page_size
+
+
+def iter_filtered_pages(
+    table_name: str,
+    *,
+    columns: str = "*",
+    eq: dict | None = None,
+    in_: dict | None = None,
+    is_null: tuple[str, ...] = (),
+    gte: dict | None = None,
+    lte: dict | None = None,
+    page_size: int = 1000,
+    order_col: str | None = None,
+):
+    """依條件逐頁讀取（條件在資料庫端過濾），不讀整張表；未指定排序時依 _DEFAULT_TABLE_ORDER。"""
+    order_col = order_col or _DEFAULT_TABLE_ORDER.get(table_name)
+    start = 0
+    while True:
+        query = _get_client().table(table_name).select(columns)
+        for col, value in (eq or {}).items():
+            query = query.eq(col, value)
+        for col, values in (in_ or {}).items():
+            query = query.in_(col, list(values))
+        for col in is_null:
+            query = query.is_(col, "null")
+        for col, value in (gte or {}).items():
+            query = query.gte(col, value)
+        for col, value in (lte or {}).items():
+            query = query.lte(col, value)
+        if order_col:
+            query = query.order(order_col)
+        res = query.range(start, start + page_size - 1).execute()
+        batch = res.data or []
+        if batch:
+            yield batch
+        if len(batch) < page_size:
             break
-        start += _PAGE_SIZE
+        start += page_size
+
+
+def fetch_table(table_name: str):
+    all_rows: list = []
+    for batch in iter_table_pages(table_name):
+        all_rows.extend(batch)
     return all_rows
 
 
@@ -130,6 +219,13 @@ def delete_rows(table_name: str, filters: dict):
     return query.execute()
 
 
+def delete_rows_in(table_name: str, field: str, values: list):
+    """刪除 field 值在 values 內的列（一次 DELETE … WHERE field IN (…)）。"""
+    if not values:
+        return None
+    return _get_client().table(table_name).delete().in_(field, list(values)).execute()
+
+
 def replace_table_rows(table_name: str, key_field: str, rows: list[dict]):
     client = _get_client()
     existing = fetch_table(table_name)
@@ -151,8 +247,10 @@ def replace_table_rows(table_name: str, key_field: str, rows: list[dict]):
 # ----------------------------------------------------------------
 def debug_connection_info() -> dict:
     """[TEMP] 診斷 Supabase 連線狀態與 id_sequences 初始化。"""
-    url = get_supabase_url()
-    key = get_supabase_key()
+    if get_data_backend() == "sqlite":
+        url, key = f"sqlite:{get_local_db_path()}", "local"
+    else:
+        url, key = get_supabase_url(), get_supabase_key()
 
     # 遮罩 URL：只顯示 https://xxxxxx...後6碼
     if url and len(url) > 20:
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+# ============================================================
+# ORIVIA OMS
+# 檔案：shared/services/view_model_cache.py
+# 說明：頁面 view model 的 session 快取 — 每個命名空間各自一份 LRU，
+#       同時限制筆數與估計位元組；記錄命中率供檢查快取是否有效。
+# ============================================================
+
+import sys
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+_VM_CACHE_KEY = "_view_model_cache"
+
+DEFAULT_MAX_ENTRIES = 8
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def estimate_nbytes(value) -> int:
+    """估計快取內容大小：DataFrame 以 memory_usage(deep=True) 計，容器逐層加總。"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(k) + estimate_nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _get_namespace(name: str, max_entries: int, max_bytes: int) -> dict:
+    root = st.session_state.setdefault(_VM_CACHE_KEY, {})
+    ns = root.get(name)
+    if not isinstance(ns, dict):
+        ns = {
+            "entries": OrderedDict(),
+            "bytes": 0,
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+        root[name] = ns
+    # 上限以呼叫端最新的設定為準
+    ns["max_entries"] = max(int(max_entries), 1)
+    ns["max_bytes"] = max(int(max_bytes), 0)
+    return ns
+
+
+def _evict(ns: dict) -> None:
+    entries: OrderedDict = ns["entries"]
+    # 至少保留最新的一筆，避免單筆超過位元組上限時整個快取失效
+    while len(entries) > 1 and (len(entries) > ns["max_entries"] or ns["bytes"] > ns["max_bytes"]):
+        _, (_, nbytes) = entries.popitem(last=False)
+        ns["bytes"] -= nbytes
+        ns["evictions"] += 1
+
+
+def vm_cache_get(name: str, signature, *, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+    """
+    取出命名空間 name 內簽章相符的快取值（不複製），沒有則回傳 None。
+    命中的項目移到最新，並計入命中次數。
+    """
+    ns = _get_namespace(name, max_entries, max_bytes)
+    entries: OrderedDict = ns["entries"]
+    hit = entries.get(signature)
+    if hit is None:
+        ns["misses"] += 1
+        return None
+    entries.move_to_end(signature)
+    ns["hits"] += 1
+    return hit[0]
+
+
+def vm_cache_set(name: str, signature, value, *, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+    """
+    寫入快取並依 LRU 淘汰超過筆數或位元組上限的舊項目，回傳 value。
+    位元組在寫入時估算；之後就地補進去的內容不會重新計算。
+    """
+    ns = _get_namespace(name, max_entries, max_bytes)
+    entries: OrderedDict = ns["entries"]
+    old = entries.pop(signature, None)
+    if old is not None:
+        ns["bytes"] -= old[1]
+    nbytes = estimate_nbytes(value)
+    entries[signature] = (value, nbytes)
+    ns["bytes"] += nbytes
+    _evict(ns)
+    return value
+
+
+def vm_cache_clear(name: str | None = None) -> None:
+    """清掉單一命名空間；name 為 None 時清掉全部 view model 快取。"""
+    if name is None:
+        st.session_state.pop(_VM_CACHE_KEY, None)
+        return
+    root = st.session_state.get(_VM_CACHE_KEY)
+    if isinstance(root, dict):
+        root.pop(name, None)
+
+
+def vm_cache_stats() -> dict[str, dict]:
+    """各命名空間的筆數、估計位元組、命中 / 未命中 / 淘汰次數與命中率。"""
+    root = st.session_state.get(_VM_CACHE_KEY)
+    if not isinstance(root, dict):
+        return {}
+    stats: dict[str, dict] = {}
+    for name, ns in root.items():
+        lookups = ns["hits"] + ns["misses"]
+        stats[name] = {
+            "entries": len(ns["entries"]),
+            "bytes": ns["bytes"],
+            "max_entries": ns["max_entries"],
+            "max_bytes": ns["max_bytes"],
+            "hits": ns["hits"],
+            "misses": ns["misses"],
+            "evictions": ns["evictions"],
+            "hit_rate": round(ns["hits"] / lookups, 4) if lookups else 0.0,
+        }
+    return stats
@@ -0,0 +1,200 @@
+"""
+匯出檔串流工具。
+
+資料以多段 DataFrame（iterable）逐段編碼，直接寫入暫存檔；
+不會先把整份結果組成單一 DataFrame 或整包 bytes，
+年度 / 全分店等大量匯出時記憶體維持在單段資料的大小；
+下載時由靜態檔路由逐段讀檔送出（publish_export_file）。
+"""
+from __future__ import annotations
+
+import math
+import os
+import secrets
+import shutil
+import tempfile
+import time
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import BinaryIO
+from urllib.parse import quote
+
+import pandas as pd
+import streamlit as st
+
+CSV_ENCODING = "utf-8-sig"
+
+# 每段最多幾列；過大會讓單段編碼的暫時字串變大，過小則呼叫次數變多
+EXPORT_CHUNK_ROWS = 50_000
+
+# 暫存檔超過此大小改寫到磁碟
+_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+EXPORT_FORMAT_CSV = "csv"
+EXPORT_FORMAT_XLSX = "xlsx"
+
+# 下載走 Streamlit 的 app 靜態檔路由（server.enableStaticServing）：回應時逐段讀檔送出。
+# st.download_button 不論傳 bytes 或檔案物件，都會把整份內容讀進伺服器記憶體。
+# 目錄名為隨機 token，只有拿到網址的人能下載；逾時或換下一份匯出時刪除。
+_STATIC_EXPORT_DIR = Path(__file__).resolve().parents[2] / "static" / "exports"
+_STATIC_EXPORT_URL = "app/static/exports"
+_STATIC_EXPORT_TTL_SECONDS = 2 * 60 * 60
+# Streamlit app 靜態檔的大小上限，超過會回 404；備援的 download_button 也不收超過此大小的檔案
+EXPORT_DOWNLOAD_MAX_BYTES = 200 * 1024 * 1024
+
+EXPORT_MIME_TYPES = {
+    EXPORT_FORMAT_CSV: "text/csv",
+    EXPORT_FORMAT_XLSX: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def iter_frame_chunks(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """把已存在的 DataFrame 依列數切段（不複製資料）。"""
+    if df is None or df.empty:
+        return
+    step = max(int(chunk_rows), 1)
+    for start in range(0, len(df), step):
+        yield df.iloc[start:start + step]
+
+
+def iter_csv_chunks(frames: Iterable[pd.DataFrame]) -> Iterator[bytes]:
+    """
+    逐段輸出 CSV bytes。
+    欄位以第一段非空資料為準，只在第一段寫表頭與 BOM；
+    所有段落串接後與 DataFrame.to_csv(index=False).encode("utf-8-sig") 相同。
+    """
+    columns: list | None = None
+    for frame in frames:
+        if frame is None or frame.empty:
+            continue
+        if columns is None:
+            columns = list(frame.columns)
+            yield frame.to_csv(index=False).encode(CSV_ENCODING)
+            continue
+        yield frame.reindex(columns=columns).to_csv(index=False, header=False).encode("utf-8")
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is pd.NaT:
+        return None
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        # numpy 純量轉成 Python 型別，openpyxl 才能寫入
+        try:
+            return value.item()
+        except (TypeError, ValueError):
+            return value
+    return value
+
+
+def write_csv_stream(frames: Iterable[pd.DataFrame], fileobj: BinaryIO) -> int:
+    """逐段寫入 CSV，回傳寫入的資料列數。"""
+    row_count = 0
+
+    def _counted() -> Iterator[pd.DataFrame]:
+        nonlocal row_count
+        for frame in frames:
+            if frame is not None:
+                row_count += len(frame)
+            yield frame
+
+    for chunk in iter_csv_chunks(_counted()):
+        fileobj.write(chunk)
+    return row_count
+
+
+def write_xlsx_stream(frames: Iterable[pd.DataFrame], fileobj: BinaryIO, *, sheet_name: str = "匯出資料") -> int:
+    """
+    以 openpyxl write-only 模式逐列寫入 XLSX，回傳寫入的資料列數。
+    write-only 工作表不在記憶體保留已寫入的列。
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title=sheet_name[:31] or "Sheet1")
+    row_count = 0
+    columns: list | None = None
+    for frame in frames:
+        if frame is None or frame.empty:
+            continue
+        if columns is None:
+            columns = list(frame.columns)
+            worksheet.append([str(c) for c in columns])
+        else:
+            frame = frame.reindex(columns=columns)
+        for row in frame.itertuples(index=False, name=None):
+            worksheet.append([_xlsx_cell(v) for v in row])
+        row_count += len(frame)
+    if columns is None:
+        worksheet.append([])
+    workbook.save(fileobj)
+    return row_count
+
+
+def spool_export(frames: Iterable[pd.DataFrame], file_format: str = EXPORT_FORMAT_CSV) -> tuple[BinaryIO, int]:
+    """
+    把多段資料寫入暫存檔（小檔留在記憶體、大檔自動落地），
+    回傳 (已移到開頭的檔案物件, 資料列數)。呼叫端負責關閉檔案。
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_BYTES, mode="w+b")
+    try:
+        if file_format == EXPORT_FORMAT_XLSX:
+            row_count = write_xlsx_stream(frames, spooled)
+        else:
+            row_count = write_csv_stream(frames, spooled)
+    except Exception:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled, row_count
+
+
+def _sweep_published_exports(now: float) -> None:
+    if not _STATIC_EXPORT_DIR.is_dir():
+        return
+    for entry in _STATIC_EXPORT_DIR.iterdir():
+        try:
+            if entry.is_dir() and now - entry.stat().st_mtime > _STATIC_EXPORT_TTL_SECONDS:
+                shutil.rmtree(entry, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def publish_export_file(export_file: BinaryIO, filename: str) -> str | None:
+    """
+    把匯出暫存檔分段複製到 static/exports/<token>/，回傳相對下載網址。
+    未開啟 server.enableStaticServing 或檔案超過靜態檔上限時回傳 None，由呼叫端改用 download_button。
+    """
+    if not st.get_option("server.enableStaticServing"):
+        return None
+    export_file.seek(0, os.SEEK_END)
+    size = export_file.tell()
+    export_file.seek(0)
+    if size > EXPORT_DOWNLOAD_MAX_BYTES:
+        return None
+    _sweep_published_exports(time.time())
+    token = secrets.token_urlsafe(24)
+    target_dir = _STATIC_EXPORT_DIR / token
+    target_dir.mkdir(parents=True)
+    safe_name = os.path.basename(filename) or "export"
+    try:
+        with open(target_dir / safe_name, "wb") as out:
+            shutil.copyfileobj(export_file, out, length=1024 * 1024)
+    except Exception:
+        shutil.rmtree(target_dir, ignore_errors=True)
+        raise
+    finally:
+        export_file.seek(0)
+    return f"{_STATIC_EXPORT_URL}/{token}/{quote(safe_name)}"
+
+
+def discard_published_export(url: str | None) -> None:
+    """刪除 publish_export_file 發佈的檔案。"""
+    if not url or not url.startswith(_STATIC_EXPORT_URL + "/"):
+        return
+    token = url[len(_STATIC_EXPORT_URL) + 1:].split("/", 1)[0]
+    if token and token not in (".", ".."):
+        shutil.rmtree(_STATIC_EXPORT_DIR / token, ignore_errors=True)
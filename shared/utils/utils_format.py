@@ -1,38 +1,15 @@
-from functools import lru_cache
+import pandas as pd
 
-from shared.services.data_backend import read_table
-from shared.utils.common_helpers import _norm
-
-
-@lru_cache(maxsize=1)
-def _unit_display_map() -> dict[str, str]:
-    try:
-        units_df = read_table("units")
-    except Exception:
-        return {}
-
-    if units_df is None or units_df.empty or "unit_id" not in units_df.columns:
-        return {}
-
-    unit_map: dict[str, str] = {}
-    for _, row in units_df.iterrows():
-        unit_id = _norm(row.get("unit_id"))
-        if not unit_id:
-            continue
-        label = _norm(row.get("unit_name_zh")) or _norm(row.get("unit_name")) or unit_id
-        unit_map[unit_id] = label
-    return unit_map
+from shared.services.service_labels import label_of, label_series
 
 
 def unit_label(unit_value: str) -> str:
-    text = _norm(unit_value)
-    if not text:
-        return ""
-    return _unit_display_map().get(text, text)
+    return label_of("units", unit_value)
 
 
-def clear_unit_label_cache():
-    _unit_display_map.cache_clear()
+def unit_label_series(unit_values: pd.Series) -> pd.Series:
+    """整欄 unit_id 轉成單位顯示名稱（向量化，取代逐格 apply(unit_label)）。"""
+    return label_series("units", unit_values)
 
 
 def _fmt_qty_with_unit(qty: float, unit: str) -> str:
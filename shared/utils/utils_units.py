@@ -124,6 +124,17 @@ def _filter_active_conversions(
     # 只保留該品項的換算規則
     work = work[work["item_id"] == item_id]
 
+    return _apply_conversion_validity(work, as_of_date)
+
+
+def _apply_conversion_validity(
+    work: pd.DataFrame,
+    as_of_date: Optional[date] = None,
+) -> pd.DataFrame:
+    """
+    保留 ratio > 0、啟用中且於 as_of_date 有效的換算規則。
+    work 需已標準化 item_id / from_unit / to_unit，且 ratio 已轉成數值。
+    """
     # 只保留 ratio 合法資料
     work = work[work["ratio"].notna()]
     work = work[work["ratio"] > 0]
@@ -165,10 +176,10 @@ def _build_unit_graph(valid_df: pd.DataFrame) -> dict:
     """
     graph = {}
 
-    for _, row in valid_df.iterrows():
-        from_unit = _normalize_text(row["from_unit"])
-        to_unit = _normalize_text(row["to_unit"])
-        ratio = float(row["ratio"])
+    for from_unit, to_unit, ratio in zip(valid_df["from_unit"], valid_df["to_unit"], valid_df["ratio"]):
+        from_unit = _normalize_text(from_unit)
+        to_unit = _normalize_text(to_unit)
+        ratio = float(ratio)
 
         if not from_unit or not to_unit or ratio <= 0:
             continue
@@ -182,6 +193,81 @@ def _build_unit_graph(valid_df: pd.DataFrame) -> dict:
     return graph
 
 
+def build_item_unit_graphs(
+    conversions_df: pd.DataFrame,
+    as_of_date: Optional[date] = None,
+    *,
+    graph_cache: Optional[dict] = None,
+) -> dict[str, dict]:
+    """
+    一次過濾全部換算規則並依 item_id 建圖，回傳 {item_id: graph}。
+    供批次換算使用，避免每筆明細重新掃描整張 unit_conversions。
+    graph_cache 有傳入時，依當日有效規則的組合共用同一份圖（多數日期的有效規則相同）。
+    """
+    if conversions_df is None or conversions_df.empty:
+        return {}
+
+    work = conversions_df.copy()
+    for col in ["item_id", "from_unit", "to_unit"]:
+        if col in work.columns:
+            work[col] = work[col].apply(_normalize_text)
+
+    if "ratio" not in work.columns:
+        raise ValueError("unit_conversions 缺少 ratio 欄位")
+    work["ratio"] = pd.to_numeric(work["ratio"], errors="coerce")
+
+    work = _apply_conversion_validity(work, as_of_date)
+    if work.empty:
+        return {}
+
+    cache_key = tuple(work.index)
+    if graph_cache is not None and cache_key in graph_cache:
+        return graph_cache[cache_key]
+
+    graphs = {
+        item_id: _build_unit_graph(group)
+        for item_id, group in work.groupby("item_id", sort=False)
+    }
+    if graph_cache is not None:
+        graph_cache[cache_key] = graphs
+    return graphs
+
+
+def find_unit_factor(graph: dict, item_id: str, from_unit: str, to_unit: str) -> float:
+    """
+    在已建好的換算圖中以 BFS 找出 1 個 from_unit 等於多少 to_unit。
+    找不到路徑時拋出 ValueError（訊息與 convert_unit 一致）。
+    """
+    if from_unit == to_unit:
+        return 1.0
+
+    if not graph:
+        raise ValueError(f"找不到品項 {item_id} 的任何有效單位換算規則")
+    if from_unit not in graph:
+        raise ValueError(f"品項 {item_id} 沒有單位 {from_unit} 的換算規則")
+    if to_unit not in graph:
+        raise ValueError(f"品項 {item_id} 沒有單位 {to_unit} 的換算規則")
+
+    queue = deque([(from_unit, 1.0)])
+    visited = {from_unit}
+
+    while queue:
+        current_unit, current_factor = queue.popleft()
+
+        # 找到目標單位時，回傳換算倍率
+        if current_unit == to_unit:
+            return current_factor
+
+        for next_unit, ratio in graph.get(current_unit, []):
+            if next_unit not in visited:
+                visited.add(next_unit)
+                queue.append((next_unit, current_factor * ratio))
+
+    raise ValueError(
+        f"品項 {item_id} 無法從 {from_unit} 換算到 {to_unit}，請檢查 unit_conversions"
+    )
+
+
 # ============================================================
 # 核心換算函式
 # ============================================================
@@ -239,27 +325,8 @@ def convert_unit(
 
     if from_unit not in graph:
         raise ValueError(f"品項 {item_id} 沒有單位 {from_unit} 的換算規則")
-    if to_unit not in graph:
-        raise ValueError(f"品項 {item_id} 沒有單位 {to_unit} 的換算規則")
-
-    queue = deque([(from_unit, 1.0)])
-    visited = {from_unit}
-
-    while queue:
-        current_unit, current_factor = queue.popleft()
-
-        # 找到目標單位時，回傳換算後數量
-        if current_unit == to_unit:
-            return qty * current_factor
 
-        for next_unit, ratio in graph.get(current_unit, []):
-            if next_unit not in visited:
-                visited.add(next_unit)
-                queue.append((next_unit, current_factor * ratio))
-
-    raise ValueError(
-        f"品項 {item_id} 無法從 {from_unit} 換算到 {to_unit}，請檢查 unit_conversions"
-    )
+    return qty * find_unit_factor(graph, item_id, from_unit, to_unit)
 
 
 # ============================================================
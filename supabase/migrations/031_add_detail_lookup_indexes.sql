@@ -0,0 +1,21 @@
+-- =============================================================================
+-- 031_add_detail_lookup_indexes.sql  —  分店 / 日期分段查詢用索引
+-- 建立時間: 2026-10-19
+-- 說明:
+--   大量匯出改為逐店、逐月份查詢明細（不再讀整張表）：
+--   先以 store_id + 日期取表頭，再以表頭 id 批次取明細。
+--   明細表原本只有 stocktake_line_id / po_line_id 的部分唯一索引，
+--   依 stocktake_id / po_id 查詢會整表掃描。
+-- =============================================================================
+
+CREATE INDEX IF NOT EXISTS idx_stocktakes_store_date
+    ON public.stocktakes (store_id, stocktake_date);
+
+CREATE INDEX IF NOT EXISTS idx_stocktake_lines_stocktake_id
+    ON public.stocktake_lines (stocktake_id);
+
+CREATE INDEX IF NOT EXISTS idx_purchase_orders_store_order_date
+    ON public.purchase_orders (store_id, order_date);
+
+CREATE INDEX IF NOT EXISTS idx_purchase_order_lines_po_id
+    ON public.purchase_order_lines (po_id);
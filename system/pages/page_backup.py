@@ -3,57 +3,28 @@ from __future__ import annotations
 # ============================================================
 # ORIVIA OMS
 # 檔案：system/pages/page_backup.py
-# 說明：備份歷史交易紀錄 — 產生 Excel 供下載，供系統初始化後還原用
+# 說明：備份歷史交易紀錄 — 產生 zip（每表一個 CSV + manifest）供下載，供系統初始化後還原用
 # 權限：system.manage（owner 限定）
 # ============================================================
 
-import io
-from datetime import datetime
-
-import pandas as pd
 import streamlit as st
 
-from shared.services.data_backend import read_table
+from system.services.service_backup import (
+    BACKUP_TABLES,
+    build_backup_archive,
+    discard_backup_archive,
+    read_backup_archive,
+)
+from system.services.service_restore import (
+    clear_restore_checkpoint,
+    discard_uploaded_archive,
+    inspect_backup_archive,
+    load_restore_checkpoint,
+    restore_backup_archive,
+    save_uploaded_archive,
+)
 from users_permissions.services.service_role_permission import has_permission
 
-# ── 備份資料表清單 ─────────────────────────────────────────────
-# (table_name, sheet_name, category)
-_BACKUP_TABLES: list[tuple[str, str, str]] = [
-    # 交易紀錄
-    ("stocktakes",           "盤點單",     "交易"),
-    ("stocktake_lines",      "盤點明細",   "交易"),
-    ("purchase_orders",      "叫貨單",     "交易"),
-    ("purchase_order_lines", "叫貨明細",   "交易"),
-    ("transactions",         "流水帳",     "交易"),
-    ("stock_adjustments",    "庫存調整",   "交易"),
-    ("stock_transfers",      "調貨單",     "交易"),
-    ("stock_transfer_lines", "調貨明細",   "交易"),
-    ("audit_logs",           "操作稽核",   "交易"),
-    # 主資料
-    ("items",                "品項",       "主資料"),
-    ("item_specs",           "品項規格",   "主資料"),
-    ("brands",               "品牌",       "主資料"),
-    ("units",                "單位",       "主資料"),
-    ("unit_conversions",     "換算規則",   "主資料"),
-    ("prices",               "價格",       "主資料"),
-    ("stores",               "分店",       "主資料"),
-    ("vendors",              "廠商",       "主資料"),
-]
-
-
-def _build_backup_excel() -> bytes:
-    """讀取所有備份表，輸出為 Excel bytes（openpyxl 引擎）。"""
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        for table_name, sheet_name, _ in _BACKUP_TABLES:
-            try:
-                df = read_table(table_name)
-            except Exception:
-                df = pd.DataFrame()
-            # 空表仍寫一個只有欄位名稱的 sheet（或空 sheet）
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-    return output.getvalue()
-
 
 def page_backup():
     st.markdown(
@@ -67,12 +38,12 @@ def page_backup():
         st.error("此功能限系統管理員使用。")
         return
 
-    st.caption("將所有交易紀錄與主資料匯出為 Excel 檔案，供系統初始化後還原使用。")
+    st.caption("將所有交易紀錄與主資料匯出為壓縮檔（每張表一個 CSV，附 manifest），供系統初始化後還原使用。")
     st.markdown("---")
 
     # ── 備份說明 ──────────────────────────────────────────────
-    txn_tables  = [(n, s) for n, s, c in _BACKUP_TABLES if c == "交易"]
-    ref_tables  = [(n, s) for n, s, c in _BACKUP_TABLES if c == "主資料"]
+    txn_tables  = [(n, s) for n, s, c in BACKUP_TABLES if c == "交易"]
+    ref_tables  = [(n, s) for n, s, c in BACKUP_TABLES if c == "主資料"]
 
     col1, col2 = st.columns(2)
     with col1:
@@ -87,31 +58,116 @@ def page_backup():
     st.markdown("---")
 
     # ── 產生下載 ──────────────────────────────────────────────
-    now_str = datetime.now().strftime("%Y%m%d_%H%M")
-    filename = f"OMS_backup_{now_str}.xlsx"
-
     st.info(
         "點擊下方按鈕產生備份檔案。資料量較大時可能需要數秒，請耐心等候。",
         icon="ℹ️",
     )
+    include_xlsx = st.checkbox("同時附上 Excel 檔（較慢）", value=False, key="backup_include_xlsx")
 
     if st.button("🔄 產生備份檔案", use_container_width=True, key="backup_generate"):
-        with st.spinner("正在讀取資料並產生 Excel…"):
-            try:
-                excel_bytes = _build_backup_excel()
-                st.session_state["_backup_excel_bytes"] = excel_bytes
-                st.session_state["_backup_filename"] = filename
-                st.success(f"備份完成，共 {len(_BACKUP_TABLES)} 個工作表。")
-            except Exception as e:
-                st.error(f"產生備份時發生錯誤：{e}")
-                st.session_state.pop("_backup_excel_bytes", None)
-
-    if "_backup_excel_bytes" in st.session_state:
+        previous = st.session_state.pop("_backup_archive", None)
+        if previous:
+            discard_backup_archive(previous.get("path", ""))
+        progress = st.progress(0.0, text="正在讀取資料表…")
+
+        def _on_table_done(done: int, total: int, result) -> None:
+            progress.progress(done / total, text=f"已完成 {done}/{total}：{result.sheet_name}")
+
+        try:
+            archive = build_backup_archive(include_xlsx=include_xlsx, on_table_done=_on_table_done)
+            st.session_state["_backup_archive"] = {"path": archive["path"], "filename": archive["filename"]}
+            tables = archive["manifest"]["tables"]
+            failed = [t for t in tables if t["error"]]
+            total_rows = sum(t["rows"] for t in tables)
+            st.success(f"備份完成，共 {len(tables) - len(failed)} 張表、{total_rows:,} 筆資料。")
+            for t in failed:
+                st.warning(f"{t['sheet_name']}（{t['table']}）讀取失敗：{t['error']}")
+        except Exception as e:
+            st.error(f"產生備份時發生錯誤：{e}")
+        finally:
+            progress.empty()
+
+    archive = st.session_state.get("_backup_archive")
+    if archive:
+        archive_path = archive["path"]
         st.download_button(
-            label="⬇️ 下載 Excel 備份檔",
-            data=st.session_state["_backup_excel_bytes"],
-            file_name=st.session_state.get("_backup_filename", filename),
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            label="⬇️ 下載備份壓縮檔",
+            data=lambda: read_backup_archive(archive_path),
+            file_name=archive["filename"],
+            mime="application/zip",
             use_container_width=True,
             key="backup_download",
         )
+
+    _render_restore_section()
+
+
+def _render_restore_section():
+    st.markdown("---")
+    st.subheader("♻️ 由備份檔還原")
+    st.caption("上傳本頁產生的備份壓縮檔，檢查後依主資料 → 交易 → 明細的順序分批寫回。中斷後重新執行會從未完成處續跑。")
+
+    uploaded = st.file_uploader("選擇備份壓縮檔（.zip）", type=["zip"], key="restore_upload")
+    state = st.session_state.get("_restore_state")
+    if uploaded is None:
+        if state:
+            discard_uploaded_archive(state.get("path", ""))
+            st.session_state.pop("_restore_state", None)
+        return
+
+    upload_key = (uploaded.name, uploaded.size)
+    if not state or state.get("upload_key") != upload_key:
+        if state:
+            discard_uploaded_archive(state.get("path", ""))
+        path = save_uploaded_archive(uploaded)
+        try:
+            plan = inspect_backup_archive(path)
+        except Exception as e:
+            discard_uploaded_archive(path)
+            st.session_state.pop("_restore_state", None)
+            st.error(f"無法讀取備份檔：{e}")
+            return
+        state = {"upload_key": upload_key, "path": path, "plan": plan}
+        st.session_state["_restore_state"] = state
+
+    plan = state["plan"]
+    progress_map = load_restore_checkpoint(plan)
+    st.caption(f"備份時間：{plan.created_at}")
+    st.dataframe(
+        [
+            {
+                "資料表": t.table_name,
+                "筆數": t.row_count,
+                "已還原": progress_map.get(t.table_name, 0),
+                "檢查": "；".join(t.errors) or "；".join(t.warnings) or "OK",
+            }
+            for t in plan.tables
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+    if plan.errors:
+        st.error("備份檔檢查未通過，無法還原。")
+        return
+
+    confirmed = st.checkbox("我了解還原會覆寫資料庫中相同主鍵的資料", key="restore_confirm")
+    c1, c2 = st.columns(2)
+    if c2.button("重設還原進度", use_container_width=True, key="restore_reset", disabled=not progress_map):
+        clear_restore_checkpoint(plan)
+        st.rerun()
+    if not c1.button("▶️ 開始還原", use_container_width=True, key="restore_start", disabled=not confirmed):
+        return
+
+    progress = st.progress(0.0, text="準備還原…")
+
+    def _on_progress(table_name: str, rows_done: int, rows_total: int) -> None:
+        progress.progress(min(rows_done / rows_total, 1.0), text=f"{table_name}：{rows_done:,} / {rows_total:,}")
+
+    try:
+        restored = restore_backup_archive(plan, on_progress=_on_progress)
+    except Exception as e:
+        st.error(f"還原中斷：{e}。已完成的批次已記錄，重新按「開始還原」會從中斷處續跑。")
+        return
+    finally:
+        progress.empty()
+    st.success(f"還原完成，共寫入 {sum(restored.values()):,} 筆資料。")
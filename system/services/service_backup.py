@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+# ============================================================
+# ORIVIA OMS
+# 檔案：system/services/service_backup.py
+# 說明：備份管線 — 多張表同時讀取，每張表逐頁寫成 CSV 暫存檔，
+#       最後壓成 zip（含 manifest.json 與選用的 XLSX）。
+#       全程落地在暫存目錄，不在記憶體保留整張表或整個備份檔。
+# ============================================================
+
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from shared.services.supabase_client import iter_table_pages
+from shared.services.table_contract import TABLE_CONTRACT
+
+# ── 備份資料表清單 ─────────────────────────────────────────────
+# (table_name, sheet_name, category)
+BACKUP_TABLES: list[tuple[str, str, str]] = [
+    # 交易紀錄
+    ("stocktakes",           "盤點單",     "交易"),
+    ("stocktake_lines",      "盤點明細",   "交易"),
+    ("purchase_orders",      "叫貨單",     "交易"),
+    ("purchase_order_lines", "叫貨明細",   "交易"),
+    ("transactions",         "流水帳",     "交易"),
+    ("stock_adjustments",    "庫存調整",   "交易"),
+    ("stock_transfers",      "調貨單",     "交易"),
+    ("stock_transfer_lines", "調貨明細",   "交易"),
+    ("audit_logs",           "操作稽核",   "交易"),
+    # 主資料
+    ("items",                "品項",       "主資料"),
+    ("item_specs",           "品項規格",   "主資料"),
+    ("brands",               "品牌",       "主資料"),
+    ("units",                "單位",       "主資料"),
+    ("unit_conversions",     "換算規則",   "主資料"),
+    ("prices",               "價格",       "主資料"),
+    ("stores",               "分店",       "主資料"),
+    ("vendors",              "廠商",       "主資料"),
+]
+
+# 分頁排序欄：各表主鍵（依 supabase/migrations）。offset 分頁必須有唯一且穩定的排序，
+# 否則讀取期間有寫入時會漏列 / 重複而 manifest 筆數仍對得上。
+# 明細表的 stocktake_line_id / po_line_id 可為 NULL，改用實際主鍵 id（自動編號）。
+_BACKUP_ORDER_COLUMNS: dict[str, str] = {
+    "stocktakes": "stocktake_id",
+    "stocktake_lines": "id",
+    "purchase_orders": "po_id",
+    "purchase_order_lines": "id",
+    "transactions": "txn_id",
+    "stock_adjustments": "adjustment_id",
+    "stock_transfers": "transfer_id",
+    "stock_transfer_lines": "transfer_line_id",
+    "audit_logs": "audit_id",
+    "items": "item_id",
+    "item_specs": "spec_id",
+    "brands": "brand_id",
+    "units": "unit_id",
+    "unit_conversions": "conversion_id",
+    "prices": "price_id",
+    "stores": "store_id",
+    "vendors": "vendor_id",
+}
+
+BACKUP_FORMAT = "oms-backup"
+# v2：NULL 以 BACKUP_NULL_MARKER 表示（與空字串區分），manifest 記錄每欄型別
+BACKUP_FORMAT_VERSION = 2
+BACKUP_NULL_MARKER = "\\N"
+MANIFEST_NAME = "manifest.json"
+BACKUP_XLSX_NAME = "OMS_backup.xlsx"
+
+# 各表互不相依，可同時讀取；上限避免一次對 Supabase 開太多連線
+_BACKUP_MAX_WORKERS = 6
+_BACKUP_PAGE_SIZE = 1000
+_HASH_BLOCK_BYTES = 1024 * 1024
+
+
+@dataclass
+class BackupTableResult:
+    table_name: str
+    sheet_name: str
+    category: str
+    path: str = ""
+    columns: list[str] = field(default_factory=list)
+    column_types: dict[str, str] = field(default_factory=dict)
+    row_count: int = 0
+    sha256: str = ""
+    size_bytes: int = 0
+    error: str = ""
+
+
+def backup_table_file_name(table_name: str) -> str:
+    """備份 zip 內每張表的路徑（還原時以同一規則尋找）。"""
+    return f"tables/{table_name}.csv"
+
+
+def _csv_cell(value) -> str:
+    # NULL 寫成 BACKUP_NULL_MARKER；以反斜線開頭的字串多加一個反斜線，避免與 NULL 混淆。
+    # 布林與 JSON 欄位寫成可還原的文字
+    if value is None:
+        return BACKUP_NULL_MARKER
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    text = str(value)
+    return "\\" + text if text.startswith("\\") else text
+
+
+def parse_backup_cell(text: str, column_type: str = "text", null_as: str = BACKUP_NULL_MARKER):
+    """_csv_cell 的反向轉換；column_type 為 manifest 記錄的欄位型別。"""
+    if text == null_as:
+        return None
+    if null_as and text.startswith("\\"):
+        text = text[1:]
+    if column_type == "bool":
+        return text.strip().lower() == "true"
+    if column_type == "integer":
+        return int(text)
+    if column_type == "number":
+        return float(text)
+    if column_type == "json":
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text
+    return text
+
+
+def _value_type(value) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "number"
+    if isinstance(value, (dict, list)):
+        return "json"
+    return "text"
+
+
+def _merge_column_type(current: str, value_type: str) -> str:
+    # 同一欄出現不同型別：整數與小數合併為 number，含 dict / list 即為 json，其餘一律 text
+    if not current or current == value_type:
+        return value_type
+    if {current, value_type} == {"integer", "number"}:
+        return "number"
+    if "json" in (current, value_type):
+        return "json"
+    return "text"
+
+
+def _collect_column_types(column_types: dict[str, str], columns: list[str], batch: list[dict]) -> None:
+    for col in columns:
+        current = column_types.get(col, "")
+        for value in (row.get(col) for row in batch):
+            if value is not None:
+                current = _merge_column_type(current, _value_type(value))
+        if current:
+            column_types[col] = current
+
+
+def _file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_BYTES), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _dump_table_to_csv(table_name: str, sheet_name: str, category: str, work_dir: str) -> BackupTableResult:
+    """
+    逐頁讀取單一資料表並寫入 CSV 暫存檔；失敗時記錄在 error，不中斷其他表。
+    此函式在背景執行緒執行，不可呼叫 st.*。
+    """
+    result = BackupTableResult(table_name=table_name, sheet_name=sheet_name, category=category)
+    contract = TABLE_CONTRACT.get(table_name, {})
+    path = os.path.join(work_dir, f"{table_name}.csv")
+    order_col = _BACKUP_ORDER_COLUMNS.get(table_name)
+    if not order_col:
+        result.error = f"{table_name} 沒有設定分頁排序欄，無法穩定分頁，不予備份"
+        return result
+    try:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            columns: list[str] | None = None
+            # 依主鍵排序分頁，避免讀取期間資料異動造成漏列 / 重複
+            for batch in iter_table_pages(table_name, page_size=_BACKUP_PAGE_SIZE, order_col=order_col):
+                if columns is None:
+                    # select * 每列欄位相同，以第一列為準
+                    columns = list(batch[0].keys())
+                    writer.writerow(columns)
+                writer.writerows([_csv_cell(row.get(col)) for col in columns] for row in batch)
+                _collect_column_types(result.column_types, columns, batch)
+                result.row_count += len(batch)
+            if columns is None:
+                columns = list(contract.get("columns_order", []))
+                writer.writerow(columns)
+        result.columns = columns
+        # 全欄都是 NULL 的欄位無從判斷型別，視為 text
+        result.column_types = {col: result.column_types.get(col, "text") for col in columns}
+        result.path = path
+        result.sha256 = _file_sha256(path)
+        result.size_bytes = os.path.getsize(path)
+    except Exception as exc:
+        result.error = str(exc)
+        result.row_count = 0
+        if os.path.exists(path):
+            os.remove(path)
+    return result
+
+
+def _write_backup_xlsx(results: list[BackupTableResult], path: str) -> None:
+    """由各表 CSV 暫存檔逐列寫入 write-only XLSX（每表一個工作表）。"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for result in results:
+        worksheet = workbook.create_sheet(title=result.sheet_name[:31])
+        if not result.path:
+            continue
+        with open(result.path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            worksheet.append(next(reader, []))
+            for row in reader:
+                # NULL 在工作表留白，字串還原跳脫
+                worksheet.append([parse_backup_cell(cell) for cell in row])
+    workbook.save(path)
+
+
+def build_backup_archive(*, include_xlsx: bool = False, on_table_done=None) -> dict:
+    """
+    產生備份 zip，回傳 {path, filename, manifest}。
+    on_table_done(done, total, result) 在主執行緒呼叫，可用來更新進度。
+    使用完畢後請呼叫 discard_backup_archive(path) 清掉暫存目錄。
+    """
+    work_dir = tempfile.mkdtemp(prefix="oms_backup_")
+    try:
+        results_by_table: dict[str, BackupTableResult] = {}
+        total = len(BACKUP_TABLES)
+        with ThreadPoolExecutor(max_workers=min(_BACKUP_MAX_WORKERS, total)) as executor:
+            futures = [
+                executor.submit(_dump_table_to_csv, table_name, sheet_name, category, work_dir)
+                for table_name, sheet_name, category in BACKUP_TABLES
+            ]
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                results_by_table[result.table_name] = result
+                if on_table_done is not None:
+                    on_table_done(done, total, result)
+        results = [results_by_table[table_name] for table_name, _, _ in BACKUP_TABLES]
+
+        created_at = datetime.now()
+        filename = f"OMS_backup_{created_at.strftime('%Y%m%d_%H%M')}.zip"
+        archive_path = os.path.join(work_dir, filename)
+
+        xlsx_path = ""
+        if include_xlsx:
+            xlsx_path = os.path.join(work_dir, BACKUP_XLSX_NAME)
+            _write_backup_xlsx(results, xlsx_path)
+
+        manifest = {
+            "format": BACKUP_FORMAT,
+            "version": BACKUP_FORMAT_VERSION,
+            "created_at": created_at.isoformat(timespec="seconds"),
+            "encoding": "utf-8",
+            "null_as": BACKUP_NULL_MARKER,
+            "xlsx": BACKUP_XLSX_NAME if include_xlsx else "",
+            "tables": [
+                {
+                    "table": r.table_name,
+                    "sheet_name": r.sheet_name,
+                    "category": r.category,
+                    "file": backup_table_file_name(r.table_name) if r.path else "",
+                    "columns": r.columns,
+                    "column_types": r.column_types,
+                    "rows": r.row_count,
+                    "sha256": r.sha256,
+                    "bytes": r.size_bytes,
+                    "error": r.error,
+                }
+                for r in results
+            ],
+        }
+
+        with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            for r in results:
+                if not r.path:
+                    continue
+                zf.write(r.path, arcname=backup_table_file_name(r.table_name))
+                os.remove(r.path)
+            if xlsx_path:
+                zf.write(xlsx_path, arcname=BACKUP_XLSX_NAME)
+                os.remove(xlsx_path)
+            zf.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+    return {"path": archive_path, "filename": filename, "manifest": manifest}
+
+
+def read_backup_archive(path: str) -> bytes:
+    """下載時才讀出 zip 內容（可在 download_button 的背景執行緒呼叫）。"""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def discard_backup_archive(path: str) -> None:
+    """刪除備份 zip 所在的暫存目錄。"""
+    if not path:
+        return
+    work_dir = os.path.dirname(path)
+    if os.path.basename(work_dir).startswith("oms_backup_"):
+        shutil.rmtree(work_dir, ignore_errors=True)
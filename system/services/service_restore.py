@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+# ============================================================
+# ORIVIA OMS
+# 檔案：system/services/service_restore.py
+# 說明：還原引擎 — 讀取 service_backup 產生的備份 zip，
+#       依 TABLE_CONTRACT 檢查後，按資料表相依順序分批 upsert 回 Supabase
+#       （明細表以業務鍵先刪後寫）；欄位值依 manifest 記錄的型別還原。
+#       每張表的進度寫入 checkpoint 檔，中斷後可從未完成的表 / 批次續跑。
+# ============================================================
+
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+
+from shared.services.data_backend import bust_cache
+from shared.services.supabase_client import delete_rows_in, insert_rows, upsert_rows
+from shared.services.table_contract import TABLE_CONTRACT
+from system.services.service_backup import (
+    BACKUP_FORMAT,
+    BACKUP_FORMAT_VERSION,
+    MANIFEST_NAME,
+    parse_backup_cell,
+)
+
+# 還原順序：被參照的主資料先寫，交易表頭先於明細，稽核紀錄最後
+RESTORE_ORDER: list[str] = [
+    "brands",
+    "units",
+    "stores",
+    "vendors",
+    "items",
+    "item_specs",
+    "unit_conversions",
+    "prices",
+    "stocktakes",
+    "stocktake_lines",
+    "purchase_orders",
+    "purchase_order_lines",
+    "stock_adjustments",
+    "stock_transfers",
+    "stock_transfer_lines",
+    "transactions",
+    "audit_logs",
+]
+
+RESTORE_BATCH_ROWS = 500
+# 先刪後寫的表，DELETE … IN (…) 每次最多帶幾個鍵（鍵放在 URL，避免過長）
+_RESTORE_DELETE_KEYS = 100
+# 同一張表內的批次互不重疊，可同時送出；upsert 與先刪後寫都冪等，失敗重跑不會重複
+_RESTORE_MAX_WORKERS = 4
+_HASH_BLOCK_BYTES = 1024 * 1024
+
+
+@dataclass
+class RestoreTablePlan:
+    table_name: str
+    file: str
+    columns: list[str]
+    row_count: int
+    column_types: dict[str, str] = field(default_factory=dict)
+    load_columns: list[str] = field(default_factory=list)
+    on_conflict: str | None = None
+    # "upsert"：以 on_conflict upsert；"replace"：依 replace_key 先刪除同鍵資料再 insert
+    load_mode: str = "upsert"
+    replace_key: str = ""
+    errors: list[str] = field(default_factory=list)
+    warnings: list[str] = field(default_factory=list)
+
+
+@dataclass
+class RestorePlan:
+    path: str
+    fingerprint: str
+    created_at: str
+    tables: list[RestoreTablePlan]
+    null_as: str = ""
+    format_warnings: list[str] = field(default_factory=list)
+
+    @property
+    def errors(self) -> list[str]:
+        return [f"{t.table_name}：{e}" for t in self.tables for e in t.errors]
+
+    @property
+    def warnings(self) -> list[str]:
+        return list(self.format_warnings) + [f"{t.table_name}：{w}" for t in self.tables for w in t.warnings]
+
+
+# ---------------------------------------------------------------------------
+# 檢查
+# ---------------------------------------------------------------------------
+
+def save_uploaded_archive(fileobj) -> str:
+    """把上傳的備份檔逐塊複製到暫存檔，回傳路徑（還原過程直接讀檔）。"""
+    fd, path = tempfile.mkstemp(prefix="oms_restore_upload_", suffix=".zip")
+    with os.fdopen(fd, "wb") as out:
+        fileobj.seek(0)
+        shutil.copyfileobj(fileobj, out, _HASH_BLOCK_BYTES)
+    return path
+
+
+def discard_uploaded_archive(path: str) -> None:
+    if path and os.path.basename(path).startswith("oms_restore_upload_"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _read_manifest(zf: zipfile.ZipFile) -> tuple[dict, str]:
+    if MANIFEST_NAME not in zf.namelist():
+        raise ValueError("備份檔缺少 manifest.json，無法還原")
+    raw = zf.read(MANIFEST_NAME)
+    manifest = json.loads(raw.decode("utf-8"))
+    if manifest.get("format") != BACKUP_FORMAT:
+        raise ValueError("不是本系統產生的備份檔")
+    if int(manifest.get("version", 0)) > BACKUP_FORMAT_VERSION:
+        raise ValueError(f"備份檔版本 {manifest.get('version')} 較新，請先更新系統")
+    return manifest, hashlib.sha256(raw).hexdigest()
+
+
+def _restore_sort_key(table_name: str) -> tuple[int, str]:
+    if table_name in RESTORE_ORDER:
+        return RESTORE_ORDER.index(table_name), table_name
+    return len(RESTORE_ORDER), table_name
+
+
+def _scan_table_file(zf: zipfile.ZipFile, plan: RestoreTablePlan, expected_sha256: str, null_as: str) -> None:
+    """串流讀一次檔案：核對 checksum、列數，並檢查必填欄位是否有空值。"""
+    hasher = hashlib.sha256()
+    with zf.open(plan.file) as raw:
+        for block in iter(lambda: raw.read(_HASH_BLOCK_BYTES), b""):
+            hasher.update(block)
+    if expected_sha256 and hasher.hexdigest() != expected_sha256:
+        plan.errors.append("檔案 checksum 不符，備份檔可能已損毀")
+        return
+
+    required = [c for c in TABLE_CONTRACT.get(plan.table_name, {}).get("required_columns", []) if c in plan.columns]
+    required_idx = [plan.columns.index(c) for c in required]
+    row_count = 0
+    blank_required = 0
+    for row in _iter_csv_rows(zf, plan.file):
+        row_count += 1
+        if any(idx >= len(row) or row[idx] in ("", null_as) for idx in required_idx):
+            blank_required += 1
+    if row_count != plan.row_count:
+        plan.errors.append(f"資料列數 {row_count} 與 manifest 記錄 {plan.row_count} 不符")
+    if blank_required:
+        plan.errors.append(f"{blank_required} 筆資料的必填欄位（{', '.join(required)}）為空")
+
+
+def inspect_backup_archive(path: str) -> RestorePlan:
+    """讀取備份 zip 並依 TABLE_CONTRACT 檢查，回傳還原計畫（含錯誤 / 警告）。"""
+    with zipfile.ZipFile(path) as zf:
+        manifest, fingerprint = _read_manifest(zf)
+        legacy_format = int(manifest.get("version", 0)) < 2
+        names = set(zf.namelist())
+        tables: list[RestoreTablePlan] = []
+        for entry in manifest.get("tables", []):
+            table_name = str(entry.get("table", "")).strip()
+            if not table_name:
+                continue
+            plan = RestoreTablePlan(
+                table_name=table_name,
+                file=str(entry.get("file", "")),
+                columns=[str(c) for c in entry.get("columns", [])],
+                column_types={str(k): str(v) for k, v in (entry.get("column_types") or {}).items()},
+                row_count=int(entry.get("rows", 0) or 0),
+            )
+            tables.append(plan)
+
+            if entry.get("error"):
+                plan.warnings.append(f"備份時讀取失敗，略過（{entry['error']}）")
+                plan.file = ""
+                continue
+            if not plan.file or plan.file not in names:
+                plan.errors.append("備份檔內找不到資料檔")
+                continue
+
+            contract = TABLE_CONTRACT.get(table_name)
+            if contract is None:
+                plan.warnings.append("不在 TABLE_CONTRACT 中，以資料庫主鍵 upsert")
+                plan.load_columns = list(plan.columns)
+            else:
+                primary_key = contract["primary_key"]
+                missing = [c for c in [primary_key, *contract.get("required_columns", [])] if c not in plan.columns]
+                if missing:
+                    plan.errors.append(f"缺少必要欄位：{', '.join(dict.fromkeys(missing))}")
+                known = set(contract.get("columns_order", []))
+                unknown = [c for c in plan.columns if c not in known]
+                if unknown:
+                    # 欄位來自同一個資料庫的 select *，照樣寫回；明細表先刪後寫，略過會遺失資料
+                    plan.warnings.append(f"TABLE_CONTRACT 未定義的欄位仍照備份寫回：{', '.join(unknown)}")
+                # 明細表的 DB 自增 id 不寫回，交給資料庫重新產生（避免序號落後）
+                has_serial_id = "id" in plan.columns and primary_key != "id"
+                plan.load_columns = [c for c in plan.columns if not (c == "id" and has_serial_id)]
+                if has_serial_id:
+                    # 應用層鍵只有 partial unique index，PostgREST 的 on_conflict 無法指定，
+                    # 改為同批先刪除相同鍵再 insert（重跑同一批結果相同）
+                    plan.load_mode = "replace"
+                    plan.replace_key = primary_key
+                else:
+                    plan.on_conflict = primary_key
+
+            if not plan.errors and plan.row_count:
+                _scan_table_file(zf, plan, str(entry.get("sha256", "")), str(manifest.get("null_as", "")))
+
+    tables.sort(key=lambda t: _restore_sort_key(t.table_name))
+    return RestorePlan(
+        path=path,
+        fingerprint=fingerprint,
+        created_at=str(manifest.get("created_at", "")),
+        tables=tables,
+        # v1 備份 NULL 與空字串同樣寫成空白
+        null_as=str(manifest.get("null_as", "")),
+        format_warnings=["舊版備份未記錄欄位型別：空白一律視為 NULL，{…} / […] 文字視為 JSON"] if legacy_format else [],
+    )
+
+
+# ---------------------------------------------------------------------------
+# 還原
+# ---------------------------------------------------------------------------
+
+def _iter_csv_rows(zf: zipfile.ZipFile, file_name: str):
+    """逐列讀取 zip 內 CSV（跳過表頭），不整份載入記憶體。"""
+    with zf.open(file_name) as raw:
+        reader = csv.reader(io.TextIOWrapper(raw, encoding="utf-8", newline=""))
+        next(reader, None)
+        yield from reader
+
+
+def _legacy_restore_cell(text: str):
+    # v1 備份：NULL 與空字串都寫成空白，JSON 欄位寫成 JSON 文字，只能依內容判斷
+    if text == "":
+        return None
+    if text[0] in "{[" and text[-1] in "}]":
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text
+    return text
+
+
+def _restore_cell(text: str, column_type: str, null_as: str):
+    if not null_as:
+        return _legacy_restore_cell(text)
+    return parse_backup_cell(text, column_type, null_as)
+
+
+def _checkpoint_path(fingerprint: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f"oms_restore_{fingerprint[:16]}.json")
+
+
+def load_restore_checkpoint(plan: RestorePlan) -> dict:
+    """讀取此備份檔的還原進度：{table_name: 已寫入列數}，完成的表為 manifest 列數。"""
+    try:
+        with open(_checkpoint_path(plan.fingerprint), encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {str(k): int(v) for k, v in data.get("tables", {}).items()}
+
+
+def _save_restore_checkpoint(plan: RestorePlan, progress: dict) -> None:
+    path = _checkpoint_path(plan.fingerprint)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": plan.fingerprint, "tables": progress}, f)
+    os.replace(tmp_path, path)
+
+
+def clear_restore_checkpoint(plan: RestorePlan) -> None:
+    try:
+        os.remove(_checkpoint_path(plan.fingerprint))
+    except OSError:
+        pass
+
+
+def _iter_batches(rows, batch_rows: int):
+    while True:
+        batch = list(islice(rows, batch_rows))
+        if not batch:
+            return
+        yield batch
+
+
+def _write_batch(table: RestoreTablePlan, batch: list[dict]) -> None:
+    if table.load_mode != "replace":
+        upsert_rows(table.table_name, batch, table.on_conflict)
+        return
+    keys = [row[table.replace_key] for row in batch]
+    for start in range(0, len(keys), _RESTORE_DELETE_KEYS):
+        delete_rows_in(table.table_name, table.replace_key, keys[start:start + _RESTORE_DELETE_KEYS])
+    insert_rows(table.table_name, batch)
+
+
+def _restore_table(zf: zipfile.ZipFile, plan: RestorePlan, table: RestoreTablePlan, progress: dict, on_progress, batch_rows: int) -> None:
+    rows_done = int(progress.get(table.table_name, 0))
+    if rows_done >= table.row_count:
+        return
+
+    col_specs = [(c, table.columns.index(c), table.column_types.get(c, "text")) for c in table.load_columns]
+    rows = islice(_iter_csv_rows(zf, table.file), rows_done, None)
+    records = (
+        {col: _restore_cell(row[idx], col_type, plan.null_as) if idx < len(row) else None for col, idx, col_type in col_specs}
+        for row in rows
+    )
+    batches = _iter_batches(records, batch_rows)
+
+    with ThreadPoolExecutor(max_workers=_RESTORE_MAX_WORKERS) as executor:
+        while True:
+            # 一輪最多送出 _RESTORE_MAX_WORKERS 批；整輪成功才推進 checkpoint
+            wave = list(islice(batches, _RESTORE_MAX_WORKERS))
+            if not wave:
+                break
+            futures = [executor.submit(_write_batch, table, batch) for batch in wave]
+            for future in futures:
+                future.result()
+            rows_done += sum(len(batch) for batch in wave)
+            progress[table.table_name] = rows_done
+            _save_restore_checkpoint(plan, progress)
+            if on_progress is not None:
+                on_progress(table.table_name, rows_done, table.row_count)
+
+
+def restore_backup_archive(plan: RestorePlan, *, on_progress=None, batch_rows: int = RESTORE_BATCH_ROWS) -> dict:
+    """
+    依 plan 的順序把每張表分批寫回資料庫，回傳 {table_name: 已寫入列數}。
+    已完成的表 / 批次依 checkpoint 略過；中途失敗時例外往外拋，
+    下次以同一個備份檔呼叫即從中斷處續跑。
+    on_progress(table_name, rows_done, rows_total) 在主執行緒呼叫。
+    """
+    if plan.errors:
+        raise ValueError("備份檔檢查未通過：" + "；".join(plan.errors))
+
+    progress = load_restore_checkpoint(plan)
+    restored: list[str] = []
+    try:
+        with zipfile.ZipFile(plan.path) as zf:
+            for table in plan.tables:
+                if not table.file or not table.row_count:
+                    progress.setdefault(table.table_name, 0)
+                    continue
+                restored.append(table.table_name)
+                _restore_table(zf, plan, table, progress, on_progress, batch_rows)
+    finally:
+        if restored:
+            bust_cache(restored)
+    clear_restore_checkpoint(plan)
+    return progress
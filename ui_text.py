@@ -33,6 +33,12 @@ TEXT = {
     "export_analysis": "進銷存分析",
     "export_history": "歷史叫貨紀錄",
     "no_export_store_data": "目前沒有可匯出的分店資料",
+    "label_export_format": "匯出格式",
+    "prepare_export_file": "產生匯出檔",
+    "download_export_file": "下載匯出檔",
+    "export_file_rows": "匯出檔已產生，共 {rows} 筆",
+    "export_file_too_large": "匯出檔超過 {mb} MB，請縮小日期區間或分店範圍後再匯出",
+    "export_preview_rows": "預覽前 {rows} 筆，完整資料請產生匯出檔",
     "analysis_no_records": "此區間內查無紀錄。",
     "analysis_all_vendor_summary": "全部廠商金額統計",
     "analysis_vendor_detail": "品項明細",
@@ -70,6 +76,7 @@ TEXT = {
     "tab_store_permission": "分店權限",
     "tab_promotion": "升遷與角色調整",
     "tab_role_permission": "角色權限表",
+    "tab_batch_users": "批次作業",
     "user_list": "使用者列表",
     "no_user_data": "目前尚無使用者資料",
     "account": "帳號",
@@ -156,6 +163,18 @@ TEXT = {
     "permission_note_2": "- 成本檢查僅限 Owner / Admin 可見。",
     "permission_note_3": "- 店長與組長必須綁定指定分店，不可使用全部分店。",
     "permission_note_4": "- 每店啟用中的店長上限為 3 位。",
+    "batch_create_users": "批次新增使用者",
+    "batch_create_caption": "一列一位使用者；整批檢查通過才會建立，預設密碼皆為 123456。",
+    "batch_create_button": "建立以上使用者",
+    "batch_create_success": "已建立 {count} 位使用者。",
+    "batch_no_rows": "請至少填寫一列。",
+    "batch_manage_users": "批次帳號管理",
+    "select_users": "選擇使用者（可多選）",
+    "please_select_users": "請至少選擇一位使用者。",
+    "batch_reassign_button": "改派到此分店",
+    "batch_reassign_success": "已改派 {count} 位使用者的分店。",
+    "batch_reset_success": "已重設 {count} 位使用者的密碼為 123456。",
+    "batch_status_success": "已更新 {count} 位使用者的帳號狀態。",
     "all_stores": "全部分店",
     "unknown": "未設定",
 }
@@ -14,9 +14,9 @@ from users_permissions.logic.user_permission import (
     is_store_manager_role,
     requires_specific_store_scope,
 )
-from users_permissions.logic.user_query import build_store_option_map, get_store_label_by_scope, norm_text, user_display_label
-from users_permissions.logic.user_write import create_user, reset_user_password, toggle_user_active, update_user
-from users_permissions.services.service_users import UserServiceError
+from users_permissions.logic.user_query import build_store_option_map, get_store_label_by_scope, norm_text, user_display_labels
+from users_permissions.logic.user_write import create_user, create_users, reset_user_password, toggle_user_active, update_user, update_users
+from users_permissions.services.service_users import UserServiceError, sha256_password
 from ui_text import t
 
 
@@ -31,8 +31,8 @@ def build_user_list_table(users_view: pd.DataFrame) -> pd.DataFrame:
 def build_user_option_map(users_view: pd.DataFrame, store_id_to_name: dict[str, str]) -> dict[str, str]:
     if users_view.empty:
         return {}
-    work = users_view.sort_values(["user_id"]).copy()
-    return {user_display_label(row, store_id_to_name, ROLE_LABELS): row["user_id"] for _, row in work.iterrows()}
+    work = users_view.sort_values(["user_id"])
+    return dict(zip(user_display_labels(work, store_id_to_name, ROLE_LABELS).tolist(), work["user_id"].tolist()))
 
 
 def build_role_filtered_option_map(users_view: pd.DataFrame, store_id_to_name: dict[str, str], role_filter) -> dict[str, str]:
@@ -40,33 +40,91 @@ def build_role_filtered_option_map(users_view: pd.DataFrame, store_id_to_name: d
     if work.empty:
         return {}
     work = work.sort_values(["user_id"])
-    return {user_display_label(row, store_id_to_name, ROLE_LABELS): row["user_id"] for _, row in work.iterrows()}
+    return dict(zip(user_display_labels(work, store_id_to_name, ROLE_LABELS).tolist(), work["user_id"].tolist()))
 
 
-def validate_create_user(ctx, *, account_code: str, display_name: str, role_id: str, store_scope: str):
-    work_users = ctx.users_df.copy()
-    work_users["account_code"] = work_users["account_code"].astype(str).str.strip().str.lower()
-    account_exists = account_code.strip().lower() in work_users["account_code"].tolist()
+def _existing_account_codes(ctx) -> set[str]:
+    return set(ctx.users_df["account_code"].astype(str).str.strip().str.lower().tolist())
+
 
+def _validate_new_user(ctx, *, account_code: str, display_name: str, role_id: str, store_scope: str, existing_accounts: set[str], extra_managers: int = 0):
     if not account_code:
         raise UserServiceError(t("please_enter_account"))
     if not display_name:
         raise UserServiceError(t("please_enter_name"))
-    if account_exists:
+    if account_code.strip().lower() in existing_accounts:
         raise UserServiceError(t("account_exists"))
     if not can_assign_role(ctx.current_user, role_id):
         raise UserServiceError(t("no_access_user_admin"))
     if requires_specific_store_scope(role_id) and store_scope == "ALL":
         raise UserServiceError(t("role_requires_store"))
-    if is_store_manager_role(role_id) and count_active_store_managers(ctx.users_df, store_scope) >= 3:
+    if is_store_manager_role(role_id) and count_active_store_managers(ctx.users_df, store_scope) + extra_managers >= 3:
         raise UserServiceError(t("store_manager_limit_reached_create"))
 
 
+def validate_create_user(ctx, *, account_code: str, display_name: str, role_id: str, store_scope: str):
+    _validate_new_user(
+        ctx,
+        account_code=account_code,
+        display_name=display_name,
+        role_id=role_id,
+        store_scope=store_scope,
+        existing_accounts=_existing_account_codes(ctx),
+    )
+
+
+def _raise_batch_errors(errors: list[str]):
+    if errors:
+        raise UserServiceError("\n".join(errors))
+
+
+def validate_create_users(ctx, users: list[dict]):
+    """整批檢查；批次內的帳號與新店長也一併計入重複與店長上限。"""
+    existing_accounts = _existing_account_codes(ctx)
+    new_managers: dict[str, int] = {}
+    errors: list[str] = []
+    for no, user in enumerate(users, start=1):
+        role_id = user.get("role_id", "")
+        store_scope = user.get("store_scope", "")
+        try:
+            _validate_new_user(
+                ctx,
+                account_code=user.get("account_code", ""),
+                display_name=user.get("display_name", ""),
+                role_id=role_id,
+                store_scope=store_scope,
+                existing_accounts=existing_accounts,
+                extra_managers=new_managers.get(store_scope, 0),
+            )
+        except UserServiceError as e:
+            errors.append(f"第 {no} 筆：{e}")
+            continue
+        existing_accounts.add(user["account_code"].strip().lower())
+        if is_store_manager_role(role_id):
+            new_managers[store_scope] = new_managers.get(store_scope, 0) + 1
+    _raise_batch_errors(errors)
+
+
 def submit_create_user(ctx, *, account_code: str, display_name: str, role_id: str, store_scope: str):
     validate_create_user(ctx, account_code=account_code, display_name=display_name, role_id=role_id, store_scope=store_scope)
     return create_user({"account_code": account_code, "display_name": display_name, "role_id": role_id, "store_scope": store_scope})
 
 
+def submit_create_users(ctx, users: list[dict]):
+    """批次建立使用者（例如新分店開幕的整批員工）；任一筆檢查失敗整批不建立。"""
+    payload = [
+        {
+            "account_code": norm_text(user.get("account_code")),
+            "display_name": norm_text(user.get("display_name")),
+            "role_id": norm_text(user.get("role_id")).lower(),
+            "store_scope": norm_text(user.get("store_scope")),
+        }
+        for user in users
+    ]
+    validate_create_users(ctx, payload)
+    return create_users(payload)
+
+
 def validate_edit_user(ctx, *, target_user: dict, role_id: str, store_scope: str, user_id: str):
     if not can_edit_user(ctx.current_user, target_user):
         raise UserServiceError(t("no_access_user_admin"))
@@ -127,6 +185,97 @@ def submit_store_reassign(ctx, *, user_id: str, target_user: dict, target_role_i
     return update_user(user_id, {"updates": {"store_scope": new_store_scope}, "before": before, "after": after}, action=action, note=note)
 
 
+def _target_rows(ctx, user_ids: list[str]) -> list[dict]:
+    wanted = [norm_text(uid) for uid in dict.fromkeys(user_ids) if norm_text(uid)]
+    if not wanted:
+        raise UserServiceError(t("please_select_users"))
+    # 與單筆操作相同，只能處理可管理的使用者（不含 owner）
+    users = ctx.managed_users_df.assign(_uid=ctx.managed_users_df["user_id"].astype(str).str.strip())
+    users = users[~users["_uid"].duplicated(keep="first")].set_index("_uid")
+    missing = [uid for uid in wanted if uid not in users.index]
+    if missing:
+        raise UserServiceError(f"找不到使用者：{', '.join(missing)}")
+    rows = users.loc[wanted].reset_index().to_dict("records")
+    for row in rows:
+        row["user_id"] = row["_uid"]
+        row["target_user"] = {"role_id": norm_text(row.get("role_id")).lower(), "user_id": row["_uid"]}
+    return rows
+
+
+def validate_store_reassign_many(ctx, *, rows: list[dict], new_store_scope: str):
+    errors = [
+        f"{norm_text(row.get('account_code'))}：{t('no_access_user_admin')}"
+        for row in rows
+        if not can_edit_user(ctx.current_user, row["target_user"])
+    ]
+    _raise_batch_errors(errors)
+    moving_managers = [row["user_id"] for row in rows if is_store_manager_role(row["target_user"]["role_id"])]
+    if moving_managers:
+        staying = ctx.users_df[~ctx.users_df["user_id"].astype(str).str.strip().isin(moving_managers)]
+        if count_active_store_managers(staying, new_store_scope) + len(moving_managers) > 3:
+            raise UserServiceError(t("store_manager_limit_assign"))
+
+
+def submit_store_reassign_many(ctx, *, user_ids: list[str], new_store_scope: str, action: str = "reassign_store", note: str = "Reassign store (batch)"):
+    """批次改派分店（例如關店時整批移動員工）：整批檢查、一次寫入、一次稽核。"""
+    rows = _target_rows(ctx, user_ids)
+    new_store_scope = norm_text(new_store_scope)
+    validate_store_reassign_many(ctx, rows=rows, new_store_scope=new_store_scope)
+    changes = [
+        {
+            "user_id": row["user_id"],
+            "updates": {"store_scope": new_store_scope},
+            "before": {"store_scope": norm_text(row.get("store_scope"))},
+            "after": {"store_scope": new_store_scope},
+        }
+        for row in rows
+        if norm_text(row.get("store_scope")) != new_store_scope
+    ]
+    if not changes:
+        return []
+    return update_users(changes, action=action, note=note)
+
+
+def submit_reset_passwords(ctx, *, user_ids: list[str]):
+    rows = _target_rows(ctx, user_ids)
+    for row in rows:
+        validate_quick_reset_password(ctx, target_user=row["target_user"])
+    changes = [
+        {
+            "user_id": row["user_id"],
+            "updates": {"password_hash": sha256_password("123456"), "must_change_password": 1},
+            "before": {
+                "user_id": row["user_id"],
+                "account_code": norm_text(row.get("account_code")),
+                "must_change_password": norm_text(row.get("must_change_password")),
+            },
+            "after": {"must_change_password": 1},
+        }
+        for row in rows
+    ]
+    return update_users(changes, action="reset_password", note="Reset password to default 123456 (batch)")
+
+
+def submit_toggle_users_active(ctx, *, user_ids: list[str], target_next_active: int):
+    rows = _target_rows(ctx, user_ids)
+    for row in rows:
+        validate_toggle_user_active(ctx, target_user=row["target_user"])
+    target_next_active = int(target_next_active)
+    changes = [
+        {
+            "user_id": row["user_id"],
+            "updates": {"is_active": target_next_active},
+            "before": {"user_id": row["user_id"], "is_active": int(row.get("is_active", 1))},
+            "after": {"is_active": target_next_active},
+        }
+        for row in rows
+        if int(row.get("is_active", 1)) != target_next_active
+    ]
+    if not changes:
+        return []
+    return update_users(changes, action="toggle_user_active", note="Adjust user active status (batch)")
+
+
 def build_promotion_state(ctx):
     promotion_users_df = ctx.users_view[ctx.users_view["role_id"].apply(is_promotion_target_role)].copy()
     option_map = build_role_filtered_option_map(ctx.users_view, ctx.store_id_to_name, is_promotion_target_role)
@@ -390,3 +539,29 @@ def build_user_quick_manage_display(selected_state: dict, labels: dict[str, str]
         "store_text": norm_text(target_row.get("store_display")),
         "status_text": norm_text(target_row.get("status_display")),
     }
+
+
+def build_batch_users_state(ctx):
+    create_state = build_account_edit_create_state(ctx)
+    managed_df = ctx.users_view.sort_values(["user_id"])
+    return {
+        **create_state,
+        "user_option_map": build_user_option_map(managed_df, ctx.store_id_to_name),
+        "store_names_only": build_store_assignment_names(ctx),
+    }
+
+
+def build_batch_create_payload(ctx, edited_rows: list[dict], store_option_map: dict[str, str]) -> list[dict]:
+    """data_editor 的列（帳號 / 姓名 / 角色名稱 / 分店名稱）轉成 submit_create_users 的參數；整列空白略過。"""
+    payload = []
+    for row in edited_rows:
+        values = {k: norm_text(row.get(k)) for k in ("account_code", "display_name", "role_name", "store_name")}
+        if not any(values.values()):
+            continue
+        payload.append({
+            "account_code": values["account_code"],
+            "display_name": values["display_name"],
+            "role_id": ctx.role_name_to_id.get(values["role_name"], ""),
+            "store_scope": store_option_map.get(values["store_name"], ""),
+        })
+    return payload
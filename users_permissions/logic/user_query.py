@@ -6,6 +6,7 @@ import pandas as pd
 import streamlit as st
 
 from shared.services.data_backend import get_table_versions, read_table
+from shared.services.view_model_cache import vm_cache_get, vm_cache_set
 
 
 
@@ -130,20 +131,33 @@ def load_stores_df() -> pd.DataFrame:
     )
 
 
+def _text_column(df: pd.DataFrame, col: str) -> pd.Series:
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[col].astype("string").str.strip().fillna("").astype(object)
+
+
+def _first_text(*columns: pd.Series) -> pd.Series:
+    """逐列取第一個非空白的值。"""
+    out = columns[0]
+    for col in columns[1:]:
+        out = out.where(out != "", col)
+    return out
+
+
 def build_store_maps(stores_df: pd.DataFrame) -> tuple[dict[str, str], dict[str, str]]:
-    active_stores_df = stores_df.copy()
-    active_stores_df["is_active"] = safe_active_series(active_stores_df)
-    active_stores_df = active_stores_df[active_stores_df["is_active"] == 1].copy()
-
-    store_id_to_name = {"ALL": "全部分店"}
-    store_name_to_id = {"全部分店": "ALL"}
-    for _, row in active_stores_df.iterrows():
-        store_id = norm_text(row.get("store_id"))
-        store_name = norm_text(row.get("store_name_zh")) or norm_text(row.get("store_name")) or store_id
-        if not store_id:
-            continue
-        store_id_to_name[store_id] = store_name
-        store_name_to_id[store_name] = store_id
+    active_stores_df = stores_df[safe_active_series(stores_df) == 1]
+    store_ids = _text_column(active_stores_df, "store_id")
+    store_names = _first_text(
+        _text_column(active_stores_df, "store_name_zh"),
+        _text_column(active_stores_df, "store_name"),
+        store_ids,
+    )
+    keep = store_ids != ""
+    store_ids, store_names = store_ids[keep].tolist(), store_names[keep].tolist()
+
+    store_id_to_name = {"ALL": "全部分店", **dict(zip(store_ids, store_names))}
+    store_name_to_id = {"全部分店": "ALL", **dict(zip(store_names, store_ids))}
     return store_id_to_name, store_name_to_id
 
 
@@ -174,19 +188,18 @@ def get_store_label_by_scope(store_option_map: dict[str, str], store_scope: str)
 
 
 def build_role_maps(roles_df: pd.DataFrame, role_labels: dict[str, str], login_role_id: str) -> tuple[dict[str, str], dict[str, str]]:
-    active_roles_df = roles_df.copy()
-    active_roles_df["is_active"] = safe_active_series(active_roles_df)
-    active_roles_df = active_roles_df[active_roles_df["is_active"] == 1].copy()
-
-    role_id_to_name: dict[str, str] = {}
-    role_name_to_id: dict[str, str] = {}
-    for _, row in active_roles_df.iterrows():
-        role_id = norm_text(row.get("role_id")).lower()
-        role_name = norm_text(row.get("role_name_zh")) or norm_text(row.get("role_name")) or role_labels.get(role_id, role_id)
-        if not role_id or role_id == "owner":
-            continue
-        role_id_to_name[role_id] = role_name
-        role_name_to_id[role_name] = role_id
+    active_roles_df = roles_df[safe_active_series(roles_df) == 1]
+    role_ids = _text_column(active_roles_df, "role_id").str.lower()
+    role_names = _first_text(
+        _text_column(active_roles_df, "role_name_zh"),
+        _text_column(active_roles_df, "role_name"),
+        role_ids.map(role_labels).fillna(role_ids),
+    )
+    keep = (role_ids != "") & (role_ids != "owner")
+    role_ids, role_names = role_ids[keep].tolist(), role_names[keep].tolist()
+
+    role_id_to_name: dict[str, str] = dict(zip(role_ids, role_names))
+    role_name_to_id: dict[str, str] = dict(zip(role_names, role_ids))
 
     if not role_id_to_name:
         base_roles = {
@@ -219,6 +232,17 @@ def user_display_label(row: pd.Series, store_id_to_name: dict[str, str], role_la
     return f"{name}（{account} / {role_name} / {store_name}）"
 
 
+def user_display_labels(users_df: pd.DataFrame, store_id_to_name: dict[str, str], role_labels: dict[str, str]) -> pd.Series:
+    """user_display_label 的整欄版本，index 與 users_df 相同。"""
+    account = _text_column(users_df, "account_code")
+    name = _first_text(_text_column(users_df, "display_name"), account)
+    role_id = _text_column(users_df, "role_id").str.lower()
+    role_name = role_id.map(role_labels).fillna(role_id)
+    store_scope = _text_column(users_df, "store_scope")
+    store_name = store_scope.map(store_id_to_name).fillna(store_scope.where(store_scope != "", "未設定"))
+    return name + "（" + account + " / " + role_name + " / " + store_name + "）"
+
+
 def build_users_view(users_df: pd.DataFrame, roles_df: pd.DataFrame, stores_df: pd.DataFrame, role_labels: dict[str, str]) -> pd.DataFrame:
     role_display_col = pick_first_existing_column(roles_df, ["role_name_zh", "role_name"], "role_id")
     role_map = roles_df[["role_id", role_display_col]].copy().rename(columns={role_display_col: "role_display"})
@@ -240,11 +264,18 @@ def build_users_view(users_df: pd.DataFrame, roles_df: pd.DataFrame, stores_df:
     return users_view
 
 
-def build_user_admin_context(current_user_role_id: str, current_user_id: str, role_labels: dict[str, str]) -> UserAdminContext:
-    current_user = {
-        "role_id": norm_text(current_user_role_id).lower(),
-        "user_id": norm_text(current_user_id),
-    }
+_USER_ADMIN_CONTEXT_CACHE = "user_admin_context"
+
+
+def _build_user_admin_frames(current_role_id: str, role_labels: dict[str, str]) -> dict:
+    """
+    使用者管理頁的表格與名稱對照，依 users / roles / stores 版本與登入者角色快取。
+    回傳的 DataFrame / dict 為共用物件，呼叫端請勿就地修改。
+    """
+    signature = (get_table_versions(_USER_ADMIN_TABLES), current_role_id, tuple(sorted(role_labels.items())))
+    cached = vm_cache_get(_USER_ADMIN_CONTEXT_CACHE, signature, max_entries=4)
+    if cached is not None:
+        return cached
 
     users_df = load_users_df()
     roles_df = load_roles_df()
@@ -253,17 +284,25 @@ def build_user_admin_context(current_user_role_id: str, current_user_id: str, ro
     managed_users_df = users_df[users_df["role_id"] != "owner"].copy().reset_index(drop=True)
     users_view = build_users_view(managed_users_df, roles_df, stores_df, role_labels)
     store_id_to_name, store_name_to_id = build_store_maps(stores_df)
-    role_id_to_name, role_name_to_id = build_role_maps(roles_df, role_labels, current_user["role_id"])
-
-    return UserAdminContext(
-        current_user=current_user,
-        users_df=users_df,
-        roles_df=roles_df,
-        stores_df=stores_df,
-        managed_users_df=managed_users_df,
-        users_view=users_view,
-        store_id_to_name=store_id_to_name,
-        store_name_to_id=store_name_to_id,
-        role_id_to_name=role_id_to_name,
-        role_name_to_id=role_name_to_id,
-    )
+    role_id_to_name, role_name_to_id = build_role_maps(roles_df, role_labels, current_role_id)
+    frames = {
+        "users_df": users_df,
+        "roles_df": roles_df,
+        "stores_df": stores_df,
+        "managed_users_df": managed_users_df,
+        "users_view": users_view,
+        "store_id_to_name": store_id_to_name,
+        "store_name_to_id": store_name_to_id,
+        "role_id_to_name": role_id_to_name,
+        "role_name_to_id": role_name_to_id,
+    }
+    return vm_cache_set(_USER_ADMIN_CONTEXT_CACHE, signature, frames, max_entries=4)
+
+
+def build_user_admin_context(current_user_role_id: str, current_user_id: str, role_labels: dict[str, str]) -> UserAdminContext:
+    current_user = {
+        "role_id": norm_text(current_user_role_id).lower(),
+        "user_id": norm_text(current_user_id),
+    }
+    frames = _build_user_admin_frames(current_user["role_id"], role_labels)
+    return UserAdminContext(current_user=current_user, **frames)
@@ -6,6 +6,7 @@ from users_permissions.services.service_users import (
     build_account_info_df,
     change_own_password,
     create_user_account,
+    create_user_accounts,
     force_change_password,
     get_user_row,
     initialize_owner_password,
@@ -14,6 +15,7 @@ from users_permissions.services.service_users import (
     reset_user_password_admin,
     toggle_user_active_admin,
     update_user_profile,
+    update_user_profiles,
 )
 
 
@@ -33,6 +35,14 @@ def update_user(user_id: str, data: dict, action: str = "update_user", note: str
     )
 
 
+def create_users(items: list[dict]):
+    return create_user_accounts(items, actor_user_id=st.session_state.get("login_user", ""))
+
+
+def update_users(changes: list[dict], action: str, note: str):
+    return update_user_profiles(changes, action=action, note=note, actor_user_id=st.session_state.get("login_user", ""))
+
+
 def reset_user_password(user_id: str, target_row: dict):
     return reset_user_password_admin(user_id, target_row, actor_user_id=st.session_state.get("login_user", ""))
 
@@ -5,6 +5,7 @@ import streamlit as st
 from shared.utils.permissions import require_permission
 from users_permissions.pages.user_admin.shared import build_user_admin_context
 from users_permissions.pages.user_admin.tab_account_edit import render_tab_account_edit
+from users_permissions.pages.user_admin.tab_batch_users import render_tab_batch_users
 from users_permissions.pages.user_admin.tab_promotion import render_tab_promotion
 from users_permissions.pages.user_admin.tab_role_permission import render_tab_role_permission
 from users_permissions.pages.user_admin.tab_store_permission import render_tab_store_permission
@@ -19,9 +20,10 @@ def page_user_admin():
         return
     ctx = build_user_admin_context()
 
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         t("tab_user_list"),
         t("tab_account_edit"),
+        t("tab_batch_users"),
         t("tab_store_permission"),
         t("tab_promotion"),
         t("tab_role_permission"),
@@ -34,10 +36,13 @@ def page_user_admin():
         render_tab_account_edit(ctx)
 
     with tab3:
-        render_tab_store_permission(ctx)
+        render_tab_batch_users(ctx)
 
     with tab4:
-        render_tab_promotion(ctx)
+        render_tab_store_permission(ctx)
 
     with tab5:
+        render_tab_promotion(ctx)
+
+    with tab6:
         render_tab_role_permission(ctx)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import pandas as pd
+import streamlit as st
+
+from users_permissions.logic.logic_user_admin import (
+    build_batch_create_payload,
+    build_batch_users_state,
+    submit_create_users,
+    submit_reset_passwords,
+    submit_store_reassign_many,
+    submit_toggle_users_active,
+)
+from users_permissions.services.service_users import UserServiceError
+from ui_text import t
+
+
+def _run_batch(action, success_key: str, failed_key: str = "action_failed"):
+    try:
+        done = action()
+    except UserServiceError as e:
+        st.error(str(e))
+        return
+    except Exception as e:
+        st.error(f"{t(failed_key)}：{e}")
+        return
+    st.success(t(success_key).format(count=len(done)))
+    st.rerun()
+
+
+def render_tab_batch_users(ctx):
+    state = build_batch_users_state(ctx)
+
+    st.subheader(t("batch_create_users"))
+    st.caption(t("batch_create_caption"))
+    if not state["role_options"]:
+        st.warning(t("no_available_roles"))
+    else:
+        edited = st.data_editor(
+            pd.DataFrame(columns=["account_code", "display_name", "role_name", "store_name"]),
+            num_rows="dynamic",
+            use_container_width=True,
+            hide_index=True,
+            key="batch_create_users_editor",
+            column_config={
+                "account_code": st.column_config.TextColumn(t("login_account"), required=True),
+                "display_name": st.column_config.TextColumn(t("display_name"), required=True),
+                "role_name": st.column_config.SelectboxColumn(t("role_name"), options=state["role_options"], required=True),
+                "store_name": st.column_config.SelectboxColumn(t("store_name"), options=state["store_options"], required=True),
+            },
+        )
+        if st.button(t("batch_create_button"), use_container_width=True, key="btn_batch_create_users"):
+            payload = build_batch_create_payload(ctx, edited.to_dict("records"), state["store_option_map"])
+            if not payload:
+                st.error(t("batch_no_rows"))
+            else:
+                _run_batch(lambda: submit_create_users(ctx, payload), "batch_create_success", "create_failed")
+
+    st.divider()
+    st.subheader(t("batch_manage_users"))
+    user_option_map = state["user_option_map"]
+    if not user_option_map:
+        st.info(t("no_manageable_users"))
+        return
+    selected_labels = st.multiselect(t("select_users"), list(user_option_map.keys()), key="batch_selected_users")
+    selected_user_ids = [user_option_map[label] for label in selected_labels]
+
+    c1, c2 = st.columns([2, 1])
+    with c1:
+        store_name = st.selectbox(t("reassign_store"), state["store_names_only"], key="batch_reassign_store")
+    with c2:
+        st.write("")
+        if st.button(t("batch_reassign_button"), use_container_width=True, key="btn_batch_reassign", disabled=not store_name):
+            _run_batch(
+                lambda: submit_store_reassign_many(ctx, user_ids=selected_user_ids, new_store_scope=ctx.store_name_to_id[store_name]),
+                "batch_reassign_success",
+                "update_failed",
+            )
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        if st.button(t("reset_password_123456"), use_container_width=True, key="btn_batch_reset_password"):
+            _run_batch(lambda: submit_reset_passwords(ctx, user_ids=selected_user_ids), "batch_reset_success")
+    with c2:
+        if st.button(t("disable_account"), use_container_width=True, key="btn_batch_disable"):
+            _run_batch(lambda: submit_toggle_users_active(ctx, user_ids=selected_user_ids, target_next_active=0), "batch_status_success", "update_failed")
+    with c3:
+        if st.button(t("enable_account"), use_container_width=True, key="btn_batch_enable"):
+            _run_batch(lambda: submit_toggle_users_active(ctx, user_ids=selected_user_ids, target_next_active=1), "batch_status_success", "update_failed")
@@ -9,43 +9,107 @@ from __future__ import annotations
 # 注意：不修改登入流程，不接 Supabase Auth，不啟用 RLS。
 #       登入後由 load_user_permissions_to_session 載入至
 #       st.session_state["current_permissions"]。
+# 快取：role_permissions + permissions 編譯成 role_id → frozenset 的權限矩陣，
+#       整個程序共用（所有 session / 使用者），逾時或兩張表 bust_cache 後重建。
 # ============================================================
 
+import threading
+import time
+
 import streamlit as st
 
+from shared.services.data_backend import get_table_versions
 from shared.services.supabase_client import fetch_table
 
+PERMISSION_TABLES: tuple[str, ...] = ("role_permissions", "permissions")
+# 權限表多半直接在資料庫維護，逾時後重新讀取以吃到外部異動
+PERMISSION_MATRIX_TTL_SECONDS = 300.0
+
+_SEEN_VERSIONS_KEY = "_permission_matrix_seen_versions"
+
+_matrix_lock = threading.Lock()
+_matrix: dict[str, frozenset[str]] | None = None
+_matrix_loaded_at = 0.0
+
 
 # ----------------------------------------------------------------
 # 內部工具
 # ----------------------------------------------------------------
 
-def _fetch_permissions_for_role(role_id: str) -> list[str]:
+def _norm_text(value) -> str:
+    return str(value if value is not None else "").strip()
+
+
+def compile_permission_matrix(rp_rows: list[dict], perm_rows: list[dict]) -> dict[str, frozenset[str]]:
+    """把 role_permissions / permissions 兩張表編譯成 role_id（小寫）→ permission_key 集合。"""
+    key_by_perm_id: dict[str, str] = {}
+    for r in perm_rows:
+        perm_id = _norm_text(r.get("permission_id"))
+        key = _norm_text(r.get("permission_key"))
+        if perm_id and key:
+            key_by_perm_id[perm_id] = key
+
+    keys_by_role: dict[str, set[str]] = {}
+    for r in rp_rows:
+        role_id = _norm_text(r.get("role_id")).lower()
+        key = key_by_perm_id.get(_norm_text(r.get("permission_id")))
+        if role_id and key:
+            keys_by_role.setdefault(role_id, set()).add(key)
+    return {role_id: frozenset(keys) for role_id, keys in keys_by_role.items()}
+
+
+def invalidate_permission_matrix() -> None:
+    """丟掉程序共用的權限矩陣，下次查詢時重新讀取。"""
+    global _matrix
+    with _matrix_lock:
+        _matrix = None
+
+
+def _sync_with_table_versions() -> None:
     """
-    從 role_permissions + permissions 查詢指定 role 的 permission_key 清單。
-    若查詢失敗則回傳空清單，不拋出例外。
+    本 session 對權限表 bust_cache（版本號變動）時，程序共用矩陣一併失效；
+    第一次看到的版本只記錄，不觸發重建。
     """
-    if not role_id:
-        return []
     try:
-        rp_rows = fetch_table("role_permissions")
-        perm_rows = fetch_table("permissions")
-
-        role_perm_ids = {
-            str(r.get("permission_id", "")).strip()
-            for r in rp_rows
-            if str(r.get("role_id", "")).strip().lower() == role_id.lower()
-        }
-
-        keys = [
-            str(r.get("permission_key", "")).strip()
-            for r in perm_rows
-            if str(r.get("permission_id", "")).strip() in role_perm_ids
-            and str(r.get("permission_key", "")).strip()
-        ]
-        return keys
+        versions = get_table_versions(PERMISSION_TABLES)
     except Exception:
-        return []
+        return
+    seen = st.session_state.get(_SEEN_VERSIONS_KEY)
+    if seen is not None and seen != versions:
+        invalidate_permission_matrix()
+    st.session_state[_SEEN_VERSIONS_KEY] = versions
+
+
+def get_permission_matrix() -> dict[str, frozenset[str]] | None:
+    """
+    取得程序共用的權限矩陣（唯讀）；讀取失敗回傳 None 且不寫入快取。
+    同時多個登入只會有一個去讀資料庫，其餘等待後直接共用結果。
+    """
+    global _matrix, _matrix_loaded_at
+    _sync_with_table_versions()
+    with _matrix_lock:
+        if _matrix is not None and time.monotonic() - _matrix_loaded_at < PERMISSION_MATRIX_TTL_SECONDS:
+            return _matrix
+        try:
+            matrix = compile_permission_matrix(fetch_table("role_permissions"), fetch_table("permissions"))
+        except Exception:
+            return None
+        _matrix = matrix
+        _matrix_loaded_at = time.monotonic()
+        return matrix
+
+
+def _fetch_permissions_for_role(role_id: str) -> frozenset[str]:
+    """
+    由權限矩陣取得指定 role 的 permission_key 集合。
+    若查詢失敗則回傳空集合，不拋出例外。
+    """
+    if not role_id:
+        return frozenset()
+    matrix = get_permission_matrix()
+    if not matrix:
+        return frozenset()
+    return matrix.get(role_id.strip().lower(), frozenset())
 
 
 def _role_fallback_permissions(role_id: str) -> list[str]:
@@ -103,20 +167,20 @@ def _role_fallback_permissions(role_id: str) -> list[str]:
 
 def load_user_permissions_to_session(role_id: str) -> None:
     """
-    登入後（或首次渲染時）載入 permission_key 清單至 session_state。
-    - current_permissions: list[str]
+    登入後（或首次渲染時）載入 permission_key 集合至 session_state。
+    - current_permissions: frozenset[str]
     - current_role: str（role_id）
 
     若 DB 查詢失敗，自動 fallback 至角色預設清單。
     """
     if not role_id:
-        st.session_state["current_permissions"] = []
+        st.session_state["current_permissions"] = frozenset()
         st.session_state["current_role"] = ""
         return
 
     perms = _fetch_permissions_for_role(role_id)
     if not perms:
-        perms = _role_fallback_permissions(role_id)
+        perms = frozenset(_role_fallback_permissions(role_id))
 
     st.session_state["current_permissions"] = perms
     st.session_state["current_role"] = role_id.lower()
@@ -128,7 +192,11 @@ def has_permission(permission_key: str) -> bool:
     若 current_permissions 尚未載入，回傳 False。
     """
     perms = st.session_state.get("current_permissions")
-    if not isinstance(perms, list):
+    if isinstance(perms, list):
+        # 舊 session 仍是 list 時轉成集合，之後都是 O(1) 查詢
+        perms = frozenset(perms)
+        st.session_state["current_permissions"] = perms
+    if not isinstance(perms, frozenset):
         return False
     return permission_key in perms
 
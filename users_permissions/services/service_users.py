@@ -8,19 +8,24 @@
 
 from __future__ import annotations
 
+from dataclasses import dataclass
 from datetime import datetime
 import hashlib
 
 import pandas as pd
+import streamlit as st
 
-from shared.services.service_audit import audit_log
-from shared.services.service_id import allocate_user_id
+from shared.services.service_audit import audit_log, audit_log_many
+from shared.services.service_id import allocate_ids_map, allocate_user_id
 from shared.services.data_backend import (
     append_rows_by_header as sheet_append,
     bust_cache as sheet_bust_cache,
     get_header as sheet_get_header,
+    get_table_version,
     read_table as sheet_read,
     update_row_by_match as sheet_update,
+    upsert_fields_by_primary_key as sheet_upsert_fields,
+    upsert_rows_by_primary_key as sheet_upsert_many,
 )
 
 
@@ -64,9 +69,12 @@ def sha256_password(password: str) -> str:
     return hashlib.sha256((password or "").encode("utf-8")).hexdigest()
 
 
+_TRUE_TEXTS = {"1", "true", "yes", "y"}
+
+
 def norm_10(value) -> int:
     text = norm_text(value).lower()
-    return 1 if text in {"1", "true", "yes", "y"} else 0
+    return 1 if text in _TRUE_TEXTS else 0
 
 
 def ensure_user_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -111,35 +119,98 @@ def build_account_info_df(user_row: pd.Series) -> pd.DataFrame:
     )
 
 
+def _text_column(series: pd.Series) -> pd.Series:
+    return series.astype("string").str.strip().fillna("").astype(object)
+
+
+def _flag_column(series: pd.Series) -> pd.Series:
+    # 與 norm_10 相同判斷，整欄一次處理
+    return series.astype("string").str.strip().str.lower().isin(_TRUE_TEXTS).astype(int)
+
+
 def _normalize_login_df(users_df: pd.DataFrame | None = None) -> pd.DataFrame:
     work = load_users_df() if users_df is None else ensure_user_columns(users_df)
     if work.empty:
         return work
     work = work.copy()
-    work["user_id"] = work["user_id"].apply(norm_text)
-    work["account_code"] = work["account_code"].apply(norm_text)
-    work["display_name"] = work["display_name"].apply(norm_text)
-    work["password_hash"] = work["password_hash"].apply(norm_text)
-    work["role_id"] = work["role_id"].apply(lambda x: norm_text(x).lower())
-    work["store_scope"] = work["store_scope"].apply(norm_text)
-    work["is_active"] = work["is_active"].apply(norm_10)
-    work["must_change_password"] = work["must_change_password"].apply(norm_10)
+    for col in ("user_id", "account_code", "display_name", "password_hash", "store_scope"):
+        work[col] = _text_column(work[col])
+    work["role_id"] = _text_column(work["role_id"]).str.lower()
+    work["is_active"] = _flag_column(work["is_active"])
+    work["must_change_password"] = _flag_column(work["must_change_password"])
     return work
 
 
+# ------------------------------------------------------------
+# users 索引：依 users 表版本快取在 session，登入 / 查詢不再掃整張表
+# ------------------------------------------------------------
+_USERS_INDEX_KEY = "_users_index"
+
+
+@dataclass(frozen=True)
+class UsersIndex:
+    df: pd.DataFrame                    # 正規化後的 users（唯讀，取列請用 row()）
+    by_user_id: dict[str, int]          # user_id → 列位置（重複時取第一筆）
+    active_by_account: dict[str, int]   # 啟用中 account_code → 列位置（重複時取第一筆）
+    account_codes_lower: frozenset[str]
+    first_active_owner: int | None
+
+    @property
+    def empty(self) -> bool:
+        return self.df.empty
+
+    def row(self, position: int) -> pd.Series:
+        return self.df.iloc[position].copy()
+
+
+def _first_positions(keys: pd.Series) -> dict[str, int]:
+    keys = keys.reset_index(drop=True)
+    keys = keys[keys != ""]
+    first = keys[~keys.duplicated(keep="first")]
+    return dict(zip(first.tolist(), first.index.tolist()))
+
+
+def build_users_index(users_df: pd.DataFrame | None = None) -> UsersIndex:
+    work = _normalize_login_df(users_df).reset_index(drop=True)
+    if work.empty:
+        return UsersIndex(work, {}, {}, frozenset(), None)
+    active = work["is_active"] == 1
+    owners = work.index[active & (work["role_id"] == "owner")]
+    return UsersIndex(
+        df=work,
+        by_user_id=_first_positions(work["user_id"]),
+        active_by_account=_first_positions(work["account_code"].where(active, "")),
+        account_codes_lower=frozenset(c.lower() for c in work["account_code"].tolist() if c),
+        first_active_owner=int(owners[0]) if len(owners) else None,
+    )
+
+
+def get_users_index() -> UsersIndex:
+    """目前 users 版本的索引；寫入後 bust_cache("users") 版本 +1 即自動重建。"""
+    version = get_table_version("users")
+    hit = st.session_state.get(_USERS_INDEX_KEY)
+    if isinstance(hit, dict) and hit.get("version") == version:
+        return hit["index"]
+    index = build_users_index()
+    # 讀取失敗（空表）不快取，下次再試
+    if not index.empty:
+        st.session_state[_USERS_INDEX_KEY] = {"version": version, "index": index}
+    return index
+
+
 def get_user_row(user_id: str) -> pd.Series:
     target_user_id = norm_text(user_id)
     if not target_user_id:
         raise UserServiceError("缺少 user_id")
 
-    work = _normalize_login_df()
-    if work.empty:
+    index = get_users_index()
+    if index.empty:
         raise UserServiceError("users 表讀取失敗")
 
-    hit = work[work["user_id"] == target_user_id].copy()
-    if hit.empty:
+    position = index.by_user_id.get(target_user_id)
+    if position is None:
         raise UserServiceError("找不到目前登入者資料")
-    return hit.iloc[0].copy()
+    return index.row(position)
 
 
 def build_login_session_payload(user_row: pd.Series) -> dict[str, object]:
@@ -160,13 +231,10 @@ def build_login_session_payload(user_row: pd.Series) -> dict[str, object]:
 # 登入 / owner 初始化 / 強制改密
 # ------------------------------------------------------------
 def get_owner_first_setup_row() -> pd.Series | None:
-    work = _normalize_login_df()
-    if work.empty:
+    index = get_users_index()
+    if index.first_active_owner is None:
         return None
-    owner_df = work[(work["role_id"] == "owner") & (work["is_active"] == 1)].copy()
-    if owner_df.empty:
-        return None
-    owner_row = owner_df.iloc[0].copy()
+    owner_row = index.row(index.first_active_owner)
     if norm_text(owner_row.get("password_hash")) != "":
         return None
     return owner_row
@@ -216,15 +284,15 @@ def initialize_owner_password(user_id: str, new_password: str, confirm_password:
 
 
 def authenticate_user(account: str, password: str) -> pd.Series:
-    work = _normalize_login_df()
-    if work.empty:
+    index = get_users_index()
+    if index.empty:
         raise UserServiceError("users 資料表為空，無法登入。")
 
-    target = work[(work["account_code"] == norm_text(account)) & (work["is_active"] == 1)].copy()
-    if target.empty:
+    position = index.active_by_account.get(norm_text(account))
+    if position is None:
         raise UserServiceError("帳號不存在，或此帳號未啟用。")
 
-    user_row = target.iloc[0].copy()
+    user_row = index.row(position)
     if norm_text(user_row.get("password_hash")) != sha256_password(password):
         raise UserServiceError("密碼錯誤。")
     return user_row
@@ -346,7 +414,7 @@ def change_own_password(user_id: str, current_password: str, new_password: str,
 # ------------------------------------------------------------
 # 使用者管理（管理員）
 # ------------------------------------------------------------
-def create_user_account(data: dict, actor_user_id: str = "") -> str:
+def _validate_new_user(data: dict) -> dict:
     account_code = norm_text(data.get("account_code"))
     display_name = norm_text(data.get("display_name"))
     role_id = norm_text(data.get("role_id")).lower()
@@ -357,32 +425,44 @@ def create_user_account(data: dict, actor_user_id: str = "") -> str:
         raise UserServiceError("請輸入姓名")
     if not role_id:
         raise UserServiceError("請選擇角色")
-
-    users_df = _normalize_login_df()
-    if not users_df.empty:
-        dup = users_df[users_df["account_code"].str.lower() == account_code.lower()]
-        if not dup.empty:
-            raise UserServiceError("帳號已存在")
-
-    new_user_id = allocate_user_id()
-    now_value = now_ts()
-    actor = norm_text(actor_user_id)
-    new_row = {
-        "user_id": new_user_id,
+    return {
         "account_code": account_code,
-        "email": "",
         "display_name": display_name,
-        "password_hash": sha256_password("123456"),
-        "must_change_password": 1,
         "role_id": role_id,
         "store_scope": store_scope,
+    }
+
+
+def _new_user_row(user_id: str, fields: dict, now_value: str, actor: str) -> dict:
+    return {
+        "user_id": user_id,
+        "account_code": fields["account_code"],
+        "email": None,
+        "display_name": fields["display_name"],
+        "password_hash": sha256_password("123456"),
+        "must_change_password": 1,
+        "role_id": fields["role_id"],
+        "store_scope": fields["store_scope"],
         "is_active": 1,
-        "last_login_at": "",
+        "last_login_at": None,
         "created_at": now_value,
         "created_by": actor,
         "updated_at": now_value,
         "updated_by": actor,
     }
+
+
+def _created_audit_after(fields: dict) -> dict:
+    return {**fields, "is_active": 1}
+
+
+def create_user_account(data: dict, actor_user_id: str = "") -> str:
+    fields = _validate_new_user(data)
+    if fields["account_code"].lower() in get_users_index().account_codes_lower:
+        raise UserServiceError("帳號已存在")
+
+    new_user_id = allocate_user_id()
+    new_row = _new_user_row(new_user_id, fields, now_ts(), norm_text(actor_user_id))
     header = sheet_get_header("users")
     sheet_append("users", header, [new_row])
     sheet_bust_cache("users")
@@ -390,18 +470,51 @@ def create_user_account(data: dict, actor_user_id: str = "") -> str:
         action="create_user",
         entity_id=new_user_id,
         before=None,
-        after={
-            "account_code": account_code,
-            "display_name": display_name,
-            "role_id": role_id,
-            "store_scope": store_scope,
-            "is_active": 1,
-        },
+        after=_created_audit_after(fields),
         note="Create new user",
     )
     return new_user_id
 
 
+def create_user_accounts(items: list[dict], actor_user_id: str = "") -> list[str]:
+    """
+    批次建立帳號：整批先檢查（含批次內帳號重複），有任何錯誤就全部不寫。
+    一次配號、一次 upsert、一次放進稽核佇列，users 快取只清一次。
+    """
+    existing = get_users_index().account_codes_lower
+    seen: set[str] = set()
+    errors: list[str] = []
+    fields_list: list[dict] = []
+    for no, data in enumerate(items, start=1):
+        try:
+            fields = _validate_new_user(data)
+        except UserServiceError as e:
+            errors.append(f"第 {no} 筆：{e}")
+            continue
+        account_key = fields["account_code"].lower()
+        if account_key in existing or account_key in seen:
+            errors.append(f"第 {no} 筆：帳號 {fields['account_code']} 已存在")
+            continue
+        seen.add(account_key)
+        fields_list.append(fields)
+    if errors:
+        raise UserServiceError("\n".join(errors))
+    if not fields_list:
+        return []
+
+    new_user_ids = allocate_ids_map({"users": len(fields_list)})["users"]
+    now_value = now_ts()
+    actor = norm_text(actor_user_id)
+    rows = [_new_user_row(uid, fields, now_value, actor) for uid, fields in zip(new_user_ids, fields_list)]
+    sheet_upsert_many("users", rows)
+    audit_log_many(
+        "create_user",
+        [(uid, None, _created_audit_after(fields)) for uid, fields in zip(new_user_ids, fields_list)],
+        note=f"Create new user (batch of {len(rows)})",
+    )
+    return list(new_user_ids)
+
+
 def update_user_profile(
     user_id: str,
     updates: dict,
@@ -463,16 +576,62 @@ def toggle_user_active_admin(user_id: str, target_row: dict, target_next_active:
     )
 
 
+def update_user_profiles(
+    changes: list[dict],
+    *,
+    action: str,
+    note: str,
+    actor_user_id: str = "",
+) -> list[str]:
+    """
+    批次版 update_user_profile：changes 每筆為 {"user_id", "updates", "before", "after"}。
+    每位使用者只帶 user_id 與異動欄位（同一人多筆異動先合併），依欄位組合分組 upsert，
+    不以快取中的整列覆蓋其他欄位；一次放進稽核佇列，找不到的 user_id 整批不寫。
+    """
+    target_ids = [norm_text(c.get("user_id")) for c in changes]
+    if not target_ids:
+        return []
+    if "" in target_ids:
+        raise UserServiceError("缺少 user_id")
+    known = get_users_index().by_user_id
+    missing = [uid for uid in target_ids if uid not in known]
+    if missing:
+        raise UserServiceError(f"找不到使用者：{', '.join(missing)}")
+
+    actor = norm_text(actor_user_id)
+    now_value = now_ts()
+    rows: dict[str, dict] = {}
+    audit_changes = []
+    for uid, change in zip(target_ids, changes):
+        final_updates = dict(change.get("updates") or {})
+        final_updates.setdefault("updated_at", now_value)
+        if actor:
+            final_updates.setdefault("updated_by", actor)
+        rows[uid] = {**rows.get(uid, {"user_id": uid}), **final_updates}
+        audit_changes.append((uid, change.get("before") or {}, change.get("after") or final_updates))
+
+    groups: dict[tuple, list[dict]] = {}
+    for row in rows.values():
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for group in groups.values():
+        sheet_upsert_fields("users", group)
+    audit_log_many(action, audit_changes, note=note)
+    return target_ids
+
+
 __all__ = [
     "UserServiceError",
+    "UsersIndex",
     "authenticate_owner",
     "authenticate_user",
     "build_account_info_df",
     "build_login_session_payload",
+    "build_users_index",
     "change_own_password",
     "force_change_password",
     "get_owner_first_setup_row",
     "get_user_row",
+    "get_users_index",
     "initialize_owner_password",
     "load_users_df",
     "login_user",
@@ -484,7 +643,9 @@ __all__ = [
     "update_user_fields",
     "now_ts",
     "create_user_account",
+    "create_user_accounts",
     "update_user_profile",
+    "update_user_profiles",
     "reset_user_password_admin",
     "toggle_user_active_admin",
 ]
@@ -0,0 +1,209 @@
+"""
+validation_baseline/bench_export_stream.py
+匯出檔記憶體峰值比對（peak RSS），跑實際的匯出查詢。
+
+比較：
+  legacy — 舊流程：讀入全部分店的整張明細表，每間分店以 build_export_view_model 組出完整預覽，
+           合併後 to_csv().encode() 成整包 bytes
+  stream — build_export_file：逐店依月份只查詢需要的明細並計算，經 utils_export.spool_export
+           逐段寫入暫存檔，再發佈到靜態檔下載路由（分段複製）
+  xlsx   — 同 stream，但以 openpyxl write-only 模式輸出 XLSX
+
+CSV 模式另外印出內容的 sha1，stream 與 legacy 相同代表輸出逐位元組一致。
+預設資料量：10 間分店 × 300 品項 × 365 天 ≈ 110 萬筆盤點明細。
+
+資料先以合成的門市 / 品項 / 盤點 / 叫貨寫入暫存的本機 SQLite 資料庫（OMS_DATA_BACKEND=sqlite），
+各模式在獨立子行程透過 data_backend 讀表並執行報表計算，讀取子行程自己的峰值（/proc/self/status 的 VmHWM），
+彼此不互相影響。
+不依賴 Supabase 或網路連線。
+
+使用方式：
+  python validation_baseline/bench_export_stream.py [--stores 10] [--items 300] [--days 365] [--modes legacy,stream]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+MODES = ("legacy", "stream", "xlsx")
+VENDOR_COUNT = 8
+END_DATE = date(2026, 3, 31)
+
+
+def _bench_env(db_path: str) -> dict[str, str]:
+    return {**os.environ, "OMS_DATA_BACKEND": "sqlite", "OMS_LOCAL_DB_PATH": db_path}
+
+
+def seed_database(db_path: str, n_stores: int, n_items: int, n_days: int, seed: int = 1) -> dict[str, int]:
+    """建立本機資料庫並寫入合成資料；每間分店每天每個廠商一張盤點單與叫貨單。"""
+    os.environ.update(_bench_env(db_path))
+    from shared.services.supabase_client import insert_rows
+
+    rng = np.random.default_rng(seed)
+    stores = [{"store_id": f"S{i:03d}", "store_name": f"分店{i:03d}", "is_active": True} for i in range(n_stores)]
+    vendors = [{"vendor_id": f"V{i:02d}", "vendor_name": f"廠商{i:02d}", "is_active": True} for i in range(VENDOR_COUNT)]
+    units = [
+        {"unit_id": "U_PACK", "unit_name": "包", "is_active": True},
+        {"unit_id": "U_BOX", "unit_name": "箱", "is_active": True},
+    ]
+    items, conversions, prices = [], [], []
+    for i in range(n_items):
+        item_id = f"ITEM_{i:05d}"
+        items.append({
+            "item_id": item_id,
+            "item_name": f"品項名稱{i:05d}",
+            "default_vendor_id": f"V{i % VENDOR_COUNT:02d}",
+            "base_unit": "U_PACK",
+            "default_stock_unit": "U_BOX" if i % 3 == 0 else "U_PACK",
+            "default_order_unit": "U_BOX",
+            "is_active": True,
+        })
+        conversions.append({"conversion_id": f"C{i:05d}", "item_id": item_id, "from_unit": "U_BOX", "to_unit": "U_PACK", "ratio": 10, "is_active": True})
+        prices.append({"price_id": f"P{i:05d}", "item_id": item_id, "unit_price": 100 + i % 50, "price_unit": "U_BOX", "effective_date": "2025-01-01", "is_active": True})
+    for table, rows in (("stores", stores), ("vendors", vendors), ("units", units), ("items", items), ("unit_conversions", conversions), ("prices", prices)):
+        insert_rows(table, rows)
+
+    counts = {"stocktake_lines": 0, "purchase_order_lines": 0}
+    start = END_DATE - timedelta(days=n_days - 1)
+    for store in stores:
+        stocktakes, stock_lines, orders, order_lines = [], [], [], []
+        for day_offset in range(n_days):
+            day = str(start + timedelta(days=day_offset))
+            for v in range(VENDOR_COUNT):
+                suffix = f"{store['store_id']}_{day_offset:04d}_{v:02d}"
+                vendor_id = f"V{v:02d}"
+                stocktakes.append({"stocktake_id": f"ST_{suffix}", "store_id": store["store_id"], "vendor_id": vendor_id, "stocktake_date": day, "status": "done", "created_at": f"{day}T10:00:00"})
+                orders.append({"po_id": f"PO_{suffix}", "store_id": store["store_id"], "vendor_id": vendor_id, "order_date": day, "delivery_date": day, "status": "draft", "stocktake_id": f"ST_{suffix}"})
+                item_idx = np.arange(v, n_items, VENDOR_COUNT)
+                qty = rng.integers(0, 50, size=len(item_idx))
+                order_qty = rng.integers(0, 4, size=len(item_idx))
+                for k, i in enumerate(item_idx):
+                    item_id = f"ITEM_{i:05d}"
+                    stock_lines.append({"stocktake_line_id": f"STL_{suffix}_{i:05d}", "stocktake_id": f"ST_{suffix}", "store_id": store["store_id"], "vendor_id": vendor_id, "item_id": item_id, "qty": int(qty[k]), "unit_id": "U_PACK", "base_qty": int(qty[k]), "base_unit": "U_PACK"})
+                    if order_qty[k]:
+                        order_lines.append({"po_line_id": f"POL_{suffix}_{i:05d}", "po_id": f"PO_{suffix}", "store_id": store["store_id"], "vendor_id": vendor_id, "item_id": item_id, "order_qty": int(order_qty[k]), "order_unit": "U_BOX", "base_qty": int(order_qty[k]) * 10, "base_unit": "U_PACK", "unit_price": 100, "amount": int(order_qty[k]) * 100})
+        insert_rows("stocktakes", stocktakes)
+        insert_rows("stocktake_lines", stock_lines)
+        insert_rows("purchase_orders", orders)
+        insert_rows("purchase_order_lines", order_lines)
+        counts["stocktake_lines"] += len(stock_lines)
+        counts["purchase_order_lines"] += len(order_lines)
+    return counts
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss 會沿用 fork 當下父行程（寫入測試資料後）的峰值，優先讀本行程自己的 VmHWM（單位 KB）
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Linux 的 ru_maxrss 單位為 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode: str, export_type: str, n_days: int) -> None:
+    """子行程進入點：執行單一模式並印出 `rows bytes seconds delta_mb peak_mb sha1`。"""
+    import pandas as pd
+
+    from analysis.logic.report_query import load_report_shared_tables
+    from analysis.logic.report_view_model import ALL_ITEMS, ALL_VENDORS, build_export_file, build_export_view_model, discard_export_file
+    from shared.services.service_reports import read_report_table
+    from shared.utils.utils_export import EXPORT_FORMAT_CSV, EXPORT_FORMAT_XLSX
+
+    stores_df = read_report_table("stores")
+    store_targets = list(zip(stores_df["store_id"].astype(str), stores_df["store_name"].astype(str)))
+    start = END_DATE - timedelta(days=n_days - 1)
+    shared_tables = load_report_shared_tables()
+
+    baseline_mb = _peak_rss_mb()
+    started = time.perf_counter()
+    if mode == "legacy":
+        frames = []
+        for store_id, store_name in store_targets:
+            preview = build_export_view_model(export_type, store_id, store_name, start, END_DATE, ALL_VENDORS, ALL_ITEMS, shared_tables)["preview"]
+            if not preview.empty and "分店" not in preview.columns:
+                preview.insert(0, "分店", store_name)
+            frames.append(preview)
+        full_df = pd.concat(frames, ignore_index=True)
+        payload = full_df.to_csv(index=False).encode("utf-8-sig")
+        row_count, size = len(full_df), len(payload)
+        digest = hashlib.sha1(payload).hexdigest()
+    else:
+        file_format = EXPORT_FORMAT_XLSX if mode == "xlsx" else EXPORT_FORMAT_CSV
+        export = build_export_file(export_type, store_targets, start, END_DATE, ALL_VENDORS, ALL_ITEMS, shared_tables, file_format)
+        export_file, row_count = export["file"], export["row_count"]
+        export_file.seek(0, 2)
+        size = export_file.tell()
+        elapsed = time.perf_counter() - started
+        digest = "-"
+        if file_format == EXPORT_FORMAT_CSV:
+            # 計時之後才逐段算 sha1，不影響峰值
+            export_file.seek(0)
+            hasher = hashlib.sha1()
+            for block in iter(lambda: export_file.read(1024 * 1024), b""):
+                hasher.update(block)
+            digest = hasher.hexdigest()
+        discard_export_file(export)
+        print(f"{row_count} {size} {elapsed:.2f} {_peak_rss_mb() - baseline_mb:.1f} {_peak_rss_mb():.1f} {digest}")
+        return
+    elapsed = time.perf_counter() - started
+    print(f"{row_count} {size} {elapsed:.2f} {_peak_rss_mb() - baseline_mb:.1f} {_peak_rss_mb():.1f} {digest}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stores", type=int, default=10)
+    parser.add_argument("--items", type=int, default=300)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--export-type", default="進銷存分析")
+    parser.add_argument("--modes", default="legacy,stream")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args.child, args.export_type, args.days)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="oms_bench_export_") as tmp_dir:
+        db_path = str(Path(tmp_dir) / "bench.sqlite3")
+        seeded_at = time.perf_counter()
+        counts = seed_database(db_path, args.stores, args.items, args.days)
+        print(
+            f"stores={args.stores} items={args.items} days={args.days} export={args.export_type} "
+            f"stocktake_lines={counts['stocktake_lines']:,} purchase_order_lines={counts['purchase_order_lines']:,} "
+            f"(seeded in {time.perf_counter() - seeded_at:.1f}s)"
+        )
+        print(f"{'mode':<8}{'rows':>10}{'size_mb':>10}{'seconds':>10}{'peak_rss_mb':>14}{'delta_mb':>11}  sha1")
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            if mode not in MODES:
+                raise SystemExit(f"未知模式：{mode}")
+            result = subprocess.run(
+                [sys.executable, __file__, "--child", mode, "--export-type", args.export_type, "--days", str(args.days)],
+                check=True,
+                capture_output=True,
+                text=True,
+                env=_bench_env(db_path),
+            )
+            rows, size, seconds, delta_mb, peak_mb, digest = result.stdout.split()[-6:]
+            print(f"{mode:<8}{int(rows):>10,}{int(size) / 1024 / 1024:>10.1f}{float(seconds):>10.2f}{float(peak_mb):>14.1f}{float(delta_mb):>11.1f}  {digest[:12]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+validation_baseline/bench_order_payload.py
+叫貨 RPC payload 清理效能比對。
+
+比較：
+  legacy     — 舊版 _sanitize_payload（遞迴逐值 pd.isna）
+  serializer — order_write_rpc.serialize_order_rpc_payload（依欄位型別整欄轉換）
+
+並確認兩者對一般 payload 的輸出 JSON 相同。
+不依賴 Supabase 或網路連線。
+
+使用方式：
+  python validation_baseline/bench_order_payload.py [--lines 150] [--repeat 200]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from operations.logic.order_write_rpc import serialize_order_rpc_payload  # noqa: E402
+
+
+def _legacy_sanitize_payload(obj, _path: str = "") -> object:
+    """舊版實作（保留作為比較基準）。"""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return {k: _legacy_sanitize_payload(v, f"{_path}.{k}") for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_legacy_sanitize_payload(item, f"{_path}[{i}]") for i, item in enumerate(obj)]
+    if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
+        return 0
+    try:
+        if pd.isna(obj):
+            return 0
+    except (TypeError, ValueError):
+        pass
+    return obj
+
+
+def build_sample_payload(n_lines: int) -> dict:
+    """依 build_order_write_rpc_payload 的欄位結構產生測試 payload。"""
+    now = "2026-01-01 10:00:00"
+    stl = []
+    pol = []
+    for i in range(n_lines):
+        item_id = f"ITEM_{i:06d}"
+        stl.append({
+            "stocktake_line_id": f"STL_{i:06d}", "stocktake_id": "ST_000001",
+            "store_id": "STORE_000001", "vendor_id": "VENDOR_000001",
+            "item_id": item_id, "item_name": f"品項{i}",
+            "qty": float(i % 7), "stock_qty": float(i % 7),
+            "unit_id": "UNIT_000001", "stock_unit": "UNIT_000001", "stock_unit_id": "UNIT_000001",
+            "base_qty": float("nan") if i % 50 == 0 else round(i * 1.5, 3), "base_unit": "UNIT_000002",
+            "created_at": now, "created_by": "U1", "updated_at": now, "updated_by": "U1",
+        })
+        pol.append({
+            "po_line_id": f"POL_{i:06d}", "po_id": "PO_000001",
+            "store_id": "STORE_000001", "vendor_id": "VENDOR_000001",
+            "item_id": item_id, "item_name": f"品項{i}",
+            "qty": float(i % 3), "order_qty": float(i % 3),
+            "unit_id": "UNIT_000003", "order_unit": "UNIT_000003",
+            "base_qty": float(i % 3) * 10, "base_unit": "UNIT_000002",
+            "unit_price": float("inf") if i % 75 == 0 else 12.5, "amount": float(i % 3) * 125.0,
+            "delivery_date": "2026-01-02",
+            "created_at": now, "created_by": "U1", "updated_at": now, "updated_by": "U1",
+        })
+    header = {"stocktake_id": "ST_000001", "store_id": "STORE_000001", "note": None}
+    return {
+        "stocktake": header,
+        "stocktake_lines": stl,
+        "purchase_order": {"po_id": "PO_000001", "status": "draft"},
+        "purchase_order_lines": pol,
+        "audit_logs": [{
+            "audit_id": "A1", "before_json": {"lines": [{"qty": float("nan")}]}, "after_json": {}, "note": "",
+        }],
+        "_meta": {"stocktake_id": "ST_000001", "po_id": "PO_000001"},
+    }
+
+
+def _timeit(fn, payload, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(payload)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    payload = build_sample_payload(args.lines)
+
+    legacy_json = json.dumps(_legacy_sanitize_payload(payload), ensure_ascii=False, sort_keys=True)
+    new_json = json.dumps(serialize_order_rpc_payload(payload), ensure_ascii=False, sort_keys=True)
+    same = json.loads(legacy_json) == json.loads(new_json)
+
+    legacy_ms = _timeit(_legacy_sanitize_payload, payload, args.repeat)
+    new_ms = _timeit(serialize_order_rpc_payload, payload, args.repeat)
+
+    print(json.dumps({
+        "lines_per_table": args.lines,
+        "repeat": args.repeat,
+        "same_output": same,
+        "legacy_ms": round(legacy_ms, 3),
+        "serializer_ms": round(new_ms, 3),
+        "speedup": round(legacy_ms / new_ms, 2) if new_ms else None,
+    }, ensure_ascii=False, indent=2))
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
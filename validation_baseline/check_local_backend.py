@@ -0,0 +1,310 @@
+"""
+validation_baseline/check_local_backend.py
+本機 SQLite 後端（shared/services/local_backend.py）與 PostgreSQL / PostgREST 行為對照檢查。
+
+檢查：
+  migrations — SQL 切分、DDL 轉譯（SERIAL、保留 DATE / TIMESTAMP / JSONB 宣告型別）、
+               ADD COLUMN IF NOT EXISTS、全部 migrations 套用與重開不重套
+  writes     — 依宣告型別檢查輸入（"" 寫進 DATE / TIMESTAMP / NUMERIC 失敗）、
+               批次寫入欄位聯集補 NULL（default_to_null）、on_conflict 只接受主鍵或非 partial 的 UNIQUE、
+               select 欄位清單、jsonb 讀回解碼
+  rpc        — rpc_save_order_transaction：新增 / 再存一次的 DO UPDATE 欄位、partial index 的 ON CONFLICT、
+               nullif / 稽核 DO NOTHING、型別錯誤整筆 rollback
+
+每項在新的 :memory: 資料庫上執行，不依賴 Supabase 或網路連線；任一項失敗時結束碼為 1。
+
+使用方式：
+  python validation_baseline/check_local_backend.py [--only migrations,writes,rpc]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from shared.services.local_backend import (  # noqa: E402
+    LocalSqliteBackend,
+    _translate_ddl,
+    split_sql_statements,
+)
+
+GROUPS = ("migrations", "writes", "rpc")
+
+
+def _backend() -> LocalSqliteBackend:
+    return LocalSqliteBackend(":memory:")
+
+
+def _rejects(fn, message: str) -> bool:
+    """fn 必須拋出 ValueError，且訊息包含 message。"""
+    try:
+        fn()
+    except ValueError as e:
+        return message in str(e)
+    return False
+
+
+# ---------------------------------------------------------------------------
+# migrations 轉譯
+# ---------------------------------------------------------------------------
+
+def check_split_statements() -> bool:
+    sql = (
+        "-- 註解; 不切\n"
+        "INSERT INTO t VALUES ('a;b', 'it''s');\n"
+        "CREATE FUNCTION f() RETURNS void AS $$ BEGIN PERFORM 1; END; $$ LANGUAGE plpgsql;\n"
+        "SELECT 1"
+    )
+    out = split_sql_statements(sql)
+    return len(out) == 3 and "'a;b'" in out[0] and out[1].endswith("plpgsql") and out[2] == "SELECT 1"
+
+
+def check_translate_ddl() -> bool:
+    ddl = _translate_ddl(
+        "CREATE TABLE t (id SERIAL, d DATE, ts TIMESTAMPTZ, j JSONB, PRIMARY KEY (id))"
+    )
+    return (
+        "id INTEGER PRIMARY KEY AUTOINCREMENT" in ddl
+        and "PRIMARY KEY (id)" not in ddl
+        and "d DATE" in ddl and "ts TIMESTAMPTZ" in ddl and "j JSONB" in ddl
+    )
+
+
+def check_add_columns() -> bool:
+    with tempfile.TemporaryDirectory(prefix="oms_check_backend_") as tmp_dir:
+        mig = Path(tmp_dir)
+        (mig / "001_a.sql").write_text("CREATE TABLE IF NOT EXISTS public.t (k TEXT PRIMARY KEY);", encoding="utf-8")
+        (mig / "002_b.sql").write_text(
+            "ALTER TABLE public.t ADD COLUMN IF NOT EXISTS d DATE, ADD COLUMN IF NOT EXISTS n NUMERIC DEFAULT 0;\n"
+            "ALTER TABLE public.t ADD COLUMN IF NOT EXISTS d DATE;",
+            encoding="utf-8",
+        )
+        backend = LocalSqliteBackend(":memory:", migrations_dir=mig)
+        cols = backend._table_columns("t")
+        return backend.applied_migrations == ["001_a.sql", "002_b.sql"] and cols == {"k": "TEXT", "d": "DATE", "n": "NUMERIC"}
+
+
+def check_full_migrations() -> bool:
+    with tempfile.TemporaryDirectory(prefix="oms_check_backend_") as tmp_dir:
+        path = Path(tmp_dir) / "oms.sqlite3"
+        backend = LocalSqliteBackend(path)
+        applied = len(backend.applied_migrations)
+        prices = backend._table_columns("prices")
+        audit = backend._table_columns("audit_logs")
+        partial = [
+            r[1] for r in backend._conn.execute("PRAGMA index_list(stocktake_lines)") if r[2] and r[4]
+        ]
+        backend.close()
+        reopened = LocalSqliteBackend(path)
+        again = reopened.applied_migrations
+        reopened.close()
+    return (
+        applied > 0 and not again
+        and prices["end_date"] == "DATE" and prices["created_at"] == "TIMESTAMP"
+        and audit["before_json"] == "JSONB" and bool(partial)
+    )
+
+
+# ---------------------------------------------------------------------------
+# table() 寫入語意
+# ---------------------------------------------------------------------------
+
+def check_rejects_blank_dates() -> bool:
+    backend = _backend()
+    prices = backend.table("prices")
+    return (
+        _rejects(lambda: prices.insert([{"price_id": "P1", "end_date": ""}]).execute(), "type date")
+        and _rejects(lambda: prices.insert([{"price_id": "P1", "updated_at": ""}]).execute(), "type timestamp")
+        and _rejects(lambda: prices.insert([{"price_id": "P1", "effective_date": "2026-13-01"}]).execute(), "type date")
+        and _rejects(lambda: prices.insert([{"price_id": "P1", "unit_price": ""}]).execute(), "type numeric")
+        and not backend.table("prices").select().execute().data
+    )
+
+
+def check_coerces_values() -> bool:
+    backend = _backend()
+    backend.table("prices").insert([
+        {"price_id": "P1", "effective_date": "2026/01/02", "end_date": "2026-01-31 00:00:00", "is_active": "false"},
+    ]).execute()
+    row = backend.table("prices").select().execute().data[0]
+    return row["effective_date"] == "2026-01-02" and row["end_date"] == "2026-01-31" and row["is_active"] is False
+
+
+def check_default_to_null() -> bool:
+    backend = _backend()
+    items = backend.table("items")
+    items.insert({"item_id": "I1"}).execute()
+    items.insert([{"item_id": "I2"}, {"item_id": "I3", "require_price": False}]).execute()
+    rows = {r["item_id"]: r["require_price"] for r in items.select("item_id", "require_price").execute().data}
+    # 單列只帶到的欄位 → 其他欄位走 DEFAULT；多列欄位不一致 → 聯集、缺的補 NULL
+    return rows == {"I1": True, "I2": None, "I3": False}
+
+
+def check_upsert_union() -> bool:
+    backend = _backend()
+    backend.table("items").insert([{"item_id": "I1", "item_name": "舊", "note": "n"}]).execute()
+    backend.table("items").upsert([{"item_id": "I1", "note": "新"}, {"item_id": "I2", "item_name": "x"}]).execute()
+    row = backend.table("items").select().eq("item_id", "I1").execute().data[0]
+    return row["item_name"] is None and row["note"] == "新"
+
+
+def check_on_conflict() -> bool:
+    backend = _backend()
+    line = {"po_line_id": "POL1", "po_id": "PO1"}
+    user = {"user_id": "U1", "account_code": "a1"}
+    backend.table("users").upsert([user], on_conflict="account_code").execute()
+    backend.table("users").upsert([user], on_conflict="user_id").execute()
+    return (
+        _rejects(lambda: backend.table("purchase_order_lines").upsert([line], on_conflict="po_line_id").execute(), "ON CONFLICT")
+        and _rejects(lambda: backend.table("users").upsert([user], on_conflict="display_name").execute(), "ON CONFLICT")
+        and len(backend.table("users").select().execute().data) == 1
+    )
+
+
+def check_unknown_column() -> bool:
+    backend = _backend()
+    return _rejects(lambda: backend.table("items").insert([{"item_id": "I1", "nope": 1}]).execute(), "nope")
+
+
+def check_select_columns() -> bool:
+    backend = _backend()
+    backend.table("items").insert([{"item_id": "I1", "item_name": "a", "is_active": True}]).execute()
+    rows = backend.table("items").select("item_id,is_active").execute().data
+    star = backend.table("items").select("*").execute().data
+    return rows == [{"item_id": "I1", "is_active": True}] and len(star[0]) > 2
+
+
+def check_json_roundtrip() -> bool:
+    backend = _backend()
+    backend.table("audit_logs").insert([
+        {"audit_id": "A1", "ts": "2026-01-01T00:00:00+08:00", "before_json": {"a": [1, None]}, "after_json": "{}"},
+    ]).execute()
+    row = backend.table("audit_logs").select().execute().data[0]
+    # Python 字串寫進 jsonb 是 JSON 字串值，讀回仍是同一個字串（與 PostgREST 相同）
+    return row["before_json"] == {"a": [1, None]} and row["after_json"] == "{}"
+
+
+# ---------------------------------------------------------------------------
+# rpc_save_order_transaction
+# ---------------------------------------------------------------------------
+
+def _payload(**overrides) -> dict:
+    payload = {
+        "stocktake": {
+            "stocktake_id": "ST1", "store_id": "S1", "vendor_id": "V1", "stocktake_date": "2026-10-01",
+            "stocktake_type": "regular", "status": "done",
+            "created_at": "2026-10-01T10:00:00+08:00", "created_by": "U1",
+            "updated_at": "2026-10-01T10:00:00+08:00", "updated_by": "U1",
+        },
+        "stocktake_lines": [
+            {"stocktake_line_id": "STL1", "stocktake_id": "ST1", "item_id": "I1", "qty": 3, "stock_qty": "3", "created_by": "U1"},
+        ],
+        "purchase_order": {"po_id": "PO1", "stocktake_id": "", "store_id": "S1", "vendor_id": "V1", "po_date": "2026-10-01", "status": "open"},
+        "purchase_order_lines": [
+            {"po_line_id": "POL1", "po_id": "PO1", "item_id": "I1", "order_qty": 2.5, "unit_price": 10, "amount": 25, "created_by": "U1"},
+        ],
+        "audit_logs": [{"audit_id": "A1", "ts": "2026-10-01T10:00:00", "after_json": {"qty": 3}}],
+    }
+    payload.update(overrides)
+    return payload
+
+
+def _save(backend: LocalSqliteBackend, payload: dict) -> dict:
+    return backend.rpc("rpc_save_order_transaction", {"p_payload": payload}).execute().data
+
+
+def _rows(backend: LocalSqliteBackend, table: str) -> list[dict]:
+    return backend.table(table).select().execute().data
+
+
+def check_rpc_save() -> bool:
+    backend = _backend()
+    result = _save(backend, _payload())
+    po = _rows(backend, "purchase_orders")[0]
+    line = _rows(backend, "purchase_order_lines")[0]
+    return (
+        result == {"ok": True, "stocktake_id": "ST1", "po_id": "PO1"}
+        and po["stocktake_id"] is None and po["po_date"] == "2026-10-01"
+        and line["order_qty"] == 2.5 and line["amount"] == 25
+        and _rows(backend, "audit_logs")[0]["after_json"] == {"qty": 3}
+    )
+
+
+def check_rpc_resave() -> bool:
+    backend = _backend()
+    _save(backend, _payload())
+    second = _payload()
+    second["stocktake"]["stocktake_type"] = "initial"
+    second["stocktake_lines"][0].update(qty=9, created_by="U2")
+    second["audit_logs"][0]["note"] = "dup"
+    _save(backend, second)
+    stocktake = _rows(backend, "stocktakes")[0]
+    lines = _rows(backend, "stocktake_lines")
+    audits = _rows(backend, "audit_logs")
+    # stocktake_type / created_by 不在 DO UPDATE 清單；稽核 ON CONFLICT DO NOTHING
+    return (
+        stocktake["stocktake_type"] == "regular"
+        and [(r["qty"], r["created_by"]) for r in lines] == [(9, "U1")]
+        and len(audits) == 1 and audits[0]["note"] is None
+    )
+
+
+def check_rpc_blank_line_id() -> bool:
+    backend = _backend()
+    lines = [{"stocktake_line_id": "", "stocktake_id": "ST1", "item_id": "I1", "qty": 1}]
+    _save(backend, _payload(stocktake_lines=lines))
+    _save(backend, _payload(stocktake_lines=lines))
+    # 空字串不在 partial unique index 範圍內，不會衝突，兩次都新增（同 PostgreSQL）
+    return len(_rows(backend, "stocktake_lines")) == 2
+
+
+def check_rpc_rollback() -> bool:
+    backend = _backend()
+    bad_qty = _payload(purchase_order_lines=[{"po_line_id": "POL2", "po_id": "PO1", "qty": "abc"}])
+    bad_ts = _payload()
+    bad_ts["stocktake"]["created_at"] = ""
+    return (
+        _rejects(lambda: _save(backend, bad_qty), "type numeric")
+        and _rejects(lambda: _save(backend, bad_ts), "timestamp")
+        and _rejects(lambda: _save(backend, _payload(audit_logs={"audit_id": "A1"})), "scalar")
+        and not _rows(backend, "stocktakes") and not _rows(backend, "stocktake_lines")
+    )
+
+
+CHECKS: dict[str, list] = {
+    "migrations": [check_split_statements, check_translate_ddl, check_add_columns, check_full_migrations],
+    "writes": [
+        check_rejects_blank_dates, check_coerces_values, check_default_to_null, check_upsert_union,
+        check_on_conflict, check_unknown_column, check_select_columns, check_json_roundtrip,
+    ],
+    "rpc": [check_rpc_save, check_rpc_resave, check_rpc_blank_line_id, check_rpc_rollback],
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=",".join(GROUPS))
+    args = parser.parse_args()
+
+    failed = 0
+    for group in [g.strip() for g in args.only.split(",") if g.strip()]:
+        if group not in CHECKS:
+            raise SystemExit(f"未知檢查群組：{group}")
+        for check in CHECKS[group]:
+            try:
+                ok, detail = check(), ""
+            except Exception as e:
+                ok, detail = False, f"{type(e).__name__}: {e}"
+            failed += not ok
+            print(f"{'PASS' if ok else 'FAIL'}  {group:<11}{check.__name__}{'  ' + detail if detail else ''}")
+    print(f"{'OK' if not failed else f'{failed} FAILED'}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()